@@ -0,0 +1,93 @@
+import os
+import pathlib
+import subprocess
+import sys
+
+import pytest
+
+from plotman import affinity
+
+
+def test_parse_cpulist() -> None:
+    assert affinity.parse_cpulist("0-3,8-9,12\n") == [0, 1, 2, 3, 8, 9, 12]
+    assert affinity.parse_cpulist("") == []
+
+
+def test_format_cpulist() -> None:
+    assert affinity.format_cpulist([12, 0, 1, 2, 3, 8, 9]) == "0-3,8-9,12"
+    assert affinity.format_cpulist([5]) == "5"
+
+
+def test_read_nodes(tmp_path: pathlib.Path) -> None:
+    for node, cpulist in [(0, "0-3,8-11"), (1, "4-7,12-15")]:
+        node_path = tmp_path.joinpath(f"node{node}")
+        node_path.mkdir()
+        node_path.joinpath("cpulist").write_text(cpulist + "\n")
+
+    assert affinity.read_nodes(root=str(tmp_path)) == {
+        0: [0, 1, 2, 3, 8, 9, 10, 11],
+        1: [4, 5, 6, 7, 12, 13, 14, 15],
+    }
+
+
+def test_read_nodes_without_numa(tmp_path: pathlib.Path) -> None:
+    assert affinity.read_nodes(root=str(tmp_path)) == {
+        0: sorted(affinity.usable_cpus())
+    }
+
+
+nodes = {0: [0, 1, 2, 3], 1: [4, 5, 6, 7]}
+
+
+def test_allocate_balances_nodes() -> None:
+    first = affinity.allocate(nodes=nodes, allocations=[], threads=2)
+    assert first == [0, 1]
+    second = affinity.allocate(nodes=nodes, allocations=[first], threads=2)
+    assert second == [4, 5]
+    third = affinity.allocate(nodes=nodes, allocations=[first, second], threads=2)
+    assert third == [2, 3]
+
+
+def test_allocate_released_cpus_reused() -> None:
+    assert affinity.allocate(nodes=nodes, allocations=[[4, 5]], threads=2) == [0, 1]
+
+
+def test_allocate_whole_node() -> None:
+    assert affinity.allocate(nodes=nodes, allocations=[[0]], threads=None) == [
+        4,
+        5,
+        6,
+        7,
+    ]
+
+
+def test_allocate_spills_over() -> None:
+    assert affinity.allocate(nodes=nodes, allocations=[[4]], threads=6) == [
+        0,
+        1,
+        2,
+        3,
+        5,
+        6,
+    ]
+
+
+@pytest.mark.skipif(
+    not hasattr(os, "sched_setaffinity"), reason="cpu affinity is not supported"
+)
+def test_pinner_pins_child_before_exec() -> None:
+    cpu = min(affinity.usable_cpus())
+
+    completed = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import os; print(sorted(os.sched_getaffinity(0)))",
+        ],
+        preexec_fn=affinity.pinner([cpu]),
+        stdout=subprocess.PIPE,
+        encoding="utf-8",
+        check=True,
+    )
+
+    assert completed.stdout.strip() == str([cpu])
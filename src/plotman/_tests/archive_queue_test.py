@@ -0,0 +1,161 @@
+import fcntl
+import os
+import pathlib
+import typing
+
+# TODO: migrate away from unittest patch
+from unittest.mock import patch
+
+import attr
+import pytest
+
+from plotman import archive, archive_queue, configuration, job, plot_util
+
+arch_cfg = configuration.Archiving(
+    target="test", rescan_s=3600, retry_backoff_s=300, max_retry_backoff_s=1000
+)
+
+
+def make_plot(d: pathlib.Path, name: str, mtime: float = 0) -> str:
+    d.mkdir(exist_ok=True)
+    path = d / f"plot-k32-{name}.plot"
+    with open(path, "wb") as f:
+        f.truncate(plot_util.get_plotsize(32))
+    os.utime(path, (mtime, mtime))
+    return str(path)
+
+
+@patch("plotman.job.Job")
+def job_to(pid: int, dstdir: str, MockJob: typing.Any) -> typing.Any:
+    j = MockJob()
+    j.proc.pid = pid
+    j.plotter.common_info.return_value.dstdir = dstdir
+    return j
+
+
+def test_queues_plots_of_ended_jobs(tmp_path: pathlib.Path) -> None:
+    d0, d1 = tmp_path / "d0", tmp_path / "d1"
+    first = make_plot(d0, "1")
+    d1.mkdir()
+    queue = archive_queue.ArchiveQueue.load(path=None, arch_cfg=arch_cfg)
+    jobs = [job_to(1, str(d0)), job_to(2, str(d1))]
+
+    assert queue.update([str(d0), str(d1)], jobs, set(), now=0) == [
+        "Queued 1 plots for archiving"
+    ]
+
+    second = make_plot(d0, "2")
+    elsewhere = make_plot(d1, "3")
+    queue.update([str(d0), str(d1)], jobs, set(), now=10)
+    assert list(queue.entries) == [first]
+
+    # Only the dst dir of the job that ended is scanned
+    queue.update([str(d0), str(d1)], jobs[1:], set(), now=20)
+    assert list(queue.entries) == [first, second]
+
+    queue.update([str(d0), str(d1)], jobs[1:], set(), now=3600)
+    assert list(queue.entries) == [first, second, elsewhere]
+
+
+def test_persists(tmp_path: pathlib.Path) -> None:
+    plot = make_plot(tmp_path / "d0", "1", mtime=5)
+    path = str(tmp_path / "queue.json")
+    queue = archive_queue.ArchiveQueue.load(path=path, arch_cfg=arch_cfg)
+    queue.update([str(tmp_path / "d0")], [], set(), now=0)
+    queue.started(plot, "/farm/a", now=10)
+
+    loaded = archive_queue.ArchiveQueue.load(path=path, arch_cfg=arch_cfg)
+
+    assert loaded.entries == {
+        plot: archive_queue.Entry(
+            path=plot,
+            dstdir=str(tmp_path / "d0"),
+            mtime=5,
+            in_flight=True,
+            started_at=10,
+            destination="/farm/a",
+        )
+    }
+
+
+def test_processes_sharing_the_state_file(tmp_path: pathlib.Path) -> None:
+    plot = make_plot(tmp_path / "d0", "1")
+    path = str(tmp_path / "queue.json")
+    archiving = archive_queue.ArchiveQueue.load(path=path, arch_cfg=arch_cfg)
+    interactive = archive_queue.ArchiveQueue.load(path=path, arch_cfg=arch_cfg)
+
+    archiving.update([str(tmp_path / "d0")], [], set(), now=0)
+    interactive.started(plot, "/farm/a", now=10)
+    archiving.update([str(tmp_path / "d0")], [], {plot}, now=20)
+
+    loaded = archive_queue.ArchiveQueue.load(path=path, arch_cfg=arch_cfg)
+    assert loaded.entries[plot].in_flight
+    assert loaded.entries[plot].destination == "/farm/a"
+    # No temporary files are left behind
+    assert sorted(os.listdir(tmp_path)) == ["d0", "queue.json", "queue.json.lock"]
+
+
+def test_locked_excludes_others(tmp_path: pathlib.Path) -> None:
+    path = str(tmp_path / "queue.json")
+    queue = archive_queue.ArchiveQueue.load(path=path, arch_cfg=arch_cfg)
+
+    with queue.locked(), open(path + ".lock") as other:
+        with pytest.raises(BlockingIOError):
+            fcntl.flock(other, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    with open(path + ".lock") as other:
+        fcntl.flock(other, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+
+def test_settles_transfers(tmp_path: pathlib.Path) -> None:
+    d0 = tmp_path / "d0"
+    done = make_plot(d0, "1")
+    failing = make_plot(d0, "2")
+    queue = archive_queue.ArchiveQueue.load(path=None, arch_cfg=arch_cfg)
+    queue.update([str(d0)], [], set(), now=0)
+    queue.started(done, "/farm/a", now=0)
+    queue.started(failing, "/farm/b", now=0)
+    assert queue.heads(set(), now=0) == {}
+
+    # Not running yet, or still running
+    assert queue.update([str(d0)], [], {failing}, now=30) == []
+    os.remove(done)
+    assert queue.update([str(d0)], [], {failing}, now=100) == [
+        f"Archived {done} to /farm/a"
+    ]
+
+    assert queue.update([str(d0)], [], set(), now=100) == [
+        f"Transfer of {failing} to /farm/b failed 1 times, retrying in 300s"
+    ]
+    assert queue.heads(set(), now=399) == {}
+    assert list(queue.heads(set(), now=400)) == [str(d0)]
+    assert queue.summary() == "1 queued (1 retrying)"
+
+    for now in [1000, 2000]:
+        queue.started(failing, "/farm/b", now=now)
+        [message] = queue.update([str(d0)], [], set(), now=now + 100)
+    assert message.endswith("failed 3 times, retrying in 1000s")
+
+
+def test_choose_queued_plot(tmp_path: pathlib.Path) -> None:
+    old = make_plot(tmp_path / "d0", "1", mtime=10)
+    make_plot(tmp_path / "d0", "2", mtime=30)
+    new = make_plot(tmp_path / "d1", "3", mtime=20)
+    queue = archive_queue.ArchiveQueue.load(path=None, arch_cfg=arch_cfg)
+    queue.update([str(tmp_path / "d0"), str(tmp_path / "d1")], [], set(), now=0)
+    free = {str(tmp_path / "d0"): 100, str(tmp_path / "d1"): 50}
+
+    def choose(order: str, busy: typing.Set[str] = set()) -> typing.Optional[str]:
+        with patch("plotman.plot_util.df_b", side_effect=free.__getitem__):
+            return archive.choose_queued_plot(
+                attr.evolve(arch_cfg, queue_order=order),
+                job.JobIndex.of([]),
+                queue,
+                busy,
+            )
+
+    assert choose("oldest") == old
+    assert choose("oldest", busy={old}) == new
+    assert choose("fullest") == new
+    # More plots in d0
+    assert choose("priority") == old
@@ -1,7 +1,243 @@
-from plotman import archive, job
+import importlib.resources
+import os
+import pathlib
+import subprocess
+import typing
+
+# TODO: migrate away from unittest patch
+from unittest.mock import MagicMock, patch
+
+import pendulum
+import pytest
+import yaml
+
+from plotman import archive, archive_queue, configuration, job, plot_util
+from plotman import resources as plotman_resources
 
 
 def test_compute_priority() -> None:
     assert archive.compute_priority(
         job.Phase(major=3, minor=1), 1000, 10
     ) > archive.compute_priority(job.Phase(major=3, minor=6), 1000, 10)
+
+
+def test_compute_priority_avoids_copies() -> None:
+    assert archive.compute_priority(
+        job.Phase(major=3, minor=1), 1000, 10
+    ) > archive.compute_priority(job.Phase(major=3, minor=1), 1000, 10, copies=1)
+
+
+def make_plot(d: pathlib.Path, name: str) -> str:
+    path = d / f"plot-k32-{name}.plot"
+    with open(path, "wb") as f:
+        f.truncate(plot_util.get_plotsize(32))
+    return str(path)
+
+
+def arch_cfg(max_concurrent: int = 1) -> configuration.Archiving:
+    return configuration.Archiving(
+        target="test",
+        env={"site_root": "/farm"},
+        max_concurrent=max_concurrent,
+        target_definitions={
+            "test": configuration.ArchivingTarget(
+                transfer_process_name="rsync",
+                transfer_process_argument_prefix="{site_root}",
+                transfer_path="/bin/true",
+            ),
+        },
+    )
+
+
+archdir_freebytes = {
+    "/farm/a": 10 * plot_util.GB ** 2,
+    "/farm/b": 10 * plot_util.GB ** 2,
+}
+
+
+def test_archive_avoids_running_transfers(tmp_path: pathlib.Path) -> None:
+    plots = sorted([make_plot(tmp_path, "1"), make_plot(tmp_path, "2")])
+    dir_cfg = configuration.Directories(tmp=[str(tmp_path)])
+    transfers = [archive.Transfer(pid=1, source=plots[0], destination="/farm/a")]
+
+    with patch(
+        "plotman.archive.get_archdir_freebytes", return_value=(archdir_freebytes, [])
+    ), patch("plotman.plot_util.list_plots", return_value=plots):
+        should_start, args, _ = archive.archive(dir_cfg, arch_cfg(), [], transfers)
+
+    assert should_start
+    assert isinstance(args, dict)
+    env = typing.cast(typing.Dict[str, str], args["env"])
+    assert env["source"] == plots[1]
+    assert env["destination"] == "/farm/b"
+
+
+def test_spawn_archive_process_concurrent(tmp_path: pathlib.Path) -> None:
+    (tmp_path / "plots").mkdir()
+    plots = [make_plot(tmp_path / "plots", name) for name in "123"]
+    dir_cfg = configuration.Directories(tmp=[str(tmp_path / "plots")])
+    log_cfg = configuration.Logging(transfers=str(tmp_path))
+
+    with patch("plotman.archive.get_running_transfers", return_value=[]), patch(
+        "plotman.archive.get_archdir_freebytes", return_value=(archdir_freebytes, [])
+    ), patch("plotman.plot_util.list_plots", return_value=plots), patch(
+        "pendulum.now", side_effect=[pendulum.datetime(2021, 1, 1, i) for i in range(3)]
+    ), patch(
+        "subprocess.Popen"
+    ) as popen:
+        status, _ = archive.spawn_archive_process(dir_cfg, arch_cfg(3), log_cfg, [])
+
+    # Only two archive dirs to write to
+    assert [call.kwargs["env"]["source"] for call in popen.call_args_list] == plots[:2]
+    assert status == "pid: <pending> %s -> /farm/a, <pending> %s -> /farm/b" % (
+        os.path.basename(plots[0]),
+        os.path.basename(plots[1]),
+    )
+
+
+def mock_process(
+    pid: int, ppid: int, name: str, cmdline: typing.List[str]
+) -> typing.Any:
+    proc = MagicMock()
+    proc.pid = pid
+    proc.ppid.return_value = ppid
+    proc.name.return_value = name
+    proc.cmdline.return_value = cmdline
+    proc.environ.return_value = {
+        "source": "/d/plot-k32-1.plot",
+        "destination": "/farm/a",
+    }
+    proc.create_time.return_value = 1000.0
+    return proc
+
+
+def test_get_running_transfers() -> None:
+    processes = [
+        mock_process(10, 1, "bash", ["bash", "/farm/a"]),
+        mock_process(11, 10, "rsync", ["rsync", "/d/plot-k32-1.plot", "/farm/a/"]),
+        # The sender and receiver of a local rsync
+        mock_process(12, 11, "rsync", ["rsync", "/d/plot-k32-1.plot", "/farm/a/"]),
+        mock_process(13, 11, "rsync", ["rsync", "/d/plot-k32-1.plot", "/farm/a/"]),
+        mock_process(20, 1, "rsync", ["rsync", "/d/plot-k32-2.plot", "/elsewhere/"]),
+    ]
+
+    with patch("psutil.process_iter", return_value=processes):
+        transfers = archive.get_running_transfers(arch_cfg())
+
+    assert transfers == [
+        archive.Transfer(
+            pid=11,
+            source="/d/plot-k32-1.plot",
+            destination="/farm/a",
+            start_time=1000.0,
+        )
+    ]
+
+
+def test_disk_space() -> None:
+    now = [100.0]
+    disk_space = archive.DiskSpace(
+        arch_cfg=arch_cfg(), refresh_s=60, clock=lambda: now[0]
+    )
+
+    assert disk_space.get() == ({}, None, [])
+
+    with patch(
+        "plotman.archive.get_archdir_freebytes",
+        return_value=({"/farm/a": 1000, "/farm/b": 1000}, ["bad line"]),
+    ):
+        disk_space.check()
+    now[0] = 110.0
+    disk_space.transfer_started("/farm/a", 300)
+
+    assert disk_space.get() == (
+        {"/farm/a": 700, "/farm/b": 1000},
+        10.0,
+        ["bad line"],
+    )
+    assert disk_space.get()[2] == []
+
+    # The next check sees the space taken by the transfer
+    now[0] = 120.0
+    with patch(
+        "plotman.archive.get_archdir_freebytes",
+        return_value=({"/farm/a": 700, "/farm/b": 1000}, []),
+    ):
+        disk_space.check()
+    assert disk_space.get()[0] == {"/farm/a": 700, "/farm/b": 1000}
+
+
+def test_archive_waits_for_disk_space(tmp_path: pathlib.Path) -> None:
+    plots = [make_plot(tmp_path, "1")]
+    dir_cfg = configuration.Directories(tmp=[str(tmp_path)])
+    disk_space = archive.DiskSpace(arch_cfg=arch_cfg(), refresh_s=60)
+
+    with patch("plotman.plot_util.list_plots", return_value=plots), patch(
+        "plotman.archive.get_archdir_freebytes"
+    ) as get_archdir_freebytes:
+        should_start, reason, _ = archive.archive(
+            dir_cfg, arch_cfg(), [], disk_space=disk_space
+        )
+
+    assert not should_start
+    assert reason == "Waiting for the archive disk space check"
+    get_archdir_freebytes.assert_not_called()
+
+
+def test_archive_resumes_at_previous_destination(tmp_path: pathlib.Path) -> None:
+    plot = make_plot(tmp_path, "1")
+    dir_cfg = configuration.Directories(tmp=[str(tmp_path)])
+    queue = archive_queue.ArchiveQueue(path=None, arch_cfg=arch_cfg())
+    queue.entries[plot] = archive_queue.Entry(
+        path=plot, dstdir=str(tmp_path), mtime=0, attempts=1, destination="/farm/b"
+    )
+
+    with patch(
+        "plotman.archive.get_archdir_freebytes", return_value=(archdir_freebytes, [])
+    ), patch("plotman.plot_util.df_b", return_value=plot_util.GB):
+        should_start, args, _ = archive.archive(dir_cfg, arch_cfg(), [], queue=queue)
+
+    assert should_start
+    assert isinstance(args, dict)
+    env = typing.cast(typing.Dict[str, str], args["env"])
+    assert env["source"] == plot
+    assert env["destination"] == "/farm/b"
+
+
+@pytest.mark.parametrize(argnames=["partial"], argvalues=[[False], [True]])
+def test_rsyncd_resumes_only_partial_transfers(
+    tmp_path: pathlib.Path, partial: bool
+) -> None:
+    definition = yaml.safe_load(
+        importlib.resources.read_text(plotman_resources, "target_definitions.yaml")
+    )["target_definitions"]["rsyncd"]
+    # Stands in for rsync, finding a partial transfer when asked to list one
+    # if there is one and otherwise recording the transfer arguments.
+    rsync = tmp_path / "rsync"
+    rsync.write_text(
+        "#!/bin/bash\n"
+        'if [ "$1" = --list-only ]; then\n'
+        f"  exit {0 if partial else 23}\n"
+        "fi\n"
+        f'echo "$@" > {tmp_path / "args"}\n'
+    )
+    rsync.chmod(0o755)
+    env = {
+        **os.environ,
+        **{key: str(value) for key, value in definition["env"].items()},
+        "command": str(rsync),
+        "user": "u",
+        "host": "h",
+        "site_root": "/farm",
+        "site": "s",
+        "source": "/d/plot-k32-1.plot",
+        "destination": "/farm/a",
+    }
+
+    subprocess.run(["bash", "-c", definition["transfer_script"]], env=env, check=True)
+
+    args = (tmp_path / "args").read_text().split()
+    assert "--partial-dir=.plotman-partial" in args
+    assert ("--no-whole-file" in args) == partial
+    assert ("--whole-file" in args) != partial
+    assert args[-2:] == ["/d/plot-k32-1.plot", "rsync://u@h:873/s/a/"]
@@ -0,0 +1,120 @@
+import typing
+
+# TODO: migrate away from unittest patch
+from unittest.mock import patch
+
+from plotman import backpressure, configuration, diskstats, job
+
+config = configuration.Backpressure(
+    high_utilization=90, low_utilization=50, sustain_s=60, max_suspend_s=600
+)
+
+
+@patch("plotman.job.Job")
+def job_w_tmpdir_phase(
+    pid: int, tmpdir: str, phase: job.Phase, MockJob: typing.Any
+) -> typing.Any:
+    j = MockJob()
+    j.proc.pid = pid
+    j.progress.return_value = phase
+    j.get_run_status.return_value = "RUN"
+    j.plotter.common_info.return_value.tmpdir = tmpdir
+    return j
+
+
+def busy(percent: float) -> typing.Dict[str, diskstats.Utilization]:
+    return {"sda": diskstats.Utilization(busy_percent=percent)}
+
+
+def device_for_tmpdir(tmpdir: str) -> typing.Optional[str]:
+    return {"/t1": "sda", "/t2": "sdb"}.get(tmpdir)
+
+
+def test_suspends_least_progressed_after_sustained_saturation() -> None:
+    jobs = [
+        job_w_tmpdir_phase(1, "/t1", job.Phase(1, 5)),
+        job_w_tmpdir_phase(2, "/t1", job.Phase(1, 2)),
+        job_w_tmpdir_phase(3, "/t2", job.Phase(1, 1)),
+    ]
+    controller = backpressure.Controller(config=config)
+
+    assert controller.update(jobs, device_for_tmpdir, now=0, utilization=busy(95)) == []
+    assert (
+        controller.update(jobs, device_for_tmpdir, now=30, utilization=busy(95)) == []
+    )
+    assert controller.update(jobs, device_for_tmpdir, now=60, utilization=busy(95))
+
+    jobs[1].suspend.assert_called_once()
+    jobs[0].suspend.assert_not_called()
+    jobs[2].suspend.assert_not_called()
+    assert list(controller.suspended) == [2]
+
+
+def test_never_suspends_last_running_job() -> None:
+    jobs = [
+        job_w_tmpdir_phase(1, "/t1", job.Phase(1, 5)),
+        job_w_tmpdir_phase(2, "/t1", job.Phase(1, 2)),
+    ]
+    controller = backpressure.Controller(config=config)
+
+    for now in range(0, 600, 60):
+        controller.update(jobs, device_for_tmpdir, now=now, utilization=busy(100))
+
+    assert list(controller.suspended) == [2]
+    jobs[0].suspend.assert_not_called()
+
+
+def test_resumes_after_sustained_relief() -> None:
+    jobs = [
+        job_w_tmpdir_phase(1, "/t1", job.Phase(1, 5)),
+        job_w_tmpdir_phase(2, "/t1", job.Phase(1, 2)),
+    ]
+    controller = backpressure.Controller(config=config)
+    controller.update(jobs, device_for_tmpdir, now=0, utilization=busy(95))
+    controller.update(jobs, device_for_tmpdir, now=60, utilization=busy(95))
+    assert list(controller.suspended) == [2]
+
+    # Between the thresholds nothing changes
+    controller.update(jobs, device_for_tmpdir, now=120, utilization=busy(70))
+    controller.update(jobs, device_for_tmpdir, now=180, utilization=busy(40))
+    controller.update(jobs, device_for_tmpdir, now=220, utilization=busy(40))
+    jobs[1].resume.assert_not_called()
+
+    controller.update(jobs, device_for_tmpdir, now=240, utilization=busy(40))
+    jobs[1].resume.assert_called_once()
+    assert controller.suspended == {}
+
+
+def test_resumes_at_suspension_cap_and_exempts() -> None:
+    jobs = [
+        job_w_tmpdir_phase(1, "/t1", job.Phase(1, 5)),
+        job_w_tmpdir_phase(2, "/t1", job.Phase(1, 2)),
+        job_w_tmpdir_phase(3, "/t1", job.Phase(1, 3)),
+    ]
+    controller = backpressure.Controller(config=config)
+    controller.update(jobs, device_for_tmpdir, now=0, utilization=busy(95))
+    controller.update(jobs, device_for_tmpdir, now=60, utilization=busy(95))
+    assert list(controller.suspended) == [2]
+
+    controller.update(jobs, device_for_tmpdir, now=660, utilization=busy(95))
+
+    jobs[1].resume.assert_called_once()
+    # The next least progressed job is suspended instead
+    assert list(controller.suspended) == [3]
+    assert 2 in controller.exempt_until
+
+
+def test_ignores_jobs_stopped_by_hand() -> None:
+    jobs = [
+        job_w_tmpdir_phase(1, "/t1", job.Phase(1, 5)),
+        job_w_tmpdir_phase(2, "/t1", job.Phase(1, 2)),
+    ]
+    jobs[1].get_run_status.return_value = "STP"
+    controller = backpressure.Controller(config=config)
+
+    controller.update(jobs, device_for_tmpdir, now=0, utilization=busy(95))
+    controller.update(jobs, device_for_tmpdir, now=60, utilization=busy(95))
+
+    assert controller.suspended == {}
+    assert controller.resume_all(jobs) == []
+    jobs[1].resume.assert_not_called()
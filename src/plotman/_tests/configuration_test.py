@@ -90,6 +90,34 @@ def test_loads_without_user_archiving(
     assert reloaded_yaml.archiving is None
 
 
+def test_loads_tuning(config_text: str, target_definitions_text: str) -> None:
+    loaded_yaml = yaml.load(config_text, Loader=yaml.SafeLoader)
+
+    loaded_yaml["plotting"]["tuning"] = {
+        "threads": [2, 4],
+        "tmpdir_classes": {"nvme": ["/mnt/tmp/00"]},
+    }
+
+    reloaded_yaml = configuration.get_validated_configs(
+        yaml.dump(loaded_yaml, Dumper=yaml.SafeDumper), "", target_definitions_text
+    )
+
+    assert reloaded_yaml.plotting.tuning == configuration.Tuning(
+        threads=[2, 4], tmpdir_classes={"nvme": ["/mnt/tmp/00"]}
+    )
+
+    loaded_yaml["plotting"]["type"] = "bladebit"
+
+    with pytest.raises(configuration.ConfigurationException) as exc_info:
+        configuration.get_validated_configs(
+            yaml.dump(loaded_yaml, Dumper=yaml.SafeDumper), "", target_definitions_text
+        )
+
+    assert exc_info.value.args[0] == (
+        "plotting: tuning: is only supported for the chia and madmax plotters"
+    )
+
+
 def test_get_dst_directories_gets_dst() -> None:
     tmp = ["/tmp"]
     dst = ["/dst0", "/dst1"]
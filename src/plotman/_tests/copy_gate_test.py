@@ -0,0 +1,88 @@
+import typing
+
+# TODO: migrate away from unittest patch
+from unittest.mock import patch
+
+from plotman import copy_gate
+
+
+@patch("plotman.job.Job")
+def job_w_dstdir(
+    pid: int, dstdir: str, copying: bool, MockJob: typing.Any
+) -> typing.Any:
+    j = MockJob()
+    j.proc.pid = pid
+    j.get_run_status.return_value = "RUN"
+    j.plotter.common_info.return_value.dstdir = dstdir
+    j.plotter.common_info.return_value.copying = copying
+    return j
+
+
+def device_for_path(d: str) -> typing.Optional[str]:
+    return {"/d1": "sda", "/d2": "sda", "/d3": "sdb"}.get(d)
+
+
+def test_holds_copies_beyond_limit_per_device() -> None:
+    gate = copy_gate.CopyGate(max_copies=1)
+    first = job_w_dstdir(1, "/d1", True)
+    second = job_w_dstdir(2, "/d2", False)
+    other_device = job_w_dstdir(3, "/d3", True)
+    jobs = [first, second, other_device]
+
+    assert gate.update(jobs, device_for_path, now=0) == []
+
+    second.plotter.common_info.return_value.copying = True
+    assert len(gate.update(jobs, device_for_path, now=10)) == 1
+
+    second.suspend.assert_called_once()
+    first.suspend.assert_not_called()
+    other_device.suspend.assert_not_called()
+    assert gate.held == {2}
+
+    # Held jobs are not held again.
+    assert gate.update(jobs, device_for_path, now=20) == []
+
+    first.plotter.common_info.return_value.copying = False
+    assert len(gate.update(jobs, device_for_path, now=30)) == 1
+
+    second.resume.assert_called_once()
+    assert gate.held == set()
+
+
+def test_resumes_in_order_of_reaching_copy() -> None:
+    gate = copy_gate.CopyGate(max_copies=1)
+    jobs = [job_w_dstdir(pid, "/d1", True) for pid in [1, 2, 3]]
+    gate.update(jobs[:1], device_for_path, now=0)
+    gate.update(jobs[:2], device_for_path, now=10)
+    gate.update(jobs[::-1], device_for_path, now=20)
+    assert gate.held == {2, 3}
+
+    gate.update(jobs[1:], device_for_path, now=30)
+
+    jobs[1].resume.assert_called_once()
+    jobs[2].resume.assert_not_called()
+    assert gate.held == {3}
+
+
+def test_jobs_stopped_by_hand_are_not_counted() -> None:
+    gate = copy_gate.CopyGate(max_copies=1)
+    stopped = job_w_dstdir(1, "/d1", True)
+    stopped.get_run_status.return_value = "STP"
+    copying = job_w_dstdir(2, "/d1", True)
+
+    assert gate.update([stopped, copying], device_for_path, now=0) == []
+
+    stopped.resume.assert_not_called()
+    copying.suspend.assert_not_called()
+
+
+def test_resume_all() -> None:
+    gate = copy_gate.CopyGate(max_copies=1)
+    jobs = [job_w_dstdir(pid, "/d1", True) for pid in [1, 2]]
+    gate.update(jobs, device_for_path, now=0)
+
+    assert len(gate.resume_all(jobs)) == 1
+
+    jobs[1].resume.assert_called_once()
+    jobs[0].resume.assert_not_called()
+    assert gate.held == set()
@@ -0,0 +1,119 @@
+import pathlib
+import typing
+
+# TODO: migrate away from unittest patch
+from unittest.mock import patch
+
+import pytest
+
+from plotman import diskstats
+
+diskstats_text = """\
+ 259       0 nvme0n1 1480392 113 181012882 371180 5366441 3398567 701398136 9138064 0 2307408 9509244 0 0 0 0
+ 259       1 nvme0n1p1 1480254 113 181008194 371153 5366441 3398567 701398136 9138064 0 2307372 9509217 0 0 0 0
+   8       0 sda 21204 5014 2080436 11580 10 0 80 20 0 15928 11600
+   7       0 loop0
+"""
+
+
+def test_parse_diskstats() -> None:
+    stats = diskstats.parse_diskstats(diskstats_text)
+
+    assert sorted(stats) == ["nvme0n1", "nvme0n1p1", "sda"]
+    assert stats["nvme0n1"] == diskstats.DiskStats(
+        reads_completed=1480392,
+        sectors_read=181012882,
+        writes_completed=5366441,
+        sectors_written=701398136,
+        io_ticks_ms=2307408,
+    )
+    assert stats["sda"].io_ticks_ms == 15928
+
+
+def test_read_diskstats_missing(tmp_path: pathlib.Path) -> None:
+    assert diskstats.read_diskstats(str(tmp_path / "diskstats")) == {}
+
+
+def write_ticks(path: pathlib.Path, ticks: int) -> None:
+    path.write_text(f"   8       0 sda 0 0 0 0 0 0 0 0 0 {ticks} 0\n")
+
+
+def test_sampler_utilization(tmp_path: pathlib.Path) -> None:
+    path = tmp_path / "diskstats"
+    sampler = diskstats.Sampler(path=str(path))
+
+    write_ticks(path, 1000)
+    assert sampler.sample(now=100) == {}
+
+    write_ticks(path, 4000)
+    assert sampler.sample(now=104)["sda"].busy_percent == pytest.approx(75)
+
+    # Tick counts can run slightly ahead of wall time
+    write_ticks(path, 7000)
+    assert sampler.sample(now=106)["sda"].busy_percent == 100
+
+
+def test_sampler_rates(tmp_path: pathlib.Path) -> None:
+    path = tmp_path / "diskstats"
+    sampler = diskstats.Sampler(path=str(path))
+
+    path.write_text("   8       0 sda 100 0 2000 0 50 0 4000 0 0 0 0\n")
+    sampler.sample(now=100)
+    path.write_text("   8       0 sda 300 0 6000 0 250 0 44000 0 0 1000 0\n")
+    usage = sampler.sample(now=102)["sda"]
+
+    assert usage == diskstats.Utilization(
+        busy_percent=50,
+        read_bytes_per_s=2000 * diskstats.SECTOR_SIZE,
+        write_bytes_per_s=20000 * diskstats.SECTOR_SIZE,
+        read_iops=100,
+        write_iops=100,
+    )
+    assert usage.iops == 200
+
+
+def test_utilization_reuses_sample(tmp_path: pathlib.Path) -> None:
+    path = tmp_path / "diskstats"
+    sampler = diskstats.Sampler(path=str(path))
+    write_ticks(path, 1000)
+
+    with patch("plotman.diskstats._sampler", sampler), patch(
+        "plotman.diskstats._latest", {}
+    ), patch("plotman.diskstats._latest_time", None):
+        assert diskstats.utilization(now=100) == {}
+        # Sampled again right away after the baseline
+        write_ticks(path, 1100)
+        first = diskstats.utilization(now=100.5)
+        assert first["sda"].busy_percent == 20
+        write_ticks(path, 2000)
+        assert diskstats.utilization(now=101) is first
+        assert diskstats.utilization(now=100.5 + diskstats.SAMPLE_TTL_S) is not first
+
+
+def test_sampler_skips_wrapped_counters(tmp_path: pathlib.Path) -> None:
+    path = tmp_path / "diskstats"
+    sampler = diskstats.Sampler(path=str(path))
+
+    path.write_text(
+        "   8       0 sda 100 0 2000 0 50 0 4294967000 0 0 1000 0\n"
+        "   8      16 sdb 100 0 2000 0 50 0 4000 0 0 1000 0\n"
+    )
+    sampler.sample(now=100)
+    path.write_text(
+        "   8       0 sda 300 0 6000 0 250 0 1000 0 0 2000 0\n"
+        "   8      16 sdb 300 0 6000 0 250 0 44000 0 0 2000 0\n"
+    )
+
+    assert list(sampler.sample(now=102)) == ["sdb"]
+
+
+def test_wait_for_interval() -> None:
+    sleeps: typing.List[float] = []
+
+    with patch("plotman.diskstats._latest", {}), patch(
+        "plotman.diskstats._latest_time", 100
+    ):
+        diskstats.wait_for_interval(now=100.25, sleep=sleeps.append)
+        diskstats.wait_for_interval(now=101.5, sleep=sleeps.append)
+
+    assert sleeps == [pytest.approx(diskstats.MIN_INTERVAL_S - 0.25)]
@@ -0,0 +1,108 @@
+import pathlib
+import threading
+import typing
+import urllib.error
+import urllib.request
+
+# TODO: migrate away from unittest patch
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from plotman import archive_queue, configuration, exporter
+
+sched_cfg = configuration.Scheduling(
+    global_max_jobs=10,
+    global_stagger_m=0,
+    polling_time_s=20,
+    tmpdir_max_jobs=1,
+    tmpdir_stagger_phase_major=2,
+    tmpdir_stagger_phase_minor=0,
+)
+
+
+def make_cfg(tmp_path: pathlib.Path) -> configuration.PlotmanConfig:
+    (tmp_path / "tmp").mkdir()
+    (tmp_path / "dst").mkdir()
+    return configuration.PlotmanConfig(
+        directories=configuration.Directories(
+            tmp=[str(tmp_path / "tmp")], dst=[str(tmp_path / "dst")]
+        ),
+        scheduling=sched_cfg,
+        plotting=configuration.Plotting(),
+        logging=configuration.Logging(plots=str(tmp_path)),
+    )
+
+
+def get(url: str) -> typing.Tuple[int, str]:
+    try:
+        with urllib.request.urlopen(url) as response:
+            return response.status, response.read().decode()
+    except urllib.error.HTTPError as e:
+        return e.code, ""
+
+
+def test_serves_collected_metrics(tmp_path: pathlib.Path) -> None:
+    collector = exporter.Collector(cfg=make_cfg(tmp_path), refresh_s=15)
+    with patch("plotman.job.Job.get_running_jobs", return_value=[]) as get_jobs:
+        collector.collect()
+
+    server = exporter.Server(collector, ("127.0.0.1", 0))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        status, first = get(f"{url}/metrics")
+        _, second = get(f"{url}/metrics")
+        not_found, _ = get(f"{url}/other")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert status == 200
+    assert not_found == 404
+    assert get_jobs.call_count == 1
+    assert "# TYPE plotman_plot_phase_major gauge" in first
+    assert f'plotman_dir_plots{{dir="{tmp_path / "dst"}",use="dst"}} 0' in first
+    assert f'plotman_dir_free_bytes{{dir="{tmp_path / "tmp"}",use="tmp"}}' in first
+    assert "plotman_exporter_collections_total{} 1" in first
+    assert "# TYPE plotman_exporter_scrapes_total counter" in first
+    assert "plotman_exporter_scrapes_total{} 1" in first
+    assert "plotman_exporter_scrapes_total{} 2" in second
+    assert "plotman_exporter_scrape_seconds_total{} 0\n" not in second
+
+
+def test_collect_reuses_jobs(tmp_path: pathlib.Path) -> None:
+    collector = exporter.Collector(cfg=make_cfg(tmp_path), refresh_s=15)
+    j = MagicMock()
+
+    with patch("plotman.job.Job.get_running_jobs", return_value=[j]) as get_jobs, patch(
+        "plotman.reporting.prometheus_report", return_value=""
+    ):
+        collector.collect()
+        collector.collect()
+
+    # The cached jobs only parse what was added to their logs
+    assert get_jobs.call_args.kwargs["cached_jobs"] == [j]
+    assert collector.collections == 2
+
+
+def test_archive_metrics() -> None:
+    queue = archive_queue.ArchiveQueue(path=None, arch_cfg=MagicMock())
+    for i, (attempts, in_flight) in enumerate([(0, False), (0, True), (2, False)]):
+        queue.entries[f"/d/plot-k32-{i}.plot"] = archive_queue.Entry(
+            path=f"/d/plot-k32-{i}.plot",
+            dstdir="/d",
+            mtime=0,
+            attempts=attempts,
+            in_flight=in_flight,
+        )
+
+    lines = exporter.archive_metrics([], {"/farm/a": 1000}, queue)
+
+    assert "plotman_archive_transfers{} 0" in lines
+    assert 'plotman_archive_dir_free_bytes{archive_dir="/farm/a"} 1000' in lines
+    assert [line for line in lines if line.startswith("plotman_archive_queue")] == [
+        'plotman_archive_queue_plots{state="queued"} 1',
+        'plotman_archive_queue_plots{state="retrying"} 1',
+        'plotman_archive_queue_plots{state="in_flight"} 1',
+    ]
@@ -0,0 +1,298 @@
+import contextlib
+import threading
+import typing
+
+# TODO: migrate away from unittest patch
+from unittest.mock import patch
+
+import attr
+import pytest
+
+from plotman import configuration, fleet, job, manager, plot_util
+
+plotting_cfg = configuration.Plotting()
+
+sched_cfg = configuration.Scheduling(
+    global_max_jobs=10,
+    global_stagger_m=0,
+    polling_time_s=20,
+    tmpdir_max_jobs=1,
+    tmpdir_stagger_phase_major=2,
+    tmpdir_stagger_phase_minor=0,
+)
+
+
+@patch("plotman.job.Job")
+def job_w_dirs(
+    plot_id: str, pid: int, tmpdir: str, dstdir: str, MockJob: typing.Any
+) -> typing.Any:
+    j = MockJob()
+    info = j.plotter.common_info.return_value
+    info.plot_id = plot_id
+    info.plot_size = 32
+    info.tmpdir = tmpdir
+    info.dstdir = dstdir
+    info.copying = False
+    info.final_plot_written = False
+    j.proc.pid = pid
+    j.progress.return_value = job.Phase(1, 0)
+    j.get_time_wall.return_value = 0
+    j.get_run_status.return_value = "RUN"
+    j.plot_id_prefix.return_value = plot_id[:8]
+    j.get_temp_files.return_value = set()
+    return j
+
+
+class FakeHost:
+    """The jobs of one host with a starter that makes fake jobs."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.jobs: typing.List[typing.Any] = []
+
+    def start(
+        self, placement: manager.Placement, jobs: typing.List[job.Job]
+    ) -> typing.Tuple[bool, str]:
+        n = len(self.jobs)
+        self.jobs.append(
+            job_w_dirs(
+                f"{self.name}{n:08d}", 1000 + n, placement.tmpdir, placement.dstdir
+            )
+        )
+        return (True, f"Starting plot job in {placement.tmpdir}")
+
+
+@contextlib.contextmanager
+def agents(
+    hosts: typing.List[FakeHost],
+    dst: typing.List[str],
+    freebytes: int = 100 * plot_util.get_plotsize(32),
+    token: typing.Optional[str] = None,
+) -> typing.Iterator[typing.List[configuration.AgentAddress]]:
+    servers = []
+    addresses = []
+    for host in hosts:
+        agent = fleet.Agent(
+            name=host.name,
+            dir_cfg=configuration.Directories(tmp=["/t0", "/t1"], dst=dst),
+            sched_cfg=sched_cfg,
+            plotting_cfg=plotting_cfg,
+            jobs=lambda host=host: list(host.jobs),  # type: ignore[misc]
+            start=host.start,
+            freebytes=lambda d: freebytes,
+            token=token,
+        )
+        server = fleet.Server(agent, ("127.0.0.1", 0))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        addresses.append(
+            configuration.AgentAddress(
+                name=host.name, host="127.0.0.1", port=server.server_address[1]
+            )
+        )
+    try:
+        yield addresses
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+
+
+def controller(
+    addresses: typing.List[configuration.AgentAddress],
+    dst_selection: str = "phase",
+    **kwargs: typing.Any,
+) -> fleet.Controller:
+    return fleet.Controller(
+        config=configuration.Controller(agents=addresses, **kwargs),
+        sched_cfg=attr.evolve(sched_cfg, dst_selection=dst_selection),
+        plot_size=plot_util.get_plotsize(32),
+    )
+
+
+def test_snapshot_round_trip() -> None:
+    host = FakeHost("a")
+    host.start(manager.Placement(tmpdir="/t0", dstdir="/d0"), [])
+    with agents([host], dst=["/d0"]) as addresses:
+        snapshots, errors = controller(addresses).snapshots()
+
+    assert errors == []
+    [snapshot] = snapshots.values()
+    assert snapshot.jobs == [
+        fleet.JobSnapshot(
+            plot_id="a00000000",
+            pid=1000,
+            tmpdir="/t0",
+            dstdir="/d0",
+            phase=job.Phase(1, 0),
+            time_wall=0,
+        )
+    ]
+    assert snapshot.placement == manager.Placement(tmpdir="/t1", dstdir="/d0")
+    assert fleet.AgentSnapshot.from_dict(snapshot.to_dict()) == snapshot
+
+
+def test_fleet_max_jobs_and_balancing() -> None:
+    hosts = [FakeHost("a"), FakeHost("b"), FakeHost("c")]
+    with agents(hosts, dst=["/d0", "/d1", "/d2"]) as addresses:
+        fleet_controller = controller(
+            addresses, dst_selection="capacity", global_max_jobs=5
+        )
+        results = [fleet_controller.maybe_start_new_plot() for _ in range(6)]
+
+    assert [started for started, _ in results] == [True] * 5 + [False]
+    assert results[-1][1] == "fleet max jobs (5)"
+    # Jobs go to the agents with the fewest jobs and spread over the dst dirs
+    # of each agent.
+    assert sorted(len(host.jobs) for host in hosts) == [1, 2, 2]
+    for host in hosts:
+        dstdirs = [j.plotter.common_info().dstdir for j in host.jobs]
+        assert len(set(dstdirs)) == len(dstdirs)
+
+
+def test_same_dst_path_on_other_agents_is_another_dir() -> None:
+    plot_size = plot_util.get_plotsize(32)
+    hosts = [FakeHost("a"), FakeHost("b")]
+    hosts[0].start(manager.Placement(tmpdir="/t0", dstdir="/d0"), [])
+    # Room for one more plot in each /d0
+    freebytes = 2 * plot_size + manager.DST_FREE_SPACE_MARGIN - 1
+    with agents(hosts, dst=["/d0"], freebytes=freebytes) as addresses:
+        started, _ = controller(addresses).maybe_start_new_plot()
+
+    assert started
+    assert [j.plotter.common_info().dstdir for j in hosts[1].jobs] == ["/d0"]
+
+
+def test_waits_while_no_agent_can_start() -> None:
+    hosts = [FakeHost("a"), FakeHost("b")]
+    with agents(hosts, dst=["/d0"]) as addresses:
+        fleet_controller = controller(addresses)
+        results = [fleet_controller.maybe_start_new_plot() for _ in range(5)]
+
+    # Each agent runs one job in each of its two tmp dirs.
+    assert [started for started, _ in results] == [True] * 4 + [False]
+    assert results[-1][1].startswith("no agent can start a job (a: no eligible")
+
+
+def test_fleet_stagger() -> None:
+    hosts = [FakeHost("a"), FakeHost("b")]
+    with agents(hosts, dst=["/d0"]) as addresses:
+        fleet_controller = controller(addresses, global_stagger_m=10)
+        assert fleet_controller.maybe_start_new_plot()[0]
+        assert fleet_controller.maybe_start_new_plot() == (
+            False,
+            "fleet stagger (0s/600s)",
+        )
+
+
+def test_no_dst_space_on_any_agent() -> None:
+    hosts = [FakeHost("a")]
+    with agents(hosts, dst=["/d0"], freebytes=0) as addresses:
+        assert controller(addresses).maybe_start_new_plot()[0] is False
+    assert hosts[0].jobs == []
+
+
+def test_unreachable_agent_is_skipped() -> None:
+    host = FakeHost("a")
+    with agents([host], dst=["/d0"]) as addresses:
+        addresses.append(
+            configuration.AgentAddress(name="gone", host="127.0.0.1", port=1)
+        )
+        fleet_controller = controller(addresses, timeout_s=1)
+        snapshots, errors = fleet_controller.snapshots()
+        started, _ = fleet_controller.maybe_start_new_plot()
+
+    assert list(snapshots) == ["a"]
+    assert len(errors) == 1 and errors[0].startswith("agent gone unreachable")
+    assert started
+
+
+def test_job_commands() -> None:
+    host = FakeHost("a")
+    host.start(manager.Placement(tmpdir="/t0", dstdir="/d0"), [])
+    host.start(manager.Placement(tmpdir="/t1", dstdir="/d0"), [])
+    with agents([host], dst=["/d0"]) as addresses:
+        fleet_controller = controller(addresses)
+        assert fleet_controller.command("a", "suspend", "a00000001") == (
+            "suspend a0000000"
+        )
+        fleet_controller.command("a", "resume", "a00000001")
+        fleet_controller.command("a", "kill", "a00000000")
+        with pytest.raises(fleet.FleetException, match="matched 2 jobs"):
+            fleet_controller.command("a", "kill", "a")
+        with pytest.raises(fleet.FleetException, match="no agent named"):
+            fleet_controller.command("b", "kill", "a")
+
+    host.jobs[1].suspend.assert_called_once()
+    host.jobs[1].resume.assert_called_once()
+    host.jobs[1].kill.assert_not_called()
+    host.jobs[0].kill.assert_called_once()
+
+
+def test_token_required() -> None:
+    with agents([FakeHost("a")], dst=["/d0"], token="secret") as addresses:
+        with pytest.raises(fleet.FleetException, match="invalid token"):
+            fleet.request(addresses[0], {"command": "snapshot"})
+        with pytest.raises(fleet.FleetException, match="unknown command"):
+            fleet.request(addresses[0], {"command": "reboot"}, token="secret")
+        response = fleet.request(addresses[0], {"command": "snapshot"}, token="secret")
+
+    assert response["snapshot"]["name"] == "a"
+
+
+def test_start_rechecks_requested_tmpdir() -> None:
+    host = FakeHost("a")
+    host.start(manager.Placement(tmpdir="/t0", dstdir="/d0"), [])
+    with agents([host], dst=["/d0"]) as addresses:
+        with pytest.raises(fleet.FleetException, match="'/t0' can not take another"):
+            fleet.request(
+                addresses[0], {"command": "start", "tmpdir": "/t0", "dstdir": "/d0"}
+            )
+        fleet.request(
+            addresses[0], {"command": "start", "tmpdir": "/t1", "dstdir": "/d0"}
+        )
+
+    assert [j.plotter.common_info().tmpdir for j in host.jobs] == ["/t0", "/t1"]
+
+
+def test_request_length_limit() -> None:
+    with agents([FakeHost("a")], dst=["/d0"]) as addresses:
+        with pytest.raises(fleet.FleetException, match="malformed request"):
+            fleet.request(
+                addresses[0],
+                {"command": "snapshot", "padding": "x" * fleet.MAX_REQUEST_BYTES},
+            )
+
+
+@pytest.mark.parametrize(
+    argnames=["host", "token", "allowed"],
+    argvalues=[
+        ("127.0.0.1", None, True),
+        ("localhost", None, True),
+        ("::1", None, True),
+        ("0.0.0.0", None, False),
+        ("plotter1", None, False),
+        ("0.0.0.0", "secret", True),
+    ],
+)
+def test_non_loopback_requires_token(
+    host: str, token: typing.Optional[str], allowed: bool
+) -> None:
+    agent = fleet.Agent(
+        name="a",
+        dir_cfg=configuration.Directories(tmp=["/t0"]),
+        sched_cfg=sched_cfg,
+        plotting_cfg=plotting_cfg,
+        jobs=list,
+        start=FakeHost("a").start,
+        token=token,
+    )
+    # Fail before binding so that the address need not exist here
+    with patch("socketserver.TCPServer.__init__") as init:
+        if allowed:
+            fleet.Server(agent, (host, 0))
+            init.assert_called_once()
+        else:
+            with pytest.raises(fleet.FleetException, match="without a token"):
+                fleet.Server(agent, (host, 0))
+            init.assert_not_called()
@@ -0,0 +1,105 @@
+import importlib.resources
+import json
+import pathlib
+
+# TODO: migrate away from unittest patch
+from unittest.mock import patch
+
+from plotman import history
+import plotman.plot_util
+import plotman._tests.resources
+
+
+def test_completed_logs_incremental(tmp_path: pathlib.Path) -> None:
+    log_bytes = importlib.resources.read_binary(
+        package=plotman._tests.resources,
+        resource="madmax.plot.log",
+    )
+    log_path = tmp_path.joinpath("2021-07-14T21_56_00.000000-04_00.plot.log")
+    half = len(log_bytes) // 2
+
+    log_path.write_bytes(log_bytes[:half])
+    completed_logs = history.CompletedLogs(directory=str(tmp_path))
+    assert completed_logs.update() == []
+    assert completed_logs.in_progress[str(log_path)].offset == half
+
+    with log_path.open("ab") as file:
+        file.write(log_bytes[half:])
+    [info] = completed_logs.update()
+
+    assert info.completed
+    assert info.tmpdir == "/farm/yards/902/"
+    assert info.total_time_raw == 4968.41
+    assert completed_logs.in_progress == {}
+    assert completed_logs.update() == []
+    assert completed_logs.recent() == [info]
+
+
+def test_completed_logs_stats(tmp_path: pathlib.Path) -> None:
+    log_bytes = importlib.resources.read_binary(
+        package=plotman._tests.resources,
+        resource="madmax.plot.log",
+    )
+    log_path = tmp_path.joinpath("2021-07-14T21_56_00.000000-04_00.plot.log")
+    log_path.write_bytes(log_bytes)
+    completed_logs = history.CompletedLogs(directory=str(tmp_path))
+    [info] = completed_logs.update()
+    completed_logs.update()
+
+    stats = completed_logs.stats
+    labels = ("madmax", "/farm/yards/902/", info.dstdir)
+    assert stats.plots == {labels: 1}
+    assert stats.plot_bytes == {labels: plotman.plot_util.get_plotsize(32)}
+    assert stats.total[labels].count == 1
+    assert stats.total[labels].sum == 4968.41
+    assert sorted(phase for _, phase in stats.phases) == [1, 2, 3, 4]
+    assert stats.phases[labels, 1].sum == info.phase1_duration_raw
+
+
+def test_persisted_completion_stats(tmp_path: pathlib.Path) -> None:
+    logs = tmp_path.joinpath("logs")
+    logs.mkdir()
+    log_bytes = importlib.resources.read_binary(
+        package=plotman._tests.resources,
+        resource="madmax.plot.log",
+    )
+    log_path = logs.joinpath("2021-07-14T21_56_00.000000-04_00.plot.log")
+    log_path.write_bytes(log_bytes)
+    state_path = str(tmp_path.joinpath("completion_stats.json"))
+
+    stats = history.persisted_completion_stats(str(logs), state_path)
+    assert sum(stats.plots.values()) == 1
+
+    # Counted logs are not parsed again by later runs
+    with patch("plotman.history.CompletedLogs._update_log") as update_log:
+        assert history.persisted_completion_stats(str(logs), state_path) == stats
+    update_log.assert_not_called()
+
+    # Nor counted again once they are removed
+    log_path.unlink()
+    assert history.persisted_completion_stats(str(logs), state_path) == stats
+    with open(state_path) as f:
+        assert json.load(f)["counted"] == []
+
+
+def test_completed_logs_keeps_most_recent(tmp_path: pathlib.Path) -> None:
+    for resource in ["madmax.plot.log", "chianetwork.plot.log"]:
+        tmp_path.joinpath(resource).write_bytes(
+            importlib.resources.read_binary(
+                package=plotman._tests.resources, resource=resource
+            )
+        )
+    completed_logs = history.CompletedLogs(directory=str(tmp_path), kept=1)
+
+    assert len(completed_logs.update()) == 2
+
+    [info] = completed_logs.recent()
+    assert info.type == "chia"
+    assert completed_logs.counted == {str(tmp_path.joinpath("madmax.plot.log"))}
+    assert sum(completed_logs.stats.plots.values()) == 2
+    # Dropped infos are not read again
+    assert completed_logs.update() == []
+
+    tmp_path.joinpath("madmax.plot.log").unlink()
+    completed_logs.update()
+    assert completed_logs.counted == set()
@@ -0,0 +1,150 @@
+import pathlib
+import typing
+
+# TODO: migrate away from unittest patch
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from plotman import job
+
+
+@pytest.fixture(autouse=True)
+def io_histories() -> typing.Iterator[typing.Dict[int, job.IoHistory]]:
+    with patch.dict(job._io_histories, clear=True):
+        yield job._io_histories
+
+
+def make_proc(pid: int = 11, create_time: float = 1.0) -> typing.Any:
+    proc = MagicMock()
+    proc.pid = pid
+    proc.create_time.return_value = create_time
+    proc.open_files.return_value = []
+    return proc
+
+
+def make_job(proc: typing.Any = None) -> typing.Any:
+    plotter = MagicMock()
+    plotter.common_info.return_value.tmpdir = "/nonexistent"
+    return job.Job(
+        proc=make_proc() if proc is None else proc,
+        plotter=plotter,
+        logroot="/var/log/plotman",
+    )
+
+
+def sample(
+    j: typing.Any, now: float, phase: job.Phase, read_bytes: int, write_bytes: int
+) -> None:
+    j.proc.io_counters.return_value = MagicMock(
+        read_bytes=read_bytes, write_bytes=write_bytes
+    )
+    j.plotter.common_info.return_value.phase = phase
+    j.update_io(now=now)
+
+
+def test_update_io_rates_and_phases() -> None:
+    j = make_job()
+    assert j.io_by_phase() == []
+
+    sample(j, now=100, phase=job.Phase(1, 1), read_bytes=1000, write_bytes=5000)
+    assert (j.io.read_rate, j.io.write_rate) == (None, None)
+    assert j.io_by_phase() == []
+    assert "read_rate" not in j.to_dict()
+    assert "io_by_phase" not in j.to_dict()
+    assert j.to_dict()["write_bytes"] == 5000
+
+    sample(j, now=110, phase=job.Phase(1, 1), read_bytes=3000, write_bytes=45000)
+    assert (j.io.read_rate, j.io.write_rate) == (200, 4000)
+
+    sample(j, now=120, phase=job.Phase(2, 1), read_bytes=3000, write_bytes=85000)
+    # Too soon after the previous sample to measure the rates again
+    sample(j, now=121, phase=job.Phase(2, 1), read_bytes=3500, write_bytes=86000)
+    assert (j.io.read_rate, j.io.write_rate) == (0, 4000)
+    sample(j, now=125, phase=job.Phase(2, 1), read_bytes=4000, write_bytes=90000)
+
+    assert (j.io.read_rate, j.io.write_rate) == (200, 1000)
+    assert j.io_by_phase() == [
+        job.PhaseIo(phase=job.Phase(1, 1), read_bytes=2000, write_bytes=80000),
+        job.PhaseIo(phase=job.Phase(2, 1), read_bytes=1000, write_bytes=5000),
+    ]
+    assert j.to_dict()["read_rate"] == 200
+    assert j.to_dict()["io_by_phase"] == [
+        {"phase": "1:1", "read_bytes": 2000, "write_bytes": 80000},
+        {"phase": "2:1", "read_bytes": 1000, "write_bytes": 5000},
+    ]
+
+
+def test_update_io_survives_rebuilding_jobs() -> None:
+    proc = make_proc()
+    sample(make_job(proc), now=100, phase=job.Phase(1, 1), read_bytes=0, write_bytes=0)
+
+    rebuilt = make_job(proc)
+    sample(rebuilt, now=110, phase=job.Phase(1, 2), read_bytes=0, write_bytes=1000)
+
+    assert rebuilt.io.write_rate == 100
+    assert [phase_io.phase for phase_io in rebuilt.io_by_phase()] == [
+        job.Phase(1, 1),
+        job.Phase(1, 2),
+    ]
+
+
+def test_update_io_reused_pid() -> None:
+    sample(make_job(), now=100, phase=job.Phase(1, 1), read_bytes=0, write_bytes=0)
+
+    reused = make_job(make_proc(create_time=2.0))
+    sample(reused, now=110, phase=job.Phase(1, 1), read_bytes=0, write_bytes=1000)
+
+    assert reused.io.write_rate is None
+
+
+def test_update_io_unsupported() -> None:
+    j = make_job()
+    del j.proc.io_counters
+
+    j.update_io(now=100)
+
+    assert j.io.sample is None
+    assert j.io_by_phase() == []
+
+
+def test_kill_removes_temp_files(tmp_path: pathlib.Path) -> None:
+    j = make_job()
+    info = j.plotter.common_info.return_value
+    info.tmpdir = str(tmp_path)
+    info.tmp2dir = str(tmp_path)
+    info.dstdir = str(tmp_path)
+    info.plot_id = "1fc7b57b"
+    temp_file = tmp_path / "plot-k32-2021-08-29-22-22-1fc7b57b.plot.2.tmp"
+    temp_file.touch()
+    other = tmp_path / "plot-k32-2021-08-29-22-22-2a.plot.2.tmp"
+    other.touch()
+
+    assert j.kill() == {str(temp_file)}
+
+    assert [name for name, _, _ in j.proc.mock_calls[-3:]] == [
+        "suspend",
+        "resume",
+        "terminate",
+    ]
+    assert not temp_file.exists()
+    assert other.exists()
+
+
+def test_get_running_jobs_parses_cached_logs_before_sampling(
+    io_histories: typing.Dict[int, job.IoHistory]
+) -> None:
+    proc = make_proc()
+    proc.ppid.return_value = 1
+    proc.cmdline.return_value = ["python", "chia", "plots", "create"]
+    cached = MagicMock()
+    cached.proc.pid = proc.pid
+    io_histories[12] = job.IoHistory()
+
+    with patch("psutil.process_iter", return_value=[proc]):
+        jobs = job.Job.get_running_jobs("/var/log/plotman", cached_jobs=[cached])
+
+    assert jobs == [cached]
+    assert [name for name, _, _ in cached.mock_calls] == ["update_log", "update_io"]
+    # Histories of processes no longer running are dropped
+    assert 12 not in io_histories
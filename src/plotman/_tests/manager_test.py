@@ -3,9 +3,11 @@ import typing
 # TODO: migrate away from unittest patch
 from unittest.mock import patch
 
+import attr
 import pytest
 
-from plotman import configuration, job, manager
+from plotman import configuration, job, manager, plot_util
+import plotman.plotters
 
 
 @pytest.fixture
@@ -80,6 +82,8 @@ def job_w_dstdir_phase(
     j.progress.return_value = phase
     i = MockJob()
     j.plotter.common_info.return_value = i
+    i.tmpdir = ""
+    i.tmp2dir = ""
     i.dstdir = dstdir
     return j
 
@@ -93,7 +97,7 @@ def test_dstdirs_to_furthest_phase() -> None:
         job_w_dstdir_phase("/plots3", job.Phase(4, 1)),
     ]
 
-    assert manager.dstdirs_to_furthest_phase(all_jobs) == {
+    assert manager.dstdirs_to_furthest_phase(job.JobIndex.of(all_jobs)) == {
         "/plots1": job.Phase(1, 5),
         "/plots2": job.Phase(3, 1),
         "/plots3": job.Phase(4, 1),
@@ -109,8 +113,356 @@ def test_dstdirs_to_youngest_phase() -> None:
         job_w_dstdir_phase("/plots3", job.Phase(4, 1)),
     ]
 
-    assert manager.dstdirs_to_youngest_phase(all_jobs) == {
+    assert manager.dstdirs_to_youngest_phase(job.JobIndex.of(all_jobs)) == {
         "/plots1": job.Phase(1, 5),
         "/plots2": job.Phase(1, 1),
         "/plots3": job.Phase(4, 1),
     }
+
+
+def test_job_index_groups_by_normalized_dir() -> None:
+    jobs = [
+        job_w_dstdir_phase("/plots1/", job.Phase(3, 1)),
+        job_w_dstdir_phase("/plots1", job.Phase(1, 5)),
+        job_w_dstdir_phase("/plots2", job.Phase(2, 1)),
+    ]
+    jobs[0].plotter.common_info.return_value.tmpdir = "/tmp/a/"
+    jobs[0].plotter.common_info.return_value.tmp2dir = "/tmp2"
+    jobs[2].plotter.common_info.return_value.tmpdir = "/tmp/a"
+
+    index = job.JobIndex.of(jobs)
+
+    assert index.phases_for_dstdir("/plots1") == [job.Phase(1, 5), job.Phase(3, 1)]
+    assert index.phases_for_dstdir("/plots1/") == index.phases_for_dstdir("/plots1")
+    assert index.phases_for_tmpdir("/tmp/a") == [job.Phase(2, 1), job.Phase(3, 1)]
+    assert [entry.job for entry in index.for_tmp2dir("/tmp2/")] == [jobs[0]]
+    assert index.phases_for_tmpdir("/tmp/b") == []
+    # Each job is only asked once.
+    for j in jobs:
+        j.plotter.common_info.assert_called_once_with()
+        j.progress.assert_called_once_with()
+
+
+def completed_info(
+    tmpdir: str, phase1: float, total: float
+) -> plotman.plotters.CommonInfo:
+    return plotman.plotters.CommonInfo(
+        type="chia",
+        phase=job.Phase(5, 3),
+        tmpdir=tmpdir,
+        tmp2dir="",
+        dstdir="/mnt/dst/00",
+        buckets=128,
+        threads=2,
+        filename="",
+        phase1_duration_raw=phase1,
+        total_time_raw=total,
+        completed=True,
+    )
+
+
+@patch("plotman.job.Job")
+def job_w_tmpdir_phase(
+    tmpdir: str, phase: job.Phase, MockJob: typing.Any
+) -> typing.Any:
+    j = MockJob()
+    j.progress.return_value = phase
+    i = MockJob()
+    j.plotter.common_info.return_value = i
+    i.tmpdir = tmpdir
+    i.tmp2dir = ""
+    i.dstdir = ""
+    return j
+
+
+def test_tmpdir_scores_favor_faster_dirs() -> None:
+    completed = [
+        completed_info("/mnt/fast", phase1=3000, total=10000),
+        completed_info("/mnt/fast/", phase1=3000, total=10000),
+        completed_info("/mnt/slow", phase1=6000, total=20000),
+    ]
+
+    scores = manager.tmpdir_scores(
+        tmpdirs=["/mnt/fast", "/mnt/slow", "/mnt/new"],
+        index=job.JobIndex.of([]),
+        completed=completed,
+        history_size=20,
+    )
+
+    assert scores["/mnt/fast"].samples == 2
+    assert scores["/mnt/fast"].speed == pytest.approx(1.5)
+    assert scores["/mnt/slow"].speed == pytest.approx(0.75)
+    assert scores["/mnt/new"].speed is None
+    assert scores["/mnt/new"].score == 1
+
+
+def test_tmpdir_scores_divide_by_load() -> None:
+    completed = [
+        completed_info("/mnt/fast", phase1=3000, total=10000),
+        completed_info("/mnt/slow", phase1=6000, total=20000),
+    ]
+    jobs = [
+        job_w_tmpdir_phase("/mnt/fast", job.Phase(1, 3)),
+        job_w_tmpdir_phase("/mnt/fast", job.Phase(3, 3)),
+    ]
+
+    scores = manager.tmpdir_scores(
+        tmpdirs=["/mnt/fast", "/mnt/slow"],
+        index=job.JobIndex.of(jobs),
+        completed=completed,
+        history_size=20,
+    )
+
+    assert scores["/mnt/fast"].load == 2
+    assert scores["/mnt/slow"].score > scores["/mnt/fast"].score
+
+
+def test_select_tmpdir_by_phase() -> None:
+    eligible = [
+        ("/mnt/a", job.Phase.list_from_tuples([(2, 1)])),
+        ("/mnt/b", job.Phase.list_from_tuples([(3, 1)])),
+    ]
+    assert manager.select_tmpdir(eligible) == "/mnt/b"
+
+
+def test_select_tmpdir_by_score() -> None:
+    eligible = [
+        ("/mnt/a", job.Phase.list_from_tuples([(2, 1)])),
+        ("/mnt/b", job.Phase.list_from_tuples([(3, 1)])),
+    ]
+    scores = {
+        "/mnt/a": manager.TmpdirScore(speed=2.0, load=1, samples=3),
+        "/mnt/b": manager.TmpdirScore(speed=0.5, load=1, samples=3),
+    }
+    assert manager.select_tmpdir(eligible, scores) == "/mnt/a"
+
+
+@patch("plotman.job.Job")
+def job_w_dstdir_k32(dstdir: str, phase: job.Phase, MockJob: typing.Any) -> typing.Any:
+    j = job_w_dstdir_phase(dstdir, phase)
+    j.plotter.common_info.return_value.plot_size = 32
+    j.plotter.common_info.return_value.copying = False
+    j.plotter.common_info.return_value.final_plot_written = phase >= job.Phase(5, 3)
+    return j
+
+
+def test_dstdir_states_subtract_inflight_plots() -> None:
+    plot_size = plot_util.get_plotsize(32)
+    jobs = [
+        job_w_dstdir_k32("/mnt/dst/00", job.Phase(1, 1)),
+        job_w_dstdir_k32("/mnt/dst/00/", job.Phase(4, 1)),
+        job_w_dstdir_k32("/mnt/dst/00", job.Phase(5, 3)),
+        job_w_dstdir_k32("/mnt/dst/01", job.Phase(2, 1)),
+    ]
+    completed = [
+        attr.evolve(
+            completed_info("/mnt/tmp/00", 1, 1),
+            dstdir="/mnt/dst/01/",
+            plot_size=32,
+            copy_time_raw=500,
+        ),
+    ]
+
+    states = manager.dstdir_states(
+        dst_dirs=["/mnt/dst/00", "/mnt/dst/01"],
+        index=job.JobIndex.of(jobs),
+        freebytes={"/mnt/dst/00": 3 * plot_size, "/mnt/dst/01": 3 * plot_size},
+        completed=completed,
+        plot_size=plot_size,
+    )
+
+    assert states["/mnt/dst/00"] == manager.DstdirState(
+        freebytes=plot_size,
+        inbound=2,
+        writers=1,
+        copies=0,
+        write_rate=None,
+        available=False,
+    )
+    assert states["/mnt/dst/01"].freebytes == 2 * plot_size
+    assert states["/mnt/dst/01"].write_rate == pytest.approx(plot_size / 500)
+    assert states["/mnt/dst/01"].available
+
+
+def test_dstdir_states_inbound_until_final_plot_written() -> None:
+    plot_size = plot_util.get_plotsize(32)
+    # chia reports 5:1 once the copy is done, madmax 5:1 while copying
+    copied = job_w_dstdir_k32("/mnt/dst/00", job.Phase(5, 1))
+    copied.plotter.common_info.return_value.final_plot_written = True
+    copying = job_w_dstdir_k32("/mnt/dst/00", job.Phase(5, 1))
+    copying.plotter.common_info.return_value.copying = True
+
+    states = manager.dstdir_states(
+        dst_dirs=["/mnt/dst/00"],
+        index=job.JobIndex.of([copied, copying]),
+        freebytes={"/mnt/dst/00": 3 * plot_size},
+        completed=[],
+        plot_size=plot_size,
+        device_for_path=lambda d: None,
+    )
+
+    assert states["/mnt/dst/00"].freebytes == 2 * plot_size
+    assert states["/mnt/dst/00"].inbound == 1
+    assert states["/mnt/dst/00"].writers == 1
+
+
+def test_dstdir_states_count_copies_per_device() -> None:
+    plot_size = plot_util.get_plotsize(32)
+    jobs = [
+        job_w_dstdir_k32("/mnt/dst/00", job.Phase(5, 1)),
+        job_w_dstdir_k32("/mnt/dst/01", job.Phase(5, 1)),
+        job_w_dstdir_k32("/mnt/dst/02", job.Phase(5, 1)),
+        job_w_dstdir_k32("/mnt/dst/00", job.Phase(4, 1)),
+    ]
+    for j in jobs[:3]:
+        j.plotter.common_info.return_value.copying = True
+    devices = {"/mnt/dst/00": "sda", "/mnt/dst/01": "sda", "/mnt/dst/02": "sdb"}
+
+    states = manager.dstdir_states(
+        dst_dirs=["/mnt/dst/00", "/mnt/dst/01", "/mnt/dst/02", "/mnt/dst/03"],
+        index=job.JobIndex.of(jobs),
+        freebytes={},
+        completed=[],
+        plot_size=plot_size,
+        device_for_path=devices.get,
+    )
+
+    assert [state.copies for state in states.values()] == [2, 2, 1, 0]
+
+
+def test_dstdir_states_share_filesystem_space() -> None:
+    plot_size = plot_util.get_plotsize(32)
+    jobs = [
+        job_w_dstdir_k32("/mnt/dst/00", job.Phase(1, 1)),
+        job_w_dstdir_k32("/mnt/dst/01", job.Phase(2, 1)),
+        job_w_dstdir_k32("/mnt/dst/02", job.Phase(3, 1)),
+    ]
+    filesystems = {"/mnt/dst/00": "9:0", "/mnt/dst/01": "9:0", "/mnt/dst/02": "8:1"}
+    free = 3 * plot_size
+
+    states = manager.dstdir_states(
+        dst_dirs=list(filesystems),
+        index=job.JobIndex.of(jobs),
+        freebytes={"/mnt/dst/00": free, "/mnt/dst/01": free, "/mnt/dst/02": free},
+        completed=[],
+        plot_size=plot_size,
+        device_for_path=lambda d: None,
+        filesystem_for_path=filesystems.__getitem__,
+    )
+
+    assert [state.freebytes for state in states.values()] == [
+        plot_size,
+        plot_size,
+        2 * plot_size,
+    ]
+    assert [state.inbound for state in states.values()] == [1, 1, 1]
+
+
+def dst_state(
+    freebytes: int = 10 * 10 ** 12,
+    writers: int = 0,
+    copies: int = 0,
+    write_rate: typing.Optional[float] = None,
+    available: bool = True,
+) -> manager.DstdirState:
+    return manager.DstdirState(
+        freebytes=freebytes,
+        inbound=writers,
+        writers=writers,
+        copies=copies,
+        write_rate=write_rate,
+        available=available,
+    )
+
+
+def test_select_dstdir_none_available() -> None:
+    states = {"/a": dst_state(available=False), "/b": dst_state(available=False)}
+    assert (
+        manager.select_dstdir(
+            ["/a", "/b"], job.JobIndex.of([]), states=states, policy="phase"
+        )
+        is None
+    )
+
+
+def test_select_dstdir_phase_skips_full() -> None:
+    states = {"/a": dst_state(available=False), "/b": dst_state()}
+    assert (
+        manager.select_dstdir(
+            ["/a", "/b"], job.JobIndex.of([]), states=states, policy="phase"
+        )
+        == "/b"
+    )
+
+
+def test_select_dstdir_copy_limit() -> None:
+    states = {"/a": dst_state(copies=2), "/b": dst_state(copies=1)}
+    assert (
+        manager.select_dstdir(
+            ["/a", "/b"],
+            job.JobIndex.of([]),
+            states=states,
+            policy="phase",
+            max_copies=2,
+        )
+        == "/b"
+    )
+    assert (
+        manager.select_dstdir(
+            ["/a", "/b"],
+            job.JobIndex.of([]),
+            states=states,
+            policy="phase",
+            max_copies=1,
+        )
+        is None
+    )
+
+
+def test_select_dstdir_capacity() -> None:
+    states = {
+        "/a": dst_state(writers=1, write_rate=100),
+        "/b": dst_state(writers=2, write_rate=200),
+        "/c": dst_state(writers=0, write_rate=100, freebytes=10 ** 12),
+        "/d": dst_state(writers=0, write_rate=100, freebytes=2 * 10 ** 12),
+    }
+    assert (
+        manager.select_dstdir(
+            ["/a", "/b", "/c", "/d"],
+            job.JobIndex.of([]),
+            states=states,
+            policy="capacity",
+        )
+        == "/d"
+    )
+    del states["/c"], states["/d"]
+    assert (
+        manager.select_dstdir(
+            ["/a", "/b"], job.JobIndex.of([]), states=states, policy="capacity"
+        )
+        == "/b"
+    )
+
+
+def test_maybe_start_new_plot_uses_listed_jobs(
+    dir_cfg: configuration.Directories, sched_cfg: configuration.Scheduling
+) -> None:
+    jobs = [job_w_dstdir_k32("/mnt/dst/00", job.Phase(1, 1))]
+
+    with patch("plotman.job.Job.get_running_jobs") as get_running_jobs:
+        with patch(
+            "plotman.manager.plan_new_plot", return_value=(None, "waiting")
+        ) as plan_new_plot:
+            assert (
+                manager.maybe_start_new_plot(
+                    dir_cfg,
+                    sched_cfg,
+                    configuration.Plotting(),
+                    configuration.Logging(plots="/var/log/plotman"),
+                    jobs,
+                )
+                == (False, "waiting")
+            )
+
+    get_running_jobs.assert_not_called()
+    assert plan_new_plot.call_args[1]["index"].jobs == jobs
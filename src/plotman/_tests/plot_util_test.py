@@ -1,4 +1,8 @@
 import os
+import pathlib
+
+# TODO: migrate away from unittest patch
+from unittest.mock import patch
 
 import pyfakefs
 
@@ -74,3 +78,31 @@ def test_get_plotsize() -> None:
     assert [659272492, 107287518791, 221143636517, 455373353413, 936816632588] == [
         plot_util.get_plotsize(n) for n in [25, 32, 33, 34, 35]
     ]
+
+
+def test_list_plots_cached(tmp_path: pathlib.Path) -> None:
+    def add_plot(name: str, mtime_ns: int) -> str:
+        path = tmp_path / name
+        with open(path, "wb") as f:
+            f.truncate(plot_util.get_plotsize(32))
+        os.utime(tmp_path, ns=(mtime_ns, mtime_ns))
+        return str(path)
+
+    first = add_plot("plot-k32-0.plot", 1)
+
+    with patch("plotman.plot_util._scan_plots", wraps=plot_util._scan_plots) as scan:
+        assert plot_util.list_plots(str(tmp_path), clock=lambda: 0) == [first]
+        assert plot_util.list_plots(str(tmp_path), clock=lambda: 1) == [first]
+        assert scan.call_count == 1
+
+        second = add_plot("plot-k32-1.plot", 2)
+        assert plot_util.list_plots(str(tmp_path), clock=lambda: 2) == [first, second]
+        assert scan.call_count == 2
+
+        (tmp_path / "plot-k32-1.plot").unlink()
+        os.utime(tmp_path, ns=(2, 2))
+        assert plot_util.list_plots(str(tmp_path), clock=lambda: 3) == [first, second]
+        assert plot_util.list_plots(
+            str(tmp_path), clock=lambda: 2 + plot_util.LIST_PLOTS_TTL_S
+        ) == [first]
+        assert scan.call_count == 3
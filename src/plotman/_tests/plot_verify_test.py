@@ -0,0 +1,121 @@
+import io
+import os
+import pathlib
+import struct
+import typing
+
+import pytest
+
+from plotman import plot_util, plot_verify
+
+plot_id = bytes(range(32))
+name = f"plot-k18-2021-08-29-22-22-{plot_id.hex()}.plot"
+
+
+def header_bytes(
+    k: int = 18, table_pointers: typing.Sequence[int] = tuple(range(200, 1200, 100))
+) -> bytes:
+    return b"".join(
+        [
+            plot_verify.PLOT_MAGIC,
+            plot_id,
+            bytes([k]),
+            struct.pack(">H", 4),
+            b"v1.0",
+            struct.pack(">H", 3),
+            b"abc",
+            struct.pack(">10Q", *table_pointers),
+        ]
+    )
+
+
+def write_plot(path: pathlib.Path, header: bytes = header_bytes()) -> int:
+    size = plot_util.get_plotsize(18)
+    with open(path, "wb") as f:
+        f.write(header)
+        f.truncate(size)
+        f.seek(size // 2)
+        f.write(os.urandom(4096))
+    return size
+
+
+def test_read_header() -> None:
+    header = plot_verify.read_header(io.BytesIO(header_bytes()))
+
+    assert header == plot_verify.Header(
+        plot_id=plot_id,
+        k=18,
+        format_description="v1.0",
+        memo=b"abc",
+        table_pointers=tuple(range(200, 1200, 100)),
+    )
+
+
+@pytest.mark.parametrize(
+    argnames=["data"],
+    argvalues=[[b"Not a plot at all, not at all"], [header_bytes()[:-1]]],
+)
+def test_read_header_rejects(data: bytes) -> None:
+    with pytest.raises(plot_verify.VerificationException):
+        plot_verify.read_header(io.BytesIO(data))
+
+
+@pytest.mark.parametrize(
+    argnames=["header", "size", "filename"],
+    argvalues=[
+        [header_bytes(k=60), 10 ** 15, name],
+        [header_bytes(), 1000, name],
+        [header_bytes(table_pointers=[300, 200] + [400] * 8), 10 ** 9, name],
+        [header_bytes(table_pointers=[200] * 9 + [10 ** 10]), 10 ** 9, name],
+        [header_bytes(), 10 ** 9, f"plot-k18-2021-08-29-22-22-{'0' * 64}.plot"],
+    ],
+)
+def test_check_header_rejects(header: bytes, size: int, filename: str) -> None:
+    with pytest.raises(plot_verify.VerificationException):
+        plot_verify.check_header(
+            plot_verify.read_header(io.BytesIO(header)), size, filename
+        )
+
+
+def test_sample_offsets() -> None:
+    assert plot_verify.sample_offsets(1000, 5, 100) == [0, 225, 450, 675, 900]
+    assert plot_verify.sample_offsets(50, 5, 100) == [0]
+    assert plot_verify.sample_offsets(1000, 0, 100) == []
+
+
+def test_verify(tmp_path: pathlib.Path) -> None:
+    size = write_plot(tmp_path / name)
+    (tmp_path / "copy").write_bytes((tmp_path / name).read_bytes())
+    clock = iter([10, 12.5]).__next__
+
+    verification = plot_verify.verify(
+        str(tmp_path / name), str(tmp_path / "copy"), samples=8, clock=clock
+    )
+
+    assert verification.header.k == 18
+    assert verification.samples == 8
+    assert verification.bytes_read == 2 * 8 * plot_verify.SAMPLE_SIZE
+    assert verification.seconds == 2.5
+    assert str(verification) == (
+        "verified k18 plot 00010203 with 8 samples, read 1048576 bytes in 2.50 s"
+    )
+    assert size > 16 * plot_verify.SAMPLE_SIZE
+
+
+def test_verify_detects_differences(tmp_path: pathlib.Path) -> None:
+    size = write_plot(tmp_path / name)
+    data = bytearray((tmp_path / name).read_bytes())
+    offset = plot_verify.sample_offsets(size, 8, plot_verify.SAMPLE_SIZE)[4]
+    data[offset] ^= 0xFF
+    (tmp_path / "copy").write_bytes(data)
+
+    with pytest.raises(plot_verify.VerificationException, match="differ"):
+        plot_verify.verify(str(tmp_path / name), str(tmp_path / "copy"), samples=8)
+
+
+def test_verify_detects_truncation(tmp_path: pathlib.Path) -> None:
+    write_plot(tmp_path / name)
+    (tmp_path / "copy").write_bytes((tmp_path / name).read_bytes()[:-1])
+
+    with pytest.raises(plot_verify.VerificationException, match="bytes instead"):
+        plot_verify.verify(str(tmp_path / name), str(tmp_path / "copy"))
@@ -53,8 +53,10 @@ def test_byte_by_byte_full_load(with_a_locale: None) -> None:
         phase3_duration_raw=6515.266,
         phase4_duration_raw=425.637,
         total_time_raw=18380.426,
+        cpu_time_raw=18380.426 * 139.320 / 100,
         copy_time_raw=178.438,
         filename="/farm/yards/902/fake_dst/plot-k32-2021-07-14-22-33-d2540dcfcffddbfbd7e60b4aca4d54fb937db71991298fabc253f020a87ff7d4.plot",
+        final_plot_written=True,
     )
 
 
@@ -94,6 +96,34 @@ def test_log_phases() -> None:
     assert wrong == []
 
 
+def test_log_copying() -> None:
+    read_bytes = importlib.resources.read_binary(
+        package=plotman._tests.resources,
+        resource="chianetwork.marked",
+    )
+
+    parser = plotman.plotters.chianetwork.Plotter()
+
+    copying_phases = set()
+    written_phases = set()
+
+    for marked_line in read_bytes.splitlines(keepends=True):
+        _, _, line_bytes = marked_line.partition(b",")
+        parser.update(chunk=line_bytes)
+        if parser.common_info().copying:
+            copying_phases.add(parser.info.phase)
+        if parser.common_info().final_plot_written:
+            written_phases.add(parser.info.phase)
+
+    assert copying_phases == {plotman.job.Phase(major=5, minor=0)}
+    assert not parser.common_info().copying
+    assert written_phases == {
+        plotman.job.Phase(major=5, minor=1),
+        plotman.job.Phase(major=5, minor=2),
+        plotman.job.Phase(major=5, minor=3),
+    }
+
+
 def test_marked_log_matches() -> None:
     # TODO: CAMPid 909831931987460871349879878609830987138931700871340870
     marked_bytes = importlib.resources.read_binary(
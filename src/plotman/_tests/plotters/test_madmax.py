@@ -38,6 +38,7 @@ def test_byte_by_byte_full_load() -> None:
         total_time_raw=4968.41,
         filename="",
         plot_name="plot-k32-2021-07-14-21-56-522acbd6308af7e229281352f746449134126482cfabd51d38e0f89745d21698",
+        final_plot_written=True,
     )
 
 
@@ -65,6 +66,30 @@ def test_log_phases() -> None:
     assert wrong == []
 
 
+def test_log_copying() -> None:
+    read_bytes = importlib.resources.read_binary(
+        package=plotman._tests.resources,
+        resource="madmax.marked",
+    )
+
+    parser = plotman.plotters.madmax.Plotter()
+
+    copying_phases = set()
+    written_phases = set()
+
+    for marked_line in read_bytes.splitlines(keepends=True):
+        _, _, line_bytes = marked_line.partition(b",")
+        parser.update(chunk=line_bytes)
+        if parser.common_info().copying:
+            copying_phases.add(parser.info.phase)
+        if parser.common_info().final_plot_written:
+            written_phases.add(parser.info.phase)
+
+    assert copying_phases == {plotman.job.Phase(major=5, minor=1)}
+    assert not parser.common_info().copying
+    assert written_phases == {plotman.job.Phase(major=5, minor=2)}
+
+
 def test_marked_log_matches() -> None:
     # TODO: CAMPid 909831931987460871349879878609830987138931700871340870
     marked_bytes = importlib.resources.read_binary(
@@ -0,0 +1,139 @@
+import sys
+import typing
+
+# TODO: migrate away from unittest patch
+from unittest.mock import MagicMock, patch
+
+import attr
+import psutil
+import pytest
+
+from plotman import configuration, job, priority
+
+
+priorities = configuration.Priorities(
+    rules=[
+        configuration.PriorityRule(phase_major=1, nice=15, ionice_value=6),
+        configuration.PriorityRule(phase_major=3, phase_minor=5, nice=10),
+    ],
+    saturated=configuration.PriorityRule(phase_major=2, nice=19, ionice_class="idle"),
+)
+
+
+def test_desired_priority_by_phase() -> None:
+    assert priority.desired_priority(
+        job.Phase(1, 3), priorities, saturated=False
+    ) == priority.Priority(nice=15, ionice_value=6)
+    assert priority.desired_priority(
+        job.Phase(3, 5), priorities, saturated=False
+    ) == priority.Priority(nice=10)
+    assert priority.desired_priority(
+        job.Phase(4, 0), priorities, saturated=False
+    ) == priority.Priority(nice=10)
+
+
+def test_desired_priority_before_rules() -> None:
+    assert priority.desired_priority(job.Phase(0, 0), priorities, False) is None
+    assert priority.desired_priority(job.Phase(known=False), priorities, True) is None
+
+
+def test_desired_priority_saturated() -> None:
+    assert priority.desired_priority(
+        job.Phase(1, 3), priorities, saturated=True
+    ) == priority.Priority(nice=19, ionice_class="idle")
+    assert priority.desired_priority(
+        job.Phase(3, 5), priorities, saturated=True
+    ) == priority.Priority(nice=10)
+
+
+@pytest.fixture(autouse=True)
+def denied() -> typing.Iterator[typing.Dict[int, typing.Set[str]]]:
+    with patch.dict(priority._denied, clear=True), patch.dict(
+        priority._original, clear=True
+    ):
+        yield priority._denied
+
+
+def make_proc(pid: int = 11, ionice_allowed: bool = False) -> typing.Any:
+    proc = MagicMock()
+    proc.pid = pid
+    niceness = [0]
+    ioprio = [(psutil.IOPRIO_CLASS_BE, 4)]
+
+    def nice(value: typing.Optional[int] = None) -> typing.Optional[int]:
+        if value is None:
+            return niceness[0]
+        niceness[0] = value
+        return None
+
+    def ionice(
+        ioclass: typing.Optional[int] = None, value: typing.Optional[int] = None
+    ) -> typing.Any:
+        if ioclass is None:
+            current_class, current_value = ioprio[0]
+            return MagicMock(ioclass=current_class, value=current_value)
+        if not ionice_allowed:
+            raise psutil.AccessDenied(pid)
+        ioprio[0] = (ioclass, 0 if value is None else value)
+        return None
+
+    proc.nice.side_effect = nice
+    proc.ionice.side_effect = ionice
+    return proc
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="ionice is Linux only")
+def test_set_priority_reports_denials_separately(
+    denied: typing.Dict[int, typing.Set[str]]
+) -> None:
+    proc = make_proc()
+    idle = priority.Priority(nice=10, ionice_class="idle")
+
+    assert priority.set_priority(proc, idle) == [
+        "nice 10",
+        "ionice idle:0 denied, higher priorities may require privileges",
+    ]
+    assert proc.nice() == 10
+    assert denied == {11: {"ionice idle:0"}}
+
+    # The denied change is not attempted again, others still are.
+    proc.ionice.reset_mock()
+    assert priority.set_priority(proc, attr.evolve(idle, nice=12)) == ["nice 12"]
+    assert [kwargs for _, kwargs in proc.ionice.call_args_list if kwargs] == []
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="priorities are not applied")
+def test_apply_forgets_denials_of_ended_jobs(
+    denied: typing.Dict[int, typing.Set[str]]
+) -> None:
+    denied[11] = {"ionice idle:0"}
+    denied[12] = {"ionice idle:0"}
+    j = MagicMock()
+    j.proc = make_proc(pid=11)
+    j.progress.return_value = job.Phase(0, 0)
+
+    assert priority.apply([j], priorities) == []
+
+    assert denied == {11: {"ionice idle:0"}}
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="priorities are not applied")
+def test_apply_restores_priority_once_no_longer_saturated() -> None:
+    j = MagicMock()
+    j.proc = make_proc(ionice_allowed=True)
+    # Before the first rule, so only lowered while saturated
+    j.progress.return_value = job.Phase(0, 0)
+
+    with patch("plotman.priority.is_saturated", return_value=True):
+        [lowered] = priority.apply([j], priorities)
+    assert lowered.endswith("(saturated): nice 19, ionice idle:0")
+
+    with patch("plotman.priority.is_saturated", return_value=False):
+        [restored] = priority.apply([j], priorities)
+        assert restored.endswith("(restored): nice 0, ionice best_effort:4")
+        assert priority.current_priority(j.proc) == priority.Priority(
+            nice=0, ionice_class="best_effort", ionice_value=4
+        )
+        # Left alone from then on
+        assert priority.apply([j], priorities) == []
+    assert priority._original == {}
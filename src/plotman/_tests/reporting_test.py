@@ -3,7 +3,7 @@ import os
 import typing
 from unittest.mock import patch, Mock
 
-from plotman import reporting
+from plotman import archive, diskstats, history, reporting, transfer_log
 from plotman import job
 
 
@@ -96,3 +96,75 @@ def test_to_prometheus_format() -> None:
     ]
     result = reporting.to_prometheus_format(metrics, prom_stati)
     assert result == expected
+
+
+def test_to_prometheus_histogram() -> None:
+    histogram = history.Histogram(bounds=(10.0, 100.0))
+    for value in [5, 50, 500, 5000]:
+        histogram.observe(value)
+
+    result = reporting.to_prometheus_histogram(
+        "duration", "How long", [('foo="bar"', histogram)]
+    )
+
+    assert result == [
+        "# HELP duration How long.",
+        "# TYPE duration histogram",
+        'duration_bucket{foo="bar",le="10"} 1',
+        'duration_bucket{foo="bar",le="100"} 2',
+        'duration_bucket{foo="bar",le="+Inf"} 4',
+        'duration_sum{foo="bar"} 5555',
+        'duration_count{foo="bar"} 4',
+    ]
+
+
+def test_io_cells() -> None:
+    usage = diskstats.Utilization(
+        busy_percent=87.4,
+        read_bytes_per_s=12.4e6,
+        write_bytes_per_s=340e6,
+        read_iops=100,
+        write_iops=2500.6,
+    )
+
+    assert reporting.io_cells(usage) == ["12", "340", "2601", "87%"]
+    assert reporting.io_cells(None) == ["-", "-", "-", "-"]
+
+
+def test_transfer_report() -> None:
+    transfers = [
+        archive.Transfer(
+            pid=11,
+            source="/d/plot-k32-1.plot",
+            destination="/farm/a",
+            start_time=1000.0,
+            info=transfer_log.TransferInfo(
+                transferred=25, percent=25, rate=250e6, eta=60
+            ),
+        ),
+        archive.Transfer(pid=None, source="/d/plot-k32-2.plot", destination="/farm/b"),
+    ]
+
+    report = reporting.transfer_report(transfers, 80, "/farm", now=1000.0 + 3900)
+
+    [_, first, second] = report.splitlines()
+    assert first.split() == [
+        "11",
+        "plot-k32-1.plot",
+        "a",
+        "1:05",
+        "25%",
+        "250MB/s",
+        "0B/s",
+        "0:01",
+    ]
+    assert second.split() == [
+        "<pending>",
+        "plot-k32-2.plot",
+        "b",
+        "-",
+        "-",
+        "-",
+        "-",
+        "-",
+    ]
@@ -0,0 +1,209 @@
+import typing
+
+import attr
+import pytest
+
+from plotman import configuration, job, simulate
+import plotman.plotters
+
+
+HOUR = 3600
+
+plotting_cfg = configuration.Plotting()
+
+# Eight hours per plot, half of it in phase 1
+durations = simulate.Durations(
+    phase1=4 * HOUR, phase2=1 * HOUR, phase3=2 * HOUR, phase4=1 * HOUR
+)
+
+
+def sched_cfg(**kwargs: object) -> configuration.Scheduling:
+    options: typing.Dict[str, typing.Any] = dict(
+        global_max_jobs=10,
+        global_stagger_m=0,
+        polling_time_s=20,
+        tmpdir_max_jobs=1,
+        tmpdir_stagger_phase_major=2,
+        tmpdir_stagger_phase_minor=0,
+    )
+    options.update(kwargs)
+    return configuration.Scheduling(**options)
+
+
+def test_durations_steps() -> None:
+    steps = durations.steps()
+
+    assert steps[0] == (job.Phase(1, 0), 0.5 * HOUR)
+    assert steps[-1][0] == job.Phase(4, 3)
+    assert sum(duration for _, duration in steps) == pytest.approx(8 * HOUR)
+    assert [phase for phase, _ in steps] == sorted(phase for phase, _ in steps)
+
+
+def test_durations_from_info() -> None:
+    info = plotman.plotters.CommonInfo(
+        type="chia",
+        phase=job.Phase(5, 3),
+        tmpdir="/t",
+        tmp2dir="/t",
+        dstdir="/d",
+        buckets=128,
+        threads=4,
+        filename="",
+        phase1_duration_raw=10,
+        phase2_duration_raw=20,
+        phase3_duration_raw=30,
+        phase4_duration_raw=40,
+        copy_time_raw=5,
+    )
+
+    assert simulate.durations_from_info(info) == simulate.Durations(
+        10, 20, 30, 40, copy=5
+    )
+    assert (
+        simulate.durations_from_info(
+            plotman.plotters.CommonInfo(
+                type="bladebit",
+                phase=job.Phase(known=False),
+                tmpdir="/t",
+                tmp2dir="/t",
+                dstdir="/d",
+                buckets=0,
+                threads=4,
+                filename="",
+                phase1_duration_raw=10,
+            )
+        )
+        is None
+    )
+
+
+def test_simulate_serial() -> None:
+    result = simulate.simulate(
+        dir_cfg=configuration.Directories(tmp=["/t0"]),
+        sched_cfg=sched_cfg(),
+        plotting_cfg=plotting_cfg,
+        days=10,
+        durations=durations,
+    )
+
+    # The last plot finishes just as the simulation ends
+    assert result.plots == 29
+    assert result.plot_times == [pytest.approx(8 * HOUR)] * 29
+    assert result.busy_fraction("/t0") == pytest.approx(1)
+    assert result.tmpdirs["/t0"].plots == 30
+
+
+def test_simulate_dst_dirs() -> None:
+    result = simulate.simulate(
+        dir_cfg=configuration.Directories(tmp=["/t0", "/t1"], dst=["/d0", "/d1"]),
+        sched_cfg=sched_cfg(),
+        plotting_cfg=plotting_cfg,
+        days=10,
+        durations=attr.evolve(durations, copy=0.5 * HOUR),
+    )
+
+    assert result.plots == 2 * 28
+    assert result.plot_times == [pytest.approx(8.5 * HOUR)] * result.plots
+
+
+def test_simulate_spreads_plots_across_dst_dirs() -> None:
+    dst = ["/d0", "/d1", "/d2"]
+    result = simulate.simulate(
+        dir_cfg=configuration.Directories(tmp=["/t0", "/t1"], dst=dst),
+        sched_cfg=sched_cfg(tmpdir_max_jobs=2),
+        plotting_cfg=plotting_cfg,
+        days=10,
+        durations=attr.evolve(durations, copy=0.5 * HOUR),
+    )
+
+    assert sorted(result.dstdirs) == dst
+    # Each new plot goes to the dst dir least recently selected
+    assert sum(result.dstdirs.values()) == sum(
+        usage.plots for usage in result.tmpdirs.values()
+    )
+    assert max(result.dstdirs.values()) - min(result.dstdirs.values()) <= 1
+    assert "Plots started per dst dir: /d0 " in simulate.report(result)
+
+
+def test_simulate_milestone_overlap() -> None:
+    # A second job starts as soon as the first reaches phase 2
+    result = simulate.simulate(
+        dir_cfg=configuration.Directories(tmp=["/t0"]),
+        sched_cfg=sched_cfg(tmpdir_max_jobs=2),
+        plotting_cfg=plotting_cfg,
+        days=10,
+        durations=durations,
+    )
+
+    assert result.plots_per_day == pytest.approx(6, abs=0.3)
+    assert result.tmpdirs["/t0"].job_s / result.duration_s == pytest.approx(2, abs=0.05)
+
+
+def test_simulate_contention() -> None:
+    # Two overlapping jobs on a tmp dir that runs one at full speed are no
+    # faster than one at a time.
+    result = simulate.simulate(
+        dir_cfg=configuration.Directories(tmp=["/t0"]),
+        sched_cfg=sched_cfg(tmpdir_max_jobs=2),
+        plotting_cfg=plotting_cfg,
+        days=10,
+        durations=durations,
+        contention=simulate.Contention(tmpdir_jobs=1),
+    )
+
+    assert result.plots_per_day == pytest.approx(3, abs=0.3)
+
+
+def test_simulate_global_stagger_idles_tmpdirs() -> None:
+    result = simulate.simulate(
+        dir_cfg=configuration.Directories(tmp=["/t0", "/t1", "/t2", "/t3"]),
+        sched_cfg=sched_cfg(global_stagger_m=240),
+        plotting_cfg=plotting_cfg,
+        days=10,
+        durations=durations,
+    )
+
+    # One start per four hours limits plotting to two jobs at a time, which
+    # the first two tmp dirs take in turn.
+    assert result.plots_per_day == pytest.approx(6, abs=0.3)
+    assert result.idle_hours_per_day("/t0") == pytest.approx(0)
+    assert result.idle_hours_per_day("/t1") == pytest.approx(0.4)
+    assert result.idle_hours_per_day("/t3") == pytest.approx(24)
+
+
+def test_simulate_requires_durations() -> None:
+    with pytest.raises(Exception, match="No completed plot logs"):
+        simulate.simulate(
+            dir_cfg=configuration.Directories(tmp=["/t0"]),
+            sched_cfg=sched_cfg(),
+            plotting_cfg=plotting_cfg,
+            days=1,
+        )
+
+
+def test_sweep() -> None:
+    assert simulate.sweep(
+        ["polling_time_s=30"], ["global_stagger_m=10,20", "tmpdir_max_jobs=2,3"]
+    ) == [
+        [("polling_time_s", 30), ("global_stagger_m", 10), ("tmpdir_max_jobs", 2)],
+        [("polling_time_s", 30), ("global_stagger_m", 10), ("tmpdir_max_jobs", 3)],
+        [("polling_time_s", 30), ("global_stagger_m", 20), ("tmpdir_max_jobs", 2)],
+        [("polling_time_s", 30), ("global_stagger_m", 20), ("tmpdir_max_jobs", 3)],
+    ]
+
+
+def test_sweep_rejects_malformed() -> None:
+    with pytest.raises(configuration.ConfigurationException):
+        simulate.sweep(["global_stagger_m"], [])
+
+
+def test_apply_overrides() -> None:
+    config_text = "scheduling:\n  global_stagger_m: 30\n  polling_time_s: 20\n"
+
+    overridden = simulate.apply_overrides(
+        config_text, [("global_stagger_m", 45), ("tmp_overrides", {"/t0": {}})]
+    )
+
+    assert "global_stagger_m: 45" in overridden
+    assert "polling_time_s: 20" in overridden
+    assert "/t0" in overridden
@@ -0,0 +1,161 @@
+import os
+import pathlib
+
+# TODO: migrate away from unittest patch
+from unittest.mock import MagicMock, patch
+
+from plotman import diskstats, topology
+
+mountinfo = """\
+22 1 254:0 / / rw,relatime shared:1 - ext4 /dev/vda rw
+31 22 0:27 / /dev/shm rw,nosuid,nodev shared:2 - tmpfs tmpfs rw
+40 22 9:0 / /mnt/my\\040raid rw,noatime shared:3 - xfs /dev/md0 rw,attr2
+"""
+
+
+def test_parse_mountinfo() -> None:
+    mounts = topology.parse_mountinfo(mountinfo + "garbage\n")
+
+    assert [mount.mount_point for mount in mounts] == ["/", "/dev/shm", "/mnt/my raid"]
+    assert mounts[2] == topology.Mount(
+        mount_id=40,
+        device_number="9:0",
+        root="/",
+        mount_point="/mnt/my raid",
+        fstype="xfs",
+        source="/dev/md0",
+    )
+
+
+def make_sysfs(root: pathlib.Path) -> None:
+    """md0 on sda1 and sdb1, dm-0 on sdc2 and nvme0n1 without partitions."""
+    block = root / "devices" / "pci" / "block"
+    virtual = root / "devices" / "virtual" / "block"
+    for disk, partitions in [("sda", ["sda1"]), ("sdb", ["sdb1"]), ("sdc", ["sdc2"])]:
+        for partition in partitions:
+            (block / disk / partition).mkdir(parents=True)
+            (block / disk / partition / "partition").write_text("1\n")
+    (block / "nvme0n1").mkdir()
+    for name, slaves in [("md0", ["sda/sda1", "sdb/sdb1"]), ("dm-0", ["sdc/sdc2"])]:
+        (virtual / name / "slaves").mkdir(parents=True)
+        for slave in slaves:
+            (virtual / name / "slaves" / os.path.basename(slave)).symlink_to(
+                block / slave
+            )
+    (root / "dev" / "block").mkdir(parents=True)
+    for number, path in [
+        ("9:0", virtual / "md0"),
+        ("253:0", virtual / "dm-0"),
+        ("259:0", block / "nvme0n1"),
+        ("8:1", block / "sda" / "sda1"),
+    ]:
+        (root / "dev" / "block" / number).symlink_to(path)
+
+
+def fake_topology(tmp_path: pathlib.Path) -> topology.Topology:
+    make_sysfs(tmp_path / "sys")
+    mounts = []
+    for i, (name, number) in enumerate(
+        [("raid", "9:0"), ("lvm", "253:0"), ("nvme", "259:0"), ("boot", "8:1")]
+    ):
+        mount_point = tmp_path / "mnt" / name
+        (mount_point / "00").mkdir(parents=True)
+        (mount_point / "01").mkdir()
+        mounts.append(
+            topology.Mount(
+                mount_id=i,
+                device_number=number,
+                root="/",
+                mount_point=str(mount_point),
+                fstype="xfs",
+                source=f"/dev/{name}",
+            )
+        )
+    return topology.Topology(mounts=mounts, sys_path=str(tmp_path / "sys"))
+
+
+def test_locate(tmp_path: pathlib.Path) -> None:
+    topo = fake_topology(tmp_path)
+    mnt = tmp_path / "mnt"
+
+    assert topo.locate(str(mnt / "raid" / "00")) == topology.Location(
+        path=str(mnt / "raid" / "00"),
+        filesystem="9:0",
+        mount_point=str(mnt / "raid"),
+        fstype="xfs",
+        device="md0",
+        disks=("sda", "sdb"),
+    )
+    assert topo.device_for_path(str(mnt / "raid" / "01/")) == "sda+sdb"
+    assert topo.locate(str(mnt / "lvm" / "00")).device == "dm-0"
+    assert topo.device_for_path(str(mnt / "lvm" / "00")) == "sdc"
+    assert topo.device_for_path(str(mnt / "nvme" / "00")) == "nvme0n1"
+    assert topo.locate(str(mnt / "boot" / "00")).device == "sda"
+    assert topo.filesystem_for_path(str(mnt / "boot")) == "8:1"
+
+
+def test_locate_missing(tmp_path: pathlib.Path) -> None:
+    topo = fake_topology(tmp_path)
+
+    location = topo.locate(str(tmp_path / "missing/"))
+
+    assert location == topology.Location(
+        path=str(tmp_path / "missing"), filesystem=str(tmp_path / "missing")
+    )
+    assert location.device_key() is None
+
+
+def test_free_bytes_once_per_filesystem(tmp_path: pathlib.Path) -> None:
+    topo = fake_topology(tmp_path)
+    mnt = tmp_path / "mnt"
+
+    with patch("shutil.disk_usage", return_value=MagicMock(free=5)) as disk_usage:
+        free = [
+            topo.free_bytes(str(mnt / name / d))
+            for name in ["raid", "lvm"]
+            for d in ["00", "01"]
+        ]
+
+    assert free == [5, 5, 5, 5]
+    assert disk_usage.call_count == 2
+
+
+def test_get_reuses_topology() -> None:
+    with patch("plotman.topology._current", None):
+        first = topology.get(now=1000)
+
+        assert topology.get(now=1001) is first
+        assert topology.get(now=1000 + topology.TOPOLOGY_TTL_S) is not first
+
+
+def test_combine_utilization() -> None:
+    utilization = {
+        "sda": diskstats.Utilization(busy_percent=20, write_bytes_per_s=100),
+        "sdb": diskstats.Utilization(busy_percent=90, write_bytes_per_s=50),
+        "md0": diskstats.Utilization(busy_percent=0),
+    }
+
+    combined = topology.combine_utilization(utilization, ["sda+sdb", "sdc", "sda"])
+
+    assert combined["sda+sdb"].busy_percent == 90
+    assert combined["sda+sdb"].write_bytes_per_s == 150
+    assert combined["sda"].busy_percent == 20
+    assert "sdc" not in combined
+
+
+def test_utilization_for_paths() -> None:
+    utilization = {
+        "sda": diskstats.Utilization(busy_percent=20),
+        "sdb": diskstats.Utilization(busy_percent=90),
+    }
+    devices = {"/mnt/a": "sda", "/mnt/raid": "sda+sdb", "/mnt/gone": None}
+    topo = MagicMock()
+    topo.device_for_path.side_effect = devices.__getitem__
+
+    with patch("plotman.topology.get", return_value=topo):
+        io = topology.utilization_for_paths(devices, utilization)
+
+    assert {path: usage.busy_percent for path, usage in io.items()} == {
+        "/mnt/a": 20,
+        "/mnt/raid": 90,
+    }
@@ -0,0 +1,212 @@
+import importlib.resources
+import pathlib
+
+import pendulum
+import pytest
+import yaml
+
+from plotman import reporting, transfer, transfer_log
+from plotman import resources as plotman_resources
+
+source = "/mnt/dst/00/plot-k32-2021-08-29-22-22-1fc7b57baae24da78e3bea44d58ab51f.plot"
+
+rsync_log = (
+    f"Archiving {source} to /farm/sites/a\n"
+    "+ rsync --info=progress2,stats1 ...\n"
+    "         32,768   0%    0.00kB/s    0:00:00  \r"
+    "  1,234,567,890   1%  150.00MB/s    0:11:22  \r"
+    "108,834,620,118 100%  172.00MB/s    0:10:02 (xfr#1, to-chk=0/1)\n"
+    "\n"
+    "sent 108,861,190,387 bytes  received 35 bytes  180,614,311.33 bytes/sec\n"
+    "total size is 108,834,620,118  speedup is 1.00\n"
+)
+
+
+def test_rsync_progress() -> None:
+    log = transfer_log.TransferLog()
+    head, tail = rsync_log.encode().split(b"0:00:00  \r")
+
+    log.update(head + b"0:00:00  \r")
+    info = log.update(tail[: tail.index(b"(xfr")])
+
+    assert info.source == source
+    assert info.destination == "/farm/sites/a"
+    assert info.transferred == 1_234_567_890
+    assert info.percent == 1
+    assert info.rate == 150 * 2 ** 20
+    assert info.eta == 11 * 60 + 22
+    assert info.average_rate() is None
+    assert info.average_rate(elapsed=10) == 123_456_789
+    assert not info.completed
+
+    info = log.update(tail[tail.index(b"(xfr") :])
+
+    assert info.completed
+    assert info.error is None
+    assert info.total == 108_834_620_118
+    assert info.eta == 0
+    assert info.elapsed == 602
+
+
+@pytest.mark.parametrize(argnames=["target"], argvalues=[["local_rsync"], ["rsyncd"]])
+def test_rsync_shipped_options_complete(target: str) -> None:
+    definitions = yaml.safe_load(
+        importlib.resources.read_text(plotman_resources, "target_definitions.yaml")
+    )
+    options = definitions["target_definitions"][target]["env"]["options"]
+    # What rsync writes for the --info flags of the shipped options
+    output = (
+        f"Archiving {source} to /farm/sites/a\n"
+        f"+ rsync {options} ...\n"
+        "  1,234,567,890   1%  150.00MB/s    0:11:22  \r"
+        "108,834,620,118 100%  172.00MB/s    0:10:02 (xfr#1, to-chk=0/1)\n"
+    )
+    if "stats1" in options:
+        output += (
+            "\n"
+            "sent 108,861,190,387 bytes  received 35 bytes  180,614,311.33 bytes/sec\n"
+            "total size is 108,834,620,118  speedup is 1.00\n"
+        )
+
+    info = transfer_log.TransferLog().update(output.encode())
+
+    assert info.completed
+    assert info.total == 108_834_620_118
+    assert info.elapsed == 602
+
+
+def test_rsync_progress_only_completes_when_nothing_left() -> None:
+    log = transfer_log.TransferLog()
+
+    info = log.update(
+        b"  1,234,567,890   1%  150.00MB/s    0:11:22  \r"
+        b"108,834,620,118 100%  172.00MB/s    0:10:02 (xfr#1, to-chk=1/2)\r"
+    )
+    assert not info.completed
+
+    info = log.update(
+        b"217,669,240,236 100%  172.00MB/s    0:20:04 (xfr#2, to-chk=0/2)\n"
+    )
+    assert info.completed
+    assert info.total == 217_669_240_236
+
+
+def test_rsync_error() -> None:
+    log = transfer_log.TransferLog()
+
+    info = log.update(
+        b'rsync: write failed on "/farm/sites/a/plot": No space left on device (28)\n'
+        b"rsync error: error in file IO (code 11) at receiver.c(374) [receiver=3.1.3]\n"
+    )
+
+    assert info.completed
+    assert (
+        info.error == "error in file IO (code 11) at receiver.c(374) [receiver=3.1.3]"
+    )
+
+
+def test_engine_progress() -> None:
+    log = transfer_log.TransferLog()
+    progress = transfer.Progress(copied=250, total=1000, elapsed=5, rate=25)
+
+    info = log.update(f"Archiving {source} to /farm/sites/a\n{progress}\n".encode())
+
+    assert (info.transferred, info.total, info.percent) == (250, 1000, 25)
+    assert info.rate == 25
+    assert info.eta == 30
+    assert info.average_rate() == 50
+
+    info = log.update(f"Moved {source} to /farm/sites/a/plot\n".encode())
+    assert info.completed
+
+
+def test_engine_done_with_spaces() -> None:
+    log = transfer_log.TransferLog()
+
+    info = log.update(
+        b"Moved /mnt/dst 00/plot-k32-1.plot to /farm/site a/plot-k32-1.plot\n"
+    )
+
+    assert info.completed
+
+
+def test_engine_verification() -> None:
+    log = transfer_log.TransferLog()
+
+    info = log.update(
+        b"verified k32 plot 1fc7b57b with 64 samples, read 8388608 bytes in 0.42 s\n"
+    )
+    assert info.verify_s == 0.42
+    assert not info.completed
+
+    info = log.update(
+        b"Traceback (most recent call last):\n"
+        b"plotman.plot_verify.VerificationException: Copy is 4 bytes instead of 5\n"
+    )
+    assert info.completed
+    assert info.error == "Copy is 4 bytes instead of 5"
+
+
+def test_engine_os_error() -> None:
+    log = transfer_log.TransferLog()
+
+    info = log.update(
+        b"Traceback (most recent call last):\n"
+        b"OSError: [Errno 28] No space left on device\n"
+    )
+
+    assert info.completed
+    assert info.error == "[Errno 28] No space left on device"
+
+
+def test_engine_resumed() -> None:
+    log = transfer_log.TransferLog()
+    progress = transfer.Progress(copied=750, total=1000, elapsed=5, rate=50)
+
+    info = log.update(f"Resuming /farm/a/plot.tmp at 500 bytes\n{progress}\n".encode())
+
+    assert info.resumed_at == 500
+    assert info.average_rate() == 50
+
+
+def test_transfer_logs(tmp_path: pathlib.Path) -> None:
+    started = "2021-08-29T22_22_52.123456-07_00"
+    (tmp_path / f"{started}.transfer.log").write_text(rsync_log)
+    running = tmp_path / "2021-08-30T01_00_00.000000-07_00.transfer.log"
+    running.write_text(f"Archiving {source} to /farm/sites/b\n")
+    logs = transfer_log.TransferLogs(directory=str(tmp_path))
+
+    [completed] = logs.update()
+    assert logs.update() == []
+    info = logs.read(str(running))
+
+    assert completed.started_at == pendulum.datetime(
+        2021, 8, 30, 5, 22, 52, 123456, tz="UTC"
+    )
+    assert info is not None and not info.completed
+    assert logs.recent() == [completed]
+
+
+def test_transfer_history_report(tmp_path: pathlib.Path) -> None:
+    (tmp_path / "2021-08-29T22_22_52.123456-07_00.transfer.log").write_text(rsync_log)
+    (tmp_path / "2021-08-29T23_22_52.123456-07_00.transfer.log").write_text(
+        "Archiving /d/plot-k32-1.plot to /farm/sites/a\n"
+        "rsync error: error in file IO (code 11)\n"
+    )
+    logs = transfer_log.TransferLogs(directory=str(tmp_path))
+    logs.update()
+
+    report = reporting.transfer_history_report(logs.recent(), 120)
+
+    [_, row] = report.splitlines()
+    assert row.split() == [
+        "/farm/sites/a",
+        "2",
+        "1",
+        "108.8GB",
+        "181MB/s",
+        "181MB/s",
+        "-",
+        "2021-08-29",
+        "23:22",
+    ]
@@ -0,0 +1,256 @@
+import errno
+import os
+import pathlib
+import typing
+
+# TODO: migrate away from unittest patch
+from unittest.mock import patch
+
+import pytest
+
+from plotman import plot_verify, transfer
+
+
+@pytest.mark.parametrize(
+    argnames=["strategy"],
+    argvalues=[[strategy] for strategy in transfer.copy_strategies()],
+)
+def test_copy(
+    tmp_path: pathlib.Path, strategy: typing.Callable[[int, int, int, int], int]
+) -> None:
+    data = os.urandom(10_000)
+    (tmp_path / "source").write_bytes(data)
+    reports: typing.List[transfer.Progress] = []
+    clock = iter(range(100)).__next__
+
+    src = os.open(tmp_path / "source", os.O_RDONLY)
+    dst = os.open(tmp_path / "destination", os.O_WRONLY | os.O_CREAT)
+    try:
+        with patch("plotman.transfer.copy_strategies", return_value=[strategy]):
+            transfer.copy(
+                src,
+                dst,
+                len(data),
+                reports.append,
+                report_interval_s=2,
+                chunk_size=3000,
+                clock=clock,
+            )
+    finally:
+        os.close(src)
+        os.close(dst)
+
+    assert (tmp_path / "destination").read_bytes() == data
+    assert [report.copied for report in reports] == [6000, 10_000]
+    assert reports[-1] == transfer.Progress(
+        copied=10_000, total=10_000, elapsed=4, rate=2000
+    )
+
+
+def test_copy_checkpoints(tmp_path: pathlib.Path) -> None:
+    data = os.urandom(10_000)
+    (tmp_path / "source").write_bytes(data)
+    checkpoints: typing.List[int] = []
+
+    src = os.open(tmp_path / "source", os.O_RDONLY)
+    dst = os.open(tmp_path / "destination", os.O_WRONLY | os.O_CREAT)
+    try:
+        transfer.copy(
+            src,
+            dst,
+            len(data),
+            lambda progress: None,
+            report_interval_s=2,
+            chunk_size=1000,
+            clock=iter(range(100)).__next__,
+            offset=3000,
+            checkpoint=checkpoints.append,
+        )
+    finally:
+        os.close(src)
+        os.close(dst)
+
+    assert (tmp_path / "destination").read_bytes()[3000:] == data[3000:]
+    assert checkpoints == [5000, 7000, 9000]
+
+
+def test_copy_falls_back(tmp_path: pathlib.Path) -> None:
+    (tmp_path / "source").write_bytes(b"plot")
+
+    def unsupported(src: int, dst: int, offset: int, count: int) -> int:
+        raise OSError(errno.EXDEV, "cross-device")
+
+    src = os.open(tmp_path / "source", os.O_RDONLY)
+    dst = os.open(tmp_path / "destination", os.O_WRONLY | os.O_CREAT)
+    try:
+        with patch(
+            "plotman.transfer.copy_strategies",
+            return_value=[unsupported, transfer._copy_read_write],
+        ):
+            transfer.copy(src, dst, 4, lambda progress: None)
+    finally:
+        os.close(src)
+        os.close(dst)
+
+    assert (tmp_path / "destination").read_bytes() == b"plot"
+
+
+def test_move_renames_on_same_filesystem(tmp_path: pathlib.Path) -> None:
+    source = tmp_path / "plot-k32-1.plot"
+    source.write_bytes(b"plot")
+
+    with patch("plotman.transfer.copy") as copy:
+        destination = transfer.move(str(source), str(tmp_path / "archive"))
+
+    copy.assert_not_called()
+    assert destination == str(tmp_path / "archive" / "plot-k32-1.plot")
+    assert pathlib.Path(destination).read_bytes() == b"plot"
+    assert not source.exists()
+
+
+def test_move_copies_between_filesystems(tmp_path: pathlib.Path) -> None:
+    source = tmp_path / "plot-k32-1.plot"
+    source.write_bytes(b"plot")
+    reports: typing.List[transfer.Progress] = []
+
+    with patch("plotman.transfer.same_filesystem", return_value=False):
+        destination = transfer.move(
+            str(source), str(tmp_path / "archive"), report=reports.append
+        )
+
+    assert pathlib.Path(destination).read_bytes() == b"plot"
+    assert os.listdir(tmp_path / "archive") == ["plot-k32-1.plot"]
+    assert not source.exists()
+    assert reports[-1].copied == 4
+
+
+def test_move_failure_keeps_source(tmp_path: pathlib.Path) -> None:
+    source = tmp_path / "plot-k32-1.plot"
+    source.write_bytes(b"plot")
+
+    with patch("plotman.transfer.same_filesystem", return_value=False), patch(
+        "plotman.transfer.copy", side_effect=OSError(errno.ENOSPC, "full")
+    ):
+        with pytest.raises(OSError):
+            transfer.move(str(source), str(tmp_path / "archive"))
+
+    assert source.read_bytes() == b"plot"
+    assert os.listdir(tmp_path / "archive") == ["plot-k32-1.plot.tmp"]
+
+
+def test_move_verification_failure_keeps_source(tmp_path: pathlib.Path) -> None:
+    source = tmp_path / "plot-k32-1.plot"
+    source.write_bytes(b"plot")
+    verified: typing.List[typing.Tuple[str, str]] = []
+
+    def verify(source: str, copy: str) -> None:
+        verified.append((source, copy))
+        raise plot_verify.VerificationException("differ")
+
+    with patch("plotman.transfer.same_filesystem", return_value=False):
+        with pytest.raises(plot_verify.VerificationException):
+            transfer.move(str(source), str(tmp_path / "archive"), verify=verify)
+
+    assert verified == [
+        (str(source), str(tmp_path / "archive" / "plot-k32-1.plot.tmp"))
+    ]
+    assert source.read_bytes() == b"plot"
+    assert os.listdir(tmp_path / "archive") == []
+
+
+def test_move_refuses_to_overwrite(tmp_path: pathlib.Path) -> None:
+    source = tmp_path / "plot-k32-1.plot"
+    source.write_bytes(b"plot")
+    (tmp_path / "archive").mkdir()
+    (tmp_path / "archive" / "plot-k32-1.plot").write_bytes(b"other")
+
+    with pytest.raises(transfer.TransferException):
+        transfer.move(str(source), str(tmp_path / "archive"))
+
+    assert source.exists()
+
+
+def test_move_completes_interrupted_move(tmp_path: pathlib.Path) -> None:
+    source = tmp_path / "plot-k32-1.plot"
+    source.write_bytes(b"plot")
+    (tmp_path / "archive").mkdir()
+    (tmp_path / "archive" / "plot-k32-1.plot").write_bytes(b"plot")
+    verified: typing.List[typing.Tuple[str, str]] = []
+
+    def verify(source: str, copy: str) -> None:
+        verified.append((source, copy))
+
+    destination = transfer.move(str(source), str(tmp_path / "archive"), verify=verify)
+
+    assert verified == [(str(source), destination)]
+    assert pathlib.Path(destination).read_bytes() == b"plot"
+    assert not source.exists()
+
+
+def test_move_refuses_unverified_destination(tmp_path: pathlib.Path) -> None:
+    source = tmp_path / "plot-k32-1.plot"
+    source.write_bytes(b"plot")
+    (tmp_path / "archive").mkdir()
+    (tmp_path / "archive" / "plot-k32-1.plot").write_bytes(b"tolp")
+
+    def verify(source: str, copy: str) -> None:
+        raise plot_verify.VerificationException("differ")
+
+    with pytest.raises(transfer.TransferException):
+        transfer.move(str(source), str(tmp_path / "archive"), verify=verify)
+
+    assert source.exists()
+
+
+def interrupted(
+    tmp_path: pathlib.Path, data: bytes, partial_data: bytes, offset: int
+) -> pathlib.Path:
+    source = tmp_path / "plot-k32-1.plot"
+    source.write_bytes(data)
+    (tmp_path / "archive").mkdir()
+    partial = tmp_path / "archive" / "plot-k32-1.plot.tmp"
+    partial.write_bytes(partial_data)
+    transfer.write_checkpoint(
+        transfer.Checkpoint(
+            source=str(source),
+            size=len(data),
+            mtime_ns=source.stat().st_mtime_ns,
+            partial=str(partial),
+            offset=offset,
+        )
+    )
+    return source
+
+
+def test_move_resumes(tmp_path: pathlib.Path) -> None:
+    data = os.urandom(300_000)
+    source = interrupted(
+        tmp_path, data, data[:200_000] + bytes(100_000), offset=200_000
+    )
+    messages: typing.List[str] = []
+
+    with patch("plotman.transfer.same_filesystem", return_value=False), patch(
+        "plotman.transfer.copy", wraps=transfer.copy
+    ) as copy:
+        destination = transfer.move(
+            str(source), str(tmp_path / "archive"), log=messages.append
+        )
+
+    assert copy.call_args.kwargs["offset"] == 200_000
+    assert messages == [f"Resuming {destination}.tmp at 200000 bytes"]
+    assert pathlib.Path(destination).read_bytes() == data
+    assert os.listdir(tmp_path / "archive") == ["plot-k32-1.plot"]
+
+
+def test_move_restarts_when_partial_differs(tmp_path: pathlib.Path) -> None:
+    data = os.urandom(300_000)
+    source = interrupted(tmp_path, data, bytes(300_000), offset=200_000)
+    messages: typing.List[str] = []
+
+    with patch("plotman.transfer.same_filesystem", return_value=False):
+        destination = transfer.move(
+            str(source), str(tmp_path / "archive"), log=messages.append
+        )
+
+    assert messages == []
+    assert pathlib.Path(destination).read_bytes() == data
@@ -0,0 +1,174 @@
+import random
+import typing
+
+# TODO: migrate away from unittest patch
+from unittest.mock import patch
+
+import attr
+
+from plotman import configuration, job, tuner
+import plotman.plotters
+import plotman.plotters.chianetwork
+
+HOUR = 3600
+
+tuning = configuration.Tuning(
+    threads=[2, 4],
+    buffer=[3389, 4000],
+    tmpdir_classes={"nvme": ["/t0", "/t1/"]},
+    min_samples=2,
+)
+
+plotting_cfg = configuration.Plotting(
+    type="chia",
+    chia=plotman.plotters.chianetwork.Options(n_threads=2, n_buckets=128),
+    tuning=tuning,
+)
+
+
+def completed_info(
+    tmpdir: str, threads: int, buffer: int, hours: float
+) -> plotman.plotters.CommonInfo:
+    return plotman.plotters.CommonInfo(
+        type="chia",
+        phase=job.Phase(5, 3),
+        tmpdir=tmpdir,
+        tmp2dir=tmpdir,
+        dstdir="/d",
+        buckets=128,
+        threads=threads,
+        buffer=buffer,
+        filename="",
+        plot_size=32,
+        phase1_duration_raw=hours * HOUR / 2,
+        phase2_duration_raw=hours * HOUR / 4,
+        phase3_duration_raw=hours * HOUR / 8,
+        phase4_duration_raw=hours * HOUR / 8,
+        total_time_raw=hours * HOUR,
+        cpu_time_raw=threads * hours * HOUR,
+        completed=True,
+    )
+
+
+@patch("plotman.job.Job")
+def running_job(info: plotman.plotters.CommonInfo, MockJob: typing.Any) -> typing.Any:
+    j = MockJob()
+    j.plotter.common_info.return_value = info
+    return j
+
+
+def test_candidates() -> None:
+    assert tuner.candidates(plotting_cfg, tuning) == [
+        tuner.Parameters(threads=2, buckets=128, buffer=3389),
+        tuner.Parameters(threads=2, buckets=128, buffer=4000),
+        tuner.Parameters(threads=4, buckets=128, buffer=3389),
+        tuner.Parameters(threads=4, buckets=128, buffer=4000),
+    ]
+
+
+def test_tmpdir_class() -> None:
+    assert tuner.tmpdir_class("/t1", tuning) == "nvme"
+    assert tuner.tmpdir_class("/t2/", tuning) == "/t2"
+
+
+def test_trials_by_class() -> None:
+    completed = [
+        completed_info("/t0", 2, 3389, hours=8),
+        completed_info("/t1", 2, 3389, hours=4),
+        completed_info("/t2", 2, 3389, hours=1),
+        completed_info("/t0", 4, 4000, hours=6),
+    ]
+    jobs = [running_job(completed_info("/t1", 4, 4000, hours=0))]
+
+    trials = tuner.trials(plotting_cfg, tuning, "/t0", jobs, completed)
+
+    assert [(trial.samples, trial.running) for trial in trials] == [
+        (2, 0),
+        (0, 0),
+        (0, 0),
+        (1, 1),
+    ]
+    assert trials[0].throughput == 2
+    assert trials[3].throughput == 1
+    assert trials[0].phase_durations == (3 * HOUR, 1.5 * HOUR, 0.75 * HOUR, 0.75 * HOUR)
+    assert trials[0].cpu_time == 12 * HOUR
+    assert trials[1].throughput is None
+
+
+def test_choose_explores_then_converges() -> None:
+    completed: typing.List[plotman.plotters.CommonInfo] = []
+    chosen = []
+    rng = random.Random(0)
+    no_exploration = attr.evolve(tuning, explore_fraction=0)
+    hours = {2: 8, 4: 6}
+
+    for _ in range(12):
+        trials = tuner.trials(plotting_cfg, no_exploration, "/t0", [], completed)
+        parameters, reason = tuner.choose(trials, no_exploration, rng)
+        chosen.append((parameters, reason))
+        assert parameters.buffer is not None
+        hours_taken = hours[parameters.threads] - (parameters.buffer == 4000)
+        completed.append(
+            completed_info("/t0", parameters.threads, parameters.buffer, hours_taken)
+        )
+
+    assert [reason for _, reason in chosen] == ["exploring"] * 8 + ["best"] * 4
+    # Twice the threads do not make the plots twice as fast
+    assert {parameters for parameters, _ in chosen[8:]} == {
+        tuner.Parameters(threads=2, buckets=128, buffer=4000)
+    }
+
+
+def test_choose_counts_running_jobs() -> None:
+    jobs = [running_job(completed_info("/t0", 2, 3389, hours=0))] * 2
+
+    trials = tuner.trials(plotting_cfg, tuning, "/t0", jobs, [])
+
+    assert tuner.choose(trials, tuning, random.Random(0)) == (
+        tuner.Parameters(threads=2, buckets=128, buffer=4000),
+        "exploring",
+    )
+
+
+def test_choose_explore_fraction() -> None:
+    single = attr.evolve(tuning, buffer=None, min_samples=1, explore_fraction=1)
+    completed = [
+        completed_info("/t0", 2, 3389, hours=8),
+        completed_info("/t0", 4, 3389, hours=3),
+    ]
+
+    trials = tuner.trials(plotting_cfg, single, "/t0", [], completed)
+
+    assert tuner.choose(trials, single, random.Random(0)) == (
+        tuner.Parameters(threads=2, buckets=128, buffer=3389),
+        "exploring",
+    )
+
+
+def test_tune_command_line() -> None:
+    tuned, message = tuner.tune(plotting_cfg, "/t0", [], [], rng=random.Random(0))
+
+    assert tuned.chia is not None
+    args = plotman.plotters.chianetwork.create_command_line(
+        options=tuned.chia,
+        tmpdir="/t0",
+        tmp2dir=None,
+        dstdir="/d",
+        farmer_public_key=None,
+        pool_public_key=None,
+        pool_contract_address=None,
+    )
+    assert args[args.index("-r") + 1] == "2"
+    assert args[args.index("-b") + 1] == "3389"
+    assert message == "tuned -r 2 -u 128 -b 3389 (exploring)"
+
+
+def test_report() -> None:
+    completed = [completed_info("/t0", 2, 3389, hours=8)]
+
+    report = tuner.report(plotting_cfg, ["/t0", "/t1", "/t2"], [], completed, 120)
+
+    lines = report.splitlines()
+    assert len(lines) == 1 + 2 * 4
+    [best] = [line for line in lines if line.endswith("*")]
+    assert best.startswith("nvme") and "1.50" in best
@@ -0,0 +1,153 @@
+import json
+import pathlib
+import typing
+
+# TODO: migrate away from unittest patch
+from unittest.mock import patch
+
+import pytest
+
+from plotman import configuration, watch
+
+
+def job_dict(
+    progress: str = "1:2", tmp_usage: int = 1000, **kwargs: object
+) -> watch.Event:
+    values: watch.Event = {
+        "plot_id": "1fc7b57b",
+        "tmp_dir": "/t",
+        "dst_dir": "/d",
+        "progress": progress,
+        "tmp_usage": tmp_usage,
+        "pid": 11,
+        "run_status": "RUN",
+        "time_wall": 100,
+    }
+    values.update(kwargs)
+    return values
+
+
+@pytest.mark.parametrize(
+    argnames=["previous", "current", "expected"],
+    argvalues=[
+        (100, 100, False),
+        (100, 105, False),
+        (100, 106, True),
+        (100, 94, True),
+        (0, 1, True),
+        ("RUN", "STP", True),
+        (None, 0, True),
+    ],
+)
+def test_moved(previous: object, current: object, expected: bool) -> None:
+    assert watch.moved(previous, current, change_ratio=0.05) == expected
+
+
+def test_watcher_reports_only_changes() -> None:
+    watcher = watch.Watcher(change_ratio=0.05)
+    snapshot = watcher.snapshot(
+        {11: job_dict()}, {"/d": {"dir": "/d", "uses": ["dst"], "free_bytes": 1000}}, 1
+    )
+    assert snapshot["event"] == "snapshot"
+    assert snapshot["jobs"] == [job_dict()]
+
+    # Small moves and the wall time are not reported.
+    assert (
+        watcher.changes(
+            {11: job_dict(tmp_usage=1040, time_wall=200)},
+            {"/d": {"dir": "/d", "uses": ["dst"], "free_bytes": 990}},
+            2,
+        )
+        == []
+    )
+
+    events = watcher.changes(
+        {
+            11: job_dict(progress="2:1", tmp_usage=1100),
+            12: job_dict(pid=12, plot_id="2a"),
+        },
+        {"/t": {"dir": "/t", "uses": ["tmp"], "free_bytes": 5}},
+        3,
+    )
+    assert events == [
+        {
+            "event": "job_phase",
+            "time": 3,
+            "pid": 11,
+            "plot_id": "1fc7b57b",
+            "phase": "2:1",
+            "previous": "1:2",
+        },
+        {
+            "event": "job_changed",
+            "time": 3,
+            "pid": 11,
+            "plot_id": "1fc7b57b",
+            "changes": {"tmp_usage": 1100},
+        },
+        {"event": "job_started", "time": 3, "job": job_dict(pid=12, plot_id="2a")},
+        {"event": "dir_removed", "time": 3, "dir": "/d"},
+        {
+            "event": "dir_added",
+            "time": 3,
+            "dir": {"dir": "/t", "uses": ["tmp"], "free_bytes": 5},
+        },
+    ]
+
+    # Compared with the value last reported, not the one last seen.
+    [changed] = watcher.changes(
+        {11: job_dict(progress="2:1", tmp_usage=1160)},
+        {"/t": {"dir": "/t", "uses": ["tmp"], "free_bytes": 5}},
+        4,
+    )[1:]
+    assert changed == {
+        "event": "job_changed",
+        "time": 4,
+        "pid": 11,
+        "plot_id": "1fc7b57b",
+        "changes": {"tmp_usage": 1160},
+    }
+    assert watcher.changes({}, {}, 5) == [
+        {"event": "job_ended", "time": 5, "pid": 11, "plot_id": "1fc7b57b"},
+        {"event": "dir_removed", "time": 5, "dir": "/t"},
+    ]
+
+
+def test_run_writes_ndjson(tmp_path: pathlib.Path) -> None:
+    (tmp_path / "tmp").mkdir()
+    cfg = configuration.PlotmanConfig(
+        directories=configuration.Directories(tmp=[str(tmp_path / "tmp")]),
+        scheduling=configuration.Scheduling(
+            global_max_jobs=1,
+            global_stagger_m=0,
+            polling_time_s=20,
+            tmpdir_max_jobs=1,
+            tmpdir_stagger_phase_major=2,
+            tmpdir_stagger_phase_minor=0,
+        ),
+        plotting=configuration.Plotting(),
+        logging=configuration.Logging(plots=str(tmp_path)),
+    )
+    lines: typing.List[str] = []
+    sleeps: typing.List[float] = []
+
+    def sleep(seconds: float) -> None:
+        sleeps.append(seconds)
+        if len(sleeps) == 1:
+            (tmp_path / "tmp").rmdir()
+        else:
+            raise KeyboardInterrupt
+
+    with patch("plotman.job.Job.get_running_jobs", return_value=[]):
+        with pytest.raises(KeyboardInterrupt):
+            watch.run(
+                cfg, interval_s=3, change_ratio=0.05, write=lines.append, sleep=sleep
+            )
+
+    assert sleeps == [3, 3]
+    assert all(line.endswith("\n") for line in lines)
+    snapshot, removed = [json.loads(line) for line in lines]
+    assert snapshot["event"] == "snapshot"
+    assert snapshot["jobs"] == []
+    assert [d["dir"] for d in snapshot["dirs"]] == [str(tmp_path / "tmp")]
+    assert removed["event"] == "dir_removed"
@@ -0,0 +1,115 @@
+import pathlib
+import typing
+
+# TODO: migrate away from unittest patch
+from unittest.mock import patch
+
+from plotman import configuration, job, watchdog
+
+config = configuration.Watchdog(stall_m=10, phase_stall_m={5: 30})
+
+MIN = 60
+
+
+@patch("plotman.job.Job")
+def job_w_log(
+    pid: int, logfile: pathlib.Path, phase: job.Phase, MockJob: typing.Any
+) -> typing.Any:
+    logfile.touch()
+    j = MockJob()
+    j.proc.pid = pid
+    j.proc.cpu_times.return_value.user = 100.0
+    j.proc.cpu_times.return_value.system = 10.0
+    j.logfile = str(logfile)
+    j.progress.return_value = phase
+    j.get_run_status.return_value = "SLP"
+    j.plot_id_prefix.return_value = f"plot{pid}"
+    j.kill.return_value = {"/t/plot-k32-x.tmp"}
+    return j
+
+
+def use_cpu(j: typing.Any, seconds: float) -> None:
+    j.proc.cpu_times.return_value.user += seconds
+
+
+def test_flags_job_without_progress_once(tmp_path: pathlib.Path) -> None:
+    j = job_w_log(1, tmp_path / "1.log", job.Phase(3, 2))
+    dog = watchdog.Watchdog(config=config)
+
+    assert dog.update([j], now=0) == []
+    assert dog.update([j], now=9 * MIN) == []
+    [message] = dog.update([j], now=10 * MIN)
+    assert dog.update([j], now=11 * MIN) == []
+
+    assert message.startswith("Flagged plot1 pid 1 in phase 3:2 stalled")
+    assert str(tmp_path / "1.log") in message
+    j.kill.assert_not_called()
+
+
+def test_log_output_is_progress(tmp_path: pathlib.Path) -> None:
+    j = job_w_log(1, tmp_path / "1.log", job.Phase(1, 2))
+    dog = watchdog.Watchdog(config=config)
+
+    dog.update([j], now=0)
+    (tmp_path / "1.log").write_text("Computing table 3\n")
+    assert dog.update([j], now=9 * MIN) == []
+    assert dog.update([j], now=18 * MIN) == []
+    assert dog.update([j], now=19 * MIN) != []
+
+
+def test_cpu_time_is_progress(tmp_path: pathlib.Path) -> None:
+    j = job_w_log(1, tmp_path / "1.log", job.Phase(1, 2))
+    dog = watchdog.Watchdog(config=config)
+
+    dog.update([j], now=0)
+    use_cpu(j, 0.5)
+    assert dog.update([j], now=9 * MIN) == []
+    # Less than a second of cpu time does not count
+    assert dog.update([j], now=10 * MIN) != []
+
+    use_cpu(j, 60)
+    assert dog.update([j], now=11 * MIN) == []
+    assert dog.flagged == set()
+
+
+def test_phase_threshold(tmp_path: pathlib.Path) -> None:
+    j = job_w_log(1, tmp_path / "1.log", job.Phase(5, 1))
+    dog = watchdog.Watchdog(config=config)
+
+    dog.update([j], now=0)
+    assert dog.update([j], now=29 * MIN) == []
+    assert dog.update([j], now=30 * MIN) != []
+
+
+def test_stopped_jobs_are_not_stalled(tmp_path: pathlib.Path) -> None:
+    j = job_w_log(1, tmp_path / "1.log", job.Phase(2, 1))
+    dog = watchdog.Watchdog(config=config)
+
+    dog.update([j], now=0)
+    j.get_run_status.return_value = "STP"
+    assert dog.update([j], now=60 * MIN) == []
+    j.get_run_status.return_value = "SLP"
+    assert dog.update([j], now=65 * MIN) == []
+    assert dog.update([j], now=70 * MIN) != []
+
+
+def test_kill(tmp_path: pathlib.Path) -> None:
+    jobs = [
+        job_w_log(1, tmp_path / "1.log", job.Phase(2, 1)),
+        job_w_log(2, tmp_path / "2.log", job.Phase(2, 1)),
+    ]
+    dog = watchdog.Watchdog(
+        config=configuration.Watchdog(stall_m=10, kill=True),
+    )
+
+    dog.update(jobs, now=0)
+    use_cpu(jobs[1], 60)
+    [message] = dog.update(jobs, now=10 * MIN)
+
+    assert message.startswith("Killed plot1 pid 1")
+    assert message.endswith("removed 1 temp files: /t/plot-k32-x.tmp")
+    jobs[0].kill.assert_called_once()
+    jobs[1].kill.assert_not_called()
+
+    dog.update(jobs[1:], now=11 * MIN)
+    assert list(dog.progress) == [2]
@@ -0,0 +1,129 @@
+import contextlib
+import glob
+import os
+import re
+import typing
+
+import psutil
+
+from plotman import job
+
+NODE_ROOT = "/sys/devices/system/node"
+
+
+def parse_cpulist(text: str) -> typing.List[int]:
+    """Parse a kernel cpu list such as ``0-3,8-11`` into sorted cpu ids."""
+    cpus: typing.Set[int] = set()
+    for segment in text.strip().split(","):
+        if not segment:
+            continue
+        first, _, last = segment.partition("-")
+        cpus.update(range(int(first), int(last or first) + 1))
+    return sorted(cpus)
+
+
+def format_cpulist(cpus: typing.Iterable[int]) -> str:
+    """Format cpu ids as a compact kernel style cpu list such as ``0-3,8-11``."""
+    ranges: typing.List[typing.List[int]] = []
+    for cpu in sorted(set(cpus)):
+        if ranges and ranges[-1][1] == cpu - 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ",".join(
+        str(first) if first == last else f"{first}-{last}" for first, last in ranges
+    )
+
+
+def read_nodes(root: str = NODE_ROOT) -> typing.Dict[int, typing.List[int]]:
+    """Return a map from NUMA node id to its cpu ids.  Systems without NUMA
+    information are treated as a single node with all usable cpus."""
+    nodes = {}
+    for path in glob.glob(os.path.join(root, "node*", "cpulist")):
+        match = re.search(r"node(\d+)$", os.path.dirname(path))
+        if match is None:
+            continue
+        with open(path) as file:
+            cpus = parse_cpulist(file.read())
+        if cpus:
+            nodes[int(match.group(1))] = cpus
+
+    if not nodes:
+        nodes[0] = sorted(usable_cpus())
+
+    return nodes
+
+
+def usable_cpus() -> typing.Set[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return os.sched_getaffinity(0)
+
+    return set(range(os.cpu_count() or 1))
+
+
+def allocate(
+    nodes: typing.Dict[int, typing.List[int]],
+    allocations: typing.Sequence[typing.Collection[int]],
+    threads: typing.Optional[int],
+) -> typing.List[int]:
+    """Choose cpus for a new job given the cpu sets already pinned for running
+    jobs.  The node running the fewest jobs is used, preferring the one with
+    the most unallocated cpus, and within it the least allocated cpus.  A job
+    needing more cpus than a node has spills over to the least allocated cpus
+    of the other nodes.  A threads value of None requests a whole node."""
+    usage = {cpu: 0 for cpus in nodes.values() for cpu in cpus}
+    node_jobs = {node: 0 for node in nodes}
+    for allocation in allocations:
+        for cpu in allocation:
+            if cpu in usage:
+                usage[cpu] += 1
+        for node, cpus in nodes.items():
+            if not set(cpus).isdisjoint(allocation):
+                node_jobs[node] += 1
+
+    def node_key(node: int) -> typing.Tuple[int, int, int]:
+        free = len([cpu for cpu in nodes[node] if usage[cpu] == 0])
+        return (node_jobs[node], -free, node)
+
+    node = min(nodes, key=node_key)
+    if threads is None:
+        threads = len(nodes[node])
+
+    def cpu_key(cpu: int) -> typing.Tuple[int, int]:
+        return (usage[cpu], cpu)
+
+    chosen = sorted(nodes[node], key=cpu_key)[:threads]
+    if len(chosen) < threads:
+        others = [cpu for cpu in usage if cpu not in nodes[node]]
+        chosen.extend(sorted(others, key=cpu_key)[: threads - len(chosen)])
+
+    return sorted(chosen)
+
+
+def pinned_allocations(
+    jobs: typing.List[job.Job],
+) -> typing.List[typing.List[int]]:
+    """Return the cpu sets of running jobs that are pinned to a subset of the
+    usable cpus.  Since the map is rebuilt from the running processes, the cpus
+    of jobs that have exited are released automatically."""
+    all_cpus = usable_cpus()
+    allocations = []
+    for j in jobs:
+        with contextlib.suppress(psutil.NoSuchProcess, psutil.AccessDenied):
+            cpus = j.get_cpu_affinity()
+            if cpus is not None and set(cpus) != all_cpus:
+                allocations.append(cpus)
+    return allocations
+
+
+def pinner(cpus: typing.Collection[int]) -> typing.Optional[typing.Callable[[], None]]:
+    """Return a function restricting the calling process to the given cpus, to
+    run in a new job's process before it executes the plotter so that every
+    thread the plotter starts inherits them, or None when not supported."""
+    if not hasattr(os, "sched_setaffinity"):
+        return None
+
+    def pin() -> None:
+        os.sched_setaffinity(0, cpus)
+
+    return pin
@@ -8,14 +8,24 @@ import random
 import re
 import subprocess
 import sys
+import threading
+import time
 import typing
 from datetime import datetime
 
+import attr
 import pendulum
 import psutil
 import texttable as tt
 
-from plotman import configuration, job, manager, plot_util
+from plotman import (
+    archive_queue,
+    configuration,
+    job,
+    manager,
+    plot_util,
+    transfer_log,
+)
 
 
 disk_space_logger = logging.getLogger("disk_space")
@@ -25,91 +35,264 @@ _WINDOWS = sys.platform == "win32"
 # TODO : write-protect and delete-protect archived plots
 
 
+@attr.frozen
+class Transfer:
+    """A running archive transfer.  The source plot and destination archive dir
+    are read from the environment plotman started the transfer with and are
+    None for transfers that were started some other way.  pid is None until
+    the transfer process of a newly started transfer has been found."""
+
+    pid: typing.Optional[int]
+    source: typing.Optional[str] = None
+    destination: typing.Optional[str] = None
+    start_time: typing.Optional[float] = None
+    logfile: typing.Optional[str] = None
+    info: typing.Optional[transfer_log.TransferInfo] = None
+
+    def __str__(self) -> str:
+        result = "<pending>" if self.pid is None else str(self.pid)
+        if self.source is not None:
+            result += " %s" % os.path.basename(self.source)
+        if self.destination is not None:
+            result += " -> %s" % self.destination
+        if self.info is not None and self.info.rate is not None:
+            result += " %sB/s" % plot_util.human_format(self.info.rate, 0)
+        return result
+
+    def average_rate(
+        self, now: typing.Optional[float] = None
+    ) -> typing.Optional[float]:
+        if self.info is None:
+            return None
+        if self.start_time is None:
+            return self.info.average_rate()
+        if now is None:
+            now = time.time()
+        return self.info.average_rate(elapsed=now - self.start_time)
+
+    def to_dict(self, now: typing.Optional[float] = None) -> typing.Dict[str, object]:
+        return {
+            "pid": self.pid,
+            "source": self.source,
+            "destination": self.destination,
+            "start_time": self.start_time,
+            "logfile": self.logfile,
+            "transferred": None if self.info is None else self.info.transferred,
+            "percent": None if self.info is None else self.info.percent,
+            "rate": None if self.info is None else self.info.rate,
+            "average_rate": self.average_rate(now),
+            "eta": None if self.info is None else self.info.eta,
+        }
+
+
+def transfer_logfile(proc: psutil.Process) -> typing.Optional[str]:
+    """The transfer log, which is where the output of the transfer goes."""
+    with contextlib.suppress(psutil.AccessDenied):
+        for open_file in proc.open_files():
+            if open_file.fd == 1:
+                return open_file.path  # type: ignore[no-any-return]
+    return None
+
+
+def read_transfer_log(
+    logfile: typing.Optional[str],
+) -> typing.Optional[transfer_log.TransferInfo]:
+    if logfile is None:
+        return None
+    return transfer_log.transfer_logs(os.path.dirname(logfile)).read(logfile)
+
+
+def transfers_status(transfers: typing.Sequence[Transfer]) -> str:
+    return "pid: " + ", ".join(map(str, transfers))
+
+
+@attr.mutable
+class DiskSpace:
+    """Archive dir free space from the disk space script, checked in a
+    background thread every refresh_s so callers never wait on it.  Space
+    reserved by transfers started since the last check is subtracted from the
+    checked free space."""
+
+    arch_cfg: configuration.Archiving
+    refresh_s: float
+    clock: typing.Callable[[], float] = time.monotonic
+    freebytes: typing.Optional[typing.Dict[str, int]] = None
+    checked_at: typing.Optional[float] = None
+    log_messages: typing.List[str] = attr.ib(factory=list)
+    # (time, archive dir, bytes) of transfers started since the last check
+    started: typing.List[typing.Tuple[float, str, int]] = attr.ib(factory=list)
+    lock: threading.Lock = attr.ib(factory=threading.Lock)
+    thread: typing.Optional[threading.Thread] = None
+
+    def check(self) -> None:
+        """Run the disk space script once."""
+        start = self.clock()
+        freebytes, log_messages = get_archdir_freebytes(self.arch_cfg)
+        with self.lock:
+            self.freebytes = freebytes
+            self.checked_at = start
+            self.log_messages.extend(log_messages)
+            # Transfers started before the check began have preallocated
+            # their space, or at least started writing, by now.
+            self.started = [entry for entry in self.started if entry[0] >= start]
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self.check()
+            except Exception as e:
+                with self.lock:
+                    self.log_messages.append(f"Disk space check failed: {e}")
+            time.sleep(self.refresh_s)
+
+    def start(self) -> None:
+        self.thread = threading.Thread(
+            target=self._run, name="archive disk space", daemon=True
+        )
+        self.thread.start()
+
+    def transfer_started(self, archdir: str, size: int) -> None:
+        with self.lock:
+            self.started.append((self.clock(), archdir, size))
+
+    def get(
+        self,
+    ) -> typing.Tuple[typing.Dict[str, int], typing.Optional[float], typing.List[str]]:
+        """Return the free bytes of each archive dir, the age in seconds of the
+        check they come from and log messages from checks since the last call.
+        Until the first check completes there are no archive dirs."""
+        with self.lock:
+            log_messages = self.log_messages
+            self.log_messages = []
+            if self.freebytes is None or self.checked_at is None:
+                return {}, None, log_messages
+
+            freebytes = dict(self.freebytes)
+            for _, archdir, size in self.started:
+                if archdir in freebytes:
+                    freebytes[archdir] -= size
+            return freebytes, self.clock() - self.checked_at, log_messages
+
+
 def spawn_archive_process(
     dir_cfg: configuration.Directories,
     arch_cfg: configuration.Archiving,
     log_cfg: configuration.Logging,
     all_jobs: typing.List[job.Job],
+    disk_space: typing.Optional[DiskSpace] = None,
+    queue: typing.Optional[archive_queue.ArchiveQueue] = None,
 ) -> typing.Tuple[typing.Union[bool, str, typing.Dict[str, object]], typing.List[str]]:
-    """Spawns a new archive process using the command created
-    in the archive() function. Returns archiving status and a log message to print."""
+    """Spawns new archive processes using the commands created in the archive()
+    function until max_concurrent transfers are running.  Returns archiving
+    status and a log message to print."""
 
     log_messages = []
     archiving_status = None
 
-    # Look for running archive jobs.  Be robust to finding more than one
-    # even though the scheduler should only run one at a time.
-    arch_jobs: typing.List[typing.Union[int, str]] = [
-        *get_running_archive_jobs(arch_cfg)
-    ]
+    transfers = get_running_transfers(arch_cfg)
+    if queue is not None:
+        log_messages.extend(
+            queue.update(
+                dir_cfg.get_dst_directories(),
+                all_jobs,
+                {
+                    os.path.normpath(transfer.source)
+                    for transfer in transfers
+                    if transfer.source is not None
+                },
+            )
+        )
 
-    if not arch_jobs:
+    while len(transfers) < arch_cfg.max_concurrent:
         (should_start, status_or_cmd, archive_log_messages) = archive(
-            dir_cfg, arch_cfg, all_jobs
+            dir_cfg, arch_cfg, all_jobs, transfers, disk_space, queue
         )
         log_messages.extend(archive_log_messages)
         if not should_start:
-            archiving_status = status_or_cmd
-        else:
-            args: typing.Dict[str, object] = status_or_cmd  # type: ignore[assignment]
+            if not transfers:
+                archiving_status = status_or_cmd
+            break
 
-            log_file_path = log_cfg.create_transfer_log_path(time=pendulum.now())
+        args: typing.Dict[str, object] = status_or_cmd  # type: ignore[assignment]
+        env: typing.Dict[str, str] = args["env"]  # type: ignore[assignment]
 
+        log_file_path = log_cfg.create_transfer_log_path(time=pendulum.now())
+
+        log_messages.append(
+            f'Starting archive: {args["args"]} ; logging to {log_file_path}'
+        )
+        # TODO: CAMPid 09840103109429840981397487498131
+        try:
+            open_log_file = open(log_file_path, "x")
+        except FileExistsError:
             log_messages.append(
-                f'Starting archive: {args["args"]} ; logging to {log_file_path}'
+                f"Archiving log file already exists, skipping attempt to start a"
+                f" new archive transfer: {log_file_path!r}"
             )
-            # TODO: CAMPid 09840103109429840981397487498131
-            try:
-                open_log_file = open(log_file_path, "x")
-            except FileExistsError:
-                log_messages.append(
-                    f"Archiving log file already exists, skipping attempt to start a"
-                    f" new archive transfer: {log_file_path!r}"
-                )
-                return (False, log_messages)
-            except FileNotFoundError as e:
-                message = (
-                    f"Unable to open log file.  Verify that the directory exists"
-                    f" and has proper write permissions: {log_file_path!r}"
-                )
-                raise Exception(message) from e
-
-            # Preferably, do not add any code between the try block above
-            # and the with block below.  IOW, this space intentionally left
-            # blank...  As is, this provides a good chance that our handle
-            # of the log file will get closed explicitly while still
-            # allowing handling of just the log file opening error.
-
-            if sys.platform == "win32":
-                creationflags = subprocess.CREATE_NO_WINDOW
-            else:
-                creationflags = 0
-
-            with open_log_file:
-                # start_new_sessions to make the job independent of this controlling tty.
-                p = subprocess.Popen(  # type: ignore[call-overload]
-                    **args,
-                    shell=True,
-                    stdout=open_log_file,
-                    stderr=subprocess.STDOUT,
-                    start_new_session=True,
-                    creationflags=creationflags,
+            return (False, log_messages)
+        except FileNotFoundError as e:
+            message = (
+                f"Unable to open log file.  Verify that the directory exists"
+                f" and has proper write permissions: {log_file_path!r}"
+            )
+            raise Exception(message) from e
+
+        # Preferably, do not add any code between the try block above
+        # and the with block below.  IOW, this space intentionally left
+        # blank...  As is, this provides a good chance that our handle
+        # of the log file will get closed explicitly while still
+        # allowing handling of just the log file opening error.
+
+        if sys.platform == "win32":
+            creationflags = subprocess.CREATE_NO_WINDOW
+        else:
+            creationflags = 0
+
+        with open_log_file:
+            # Identifies the transfer in its log for plotman.transfer_log.
+            open_log_file.write(f'Archiving {env["source"]} to {env["destination"]}\n')
+            open_log_file.flush()
+            # start_new_sessions to make the job independent of this controlling tty.
+            p = subprocess.Popen(  # type: ignore[call-overload]
+                **args,
+                shell=True,
+                stdout=open_log_file,
+                stderr=subprocess.STDOUT,
+                start_new_session=True,
+                creationflags=creationflags,
+            )
+        # At least for now it seems that even if we get a new running
+        # archive jobs list it doesn't contain the new rsync process.
+        # My guess is that this is because the bash in the middle due to
+        # shell=True is still starting up and really hasn't launched the
+        # new rsync process yet.  So, just put a placeholder here.  It
+        # will get filled on the next cycle.
+        if queue is not None:
+            queue.started(env["source"], env["destination"])
+        if disk_space is not None:
+            with contextlib.suppress(OSError):
+                disk_space.transfer_started(
+                    env["destination"], os.stat(env["source"]).st_size
                 )
-            # At least for now it seems that even if we get a new running
-            # archive jobs list it doesn't contain the new rsync process.
-            # My guess is that this is because the bash in the middle due to
-            # shell=True is still starting up and really hasn't launched the
-            # new rsync process yet.  So, just put a placeholder here.  It
-            # will get filled on the next cycle.
-            arch_jobs.append("<pending>")
+        transfers.append(
+            Transfer(
+                pid=None,
+                source=env.get("source"),
+                destination=env.get("destination"),
+            )
+        )
 
     if archiving_status is None:
-        archiving_status = "pid: " + ", ".join(map(str, arch_jobs))
+        archiving_status = transfers_status(transfers)
+    if queue is not None:
+        archiving_status = f"{archiving_status} ; {queue.summary()}"
 
     return archiving_status, log_messages
 
 
-def compute_priority(phase: job.Phase, gb_free: float, n_plots: int) -> int:
+def compute_priority(
+    phase: job.Phase, gb_free: float, n_plots: int, copies: int = 0
+) -> int:
     # All these values are designed around dst buffer dirs of about
     # ~2TB size and containing k32 plots.  TODO: Generalize, and
     # rewrite as a sort function.
@@ -129,6 +312,10 @@ def compute_priority(phase: job.Phase, gb_free: float, n_plots: int) -> int:
         elif phase >= job.Phase(3, 7):
             priority -= 32
 
+    # Reading a plot off a drive competes with the final copies of plots being
+    # written to it.
+    priority -= 32 * copies
+
     # If a drive is getting full, we should prioritize it
     if gb_free < 1000:
         priority += 1 + int((1000 - gb_free) / 100)
@@ -196,53 +383,142 @@ def get_archdir_freebytes(
 
 
 # TODO: maybe consolidate with similar code in job.py?
-def get_running_archive_jobs(arch_cfg: configuration.Archiving) -> typing.List[int]:
-    """Look for running rsync jobs that seem to match the pattern we use for archiving
-    them.  Return a list of PIDs of matching jobs."""
-    jobs = []
+def get_running_transfers(arch_cfg: configuration.Archiving) -> typing.List[Transfer]:
+    """Look for running transfer processes that seem to match the pattern we use
+    for archiving.  Processes started by another matching process, such as the
+    sender and receiver of a local rsync, are part of that transfer."""
     target = arch_cfg.target_definition()
     variables = {**os.environ, **arch_cfg.environment()}
     dest = target.transfer_process_argument_prefix.format(**variables)
     proc_name = target.transfer_process_name.format(**variables)
+
+    found: typing.Dict[int, typing.Tuple[int, Transfer]] = {}
     for proc in psutil.process_iter():
         with contextlib.suppress(psutil.NoSuchProcess):
             with proc.oneshot():
-                if proc.name() == proc_name:
-                    args = proc.cmdline()
-                    for arg in args:
-                        if arg.startswith(dest):
-                            jobs.append(proc.pid)
-    return jobs
+                if proc.name() != proc_name:
+                    continue
+                if not any(arg.startswith(dest) for arg in proc.cmdline()):
+                    continue
+                environ: typing.Dict[str, str] = {}
+                with contextlib.suppress(psutil.AccessDenied):
+                    environ = proc.environ()
+                logfile = transfer_logfile(proc)
+                found[proc.pid] = (
+                    proc.ppid(),
+                    Transfer(
+                        pid=proc.pid,
+                        source=environ.get("source"),
+                        destination=environ.get("destination"),
+                        start_time=proc.create_time(),
+                        logfile=logfile,
+                        info=read_transfer_log(logfile),
+                    ),
+                )
+
+    return [
+        transfer for pid, (ppid, transfer) in sorted(found.items()) if ppid not in found
+    ]
+
+
+def get_running_archive_jobs(arch_cfg: configuration.Archiving) -> typing.List[int]:
+    """Return a list of PIDs of running archive transfers."""
+    return [
+        transfer.pid
+        for transfer in get_running_transfers(arch_cfg)
+        if transfer.pid is not None
+    ]
+
+
+def choose_queued_plot(
+    arch_cfg: configuration.Archiving,
+    index: job.JobIndex,
+    queue: archive_queue.ArchiveQueue,
+    busy_sources: typing.Set[str],
+) -> typing.Optional[str]:
+    """Pick the next plot from the queue.  Only the oldest plot of each dst dir
+    is considered and the dst dir is chosen by the queue_order policy."""
+    heads = queue.heads(busy_sources)
+    if not heads:
+        return None
+
+    if arch_cfg.queue_order == "oldest":
+        head, _ = min(heads.values(), key=lambda item: item[0].mtime)
+        return head.path
+
+    if arch_cfg.queue_order == "fullest":
+        return heads[min(sorted(heads), key=plot_util.df_b)][0].path
+
+    dir2ph = manager.dstdirs_to_furthest_phase(index)
+    copies = manager.copies_by_device(index)
+
+    def priority(dstdir: str) -> int:
+        return compute_priority(
+            dir2ph.get(dstdir, job.Phase(0, 0)),
+            plot_util.df_b(dstdir) / plot_util.GB,
+            heads[dstdir][1],
+            copies.get(manager.dst_device(dstdir), 0),
+        )
+
+    return heads[max(sorted(heads), key=priority)][0].path
 
 
 def archive(
     dir_cfg: configuration.Directories,
     arch_cfg: configuration.Archiving,
     all_jobs: typing.List[job.Job],
+    transfers: typing.Sequence[Transfer] = (),
+    disk_space: typing.Optional[DiskSpace] = None,
+    queue: typing.Optional[archive_queue.ArchiveQueue] = None,
 ) -> typing.Tuple[
     bool, typing.Optional[typing.Union[typing.Dict[str, object], str]], typing.List[str]
 ]:
     """Configure one archive job.  Needs to know all jobs so it can avoid IO
-    contention on the plotting dstdir drives.  Returns either (False, <reason>)
+    contention on the plotting dstdir drives, and the running transfers so it
+    neither picks a plot already being transferred nor an archive dir on a
+    disk already being written to.  Returns either (False, <reason>)
     if we should not execute an archive job or (True, <cmd>) with the archive
-    command if we should."""
+    command if we should.  Free archive space comes from disk_space when given
+    and is otherwise checked now.  Likewise the plot comes from queue when
+    given and otherwise from scanning the dst dirs."""
     log_messages: typing.List[str] = []
     if arch_cfg is None:
         return (False, "No 'archive' settings declared in plotman.yaml", log_messages)
 
-    dir2ph = manager.dstdirs_to_furthest_phase(all_jobs)
-    best_priority = -100000000
-    chosen_plot = None
-    dst_dir = dir_cfg.get_dst_directories()
-    for d in dst_dir:
-        ph = dir2ph.get(d, job.Phase(0, 0))
-        dir_plots = plot_util.list_plots(d)
-        gb_free = plot_util.df_b(d) / plot_util.GB
-        n_plots = len(dir_plots)
-        priority = compute_priority(ph, gb_free, n_plots)
-        if priority >= best_priority and dir_plots:
-            best_priority = priority
-            chosen_plot = dir_plots[0]
+    busy_sources = {
+        os.path.normpath(transfer.source)
+        for transfer in transfers
+        if transfer.source is not None
+    }
+    # Remote archive dirs do not exist locally and are told apart by path.
+    busy_devices = {
+        manager.dst_device(transfer.destination)
+        for transfer in transfers
+        if transfer.destination is not None
+    }
+
+    job_index = job.JobIndex.of(all_jobs)
+    if queue is not None:
+        chosen_plot = choose_queued_plot(arch_cfg, job_index, queue, busy_sources)
+    else:
+        dir2ph = manager.dstdirs_to_furthest_phase(job_index)
+        copies = manager.copies_by_device(job_index)
+        best_priority = -100000000
+        chosen_plot = None
+        dst_dir = dir_cfg.get_dst_directories()
+        for d in dst_dir:
+            ph = dir2ph.get(os.path.normpath(d), job.Phase(0, 0))
+            dir_plots = plot_util.list_plots(d)
+            available_plots = [
+                plot for plot in dir_plots if os.path.normpath(plot) not in busy_sources
+            ]
+            gb_free = plot_util.df_b(d) / plot_util.GB
+            n_plots = len(dir_plots)
+            device = manager.dst_device(d)
+            priority = compute_priority(ph, gb_free, n_plots, copies.get(device, 0))
+            if priority >= best_priority and available_plots:
+                best_priority = priority
+                chosen_plot = available_plots[0]
 
     if not chosen_plot:
         return (False, "No plots found", log_messages)
@@ -253,7 +529,13 @@ def archive(
     #
     # Pick first archive dir with sufficient space
     #
-    archdir_freebytes, freebytes_log_messages = get_archdir_freebytes(arch_cfg)
+    if disk_space is None:
+        archdir_freebytes, freebytes_log_messages = get_archdir_freebytes(arch_cfg)
+    else:
+        archdir_freebytes, age, freebytes_log_messages = disk_space.get()
+        if age is None:
+            log_messages.extend(freebytes_log_messages)
+            return (False, "Waiting for the archive disk space check", log_messages)
     log_messages.extend(freebytes_log_messages)
     if not archdir_freebytes:
         return (False, "No free archive dirs found.", log_messages)
@@ -267,8 +549,13 @@ def archive(
         (d, space)
         for (d, space) in archdir_freebytes.items()
         if space > (chosen_plot_size + free_space_margin)
+        and manager.dst_device(d) not in busy_devices
     ]
-    if len(available) > 0:
+    # Retry an interrupted transfer where it left its partial plot.
+    previous = None if queue is None else queue.entries.get(chosen_plot)
+    if previous is not None and previous.destination in dict(available):
+        archdir = previous.destination
+    elif len(available) > 0:
         index = arch_cfg.index % len(available)
         (archdir, freespace) = sorted(available)[index]
 
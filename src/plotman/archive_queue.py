@@ -0,0 +1,241 @@
+import contextlib
+import json
+import os
+import sys
+import time
+import typing
+
+import attr
+
+from plotman import configuration, job, plot_util
+
+if sys.platform != "win32":
+    import fcntl
+
+# Seconds a started transfer may take to show up as a running process before
+# its outcome is judged by whether the plot is still there.
+START_GRACE_S = 60.0
+
+
+@attr.mutable
+class Entry:
+    """A completed plot waiting to be archived.  Failed transfers are retried
+    from next_attempt_at on."""
+
+    path: str
+    dstdir: str
+    mtime: float
+    attempts: int = 0
+    next_attempt_at: float = 0
+    in_flight: bool = False
+    started_at: typing.Optional[float] = None
+    destination: typing.Optional[str] = None
+
+
+def read_entries(path: str) -> typing.Dict[str, Entry]:
+    entries = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            for entry in json.load(f)["entries"]:
+                entries[entry["path"]] = Entry(**entry)
+    return entries
+
+
+@attr.mutable
+class ArchiveQueue:
+    """The plots to archive, kept in a state file so that restarts neither lose
+    the retry state nor need to rediscover them.  Plots enter when the job
+    writing to their dst dir ends and dst dirs are only rescanned every
+    rescan_s to pick up plots that arrived some other way.
+
+    Interactive, archive and the exporter may share the state file, so every
+    change rereads it and writes it back while holding a lock on it."""
+
+    path: typing.Optional[str]
+    arch_cfg: configuration.Archiving
+    entries: typing.Dict[str, Entry] = attr.ib(factory=dict)
+    job_dstdirs: typing.Optional[typing.Dict[int, str]] = None
+    scanned_at: typing.Optional[float] = None
+
+    @classmethod
+    def load(
+        cls, path: typing.Optional[str], arch_cfg: configuration.Archiving
+    ) -> "ArchiveQueue":
+        queue = cls(path=path, arch_cfg=arch_cfg)
+        if path is not None:
+            queue.entries = read_entries(path)
+        return queue
+
+    @contextlib.contextmanager
+    def locked(self) -> typing.Iterator[None]:
+        """Reread the state file and save the changes made within, with other
+        processes kept from changing it meanwhile."""
+        if self.path is None:
+            yield
+            return
+        with open(self.path + ".lock", "a") as lock_file:
+            if sys.platform != "win32":
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            self.entries = read_entries(self.path)
+            yield
+            self.save()
+
+    def save(self) -> None:
+        """Replace the state file in one step so readers never see it partly
+        written."""
+        if self.path is None:
+            return
+        temporary = f"{self.path}.{os.getpid()}.tmp"
+        with open(temporary, "w") as f:
+            json.dump(
+                {"entries": [attr.asdict(entry) for entry in self.entries.values()]},
+                f,
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.path)
+
+    def scan(self, dstdirs: typing.Iterable[str]) -> int:
+        """Add the plots in dstdirs that are not queued yet and drop queued
+        plots that are gone.  Returns the number of plots added."""
+        added = 0
+        for d in dstdirs:
+            dstdir = os.path.normpath(d)
+            present = set(plot_util.list_plots(dstdir))
+            for plot in sorted(present - self.entries.keys()):
+                mtime = os.stat(plot).st_mtime
+                self.entries[plot] = Entry(path=plot, dstdir=dstdir, mtime=mtime)
+                added += 1
+            for path, entry in list(self.entries.items()):
+                if (
+                    entry.dstdir == dstdir
+                    and not entry.in_flight
+                    and path not in present
+                ):
+                    del self.entries[path]
+        return added
+
+    def update(
+        self,
+        dstdirs: typing.List[str],
+        all_jobs: typing.List[job.Job],
+        running_sources: typing.Set[str],
+        now: typing.Optional[float] = None,
+    ) -> typing.List[str]:
+        """Queue the plots of jobs that ended since the last update and settle
+        transfers that are no longer running.  Returns log messages."""
+        if now is None:
+            now = time.time()
+        with self.locked():
+            return self._update(dstdirs, all_jobs, running_sources, now)
+
+    def _update(
+        self,
+        dstdirs: typing.List[str],
+        all_jobs: typing.List[job.Job],
+        running_sources: typing.Set[str],
+        now: float,
+    ) -> typing.List[str]:
+        log_messages = []
+
+        job_dstdirs = {}
+        for j in all_jobs:
+            dstdir = j.plotter.common_info().dstdir
+            if dstdir:
+                job_dstdirs[j.proc.pid] = dstdir
+        if self.scanned_at is None or now - self.scanned_at >= self.arch_cfg.rescan_s:
+            to_scan = set(dstdirs)
+            self.scanned_at = now
+        elif self.job_dstdirs is not None:
+            to_scan = {
+                dstdir
+                for pid, dstdir in self.job_dstdirs.items()
+                if pid not in job_dstdirs
+            }
+        else:
+            to_scan = set()
+        self.job_dstdirs = job_dstdirs
+        added = self.scan(sorted(to_scan))
+        if added:
+            log_messages.append(f"Queued {added} plots for archiving")
+
+        for path, entry in list(self.entries.items()):
+            if not entry.in_flight or os.path.normpath(path) in running_sources:
+                continue
+            assert entry.started_at is not None
+            if now - entry.started_at < START_GRACE_S:
+                continue
+            if not os.path.exists(path):
+                del self.entries[path]
+                log_messages.append(f"Archived {path} to {entry.destination}")
+                continue
+            entry.in_flight = False
+            entry.attempts += 1
+            backoff = min(
+                self.arch_cfg.retry_backoff_s * 2 ** (entry.attempts - 1),
+                self.arch_cfg.max_retry_backoff_s,
+            )
+            entry.next_attempt_at = now + backoff
+            log_messages.append(
+                f"Transfer of {path} to {entry.destination} failed"
+                f" {entry.attempts} times, retrying in {backoff}s"
+            )
+
+        return log_messages
+
+    def heads(
+        self,
+        busy_sources: typing.Set[str],
+        now: typing.Optional[float] = None,
+    ) -> typing.Dict[str, typing.Tuple[Entry, int]]:
+        """Return the oldest plot ready to archive in each dst dir, by
+        normalized path, along with the number of plots ready there."""
+        if now is None:
+            now = time.time()
+        result: typing.Dict[str, typing.Tuple[Entry, int]] = {}
+        for entry in self.entries.values():
+            if (
+                entry.in_flight
+                or entry.next_attempt_at > now
+                or os.path.normpath(entry.path) in busy_sources
+            ):
+                continue
+            head, count = result.get(entry.dstdir, (entry, 0))
+            if entry.mtime < head.mtime:
+                head = entry
+            result[entry.dstdir] = (head, count + 1)
+
+        gone = [
+            dstdir
+            for dstdir, (head, _) in result.items()
+            if not os.path.exists(head.path)
+        ]
+        if gone:
+            # Plots removed by other means leave the queue as they come up.
+            with self.locked():
+                for dstdir in gone:
+                    self.entries.pop(result.pop(dstdir)[0].path, None)
+        return result
+
+    def started(
+        self, path: str, destination: str, now: typing.Optional[float] = None
+    ) -> None:
+        with self.locked():
+            entry = self.entries.get(path)
+            if entry is None:
+                return
+            entry.in_flight = True
+            entry.started_at = time.time() if now is None else now
+            entry.destination = destination
+
+    def summary(self) -> str:
+        in_flight = sum(entry.in_flight for entry in self.entries.values())
+        failed = sum(
+            entry.attempts > 0 and not entry.in_flight
+            for entry in self.entries.values()
+        )
+        queued = len(self.entries) - in_flight
+        result = f"{queued} queued"
+        if failed:
+            result += f" ({failed} retrying)"
+        return result
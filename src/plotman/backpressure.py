@@ -0,0 +1,148 @@
+import collections
+import contextlib
+import time
+import typing
+
+import attr
+import psutil
+
+from plotman import configuration, diskstats, job, topology
+
+
+@attr.frozen
+class Suspension:
+    device: str
+    since: float
+
+
+def is_stopped(j: job.Job) -> bool:
+    try:
+        return j.get_run_status() == "STP"
+    except psutil.NoSuchProcess:
+        return True
+
+
+@attr.mutable
+class Controller:
+    """Suspends the least progressed job on a tmp device that stays saturated
+    and resumes it once the device has stayed below the low water mark.
+
+    Only jobs suspended by this controller are ever resumed by it.  Its state
+    lives in memory, so if plotman is killed while jobs are suspended they must
+    be resumed with ``plotman resume``."""
+
+    config: configuration.Backpressure
+    sampler: diskstats.Sampler = attr.ib(factory=diskstats.Sampler)
+    saturated_since: typing.Dict[str, float] = attr.ib(factory=dict)
+    relieved_since: typing.Dict[str, float] = attr.ib(factory=dict)
+    suspended: typing.Dict[int, Suspension] = attr.ib(factory=dict)
+    # Jobs resumed after hitting the suspension cap are left alone for as long
+    # again so they are not starved by being repeatedly suspended.
+    exempt_until: typing.Dict[int, float] = attr.ib(factory=dict)
+
+    def update(
+        self,
+        jobs: typing.List[job.Job],
+        device_for_tmpdir: typing.Callable[[str], typing.Optional[str]],
+        now: typing.Optional[float] = None,
+        utilization: typing.Optional[typing.Dict[str, diskstats.Utilization]] = None,
+    ) -> typing.List[str]:
+        """Take one control step.  Returns log messages for each action taken."""
+        if now is None:
+            now = time.monotonic()
+        if utilization is None:
+            utilization = self.sampler.sample(now=now)
+
+        log_messages: typing.List[str] = []
+        jobs_by_pid = {j.proc.pid: j for j in jobs}
+        jobs_by_device: typing.Dict[
+            str, typing.List[job.Job]
+        ] = collections.defaultdict(list)
+        for j in jobs:
+            device = device_for_tmpdir(j.plotter.common_info().tmpdir)
+            if device is not None:
+                jobs_by_device[device].append(j)
+        utilization = topology.combine_utilization(utilization, jobs_by_device)
+
+        for pid in list(self.suspended):
+            if pid not in jobs_by_pid:
+                del self.suspended[pid]
+        for pid, until in list(self.exempt_until.items()):
+            if pid not in jobs_by_pid or until <= now:
+                del self.exempt_until[pid]
+
+        for device, usage in utilization.items():
+            if usage.busy_percent >= self.config.high_utilization:
+                self.saturated_since.setdefault(device, now)
+                self.relieved_since.pop(device, None)
+            elif usage.busy_percent <= self.config.low_utilization:
+                self.relieved_since.setdefault(device, now)
+                self.saturated_since.pop(device, None)
+            else:
+                self.saturated_since.pop(device, None)
+                self.relieved_since.pop(device, None)
+
+        # Resume first, jobs at the cap and then one per relieved device.
+        for pid, suspension in sorted(self.suspended.items()):
+            if now - suspension.since >= self.config.max_suspend_s:
+                self._resume(jobs_by_pid[pid], "suspension cap reached", log_messages)
+                self.exempt_until[pid] = now + self.config.max_suspend_s
+
+        for device, since in self.relieved_since.items():
+            if now - since < self.config.sustain_s:
+                continue
+            suspended_here = [
+                (suspension.since, pid)
+                for pid, suspension in self.suspended.items()
+                if suspension.device == device
+            ]
+            if suspended_here:
+                _, pid = min(suspended_here)
+                self._resume(jobs_by_pid[pid], f"{device} relieved", log_messages)
+                self.relieved_since[device] = now
+
+        for device, since in self.saturated_since.items():
+            if now - since < self.config.sustain_s:
+                continue
+            # Jobs stopped by hand are neither counted nor touched.
+            running = [
+                j
+                for j in jobs_by_device.get(device, [])
+                if j.proc.pid not in self.suspended and not is_stopped(j)
+            ]
+            candidates = [
+                j
+                for j in running
+                if j.proc.pid not in self.exempt_until and j.progress().known
+            ]
+            # Never stop the last job on a device, that can not help.
+            if len(running) < 2 or not candidates:
+                continue
+            victim = min(candidates, key=lambda j: j.progress())
+            with contextlib.suppress(psutil.NoSuchProcess):
+                victim.suspend(reason=f"backpressure on {device}")
+                self.suspended[victim.proc.pid] = Suspension(device=device, since=now)
+                log_messages.append(
+                    f"Suspended {victim.plot_id_prefix()} in phase"
+                    f" {victim.progress()}: {device} saturated"
+                    f" ({utilization[device].busy_percent:.0f}% busy)"
+                )
+            # Require the device to stay saturated for another period before
+            # suspending more.
+            self.saturated_since[device] = now
+
+        return log_messages
+
+    def _resume(self, j: job.Job, reason: str, log_messages: typing.List[str]) -> None:
+        del self.suspended[j.proc.pid]
+        with contextlib.suppress(psutil.NoSuchProcess):
+            j.resume()
+            log_messages.append(f"Resumed {j.plot_id_prefix()}: {reason}")
+
+    def resume_all(self, jobs: typing.List[job.Job]) -> typing.List[str]:
+        """Resume every job this controller suspended, such as when exiting."""
+        log_messages: typing.List[str] = []
+        for j in jobs:
+            if j.proc.pid in self.suspended:
+                self._resume(j, "backpressure stopped", log_messages)
+        return log_messages
@@ -153,7 +153,36 @@ def get_validated_configs(
                 "plotting: madmax: executable: must refer to an executable named chia_plot"
             )
 
+    tuning = loaded.plotting.tuning
+    if tuning is not None:
+        if loaded.plotting.type not in {"chia", "madmax"}:
+            raise ConfigurationException(
+                "plotting: tuning: is only supported for the chia and madmax plotters"
+            )
+        if tuning.buffer is not None and loaded.plotting.type != "chia":
+            raise ConfigurationException(
+                "plotting: tuning: buffer: is only supported for the chia plotter"
+            )
+        if not 0 <= tuning.explore_fraction <= 1:
+            raise ConfigurationException(
+                "plotting: tuning: explore_fraction: must be between 0 and 1"
+            )
+
+    backpressure = loaded.scheduling.backpressure
+    if (
+        backpressure is not None
+        and backpressure.low_utilization >= backpressure.high_utilization
+    ):
+        raise ConfigurationException(
+            "scheduling: backpressure: low_utilization: must be less than high_utilization:"
+        )
+
     if loaded.archiving is not None:
+        if loaded.archiving.max_concurrent < 1:
+            raise ConfigurationException(
+                "archiving: max_concurrent: must be at least 1"
+            )
+
         preset_target_objects = yaml.safe_load(preset_target_definitions_text)
         preset_target_schema = desert.schema(PresetTargetDefinitions)
         preset_target_definitions = preset_target_schema.load(preset_target_objects)
@@ -229,6 +258,29 @@ class Archiving:
         },
     )
     index: int = 0  # If not explicit, "index" will default to 0
+    # Transfers to run at once, each to its own archive disk.
+    max_concurrent: int = 1
+    # Seconds between runs of the disk space script in the background.
+    disk_space_refresh_s: int = 60
+    # Which dst dir's oldest queued plot to archive next.
+    queue_order: str = attr.ib(
+        default="priority",
+        metadata={
+            desert._make._DESERT_SENTINEL: {
+                "marshmallow_field": marshmallow.fields.String(
+                    validate=marshmallow.validate.OneOf(
+                        choices=["priority", "oldest", "fullest"]
+                    ),
+                ),
+            },
+        },
+    )
+    # Seconds between full scans of the dst dirs for plots to queue.
+    rescan_s: int = 3600
+    # Seconds to wait before retrying a failed transfer, doubling with each
+    # failure up to max_retry_backoff_s.
+    retry_backoff_s: int = 300
+    max_retry_backoff_s: int = 6 * 3600
     target_definitions: Dict[str, ArchivingTarget] = attr.ib(factory=dict)
 
     def target_definition(self) -> ArchivingTarget:
@@ -323,12 +375,20 @@ class Logging:
     disk_spaces: str = os.path.join(
         appdirs.user_log_dir("plotman"), "plotman-disk_spaces.log"
     )
+    archive_queue: str = os.path.join(
+        appdirs.user_data_dir("plotman"), "archive_queue.json"
+    )
+    completion_stats: str = os.path.join(
+        appdirs.user_data_dir("plotman"), "completion_stats.json"
+    )
 
     def setup(self) -> None:
         os.makedirs(self.plots, exist_ok=True)
         os.makedirs(self.transfers, exist_ok=True)
         os.makedirs(os.path.dirname(self.application), exist_ok=True)
         os.makedirs(os.path.dirname(self.disk_spaces), exist_ok=True)
+        os.makedirs(os.path.dirname(self.archive_queue), exist_ok=True)
+        os.makedirs(os.path.dirname(self.completion_stats), exist_ok=True)
 
     def create_plot_log_path(self, time: pendulum.DateTime) -> str:
         return self._create_log_path(
@@ -375,6 +435,49 @@ class Directories:
         return self.dst  # type: ignore[return-value]
 
 
+@attr.frozen
+class PriorityRule:
+    phase_major: int
+    phase_minor: int = 0
+    nice: Optional[int] = None
+    ionice_class: Optional[str] = attr.ib(
+        default=None,
+        metadata={
+            desert._make._DESERT_SENTINEL: {
+                "marshmallow_field": marshmallow.fields.String(
+                    allow_none=True,
+                    validate=marshmallow.validate.OneOf(
+                        choices=["best_effort", "idle"]
+                    ),
+                ),
+            },
+        },
+    )
+    ionice_value: Optional[int] = None
+
+
+@attr.frozen
+class Priorities:
+    rules: List[PriorityRule] = attr.ib(factory=list)
+    saturation_load: float = 1.0
+    saturated: Optional[PriorityRule] = None
+
+
+@attr.frozen
+class Backpressure:
+    high_utilization: float = 95
+    low_utilization: float = 70
+    sustain_s: int = 60
+    max_suspend_s: int = 1800
+
+
+@attr.frozen
+class Watchdog:
+    stall_m: int = 60
+    phase_stall_m: Dict[int, int] = attr.ib(factory=dict)
+    kill: bool = False
+
+
 @attr.frozen
 class Scheduling:
     global_max_jobs: int
@@ -387,6 +490,45 @@ class Scheduling:
         1  # If not explicit, "tmpdir_stagger_phase_limit" will default to 1
     )
     tmp_overrides: Optional[Dict[str, TmpOverrides]] = None
+    tmpdir_selection: str = attr.ib(
+        default="phase",
+        metadata={
+            desert._make._DESERT_SENTINEL: {
+                "marshmallow_field": marshmallow.fields.String(
+                    validate=marshmallow.validate.OneOf(
+                        choices=["phase", "throughput"]
+                    ),
+                ),
+            },
+        },
+    )
+    tmpdir_history_size: int = 20
+    cpu_affinity: bool = False
+    priorities: Optional[Priorities] = None
+    dst_selection: str = attr.ib(
+        default="phase",
+        metadata={
+            desert._make._DESERT_SENTINEL: {
+                "marshmallow_field": marshmallow.fields.String(
+                    validate=marshmallow.validate.OneOf(choices=["phase", "capacity"]),
+                ),
+            },
+        },
+    )
+    dst_max_copies: Optional[int] = None
+    backpressure: Optional[Backpressure] = None
+    watchdog: Optional[Watchdog] = None
+
+
+@attr.frozen
+class Tuning:
+    threads: Optional[List[int]] = None
+    buckets: Optional[List[int]] = None
+    buffer: Optional[List[int]] = None
+    tmpdir_classes: Optional[Dict[str, List[str]]] = None
+    min_samples: int = 3
+    history_size: int = 20
+    explore_fraction: float = 0.1
 
 
 @attr.frozen
@@ -409,6 +551,25 @@ class Plotting:
     bladebit: Optional[plotman.plotters.bladebit.Options] = None
     chia: Optional[plotman.plotters.chianetwork.Options] = None
     madmax: Optional[plotman.plotters.madmax.Options] = None
+    tuning: Optional[Tuning] = None
+
+    def plot_size(self) -> int:
+        """The k size of plots created with this configuration."""
+        if self.type == "chia" and self.chia is not None and self.chia.k is not None:
+            return self.chia.k
+
+        return 32
+
+    def threads(self) -> Optional[int]:
+        """The number of threads each job uses, None if up to the plotter."""
+        if self.type == "chia" and self.chia is not None:
+            return self.chia.n_threads
+        elif self.type == "madmax" and self.madmax is not None:
+            return self.madmax.n_threads
+        elif self.type == "bladebit" and self.bladebit is not None:
+            return self.bladebit.threads
+
+        return None
 
 
 @attr.frozen
@@ -422,9 +583,50 @@ class Interactive:
     autostart_archiving: bool = True
 
 
+@attr.frozen
+class Agent:
+    host: str = "127.0.0.1"
+    port: int = 8538
+    name: Optional[str] = None
+    token: Optional[str] = None
+
+
+@attr.frozen
+class AgentAddress:
+    name: str
+    host: str
+    port: int = 8538
+
+
+@attr.frozen
+class Controller:
+    agents: List[AgentAddress]
+    global_max_jobs: Optional[int] = None
+    global_stagger_m: Optional[int] = None
+    token: Optional[str] = None
+    timeout_s: float = 5
+
+
+@attr.frozen
+class Exporter:
+    host: str = "127.0.0.1"
+    port: int = 8539
+    refresh_s: float = 15
+
+
+@attr.frozen
+class Status:
+    interval_s: float = 5
+    change_ratio: float = 0.05
+
+
 @attr.frozen
 class Commands:
     interactive: Interactive = attr.ib(factory=Interactive)
+    agent: Agent = attr.ib(factory=Agent)
+    controller: Optional[Controller] = None
+    exporter: Exporter = attr.ib(factory=Exporter)
+    status: Status = attr.ib(factory=Status)
 
 
 @attr.frozen
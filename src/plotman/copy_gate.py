@@ -0,0 +1,96 @@
+import collections
+import contextlib
+import time
+import typing
+
+import attr
+import psutil
+
+from plotman import backpressure, job, manager, topology
+
+
+@attr.mutable
+class CopyGate:
+    """Holds jobs at the start of the final copy of their plot to the dst dir
+    while max_copies other jobs are copying to the same dst device, and resumes
+    them in the order they reached the copy as the others finish.  This limits
+    the copies actually running at once, which the jobs running when a dst dir
+    is selected for a new job say little about.
+
+    Like the backpressure controller, only jobs held by the gate are ever
+    resumed by it and held jobs must be resumed with ``plotman resume`` if
+    plotman is killed."""
+
+    max_copies: int
+    # When each job was first seen copying
+    copying_since: typing.Dict[int, float] = attr.ib(factory=dict)
+    held: typing.Set[int] = attr.ib(factory=set)
+
+    def update(
+        self,
+        jobs: typing.List[job.Job],
+        device_for_path: typing.Callable[
+            [str], typing.Optional[str]
+        ] = topology.device_for_path,
+        now: typing.Optional[float] = None,
+    ) -> typing.List[str]:
+        """Take one control step.  Returns log messages for each action taken."""
+        if now is None:
+            now = time.monotonic()
+
+        log_messages: typing.List[str] = []
+        copying_by_device: typing.Dict[
+            str, typing.List[job.Job]
+        ] = collections.defaultdict(list)
+        for j in jobs:
+            info = j.plotter.common_info()
+            if info.copying and info.dstdir:
+                self.copying_since.setdefault(j.proc.pid, now)
+                device = manager.dst_device(info.dstdir, device_for_path)
+                copying_by_device[device].append(j)
+
+        copying_pids = {j.proc.pid for js in copying_by_device.values() for j in js}
+        for pid in list(self.copying_since):
+            if pid not in copying_pids:
+                del self.copying_since[pid]
+                self.held.discard(pid)
+
+        for device, copying in sorted(copying_by_device.items()):
+            # Jobs stopped by hand are neither counted nor touched.
+            gated = [
+                j
+                for j in copying
+                if j.proc.pid in self.held or not backpressure.is_stopped(j)
+            ]
+            gated.sort(key=lambda j: (self.copying_since[j.proc.pid], j.proc.pid))
+            for position, j in enumerate(gated):
+                pid = j.proc.pid
+                with contextlib.suppress(psutil.NoSuchProcess):
+                    if position < self.max_copies and pid in self.held:
+                        self.held.discard(pid)
+                        j.resume()
+                        log_messages.append(
+                            f"Resumed copy of {j.plot_id_prefix()} to {device}"
+                        )
+                    elif position >= self.max_copies and pid not in self.held:
+                        j.suspend(reason=f"waiting to copy to {device}")
+                        self.held.add(pid)
+                        log_messages.append(
+                            f"Held copy of {j.plot_id_prefix()}: {device} has"
+                            f" {self.max_copies} copies in progress"
+                        )
+
+        return log_messages
+
+    def resume_all(self, jobs: typing.List[job.Job]) -> typing.List[str]:
+        """Resume every job held by the gate, such as when exiting."""
+        log_messages: typing.List[str] = []
+        for j in jobs:
+            if j.proc.pid in self.held:
+                self.held.discard(j.proc.pid)
+                with contextlib.suppress(psutil.NoSuchProcess):
+                    j.resume()
+                    log_messages.append(
+                        f"Resumed copy of {j.plot_id_prefix()}: copy gate stopped"
+                    )
+        return log_messages
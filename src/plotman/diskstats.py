@@ -0,0 +1,157 @@
+import time
+import typing
+
+import attr
+
+DISKSTATS_PATH = "/proc/diskstats"
+
+# /proc/diskstats counts 512 byte sectors whatever the sector size of the disk.
+SECTOR_SIZE = 512
+
+# Seconds a sample is reused for, so that all the dirs of one tick are
+# reported from a single read of /proc/diskstats.
+SAMPLE_TTL_S = 1.0
+
+# Seconds a one-shot report waits after the baseline sample at least, as the
+# activity over the few milliseconds it otherwise takes says nothing.
+MIN_INTERVAL_S = 1.0
+
+
+@attr.frozen
+class DiskStats:
+    """Cumulative counters for one block device from /proc/diskstats."""
+
+    reads_completed: int
+    sectors_read: int
+    writes_completed: int
+    sectors_written: int
+    io_ticks_ms: int
+
+
+@attr.frozen
+class Utilization:
+    """Device activity over the interval between two samples, with rates per
+    second."""
+
+    busy_percent: float
+    read_bytes_per_s: float = 0
+    write_bytes_per_s: float = 0
+    read_iops: float = 0
+    write_iops: float = 0
+
+    @property
+    def iops(self) -> float:
+        return self.read_iops + self.write_iops
+
+
+def parse_diskstats(text: str) -> typing.Dict[str, DiskStats]:
+    # https://www.kernel.org/doc/Documentation/ABI/testing/procfs-diskstats
+    #  259       0 nvme0n1 1480392 113 181012882 371180 5366441 3398567 ...
+    stats = {}
+    for line in text.splitlines():
+        fields = line.split()
+        if len(fields) < 14:
+            continue
+        stats[fields[2]] = DiskStats(
+            reads_completed=int(fields[3]),
+            sectors_read=int(fields[5]),
+            writes_completed=int(fields[7]),
+            sectors_written=int(fields[9]),
+            io_ticks_ms=int(fields[12]),
+        )
+    return stats
+
+
+def read_diskstats(path: str = DISKSTATS_PATH) -> typing.Dict[str, DiskStats]:
+    try:
+        with open(path) as file:
+            return parse_diskstats(file.read())
+    except FileNotFoundError:
+        # Not Linux
+        return {}
+
+
+@attr.mutable
+class Sampler:
+    """Turns consecutive /proc/diskstats readings into per-device utilization."""
+
+    path: str = DISKSTATS_PATH
+    previous: typing.Optional[typing.Dict[str, DiskStats]] = None
+    previous_time: float = 0
+
+    def sample(
+        self, now: typing.Optional[float] = None
+    ) -> typing.Dict[str, Utilization]:
+        """Read the counters and return the utilization of each device since the
+        previous sample.  The first sample only establishes the baseline."""
+        if now is None:
+            now = time.monotonic()
+        current = read_diskstats(self.path)
+        previous, previous_time = self.previous, self.previous_time
+        self.previous, self.previous_time = current, now
+
+        if previous is None or now <= previous_time:
+            return {}
+
+        elapsed = now - previous_time
+        result = {}
+        for device, stats in current.items():
+            before = previous.get(device)
+            if before is None:
+                continue
+            if any(
+                after < earlier
+                for after, earlier in zip(attr.astuple(stats), attr.astuple(before))
+            ):
+                # Counters wrap on 32 bit kernels, skip the sample then.
+                continue
+
+            def rate(after: int, before: int) -> float:
+                return (after - before) / elapsed
+
+            busy_ms = stats.io_ticks_ms - before.io_ticks_ms
+            result[device] = Utilization(
+                busy_percent=min(100.0, 100 * busy_ms / (elapsed * 1000)),
+                read_bytes_per_s=SECTOR_SIZE
+                * rate(stats.sectors_read, before.sectors_read),
+                write_bytes_per_s=SECTOR_SIZE
+                * rate(stats.sectors_written, before.sectors_written),
+                read_iops=rate(stats.reads_completed, before.reads_completed),
+                write_iops=rate(stats.writes_completed, before.writes_completed),
+            )
+        return result
+
+
+_sampler = Sampler()
+_latest: typing.Dict[str, Utilization] = {}
+_latest_time: typing.Optional[float] = None
+
+
+def utilization(
+    max_age_s: float = SAMPLE_TTL_S, now: typing.Optional[float] = None
+) -> typing.Dict[str, Utilization]:
+    """The process wide utilization of each device since the previous sample,
+    sampled again once older than max_age_s.  The first call only takes the
+    baseline, the next one samples regardless of age."""
+    global _latest, _latest_time
+    if now is None:
+        now = time.monotonic()
+    if _latest_time is None or not _latest or now - _latest_time >= max_age_s:
+        _latest = _sampler.sample(now=now)
+        _latest_time = now
+    return _latest
+
+
+def wait_for_interval(
+    min_interval_s: float = MIN_INTERVAL_S,
+    now: typing.Optional[float] = None,
+    sleep: typing.Callable[[float], None] = time.sleep,
+) -> None:
+    """Wait until min_interval_s has passed since the process wide baseline
+    sample so that the utilization sampled next covers at least that long."""
+    if now is None:
+        now = time.monotonic()
+    if _latest_time is not None and not _latest:
+        remaining = _latest_time + min_interval_s - now
+        if remaining > 0:
+            sleep(remaining)
@@ -0,0 +1,259 @@
+import http.server
+import logging
+import threading
+import time
+import typing
+
+import attr
+
+from plotman import (
+    archive,
+    archive_queue,
+    configuration,
+    history,
+    job,
+    plot_util,
+    reporting,
+    topology,
+)
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def dir_metrics(dir_cfg: configuration.Directories) -> typing.List[str]:
+    metrics = {
+        "plotman_dir_free_bytes": "Free space in the filesystem of the dir in bytes",
+        "plotman_dir_plots": "Completed plots in the dst dir",
+        "plotman_dir_read_bytes_per_second": "Bytes read from the disks of the dir per s",
+        "plotman_dir_write_bytes_per_second": "Bytes written to the disks of the dir per s",
+        "plotman_dir_iops": "Reads and writes completed by the disks of the dir per s",
+        "plotman_dir_busy_percent": "Percent of time the disks of the dir were busy",
+    }
+    dirs = [("tmp", d) for d in dir_cfg.tmp]
+    if dir_cfg.tmp2 is not None:
+        dirs.append(("tmp2", dir_cfg.tmp2))
+    if dir_cfg.dst is not None:
+        dirs.extend(("dst", d) for d in dir_cfg.dst)
+    io = topology.utilization_for_paths(d for _, d in dirs)
+
+    prom_stati = []
+    for use, d in dirs:
+        usage = io.get(d)
+        values: typing.Dict[str, typing.Union[int, float, None]] = {
+            "plotman_dir_free_bytes": None,
+            "plotman_dir_plots": None,
+            "plotman_dir_read_bytes_per_second": None
+            if usage is None
+            else usage.read_bytes_per_s,
+            "plotman_dir_write_bytes_per_second": None
+            if usage is None
+            else usage.write_bytes_per_s,
+            "plotman_dir_iops": None if usage is None else usage.iops,
+            "plotman_dir_busy_percent": None if usage is None else usage.busy_percent,
+        }
+        try:
+            values["plotman_dir_free_bytes"] = plot_util.df_b(d)
+            if use == "dst":
+                values["plotman_dir_plots"] = len(plot_util.list_plots(d))
+        except OSError:
+            # Missing or unavailable
+            pass
+        prom_stati.append((f'dir="{d}",use="{use}"', values))
+    return reporting.to_prometheus_format(metrics, prom_stati)
+
+
+def archive_metrics(
+    transfers: typing.Sequence[archive.Transfer],
+    archdir_freebytes: typing.Dict[str, int],
+    queue: typing.Optional[archive_queue.ArchiveQueue],
+) -> typing.List[str]:
+    lines = reporting.to_prometheus_format(
+        {"plotman_archive_transfers": "Running archive transfers"},
+        [("", {"plotman_archive_transfers": len(transfers)})],
+    )
+    lines.extend(
+        reporting.to_prometheus_format(
+            {"plotman_archive_dir_free_bytes": "Free archive dir space in bytes"},
+            [
+                (f'archive_dir="{d}"', {"plotman_archive_dir_free_bytes": space})
+                for d, space in sorted(archdir_freebytes.items())
+            ],
+        )
+    )
+    if queue is not None:
+        entries = queue.entries.values()
+        in_flight = sum(entry.in_flight for entry in entries)
+        retrying = sum(entry.attempts > 0 and not entry.in_flight for entry in entries)
+        lines.extend(
+            reporting.to_prometheus_format(
+                {"plotman_archive_queue_plots": "Plots in the archive queue"},
+                [
+                    (f'state="{state}"', {"plotman_archive_queue_plots": count})
+                    for state, count in [
+                        ("queued", len(entries) - in_flight - retrying),
+                        ("retrying", retrying),
+                        ("in_flight", in_flight),
+                    ]
+                ],
+            )
+        )
+    return lines
+
+
+@attr.mutable
+class Collector:
+    """Collects the metrics in a background thread every refresh_s and keeps
+    the rendered result, so that a scrape only hands out the latest snapshot.
+    Jobs are kept between collections and only the new part of their logs is
+    parsed."""
+
+    cfg: configuration.PlotmanConfig
+    refresh_s: float
+    clock: typing.Callable[[], float] = time.perf_counter
+    jobs: typing.List[job.Job] = attr.ib(factory=list)
+    disk_space: typing.Optional[archive.DiskSpace] = None
+    body: bytes = b""
+    collected_at: typing.Optional[float] = None
+    collect_seconds: float = 0
+    collections: int = 0
+    errors: int = 0
+    scrapes: int = 0
+    scrape_seconds: float = 0
+    lock: threading.Lock = attr.ib(factory=threading.Lock)
+    thread: typing.Optional[threading.Thread] = None
+
+    def collect(self) -> None:
+        start = self.clock()
+        jobs = job.Job.get_running_jobs(self.cfg.logging.plots, cached_jobs=self.jobs)
+
+        arch_cfg = self.cfg.archiving
+        transfers = [] if arch_cfg is None else archive.get_running_transfers(arch_cfg)
+        lines = [
+            reporting.prometheus_report(
+                jobs,
+                transfers=transfers,
+                completions=history.completed_logs(self.cfg.logging.plots).stats,
+            )
+        ]
+        lines.extend(dir_metrics(self.cfg.directories))
+        if arch_cfg is not None:
+            archdir_freebytes: typing.Dict[str, int] = {}
+            if self.disk_space is not None:
+                archdir_freebytes, _, log_messages = self.disk_space.get()
+                for log_message in log_messages:
+                    logger.info("%s", log_message)
+            queue = None
+            if self.cfg.logging.archive_queue is not None:
+                queue = archive_queue.ArchiveQueue.load(
+                    path=self.cfg.logging.archive_queue, arch_cfg=arch_cfg
+                )
+            lines.extend(archive_metrics(transfers, archdir_freebytes, queue))
+        body = ("\n".join(line for line in lines if line) + "\n").encode()
+
+        with self.lock:
+            self.jobs = jobs
+            self.body = body
+            self.collected_at = time.time()
+            self.collect_seconds = self.clock() - start
+            self.collections += 1
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self.collect()
+            except Exception:
+                logger.exception("Collecting metrics failed")
+                with self.lock:
+                    self.errors += 1
+            time.sleep(self.refresh_s)
+
+    def start(self) -> None:
+        if self.cfg.archiving is not None:
+            self.disk_space = archive.DiskSpace(
+                arch_cfg=self.cfg.archiving,
+                refresh_s=self.cfg.archiving.disk_space_refresh_s,
+            )
+            self.disk_space.start()
+        self.thread = threading.Thread(
+            target=self._run, name="exporter collection", daemon=True
+        )
+        self.thread.start()
+
+    def scrape(self) -> bytes:
+        """The latest collection followed by metrics about the exporter."""
+        with self.lock:
+            self.scrapes += 1
+            lines = reporting.to_prometheus_format(
+                {
+                    "plotman_exporter_collect_seconds": "Duration of the last collection in s",
+                    "plotman_exporter_last_collect_timestamp_seconds": "Unix time of the last collection",
+                },
+                [
+                    (
+                        "",
+                        {
+                            "plotman_exporter_collect_seconds": self.collect_seconds,
+                            "plotman_exporter_last_collect_timestamp_seconds": self.collected_at,
+                        },
+                    )
+                ],
+            )
+            lines.extend(
+                reporting.to_prometheus_format(
+                    {
+                        "plotman_exporter_collections_total": "Collections",
+                        "plotman_exporter_collect_errors_total": "Failed collections",
+                        "plotman_exporter_scrapes_total": "Scrapes",
+                        "plotman_exporter_scrape_seconds_total": "Time spent serving scrapes before this one in s",
+                    },
+                    [
+                        (
+                            "",
+                            {
+                                "plotman_exporter_collections_total": self.collections,
+                                "plotman_exporter_collect_errors_total": self.errors,
+                                "plotman_exporter_scrapes_total": self.scrapes,
+                                "plotman_exporter_scrape_seconds_total": self.scrape_seconds,
+                            },
+                        )
+                    ],
+                    metric_type="counter",
+                )
+            )
+            return self.body + ("\n".join(lines) + "\n").encode()
+
+    def scraped(self, seconds: float) -> None:
+        with self.lock:
+            self.scrape_seconds += seconds
+
+
+class RequestHandler(http.server.BaseHTTPRequestHandler):
+    server: "Server"
+
+    def do_GET(self) -> None:
+        start = self.server.collector.clock()
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.collector.scrape()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.collector.scraped(self.server.collector.clock() - start)
+
+    def log_message(self, format: str, *args: typing.Any) -> None:
+        # Every scrape would be logged to stderr otherwise.
+        pass
+
+
+class Server(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, collector: Collector, address: typing.Tuple[str, int]) -> None:
+        self.collector = collector
+        super().__init__(address, RequestHandler)
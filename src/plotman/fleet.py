@@ -0,0 +1,527 @@
+import contextlib
+import hmac
+import ipaddress
+import json
+import os
+import socket
+import socketserver
+import threading
+import typing
+
+import attr
+import psutil
+
+from plotman import configuration, history, job, manager, plot_util
+import plotman.plotters
+
+# Requests and responses are single line JSON objects, one request per
+# connection.  Every response has an "ok" member and either the result or an
+# "error" message.
+PROTOCOL_VERSION = 1
+
+# Longer request lines are rejected rather than read into memory.
+MAX_REQUEST_BYTES = 64 * 1024
+
+
+class FleetException(Exception):
+    pass
+
+
+@attr.frozen
+class JobSnapshot:
+    """What an agent reports of one of its jobs.  It provides the parts of the
+    ``job.Job`` and ``CommonInfo`` interfaces that the scheduling logic uses."""
+
+    plot_id: str
+    pid: int
+    tmpdir: str
+    dstdir: str
+    phase: job.Phase
+    time_wall: int
+    plot_size: int = 32
+    suspended: bool = False
+    copying: bool = False
+    final_plot_written: bool = False
+
+    @classmethod
+    def from_job(cls, j: job.Job) -> "JobSnapshot":
+        info = j.plotter.common_info()
+        suspended = False
+        with contextlib.suppress(psutil.NoSuchProcess, psutil.AccessDenied):
+            suspended = j.get_run_status() == "STP"
+        return cls(
+            plot_id=info.plot_id or "",
+            pid=j.proc.pid,
+            tmpdir=info.tmpdir,
+            dstdir=info.dstdir,
+            phase=j.progress(),
+            time_wall=j.get_time_wall(),
+            plot_size=info.plot_size or 32,
+            suspended=suspended,
+            copying=info.copying,
+            final_plot_written=info.final_plot_written,
+        )
+
+    @classmethod
+    def from_dict(cls, d: typing.Dict[str, typing.Any]) -> "JobSnapshot":
+        phase = job.Phase(known=False)
+        if d["phase"] is not None:
+            phase = job.Phase(*d["phase"])
+        return cls(**{**d, "phase": phase})
+
+    def to_dict(self) -> typing.Dict[str, object]:
+        d = attr.asdict(self, recurse=False)
+        d["phase"] = [self.phase.major, self.phase.minor] if self.phase.known else None
+        return d
+
+    @property
+    def plotter(self) -> "JobSnapshot":
+        return self
+
+    @property
+    def tmp2dir(self) -> str:
+        # Not reported, the tmp2 dirs of agents are not shared.
+        return ""
+
+    def common_info(self) -> "JobSnapshot":
+        return self
+
+    def progress(self) -> job.Phase:
+        return self.phase
+
+    def get_time_wall(self) -> int:
+        return self.time_wall
+
+
+@attr.frozen
+class AgentSnapshot:
+    """The state of one agent and whether, by its own configuration, it could
+    start a job now and where."""
+
+    name: str
+    jobs: typing.List[JobSnapshot]
+    placement: typing.Optional[manager.Placement]
+    wait_reason: str
+    dst_freebytes: typing.Dict[str, int]
+
+    @classmethod
+    def from_dict(cls, d: typing.Dict[str, typing.Any]) -> "AgentSnapshot":
+        placement = d["placement"]
+        return cls(
+            name=d["name"],
+            jobs=[JobSnapshot.from_dict(j) for j in d["jobs"]],
+            placement=None if placement is None else manager.Placement(**placement),
+            wait_reason=d["wait_reason"],
+            dst_freebytes=d["dst_freebytes"],
+        )
+
+    def to_dict(self) -> typing.Dict[str, object]:
+        return dict(
+            name=self.name,
+            jobs=[j.to_dict() for j in self.jobs],
+            placement=None if self.placement is None else attr.asdict(self.placement),
+            wait_reason=self.wait_reason,
+            dst_freebytes=self.dst_freebytes,
+        )
+
+
+@attr.mutable
+class Agent:
+    """Answers requests about, and for, the jobs on this host.  The job source
+    and starter are replaceable so that agents can be run without plotters."""
+
+    name: str
+    dir_cfg: configuration.Directories
+    sched_cfg: configuration.Scheduling
+    plotting_cfg: configuration.Plotting
+    jobs: typing.Callable[[], typing.List[job.Job]]
+    start: typing.Callable[
+        [manager.Placement, typing.List[job.Job]], typing.Tuple[bool, str]
+    ]
+    completed: typing.Callable[
+        [], typing.Sequence[plotman.plotters.CommonInfo]
+    ] = attr.ib(default=list)
+    freebytes: typing.Callable[[str], int] = manager.dstdir_freebytes
+    token: typing.Optional[str] = None
+    lock: threading.Lock = attr.ib(factory=threading.Lock)
+
+    def handle(self, request: typing.Dict[str, typing.Any]) -> typing.Dict[str, object]:
+        if self.token is not None and not hmac.compare_digest(
+            str(request.get("token", "")), self.token
+        ):
+            return error("invalid token")
+
+        command = request.get("command")
+        handlers = {
+            "snapshot": self.handle_snapshot,
+            "start": self.handle_start,
+            "suspend": self.handle_job_command,
+            "resume": self.handle_job_command,
+            "kill": self.handle_job_command,
+        }
+        handler = handlers.get(typing.cast(str, command))
+        if handler is None:
+            return error(f"unknown command: {command!r}")
+
+        with self.lock:
+            return handler(request)
+
+    def dst_dirs(self) -> typing.List[str]:
+        if self.dir_cfg.dst is None:
+            return []
+        return [d.rstrip("/") for d in self.dir_cfg.dst]
+
+    def snapshot(self) -> AgentSnapshot:
+        jobs = self.jobs()
+        placement, wait_reason = manager.plan_new_plot(
+            index=job.JobIndex.of(jobs),
+            dir_cfg=self.dir_cfg,
+            sched_cfg=self.sched_cfg,
+            plotting_cfg=self.plotting_cfg,
+            completed=self.completed,
+            freebytes=self.freebytes,
+        )
+        return AgentSnapshot(
+            name=self.name,
+            jobs=[JobSnapshot.from_job(j) for j in jobs],
+            placement=placement,
+            wait_reason=wait_reason,
+            dst_freebytes={d: self.freebytes(d) for d in self.dst_dirs()},
+        )
+
+    def handle_snapshot(
+        self, request: typing.Dict[str, typing.Any]
+    ) -> typing.Dict[str, object]:
+        return {"ok": True, "snapshot": self.snapshot().to_dict()}
+
+    def handle_start(
+        self, request: typing.Dict[str, typing.Any]
+    ) -> typing.Dict[str, object]:
+        placement = manager.Placement(
+            tmpdir=request["tmpdir"], dstdir=request["dstdir"]
+        )
+        if placement.tmpdir not in self.dir_cfg.tmp:
+            return error(f"not a configured tmp dir: {placement.tmpdir!r}")
+
+        jobs = self.jobs()
+        index = job.JobIndex.of(jobs)
+        # Recheck in case anything changed since the controller's snapshot
+        planned, wait_reason = manager.plan_new_plot(
+            index=index,
+            dir_cfg=self.dir_cfg,
+            sched_cfg=self.sched_cfg,
+            plotting_cfg=self.plotting_cfg,
+            completed=self.completed,
+            freebytes=self.freebytes,
+        )
+        if planned is None:
+            return error(wait_reason)
+        if placement.tmpdir != planned.tmpdir and not manager.phases_permit_new_job(
+            index.phases_for_tmpdir(placement.tmpdir),
+            placement.tmpdir,
+            self.sched_cfg,
+            self.dir_cfg,
+        ):
+            return error(f"tmp dir {placement.tmpdir!r} can not take another job")
+        if placement.dstdir not in self.dst_dirs() + [planned.dstdir]:
+            return error(f"not a configured dst dir: {placement.dstdir!r}")
+
+        started, message = self.start(placement, jobs)
+        return {"ok": started, "message": message}
+
+    def handle_job_command(
+        self, request: typing.Dict[str, typing.Any]
+    ) -> typing.Dict[str, object]:
+        selected = manager.select_jobs_by_partial_id(self.jobs(), request["plot_id"])
+        if len(selected) != 1:
+            return error(
+                f"{request['plot_id']!r} matched {len(selected)} jobs, expected one"
+            )
+        [j] = selected
+
+        command = request["command"]
+        try:
+            if command == "suspend":
+                j.suspend(reason="suspended by controller")
+            elif command == "resume":
+                j.resume()
+            else:
+                j.kill()
+        except psutil.NoSuchProcess:
+            return error(f"job {request['plot_id']!r} has exited")
+
+        return {"ok": True, "message": f"{command} {j.plot_id_prefix()}"}
+
+
+def error(message: str) -> typing.Dict[str, object]:
+    return {"ok": False, "error": message}
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    server: "Server"
+
+    def handle(self) -> None:
+        line = self.rfile.readline(MAX_REQUEST_BYTES + 1)
+        try:
+            if len(line) > MAX_REQUEST_BYTES:
+                raise ValueError(f"longer than {MAX_REQUEST_BYTES} bytes")
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("request must be an object")
+            if request.get("version") != PROTOCOL_VERSION:
+                response = error(
+                    f"unsupported protocol version, use {PROTOCOL_VERSION}"
+                )
+            else:
+                response = self.server.agent.handle(request)
+        except (ValueError, KeyError, TypeError) as e:
+            response = error(f"malformed request: {e}")
+
+        self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+
+
+class Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, agent: Agent, address: typing.Tuple[str, int]) -> None:
+        if agent.token is None and not is_loopback(address[0]):
+            raise FleetException(
+                f"refusing to serve the agent on {address[0]} without a token,"
+                " set commands: agent: token:"
+            )
+        self.agent = agent
+        super().__init__(address, RequestHandler)
+
+
+def is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        # A host name, which may resolve to anything
+        return False
+
+
+def request(
+    address: configuration.AgentAddress,
+    message: typing.Dict[str, object],
+    token: typing.Optional[str] = None,
+    timeout: float = 5,
+) -> typing.Dict[str, typing.Any]:
+    """Send one request to an agent and return its successful response."""
+    payload = {**message, "version": PROTOCOL_VERSION}
+    if token is not None:
+        payload["token"] = token
+
+    try:
+        with socket.create_connection(
+            (address.host, address.port), timeout=timeout
+        ) as connection:
+            connection.sendall(json.dumps(payload).encode("utf-8") + b"\n")
+            with connection.makefile("rb") as file:
+                line = file.readline()
+    except OSError as e:
+        raise FleetException(f"agent {address.name} unreachable: {e}") from e
+
+    try:
+        response: typing.Dict[str, typing.Any] = json.loads(line)
+    except ValueError as e:
+        raise FleetException(f"agent {address.name} sent a malformed response") from e
+
+    if not response.get("ok"):
+        raise FleetException(
+            f"agent {address.name}: {response.get('error') or response.get('message')}"
+        )
+
+    return response
+
+
+@attr.mutable
+class Controller:
+    """Schedules jobs across agents.  Each agent's own configuration decides
+    whether and in which tmp dir it could start a job.  The controller applies
+    the fleet wide limits, starts the job on the agent with the fewest jobs and
+    picks among that agent's dst dirs considering its own jobs.  The same path
+    on two hosts is not assumed to be the same dir."""
+
+    config: configuration.Controller
+    sched_cfg: configuration.Scheduling
+    plot_size: int
+
+    def agent(self, name: str) -> configuration.AgentAddress:
+        for address in self.config.agents:
+            if address.name == name:
+                return address
+        raise FleetException(f"no agent named {name!r}")
+
+    def request(
+        self, address: configuration.AgentAddress, message: typing.Dict[str, object]
+    ) -> typing.Dict[str, typing.Any]:
+        return request(
+            address=address,
+            message=message,
+            token=self.config.token,
+            timeout=self.config.timeout_s,
+        )
+
+    def snapshots(
+        self,
+    ) -> typing.Tuple[typing.Dict[str, AgentSnapshot], typing.List[str]]:
+        """Return the snapshots of reachable agents and errors for the others."""
+        snapshots = {}
+        errors = []
+        for address in self.config.agents:
+            try:
+                response = self.request(address, {"command": "snapshot"})
+                snapshots[address.name] = AgentSnapshot.from_dict(response["snapshot"])
+            except (FleetException, KeyError, TypeError) as e:
+                errors.append(str(e))
+        return (snapshots, errors)
+
+    def command(self, name: str, command: str, plot_id: str) -> str:
+        response = self.request(
+            self.agent(name), {"command": command, "plot_id": plot_id}
+        )
+        return typing.cast(str, response["message"])
+
+    def choose(
+        self, snapshots: typing.Dict[str, AgentSnapshot]
+    ) -> typing.Tuple[typing.Optional[typing.Tuple[str, manager.Placement]], str]:
+        """Decide which agent should start a job and where, or why none should."""
+        all_jobs = [j for snapshot in snapshots.values() for j in snapshot.jobs]
+
+        if self.config.global_stagger_m is not None and all_jobs:
+            youngest_job_age = min(j.time_wall for j in all_jobs)
+            global_stagger = self.config.global_stagger_m * manager.MIN
+            if youngest_job_age < global_stagger:
+                return (
+                    None,
+                    "fleet stagger (%ds/%ds)" % (youngest_job_age, global_stagger),
+                )
+
+        if (
+            self.config.global_max_jobs is not None
+            and len(all_jobs) >= self.config.global_max_jobs
+        ):
+            return (None, "fleet max jobs (%d)" % self.config.global_max_jobs)
+
+        candidates = sorted(
+            (len(snapshot.jobs), name)
+            for name, snapshot in snapshots.items()
+            if snapshot.placement is not None
+        )
+        if not candidates:
+            return (
+                None,
+                "no agent can start a job (%s)"
+                % (
+                    ", ".join(
+                        f"{name}: {snapshot.wait_reason}"
+                        for name, snapshot in sorted(snapshots.items())
+                    )
+                ),
+            )
+
+        for _, name in candidates:
+            snapshot = snapshots[name]
+            placement = snapshot.placement
+            assert placement is not None
+            dst_dirs = list(snapshot.dst_freebytes)
+            if not dst_dirs:
+                # The agent plots to its tmp or tmp2 dirs
+                return ((name, placement), "")
+
+            # The same path on two hosts is two different dirs, so each agent's
+            # dst dirs are assessed against its own jobs only.
+            index = job.JobIndex.of(typing.cast(typing.List[job.Job], snapshot.jobs))
+            states = manager.dstdir_states(
+                dst_dirs=dst_dirs,
+                index=index,
+                freebytes=snapshot.dst_freebytes,
+                completed=[],
+                plot_size=self.plot_size,
+                # The devices and filesystems of other hosts are unknown here,
+                # count copies and subtract inbound plots per dst dir instead.
+                device_for_path=lambda d: None,
+                filesystem_for_path=os.path.normpath,
+            )
+            dstdir = manager.select_dstdir(
+                dst_dirs=dst_dirs,
+                index=index,
+                states=states,
+                policy=self.sched_cfg.dst_selection,
+                max_copies=self.sched_cfg.dst_max_copies,
+            )
+            if dstdir is not None:
+                return ((name, attr.evolve(placement, dstdir=dstdir)), "")
+
+        return (None, "no dst dirs with space for another plot on any agent")
+
+    def maybe_start_new_plot(self) -> typing.Tuple[bool, str]:
+        snapshots, errors = self.snapshots()
+        if not snapshots:
+            return (False, "no agents reachable (%s)" % "; ".join(errors))
+
+        choice, wait_reason = self.choose(snapshots)
+        if choice is None:
+            return (False, wait_reason)
+
+        name, placement = choice
+        try:
+            response = self.request(
+                self.agent(name),
+                {
+                    "command": "start",
+                    "tmpdir": placement.tmpdir,
+                    "dstdir": placement.dstdir,
+                },
+            )
+        except FleetException as e:
+            return (False, str(e))
+
+        return (True, "%s: %s" % (name, response["message"]))
+
+
+def create_controller(cfg: configuration.PlotmanConfig) -> Controller:
+    if cfg.commands.controller is None:
+        raise FleetException(
+            "commands: controller: must be configured to run a controller"
+        )
+    return Controller(
+        config=cfg.commands.controller,
+        sched_cfg=cfg.scheduling,
+        plot_size=plot_util.get_plotsize(cfg.plotting.plot_size()),
+    )
+
+
+def create_agent(cfg: configuration.PlotmanConfig) -> Agent:
+    def jobs() -> typing.List[job.Job]:
+        return job.Job.get_running_jobs(cfg.logging.plots)
+
+    def start(
+        placement: manager.Placement, jobs: typing.List[job.Job]
+    ) -> typing.Tuple[bool, str]:
+        return manager.start_plot(
+            placement=placement,
+            jobs=jobs,
+            dir_cfg=cfg.directories,
+            sched_cfg=cfg.scheduling,
+            plotting_cfg=cfg.plotting,
+            log_cfg=cfg.logging,
+        )
+
+    def completed() -> typing.List[plotman.plotters.CommonInfo]:
+        return history.completed_logs(cfg.logging.plots).recent()
+
+    return Agent(
+        name=cfg.commands.agent.name or socket.gethostname(),
+        dir_cfg=cfg.directories,
+        sched_cfg=cfg.scheduling,
+        plotting_cfg=cfg.plotting,
+        jobs=jobs,
+        start=start,
+        completed=completed,
+        token=cfg.commands.agent.token,
+    )
@@ -0,0 +1,320 @@
+import glob
+import json
+import os
+import sys
+import typing
+
+import attr
+
+import plotman.errors
+import plotman.plot_util
+import plotman.plotters
+
+if sys.platform != "win32":
+    import fcntl
+
+# Bucket upper bounds in seconds.  Phases take from minutes on fast machines to
+# most of a day on slow ones, copies from seconds to about an hour.
+DURATION_BUCKETS_S = (
+    300.0,
+    600.0,
+    1200.0,
+    1800.0,
+    3600.0,
+    5400.0,
+    7200.0,
+    10800.0,
+    14400.0,
+    21600.0,
+    28800.0,
+    43200.0,
+    86400.0,
+)
+COPY_BUCKETS_S = (10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1200.0, 1800.0, 3600.0)
+
+# Completed infos kept for scoring, tuning and simulation, which read the most
+# recent ones.  This covers their history windows for each tmp dir and set of
+# plotting parameters on all but the largest rigs.
+COMPLETED_KEPT = 1000
+
+# Label values of a completed plot: plotter, tmp dir and dst dir.
+CompletionLabels = typing.Tuple[str, str, str]
+
+
+@attr.mutable
+class LogState:
+    offset: int = 0
+    plotter: typing.Optional["plotman.plotters.Plotter"] = None
+
+
+@attr.mutable
+class Histogram:
+    """Counts of observed values at or below each bound, not cumulative, with
+    the values above the last bound in the final count."""
+
+    bounds: typing.Tuple[float, ...]
+    counts: typing.List[int] = attr.ib()
+    sum: float = 0
+    count: int = 0
+
+    @counts.default
+    def _counts_default(self) -> typing.List[int]:
+        return [0] * (len(self.bounds) + 1)
+
+    def observe(self, value: float) -> None:
+        index = len(self.bounds)
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> typing.List[typing.Tuple[float, int]]:
+        """(upper bound, count) pairs as Prometheus buckets, ending with
+        infinity."""
+        buckets = []
+        total = 0
+        for bound, count in zip(self.bounds + (float("inf"),), self.counts):
+            total += count
+            buckets.append((bound, total))
+        return buckets
+
+    def to_dict(self) -> typing.Dict[str, typing.Any]:
+        return attr.asdict(self)
+
+    @classmethod
+    def from_dict(cls, d: typing.Dict[str, typing.Any]) -> "Histogram":
+        return cls(
+            bounds=tuple(d["bounds"]),
+            counts=d["counts"],
+            sum=d["sum"],
+            count=d["count"],
+        )
+
+
+@attr.mutable
+class CompletionStats:
+    """Durations and counts of completed plots by plotter, tmp dir and dst
+    dir, added to as logs complete rather than recomputed from the history."""
+
+    phases: typing.Dict[typing.Tuple[CompletionLabels, int], Histogram] = attr.ib(
+        factory=dict
+    )
+    total: typing.Dict[CompletionLabels, Histogram] = attr.ib(factory=dict)
+    copy: typing.Dict[CompletionLabels, Histogram] = attr.ib(factory=dict)
+    plots: typing.Dict[CompletionLabels, int] = attr.ib(factory=dict)
+    plot_bytes: typing.Dict[CompletionLabels, int] = attr.ib(factory=dict)
+
+    def add(self, info: plotman.plotters.CommonInfo) -> None:
+        labels = (info.type, info.tmpdir, info.dstdir)
+        for phase, duration in enumerate(
+            [
+                info.phase1_duration_raw,
+                info.phase2_duration_raw,
+                info.phase3_duration_raw,
+                info.phase4_duration_raw,
+            ],
+            start=1,
+        ):
+            if duration > 0:
+                self.phases.setdefault(
+                    (labels, phase), Histogram(bounds=DURATION_BUCKETS_S)
+                ).observe(duration)
+        if info.total_time_raw > 0:
+            self.total.setdefault(labels, Histogram(bounds=DURATION_BUCKETS_S)).observe(
+                info.total_time_raw
+            )
+        if info.copy_time_raw > 0:
+            self.copy.setdefault(labels, Histogram(bounds=COPY_BUCKETS_S)).observe(
+                info.copy_time_raw
+            )
+        self.plots[labels] = self.plots.get(labels, 0) + 1
+        if info.plot_size > 0:
+            self.plot_bytes[labels] = self.plot_bytes.get(
+                labels, 0
+            ) + plotman.plot_util.get_plotsize(info.plot_size)
+
+    def to_dict(self) -> typing.Dict[str, typing.Any]:
+        return {
+            "phases": [
+                {"labels": labels, "phase": phase, "histogram": histogram.to_dict()}
+                for (labels, phase), histogram in self.phases.items()
+            ],
+            "total": [
+                {"labels": labels, "histogram": histogram.to_dict()}
+                for labels, histogram in self.total.items()
+            ],
+            "copy": [
+                {"labels": labels, "histogram": histogram.to_dict()}
+                for labels, histogram in self.copy.items()
+            ],
+            "plots": [
+                {"labels": labels, "value": value}
+                for labels, value in self.plots.items()
+            ],
+            "plot_bytes": [
+                {"labels": labels, "value": value}
+                for labels, value in self.plot_bytes.items()
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, d: typing.Dict[str, typing.Any]) -> "CompletionStats":
+        def labels(entry: typing.Dict[str, typing.Any]) -> CompletionLabels:
+            plotter, tmpdir, dstdir = entry["labels"]
+            return (plotter, tmpdir, dstdir)
+
+        return cls(
+            phases={
+                (labels(entry), entry["phase"]): Histogram.from_dict(entry["histogram"])
+                for entry in d["phases"]
+            },
+            total={
+                labels(entry): Histogram.from_dict(entry["histogram"])
+                for entry in d["total"]
+            },
+            copy={
+                labels(entry): Histogram.from_dict(entry["histogram"])
+                for entry in d["copy"]
+            },
+            plots={labels(entry): entry["value"] for entry in d["plots"]},
+            plot_bytes={labels(entry): entry["value"] for entry in d["plot_bytes"]},
+        )
+
+
+@attr.mutable
+class CompletedLogs:
+    """Incrementally parsed history of completed plot logs in a directory.
+
+    Each log is only read from where the previous update left off, so
+    repeated updates only cost the bytes appended since the last call.
+    Logs are dropped from the in-progress set as soon as they complete and
+    added to the stats.  Only the infos of the most recent ``kept`` completed
+    logs are kept, older ones are only remembered as counted."""
+
+    directory: str
+    kept: int = COMPLETED_KEPT
+    completed: typing.Dict[str, plotman.plotters.CommonInfo] = attr.ib(factory=dict)
+    in_progress: typing.Dict[str, LogState] = attr.ib(factory=dict)
+    stats: CompletionStats = attr.ib(factory=CompletionStats)
+    # Completed logs already in the stats whose infos are not kept
+    counted: typing.Set[str] = attr.ib(factory=set)
+
+    def update(self) -> typing.List[plotman.plotters.CommonInfo]:
+        """Read new log data and return the infos of newly completed logs."""
+        newly_completed = []
+
+        filenames = glob.glob(os.path.join(self.directory, "*.plot.log"))
+        for filename in filenames:
+            if filename in self.completed or filename in self.counted:
+                continue
+
+            state = self.in_progress.setdefault(filename, LogState())
+            info = self._update_log(filename=filename, state=state)
+            if info is not None and info.completed:
+                del self.in_progress[filename]
+                self.completed[filename] = info
+                self.stats.add(info)
+                newly_completed.append(info)
+
+        if len(self.completed) > self.kept:
+            by_start = sorted(
+                self.completed,
+                key=lambda filename: start_time(self.completed[filename]),
+            )
+            for filename in by_start[: -self.kept]:
+                del self.completed[filename]
+                self.counted.add(filename)
+        # Removed logs are not coming back
+        self.counted.intersection_update(filenames)
+
+        return newly_completed
+
+    def _update_log(
+        self, filename: str, state: LogState
+    ) -> typing.Optional[plotman.plotters.CommonInfo]:
+        try:
+            with open(filename, "rb") as file:
+                file.seek(state.offset)
+                chunk = file.read()
+        except FileNotFoundError:
+            del self.in_progress[filename]
+            return None
+
+        if state.plotter is None:
+            lines = chunk.decode("utf-8", errors="ignore").splitlines()
+            try:
+                plotter_type = plotman.plotters.get_plotter_from_log(lines=lines)
+            except plotman.errors.UnableToIdentifyPlotterFromLogError:
+                # Perhaps the identifying line has not been written yet.
+                return None
+            state.plotter = plotter_type()
+
+        state.offset += len(chunk)
+        state.plotter.update(chunk=chunk)
+
+        return state.plotter.common_info()
+
+    def recent(
+        self, limit: typing.Optional[int] = None
+    ) -> typing.List[plotman.plotters.CommonInfo]:
+        """Return completed infos ordered by start time, most recent last."""
+        infos = sorted(self.completed.values(), key=start_time)
+        if limit is not None:
+            infos = infos[-limit:]
+        return infos
+
+
+def start_time(info: plotman.plotters.CommonInfo) -> float:
+    return info.started_at.timestamp() if info.started_at is not None else 0
+
+
+_completed_logs_by_directory: typing.Dict[str, CompletedLogs] = {}
+
+
+def completed_logs(directory: str) -> CompletedLogs:
+    """Return the updated, process wide, completed log history for directory."""
+    history = _completed_logs_by_directory.setdefault(
+        directory, CompletedLogs(directory=directory)
+    )
+    history.update()
+    return history
+
+
+def persisted_completion_stats(directory: str, path: str) -> CompletionStats:
+    """Return the completion stats of the logs in directory, kept in the state
+    file at path so that each log is only parsed by the first run after it
+    completes rather than by every one-shot report."""
+    with open(path + ".lock", "a") as lock_file:
+        if sys.platform != "win32":
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+        history = CompletedLogs(directory=directory)
+        if os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            if state["directory"] == directory:
+                history.counted = set(state["counted"])
+                history.stats = CompletionStats.from_dict(state["stats"])
+        history.update()
+
+        # Logs that were removed are not coming back, their counts stay
+        present = set(glob.glob(os.path.join(directory, "*.plot.log")))
+        counted = (history.counted | history.completed.keys()) & present
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "w") as f:
+            json.dump(
+                {
+                    "directory": directory,
+                    "counted": sorted(counted),
+                    "stats": history.stats.to_dict(),
+                },
+                f,
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, path)
+
+    return history.stats
@@ -8,8 +8,19 @@ import sys
 import typing
 import logging
 
-from plotman import archive, configuration, manager, reporting
-from plotman.job import Job
+from plotman import (
+    archive,
+    archive_queue,
+    backpressure,
+    configuration,
+    copy_gate,
+    manager,
+    priority,
+    reporting,
+    topology,
+    watchdog,
+)
+from plotman.job import Job, JobIndex
 
 root_logger = logging.getLogger()
 
@@ -115,8 +126,35 @@ def curses_main(
     pressed_key = ""  # For debugging
 
     archdir_freebytes = None
+    archdir_age = None
+    archive_transfers: typing.List[archive.Transfer] = []
     aging_reason = None
 
+    archive_disk_space = None
+    archive_plot_queue = None
+    if cfg.archiving is not None:
+        archive_disk_space = archive.DiskSpace(
+            arch_cfg=cfg.archiving, refresh_s=cfg.archiving.disk_space_refresh_s
+        )
+        archive_disk_space.start()
+        archive_plot_queue = archive_queue.ArchiveQueue.load(
+            path=cfg.logging.archive_queue, arch_cfg=cfg.archiving
+        )
+
+    backpressure_controller = None
+    if cfg.scheduling.backpressure is not None:
+        backpressure_controller = backpressure.Controller(
+            config=cfg.scheduling.backpressure
+        )
+
+    dst_copy_gate = None
+    if cfg.scheduling.dst_max_copies is not None:
+        dst_copy_gate = copy_gate.CopyGate(max_copies=cfg.scheduling.dst_max_copies)
+
+    job_watchdog = None
+    if cfg.scheduling.watchdog is not None:
+        job_watchdog = watchdog.Watchdog(config=cfg.scheduling.watchdog)
+
     while True:
 
         # A full refresh scans for and reads info for running jobs from
@@ -139,7 +177,7 @@ def curses_main(
 
             if plotting_active:
                 (started, msg) = manager.maybe_start_new_plot(
-                    cfg.directories, cfg.scheduling, cfg.plotting, cfg.logging
+                    cfg.directories, cfg.scheduling, cfg.plotting, cfg.logging, jobs
                 )
                 if started:
                     if aging_reason is not None:
@@ -155,10 +193,37 @@ def curses_main(
                     plotting_status = msg
                 root_logger.info("[plot] %s", msg)
 
-            if cfg.archiving is not None:
+            if cfg.scheduling.priorities is not None:
+                for log_message in priority.apply(jobs, cfg.scheduling.priorities):
+                    log.log(log_message)
+                    root_logger.info("[priority] %s", log_message)
+
+            if backpressure_controller is not None:
+                for log_message in backpressure_controller.update(
+                    jobs, topology.device_for_path
+                ):
+                    log.log(log_message)
+                    root_logger.info("[backpressure] %s", log_message)
+
+            if dst_copy_gate is not None:
+                for log_message in dst_copy_gate.update(jobs):
+                    log.log(log_message)
+                    root_logger.info("[copy gate] %s", log_message)
+
+            if job_watchdog is not None:
+                for log_message in job_watchdog.update(jobs):
+                    log.log(log_message)
+                    root_logger.warning("[watchdog] %s", log_message)
+
+            if cfg.archiving is not None and archive_disk_space is not None:
                 if archiving_active:
                     archiving_status, log_messages = archive.spawn_archive_process(
-                        cfg.directories, cfg.archiving, cfg.logging, jobs
+                        cfg.directories,
+                        cfg.archiving,
+                        cfg.logging,
+                        jobs,
+                        disk_space=archive_disk_space,
+                        queue=archive_plot_queue,
                     )
                     if log_messages:
                         for log_message in log_messages:
@@ -167,11 +232,14 @@ def curses_main(
                     else:
                         root_logger.info("[archive] %s", archiving_status)
 
-                archdir_freebytes, log_messages = archive.get_archdir_freebytes(
-                    cfg.archiving
-                )
+                (
+                    archdir_freebytes,
+                    archdir_age,
+                    log_messages,
+                ) = archive_disk_space.get()
                 for log_message in log_messages:
                     log.log(log_message)
+                archive_transfers = archive.get_running_transfers(cfg.archiving)
 
         # Get terminal size.  Recommended method is stdscr.getmaxyx(), but this
         # does not seem to work on some systems.  It may be a bug in Python
@@ -214,16 +282,33 @@ def curses_main(
         n_tmpdirs = len(cfg.directories.tmp)
 
         # Directory reports.
+        index = JobIndex.of(jobs)
+        io = topology.utilization_for_paths(cfg.directories.tmp + dst_dir)
+        tmpdir_scores = manager.configured_tmpdir_scores(
+            index, cfg.directories, cfg.scheduling, cfg.logging
+        )
         tmp_report = reporting.tmp_dir_report(
-            jobs, cfg.directories, cfg.scheduling, n_cols, 0, n_tmpdirs, tmp_prefix
+            index,
+            cfg.directories,
+            cfg.scheduling,
+            n_cols,
+            0,
+            n_tmpdirs,
+            tmp_prefix,
+            scores=tmpdir_scores,
+            io=io,
         )
-        dst_report = reporting.dst_dir_report(jobs, dst_dir, n_cols, dst_prefix)
+        dst_report = reporting.dst_dir_report(index, dst_dir, n_cols, dst_prefix, io=io)
         if archdir_freebytes is not None:
             arch_report = reporting.arch_dir_report(
                 archdir_freebytes, n_cols, arch_prefix
             )
             if not arch_report:
                 arch_report = "<no archive dir info>"
+            if archive_transfers:
+                arch_report += "\n" + reporting.transfer_report(
+                    archive_transfers, n_cols, arch_prefix
+                )
         else:
             arch_report = "<archiving not configured>"
 
@@ -333,7 +418,10 @@ def curses_main(
         dstwin.chgat(0, 0, curses.A_REVERSE)
 
         archwin = curses.newwin(arch_h, arch_w, dirs_pos + maxtd_h, 0)
-        archwin.addstr(0, 0, "Archive dirs free space", curses.A_REVERSE)
+        arch_title = "Archive dirs free space"
+        if archdir_age is not None:
+            arch_title += " (checked %ds ago)" % archdir_age
+        archwin.addstr(0, 0, arch_title, curses.A_REVERSE)
         archwin.addstr(1, 0, arch_report)
 
         # Log.  Could use a pad here instead of managing scrolling ourselves, but
@@ -378,6 +466,12 @@ def curses_main(
             archiving_active = not archiving_active
             pressed_key = "a"
         elif key == ord("q"):
+            if backpressure_controller is not None:
+                for log_message in backpressure_controller.resume_all(jobs):
+                    root_logger.info("[backpressure] %s", log_message)
+            if dst_copy_gate is not None:
+                for log_message in dst_copy_gate.resume_all(jobs):
+                    root_logger.info("[copy gate] %s", log_message)
             break
         else:
             pressed_key = key
@@ -15,28 +15,7 @@ import plotman.errors
 
 if typing.TYPE_CHECKING:
     import plotman.errors
-
-
-def job_phases_for_tmpdir(d: str, all_jobs: typing.List["Job"]) -> typing.List["Phase"]:
-    """Return phase 2-tuples for jobs running on tmpdir d"""
-    return sorted(
-        [
-            j.progress()
-            for j in all_jobs
-            if os.path.normpath(j.plotter.common_info().tmpdir) == os.path.normpath(d)
-        ]
-    )
-
-
-def job_phases_for_dstdir(d: str, all_jobs: typing.List["Job"]) -> typing.List["Phase"]:
-    """Return phase 2-tuples for jobs outputting to dstdir d"""
-    return sorted(
-        [
-            j.progress()
-            for j in all_jobs
-            if os.path.normpath(j.plotter.common_info().dstdir) == os.path.normpath(d)
-        ]
-    )
+    import plotman.plotters
 
 
 @attr.frozen
@@ -99,6 +78,59 @@ class Phase:
         return f"{self.major}:{self.minor}"
 
 
+@attr.frozen
+class IoSample:
+    """Bytes a process has read from and written to storage by time."""
+
+    time: float
+    read_bytes: int
+    write_bytes: int
+
+
+@attr.frozen
+class PhaseIo:
+    """Bytes read and written by a job while in phase."""
+
+    phase: Phase
+    read_bytes: int
+    write_bytes: int
+
+
+# Rates are measured over at least this long so that jobs listed several times
+# in quick succession, as by the plot loop, keep meaningful rates.
+IO_RATE_MIN_S = 5.0
+
+
+@attr.mutable
+class IoHistory:
+    """The io samples of one process.  These are kept per pid for as long as
+    the process runs rather than on a Job, which is rebuilt whenever the jobs
+    are listed from scratch.  The rates in bytes/s are those between the two
+    latest samples at least IO_RATE_MIN_S apart and phase_marks has each phase
+    the job was seen in with the io counters when first seen in it."""
+
+    create_time: float = 0
+    sample: typing.Optional[IoSample] = None
+    rate_sample: typing.Optional[IoSample] = None
+    read_rate: typing.Optional[float] = None
+    write_rate: typing.Optional[float] = None
+    phase_marks: typing.List[PhaseIo] = attr.ib(factory=list)
+
+
+_io_histories: typing.Dict[int, IoHistory] = {}
+
+
+def io_history(proc: psutil.Process) -> IoHistory:
+    """Return the process wide io history of proc, a new one if its pid was
+    reused."""
+    create_time = proc.create_time()
+    history = _io_histories.get(proc.pid)
+    if history is None or history.create_time != create_time:
+        history = IoHistory(create_time=create_time)
+        _io_histories[proc.pid] = history
+    return history
+
+
 # TODO: be more principled and explicit about what we cache vs. what we look up
 # dynamically from the logfile
 class Job:
@@ -107,8 +139,11 @@ class Job:
     plotter: "plotman.plotters.Plotter"
 
     logfile: typing.Optional[str] = None
+    # Bytes of the logfile parsed so far
+    log_offset: int = 0
     job_id: int = 0
     proc: psutil.Process
+    io: IoHistory
 
     @classmethod
     def get_running_jobs(
@@ -117,8 +152,9 @@ class Job:
         cached_jobs: typing.Sequence["Job"] = (),
     ) -> typing.List["Job"]:
         """Return a list of running plot jobs.  If a cache of preexisting jobs is provided,
-        reuse those previous jobs without updating their information.  Always look for
-        new jobs not already in the cache."""
+        reuse those previous jobs, only parsing what was added to their logs.  Always look
+        for new jobs not already in the cache.  The io counters of every job are
+        sampled."""
         jobs: typing.List[Job] = []
         cached_jobs_by_pid = {j.proc.pid: j for j in cached_jobs}
 
@@ -157,7 +193,13 @@ class Job:
             for proc in wanted_processes:
                 with contextlib.suppress(psutil.NoSuchProcess, psutil.AccessDenied):
                     if proc.pid in cached_jobs_by_pid.keys():
-                        jobs.append(cached_jobs_by_pid[proc.pid])  # Copy from cache
+                        cached_job = cached_jobs_by_pid[proc.pid]
+                        # Parse the log first so the io is marked in the
+                        # phase the job is in now
+                        with contextlib.suppress(FileNotFoundError):
+                            cached_job.update_log()
+                        cached_job.update_io()
+                        jobs.append(cached_job)  # Copy from cache
                     else:
                         with proc.oneshot():
                             command_line = list(proc.cmdline())
@@ -190,13 +232,13 @@ class Job:
                                 plotter=plotter,
                                 logroot=logroot,
                             )
-                            if job.logfile is not None:
-                                # TODO: stop reloading every time...
-                                with open(job.logfile, "rb") as f:
-                                    r = f.read()
-                                job.plotter.update(chunk=r)
+                            job.update_log()
+                            job.update_io()
                             jobs.append(job)
 
+            for pid in _io_histories.keys() - wanted_pids:
+                del _io_histories[pid]
+
         return jobs
 
     def __init__(
@@ -209,6 +251,8 @@ class Job:
         """Initialize from an existing psutil.Process object.  must know logroot in order to understand open files"""
         self.proc = proc
         self.plotter = plotter
+        # Replaced by the process wide history when first sampled
+        self.io = IoHistory()
 
         # Find logfile (whatever file is open under the log root).  The
         # file may be open more than once, e.g. for STDOUT and STDERR.
@@ -220,6 +264,71 @@ class Job:
                     self.logfile = f.path
                 break
 
+    def update_log(self) -> None:
+        """Parse what was written to the logfile since it was last read."""
+        if self.logfile is None:
+            return
+        with open(self.logfile, "rb") as f:
+            f.seek(self.log_offset)
+            chunk = f.read()
+        self.log_offset += len(chunk)
+        self.plotter.update(chunk=chunk)
+
+    def update_io(self, now: typing.Optional[float] = None) -> None:
+        """Sample the io counters of the process, from /proc/<pid>/io on Linux,
+        and mark them when the job is first seen in a phase."""
+        if not hasattr(self.proc, "io_counters"):
+            # Not supported on macOS
+            return
+        if now is None:
+            now = time.monotonic()
+        history = io_history(self.proc)
+        self.io = history
+        counters = self.proc.io_counters()
+        sample = IoSample(
+            time=now, read_bytes=counters.read_bytes, write_bytes=counters.write_bytes
+        )
+        history.sample = sample
+        previous = history.rate_sample
+        if previous is None:
+            history.rate_sample = sample
+        elif now - previous.time >= IO_RATE_MIN_S:
+            elapsed = now - previous.time
+            history.read_rate = (sample.read_bytes - previous.read_bytes) / elapsed
+            history.write_rate = (sample.write_bytes - previous.write_bytes) / elapsed
+            history.rate_sample = sample
+
+        phase = self.progress()
+        marks = history.phase_marks
+        if not marks or marks[-1].phase != phase:
+            marks.append(
+                PhaseIo(
+                    phase=phase,
+                    read_bytes=sample.read_bytes,
+                    write_bytes=sample.write_bytes,
+                )
+            )
+
+    def io_by_phase(self) -> typing.List[PhaseIo]:
+        """The bytes read and written in each phase seen since plotman started
+        following the job, the last phase still going on.  Empty until the
+        job has been followed long enough to measure its rates."""
+        sample = self.io.sample
+        if sample is None or self.io.read_rate is None:
+            return []
+        marks = self.io.phase_marks
+        ends = [(mark.read_bytes, mark.write_bytes) for mark in marks[1:]] + [
+            (sample.read_bytes, sample.write_bytes)
+        ]
+        return [
+            PhaseIo(
+                phase=mark.phase,
+                read_bytes=read_end - mark.read_bytes,
+                write_bytes=write_end - mark.write_bytes,
+            )
+            for mark, (read_end, write_end) in zip(marks, ends)
+        ]
+
     def progress(self) -> Phase:
         """Return a 2-tuple with the job phase and subphase (by reading the logfile)"""
         return self.plotter.common_info().phase
@@ -235,9 +344,10 @@ class Job:
     def status_str_long(self) -> str:
         # TODO: get the rest of this filled out
         info = self.plotter.common_info()
-        return "{plot_id}\npid:{pid}\ntmp:{tmp}\ndst:{dst}\nlogfile:{logfile}".format(
+        return "{plot_id}\npid:{pid}\ncpus:{cpus}\ntmp:{tmp}\ndst:{dst}\nlogfile:{logfile}".format(
             plot_id=info.plot_id,
             pid=self.proc.pid,
+            cpus=self.get_cpu_affinity_str(),
             tmp=info.tmpdir,
             dst=info.dstdir,
             logfile=self.logfile,
@@ -279,7 +389,7 @@ class Job:
         """Exports important information as dictionary."""
         info = self.plotter.common_info()
         # TODO: get the rest of this filled out
-        return dict(
+        result: typing.Dict[str, object] = dict(
             plot_id=self.plot_id_prefix(),
             # k=self.k,
             tmp_dir=info.tmpdir,
@@ -287,13 +397,31 @@ class Job:
             progress=str(self.progress()),
             tmp_usage=self.get_tmp_usage(),
             pid=self.proc.pid,
+            cpus=self.get_cpu_affinity_str(),
             run_status=self.get_run_status(),
             mem_usage=self.get_mem_usage(),
             time_wall=self.get_time_wall(),
             time_user=self.get_time_user(),
             time_sys=self.get_time_sys(),
             time_iowait=self.get_time_iowait(),
+            read_bytes=None if self.io.sample is None else self.io.sample.read_bytes,
+            write_bytes=None if self.io.sample is None else self.io.sample.write_bytes,
         )
+        # Rates need an earlier sample, which one-off listings lack
+        if self.io.read_rate is not None:
+            result.update(
+                read_rate=self.io.read_rate,
+                write_rate=self.io.write_rate,
+                io_by_phase=[
+                    {
+                        "phase": str(phase_io.phase),
+                        "read_bytes": phase_io.read_bytes,
+                        "write_bytes": phase_io.write_bytes,
+                    }
+                    for phase_io in self.io_by_phase()
+                ],
+            )
+        return result
 
     def get_mem_usage(self) -> int:
         # Total, inc swapped
@@ -312,6 +440,25 @@ class Job:
                             total_bytes += entry.stat().st_size
         return total_bytes
 
+    def get_cpu_affinity(self) -> typing.Optional[typing.List[int]]:
+        """The cpus the process may run on, None where not supported."""
+        if not hasattr(self.proc, "cpu_affinity"):
+            return None
+
+        return self.proc.cpu_affinity()  # type: ignore[no-any-return]
+
+    def get_cpu_affinity_str(self) -> str:
+        cpus = self.get_cpu_affinity()
+        if cpus is None:
+            return "-"
+
+        import plotman.affinity
+
+        if set(cpus) == plotman.affinity.usable_cpus():
+            return "all"
+
+        return plotman.affinity.format_cpulist(cpus)
+
     def get_run_status(self) -> str:
         """Running, suspended, etc."""
         status = self.proc.status()
@@ -364,6 +511,17 @@ class Job:
 
         return temp_files
 
+    def kill(self) -> typing.Set[str]:
+        """Cancel the job and remove its temp files.  Returns the files."""
+        # Suspend first so the job doesn't create new files
+        self.suspend()
+        temp_files = self.get_temp_files()
+        self.cancel()
+        for f in temp_files:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(f)
+        return temp_files
+
     def cancel(self) -> None:
         "Cancel an already running job"
         # We typically suspend the job as the first action in killing it, so it
@@ -372,3 +530,87 @@ class Job:
         # TODO: check that this is best practice for killing a job.
         self.proc.resume()
         self.proc.terminate()
+
+
+@attr.frozen
+class IndexedJob:
+    job: Job
+    info: "plotman.plotters.CommonInfo"
+    phase: Phase
+
+
+def _group(
+    entries: typing.List[IndexedJob],
+    key: typing.Callable[[IndexedJob], str],
+) -> typing.Dict[str, typing.List[IndexedJob]]:
+    groups: typing.Dict[str, typing.List[IndexedJob]] = {}
+    for entry in entries:
+        d = key(entry)
+        if d:
+            groups.setdefault(os.path.normpath(d), []).append(entry)
+    return groups
+
+
+@attr.frozen
+class JobIndex:
+    """The running jobs grouped by their normalized tmp, tmp2 and dst dirs.
+    Built once per tick from the job list so that the info and phase of each
+    job are only read once and looking up a dir does not scan all jobs.  The
+    jobs of each dir are ordered by phase, youngest first."""
+
+    jobs: typing.List[Job]
+    entries: typing.List[IndexedJob]
+    by_tmpdir: typing.Dict[str, typing.List[IndexedJob]]
+    by_tmp2dir: typing.Dict[str, typing.List[IndexedJob]]
+    by_dstdir: typing.Dict[str, typing.List[IndexedJob]]
+    tmpdir_phases: typing.Dict[str, typing.List[Phase]]
+    tmp2dir_phases: typing.Dict[str, typing.List[Phase]]
+    dstdir_phases: typing.Dict[str, typing.List[Phase]]
+
+    @classmethod
+    def of(cls, jobs: typing.Sequence[Job]) -> "JobIndex":
+        entries = []
+        for j in jobs:
+            entries.append(
+                IndexedJob(job=j, info=j.plotter.common_info(), phase=j.progress())
+            )
+        by_phase = sorted(entries, key=lambda entry: entry.phase)
+        by_tmpdir = _group(by_phase, lambda entry: entry.info.tmpdir)
+        by_tmp2dir = _group(by_phase, lambda entry: entry.info.tmp2dir)
+        by_dstdir = _group(by_phase, lambda entry: entry.info.dstdir)
+
+        def phases(
+            groups: typing.Dict[str, typing.List[IndexedJob]]
+        ) -> typing.Dict[str, typing.List[Phase]]:
+            return {d: [entry.phase for entry in group] for d, group in groups.items()}
+
+        return cls(
+            jobs=list(jobs),
+            entries=entries,
+            by_tmpdir=by_tmpdir,
+            by_tmp2dir=by_tmp2dir,
+            by_dstdir=by_dstdir,
+            tmpdir_phases=phases(by_tmpdir),
+            tmp2dir_phases=phases(by_tmp2dir),
+            dstdir_phases=phases(by_dstdir),
+        )
+
+    def for_tmpdir(self, d: str) -> typing.List[IndexedJob]:
+        return self.by_tmpdir.get(os.path.normpath(d), [])
+
+    def for_tmp2dir(self, d: str) -> typing.List[IndexedJob]:
+        return self.by_tmp2dir.get(os.path.normpath(d), [])
+
+    def for_dstdir(self, d: str) -> typing.List[IndexedJob]:
+        return self.by_dstdir.get(os.path.normpath(d), [])
+
+    def phases_for_tmpdir(self, d: str) -> typing.List[Phase]:
+        """Return the sorted phases of the jobs running on tmpdir d"""
+        return self.tmpdir_phases.get(os.path.normpath(d), [])
+
+    def phases_for_tmp2dir(self, d: str) -> typing.List[Phase]:
+        return self.tmp2dir_phases.get(os.path.normpath(d), [])
+
+    def phases_for_dstdir(self, d: str) -> typing.List[Phase]:
+        """Return the sorted phases of the jobs outputting to dstdir d"""
+        return self.dstdir_phases.get(os.path.normpath(d), [])
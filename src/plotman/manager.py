@@ -1,14 +1,17 @@
+import collections
 import logging
 import operator
 import os
 import random
 import re
+import statistics
 import subprocess
 import sys
 import time
 import typing
 from datetime import datetime
 
+import attr
 import pendulum
 import psutil
 
@@ -16,10 +19,14 @@ import psutil
 from plotman import (
     archive,
 )  # for get_archdir_freebytes(). TODO: move to avoid import loop
-from plotman import job, plot_util
+from plotman import job, plot_util, topology
+import plotman.affinity
 import plotman.configuration
+import plotman.history
+import plotman.plotters
 import plotman.plotters.chianetwork
 import plotman.plotters.madmax
+import plotman.tuner
 
 
 # Constants
@@ -29,48 +36,28 @@ HR = 3600  # Seconds
 MAX_AGE = 1000_000_000  # Arbitrary large number of seconds
 
 
-def dstdirs_to_furthest_phase(
-    all_jobs: typing.List[job.Job],
-) -> typing.Dict[str, job.Phase]:
-    """Return a map from dst dir to a phase tuple for the most progressed job
-    that is emitting to that dst dir."""
-    result: typing.Dict[str, job.Phase] = {}
-    for j in all_jobs:
-        dstdir = j.plotter.common_info().dstdir
-        if not dstdir in result.keys() or result[dstdir] < j.progress():
-            result[dstdir] = j.progress()
-    return result
-
-
-def dstdirs_to_youngest_phase(
-    all_jobs: typing.List[job.Job],
-) -> typing.Dict[str, job.Phase]:
-    """Return a map from dst dir to a phase tuple for the least progressed job
-    that is emitting to that dst dir."""
-    result: typing.Dict[str, job.Phase] = {}
-    for j in all_jobs:
-        dstdir = j.plotter.common_info().dstdir
-        if dstdir is None:
-            continue
-        if not dstdir in result.keys() or result[dstdir] > j.progress():
-            result[dstdir] = j.progress()
-    return result
+def dstdirs_to_furthest_phase(index: job.JobIndex) -> typing.Dict[str, job.Phase]:
+    """Return a map from normalized dst dir to a phase tuple for the most
+    progressed job that is emitting to that dst dir."""
+    return {d: phases[-1] for d, phases in index.dstdir_phases.items()}
 
 
-def phases_permit_new_job(
-    phases: typing.List[job.Phase],
-    d: str,
-    sched_cfg: plotman.configuration.Scheduling,
-    dir_cfg: plotman.configuration.Directories,
-) -> bool:
-    """Scheduling logic: return True if it's OK to start a new job on a tmp dir
-    with existing jobs in the provided phases."""
-    # Filter unknown-phase jobs
-    phases = [ph for ph in phases if ph.known]
+def dstdirs_to_youngest_phase(index: job.JobIndex) -> typing.Dict[str, job.Phase]:
+    """Return a map from normalized dst dir to a phase tuple for the least
+    progressed job that is emitting to that dst dir."""
+    return {d: phases[0] for d, phases in index.dstdir_phases.items()}
 
-    if len(phases) == 0:
-        return True
 
+@attr.frozen
+class TmpdirLimits:
+    milestone: job.Phase
+    stagger_phase_limit: int
+    max_jobs: int
+
+
+def tmpdir_limits(d: str, sched_cfg: plotman.configuration.Scheduling) -> TmpdirLimits:
+    """Return the stagger milestone and job limits for tmp dir d, with any
+    configured overrides applied."""
     # Assign variables
     major = sched_cfg.tmpdir_stagger_phase_major
     minor = sched_cfg.tmpdir_stagger_phase_minor
@@ -97,193 +84,587 @@ def phases_permit_new_job(
         if curr_overrides.tmpdir_max_jobs is not None:
             max_plots = curr_overrides.tmpdir_max_jobs
 
-    milestone = job.Phase(major, minor)
+    return TmpdirLimits(
+        milestone=job.Phase(major, minor),
+        stagger_phase_limit=stagger_phase_limit,
+        max_jobs=max_plots,
+    )
+
+
+def phases_permit_new_job(
+    phases: typing.List[job.Phase],
+    d: str,
+    sched_cfg: plotman.configuration.Scheduling,
+    dir_cfg: plotman.configuration.Directories,
+) -> bool:
+    """Scheduling logic: return True if it's OK to start a new job on a tmp dir
+    with existing jobs in the provided phases."""
+    # Filter unknown-phase jobs
+    phases = [ph for ph in phases if ph.known]
+
+    if len(phases) == 0:
+        return True
+
+    limits = tmpdir_limits(d, sched_cfg)
 
     # Check if phases pass the criteria
-    if len([p for p in phases if p < milestone]) >= stagger_phase_limit:
+    if len([p for p in phases if p < limits.milestone]) >= limits.stagger_phase_limit:
         return False
 
-    if len(phases) >= max_plots:
+    if len(phases) >= limits.max_jobs:
         return False
 
     return True
 
 
-def maybe_start_new_plot(
+@attr.frozen
+class TmpdirScore:
+    """How attractive a tmp dir is for the next job under the throughput policy.
+
+    ``speed`` is the dir's recent completed-job speed relative to the average of
+    all dirs with history, or ``None`` when it has none (then treated as 1.0).
+    ``load`` is the number of jobs currently running in it."""
+
+    speed: typing.Optional[float]
+    load: int
+    samples: int
+
+    @property
+    def score(self) -> float:
+        speed = 1.0 if self.speed is None else self.speed
+        return speed / (1 + self.load)
+
+
+def tmpdir_scores(
+    tmpdirs: typing.List[str],
+    index: job.JobIndex,
+    completed: typing.Sequence[plotman.plotters.CommonInfo],
+    history_size: int,
+) -> typing.Dict[str, TmpdirScore]:
+    """Score tmp dirs by their measured phase 1 and total durations from recent
+    completed jobs, divided by the number of jobs running in them.  A dir that
+    completes plots twice as fast scores as well as a slower dir with half its
+    load so faster devices receive proportionally more jobs."""
+    by_dir: typing.Dict[str, typing.List[plotman.plotters.CommonInfo]] = {
+        os.path.normpath(d): [] for d in tmpdirs
+    }
+    for info in completed:
+        if not info.tmpdir or info.phase1_duration_raw <= 0 or info.total_time_raw <= 0:
+            continue
+        infos = by_dir.get(os.path.normpath(info.tmpdir))
+        if infos is not None:
+            infos.append(info)
+
+    means: typing.Dict[str, typing.Tuple[float, float]] = {}
+    for d, infos in by_dir.items():
+        recent = infos[-history_size:]
+        if recent:
+            means[d] = (
+                statistics.mean(info.phase1_duration_raw for info in recent),
+                statistics.mean(info.total_time_raw for info in recent),
+            )
+
+    if means:
+        reference_phase1 = statistics.mean(phase1 for phase1, _ in means.values())
+        reference_total = statistics.mean(total for _, total in means.values())
+
+    scores = {}
+    for d in tmpdirs:
+        normalized = os.path.normpath(d)
+        speed = None
+        if normalized in means:
+            phase1, total = means[normalized]
+            speed = (reference_phase1 / phase1 + reference_total / total) / 2
+        scores[d] = TmpdirScore(
+            speed=speed,
+            load=len(index.phases_for_tmpdir(d)),
+            samples=len(by_dir[normalized][-history_size:]),
+        )
+
+    return scores
+
+
+def configured_tmpdir_scores(
+    index: job.JobIndex,
     dir_cfg: plotman.configuration.Directories,
     sched_cfg: plotman.configuration.Scheduling,
-    plotting_cfg: plotman.configuration.Plotting,
     log_cfg: plotman.configuration.Logging,
-) -> typing.Tuple[bool, str]:
-    jobs = job.Job.get_running_jobs(log_cfg.plots)
+) -> typing.Optional[typing.Dict[str, TmpdirScore]]:
+    """Return the tmp dir scores if the throughput selection policy is
+    configured, otherwise None."""
+    if sched_cfg.tmpdir_selection != "throughput":
+        return None
+
+    completed = plotman.history.completed_logs(log_cfg.plots).recent()
+    return tmpdir_scores(
+        tmpdirs=dir_cfg.tmp,
+        index=index,
+        completed=completed,
+        history_size=sched_cfg.tmpdir_history_size,
+    )
+
+
+def select_tmpdir(
+    eligible: typing.List[typing.Tuple[str, typing.List[job.Phase]]],
+    scores: typing.Optional[typing.Dict[str, TmpdirScore]] = None,
+) -> str:
+    """Pick a tmp dir from the eligible (dir, phases) pairs.  Without scores,
+    plot to the dir whose youngest job is furthest along.  With scores, plot to
+    the best scoring dir, breaking ties the same way."""
+    rankable = [
+        (d, phases[0]) if phases else (d, job.Phase(known=False))
+        for (d, phases) in eligible
+    ]
+
+    if scores is None:
+        return max(rankable, key=operator.itemgetter(1))[0]
+
+    def key(item: typing.Tuple[str, job.Phase]) -> typing.Tuple[float, job.Phase]:
+        d, phase = item
+        return (scores[d].score, phase)
+
+    return max(rankable, key=key)[0]
+
+
+# The in-flight plot size estimate should leave some room for filesystem
+# overhead without making it hard to fill a drive.
+DST_FREE_SPACE_MARGIN = 100_000_000
+
 
-    wait_reason = None  # If we don't start a job this iteration, this says why.
+@attr.frozen
+class DstdirState:
+    """The capacity of a dst dir to take another plot.  ``freebytes`` has the
+    expected sizes of in-flight plots targeting the dir already subtracted."""
 
-    youngest_job_age = (
-        min(jobs, key=job.Job.get_time_wall).get_time_wall() if jobs else MAX_AGE
+    freebytes: int
+    inbound: int
+    writers: int
+    copies: int
+    write_rate: typing.Optional[float]
+    available: bool
+
+
+def dstdir_freebytes(d: str) -> int:
+    try:
+        return plot_util.df_b(d)
+    except OSError:
+        # Missing or unavailable, treat as full
+        return 0
+
+
+def is_writing_final_plot(entry: job.IndexedJob) -> bool:
+    """Whether a job is writing its final plot file, or about to."""
+    return (
+        entry.phase.known
+        and job.Phase(4, 0) <= entry.phase
+        and not entry.info.final_plot_written
     )
+
+
+def dst_device(
+    d: str,
+    device_for_path: typing.Callable[
+        [str], typing.Optional[str]
+    ] = topology.device_for_path,
+) -> str:
+    """The device a dst dir is on, or the dir itself if that is unknown."""
+    return device_for_path(d) or os.path.normpath(d)
+
+
+def copies_by_device(
+    index: job.JobIndex,
+    device_for_path: typing.Callable[
+        [str], typing.Optional[str]
+    ] = topology.device_for_path,
+) -> typing.Dict[str, int]:
+    """Count the jobs copying their final plot to each dst device."""
+    copies: typing.Dict[str, int] = collections.Counter()
+    for d, entries in index.by_dstdir.items():
+        copying = sum(entry.info.copying for entry in entries)
+        if copying:
+            copies[dst_device(d, device_for_path)] += copying
+    return copies
+
+
+def dstdir_states(
+    dst_dirs: typing.List[str],
+    index: job.JobIndex,
+    freebytes: typing.Dict[str, int],
+    completed: typing.Sequence[plotman.plotters.CommonInfo],
+    plot_size: int,
+    device_for_path: typing.Callable[
+        [str], typing.Optional[str]
+    ] = topology.device_for_path,
+    filesystem_for_path: typing.Callable[[str], str] = topology.filesystem_for_path,
+) -> typing.Dict[str, DstdirState]:
+    """Assess dst dirs for one more plot of plot_size bytes.  Plots of running
+    jobs that have not yet finished writing their final file are subtracted from
+    the free space of their filesystem, which dst dirs may share.  The write
+    rate is measured from the copy times of completed jobs and the final copies
+    in progress are counted per device."""
+    inbound: typing.Dict[str, typing.List[job.IndexedJob]] = {
+        os.path.normpath(d): [
+            entry for entry in index.for_dstdir(d) if not entry.info.final_plot_written
+        ]
+        for d in dst_dirs
+    }
+
+    copy_rates: typing.Dict[str, typing.List[float]] = collections.defaultdict(list)
+    for info in completed:
+        if info.dstdir and info.copy_time_raw > 0 and info.plot_size > 0:
+            copy_rates[os.path.normpath(info.dstdir)].append(
+                plot_util.get_plotsize(info.plot_size) / info.copy_time_raw
+            )
+
+    copies = copies_by_device(index, device_for_path)
+
+    expected: typing.Dict[str, int] = collections.Counter()
+    for normalized, entries in inbound.items():
+        expected[filesystem_for_path(normalized)] += sum(
+            plot_util.get_plotsize(entry.info.plot_size or 32) for entry in entries
+        )
+
+    states = {}
+    for d in dst_dirs:
+        normalized = os.path.normpath(d)
+        entries = inbound[normalized]
+        remaining = freebytes.get(d, 0) - expected[filesystem_for_path(normalized)]
+        rates = copy_rates.get(normalized)
+        states[d] = DstdirState(
+            freebytes=remaining,
+            inbound=len(entries),
+            writers=len([entry for entry in entries if is_writing_final_plot(entry)]),
+            copies=copies.get(dst_device(d, device_for_path), 0),
+            write_rate=statistics.mean(rates) if rates else None,
+            available=remaining >= plot_size + DST_FREE_SPACE_MARGIN,
+        )
+
+    return states
+
+
+def select_dstdir(
+    dst_dirs: typing.List[str],
+    index: job.JobIndex,
+    states: typing.Dict[str, DstdirState],
+    policy: str,
+    max_copies: typing.Optional[int] = None,
+) -> typing.Optional[str]:
+    """Select a dst dir among those with space for another plot, and on a
+    device with fewer than max_copies final copies in progress, or None if there
+    are none.  The phase policy selects the dst dir least recently selected.
+    The capacity policy selects the dir expected to finish writing the new plot
+    soonest given its concurrent writers and measured write rate, preferring
+    more free space."""
+    available = [
+        d
+        for d in dst_dirs
+        if states[d].available and (max_copies is None or states[d].copies < max_copies)
+    ]
+    if not available:
+        return None
+
+    if policy == "capacity":
+        known_rates = [
+            state.write_rate
+            for state in states.values()
+            if state.write_rate is not None
+        ]
+        default_rate = statistics.mean(known_rates) if known_rates else 1.0
+
+        def capacity_key(d: str) -> typing.Tuple[float, int]:
+            state = states[d]
+            rate = default_rate if state.write_rate is None else state.write_rate
+            return ((state.writers + 1) / rate, -state.freebytes)
+
+        return min(available, key=capacity_key)
+
+    # Select the dst dir least recently selected
+    dir2ph = {
+        d.rstrip("/"): ph
+        for (d, ph) in dstdirs_to_youngest_phase(index).items()
+        if d.rstrip("/") in available and ph is not None
+    }
+    unused_dirs = [d for d in available if d not in dir2ph.keys()]
+    if unused_dirs:
+        return random.choice(unused_dirs)
+
+    def key(key: str) -> job.Phase:
+        return dir2ph[key]
+
+    return max(dir2ph, key=key)
+
+
+@attr.frozen
+class Placement:
+    tmpdir: str
+    dstdir: str
+
+
+def plan_new_plot(
+    index: job.JobIndex,
+    dir_cfg: plotman.configuration.Directories,
+    sched_cfg: plotman.configuration.Scheduling,
+    plotting_cfg: plotman.configuration.Plotting,
+    completed: typing.Callable[[], typing.Sequence[plotman.plotters.CommonInfo]],
+    freebytes: typing.Callable[[str], int] = dstdir_freebytes,
+) -> typing.Tuple[typing.Optional[Placement], str]:
+    """Scheduling logic: decide whether a new job should start given the running
+    jobs and, if so, where.  Returns the placement, or None and the reason to
+    wait.  Completed job info is only requested when a policy needs it."""
+    jobs = index.jobs
+    youngest_job_age = min(j.get_time_wall() for j in jobs) if jobs else MAX_AGE
     global_stagger = int(sched_cfg.global_stagger_m * MIN)
     if youngest_job_age < global_stagger:
-        wait_reason = "stagger (%ds/%ds)" % (youngest_job_age, global_stagger)
+        return (None, "stagger (%ds/%ds)" % (youngest_job_age, global_stagger))
     elif len(jobs) >= sched_cfg.global_max_jobs:
-        wait_reason = "max jobs (%d) - (%ds/%ds)" % (
-            sched_cfg.global_max_jobs,
-            youngest_job_age,
-            global_stagger,
+        return (
+            None,
+            "max jobs (%d) - (%ds/%ds)"
+            % (
+                sched_cfg.global_max_jobs,
+                youngest_job_age,
+                global_stagger,
+            ),
+        )
+
+    tmp_to_all_phases = [(d, index.phases_for_tmpdir(d)) for d in dir_cfg.tmp]
+    eligible = [
+        (d, phases)
+        for (d, phases) in tmp_to_all_phases
+        if phases_permit_new_job(phases, d, sched_cfg, dir_cfg)
+    ]
+    if not eligible:
+        return (
+            None,
+            "no eligible tempdirs (%ds/%ds)" % (youngest_job_age, global_stagger),
+        )
+
+    scores = None
+    if sched_cfg.tmpdir_selection == "throughput":
+        scores = tmpdir_scores(
+            tmpdirs=dir_cfg.tmp,
+            index=index,
+            completed=completed(),
+            history_size=sched_cfg.tmpdir_history_size,
         )
+    tmpdir = select_tmpdir(eligible=eligible, scores=scores)
+
+    dst_dirs = [d.rstrip("/") for d in dir_cfg.get_dst_directories()]
+
+    dstdir: str
+    if dir_cfg.dst_is_tmp2():
+        dstdir = dir_cfg.tmp2  # type: ignore[assignment]
+    elif tmpdir in dst_dirs:
+        dstdir = tmpdir
+    elif dir_cfg.dst_is_tmp():
+        dstdir = tmpdir
     else:
-        tmp_to_all_phases = [
-            (d, job.job_phases_for_tmpdir(d, jobs)) for d in dir_cfg.tmp
-        ]
-        eligible = [
-            (d, phases)
-            for (d, phases) in tmp_to_all_phases
-            if phases_permit_new_job(phases, d, sched_cfg, dir_cfg)
-        ]
-        rankable = [
-            (d, phases[0]) if phases else (d, job.Phase(known=False))
-            for (d, phases) in eligible
-        ]
+        states = dstdir_states(
+            dst_dirs=dst_dirs,
+            index=index,
+            freebytes={d: freebytes(d) for d in dst_dirs},
+            completed=completed() if sched_cfg.dst_selection == "capacity" else [],
+            plot_size=plot_util.get_plotsize(plotting_cfg.plot_size()),
+        )
+        selected = select_dstdir(
+            dst_dirs=dst_dirs,
+            index=index,
+            states=states,
+            policy=sched_cfg.dst_selection,
+            max_copies=sched_cfg.dst_max_copies,
+        )
+        if selected is None:
+            return (
+                None,
+                "no dst dirs with space for another plot (%s)"
+                % (
+                    ", ".join(
+                        "%s:%dG%s"
+                        % (
+                            d,
+                            state.freebytes / plot_util.GB,
+                            " %d copying" % state.copies if state.copies else "",
+                        )
+                        for d, state in states.items()
+                    )
+                ),
+            )
+        dstdir = selected
 
-        if not eligible:
-            wait_reason = "no eligible tempdirs (%ds/%ds)" % (
-                youngest_job_age,
-                global_stagger,
+    return (Placement(tmpdir=tmpdir, dstdir=dstdir), "")
+
+
+def maybe_start_new_plot(
+    dir_cfg: plotman.configuration.Directories,
+    sched_cfg: plotman.configuration.Scheduling,
+    plotting_cfg: plotman.configuration.Plotting,
+    log_cfg: plotman.configuration.Logging,
+    jobs: typing.Optional[typing.List[job.Job]] = None,
+) -> typing.Tuple[bool, str]:
+    """Start a plot job if the schedule allows one.  jobs are the running jobs
+    if already listed this tick, they are listed otherwise."""
+    if jobs is None:
+        jobs = job.Job.get_running_jobs(log_cfg.plots)
+
+    def completed() -> typing.List[plotman.plotters.CommonInfo]:
+        return plotman.history.completed_logs(log_cfg.plots).recent()
+
+    placement, wait_reason = plan_new_plot(
+        index=job.JobIndex.of(jobs),
+        dir_cfg=dir_cfg,
+        sched_cfg=sched_cfg,
+        plotting_cfg=plotting_cfg,
+        completed=completed,
+    )
+    if placement is None:
+        return (False, wait_reason)
+
+    return start_plot(
+        placement=placement,
+        jobs=jobs,
+        dir_cfg=dir_cfg,
+        sched_cfg=sched_cfg,
+        plotting_cfg=plotting_cfg,
+        log_cfg=log_cfg,
+    )
+
+
+def start_plot(
+    placement: Placement,
+    jobs: typing.List[job.Job],
+    dir_cfg: plotman.configuration.Directories,
+    sched_cfg: plotman.configuration.Scheduling,
+    plotting_cfg: plotman.configuration.Plotting,
+    log_cfg: plotman.configuration.Logging,
+) -> typing.Tuple[bool, str]:
+    """Launch a plot job in the given tmp and dst dirs."""
+    tmpdir = placement.tmpdir
+    dstdir = placement.dstdir
+
+    tuned = ""
+    if plotting_cfg.tuning is not None:
+        plotting_cfg, tuned = plotman.tuner.tune(
+            plotting_cfg=plotting_cfg,
+            tmpdir=tmpdir,
+            jobs=jobs,
+            completed=plotman.history.completed_logs(log_cfg.plots).recent(),
+        )
+
+    log_file_path = log_cfg.create_plot_log_path(time=pendulum.now())
+
+    plot_args: typing.List[str]
+    if plotting_cfg.type == "bladebit":
+        if plotting_cfg.bladebit is None:
+            raise Exception(
+                "bladebit plotter selected but not configured, report this as a plotman bug",
             )
-        else:
-            # Plot to oldest tmpdir.
-            tmpdir = max(rankable, key=operator.itemgetter(1))[0]
-
-            dst_dirs = [d.rstrip("/") for d in dir_cfg.get_dst_directories()]
-
-            dstdir: str
-            if dir_cfg.dst_is_tmp2():
-                dstdir = dir_cfg.tmp2  # type: ignore[assignment]
-            elif tmpdir in dst_dirs:
-                dstdir = tmpdir
-            elif dir_cfg.dst_is_tmp():
-                dstdir = tmpdir
-            else:
-                # Select the dst dir least recently selected
-                dir2ph = {
-                    d.rstrip("/"): ph
-                    for (d, ph) in dstdirs_to_youngest_phase(jobs).items()
-                    if d.rstrip("/") in dst_dirs and ph is not None
-                }
-                unused_dirs = [
-                    d.rstrip("/") for d in dst_dirs if d not in dir2ph.keys()
-                ]
-                dstdir = ""
-                if unused_dirs:
-                    dstdir = random.choice(unused_dirs)
-                else:
-
-                    def key(key: str) -> job.Phase:
-                        return dir2ph[key]
-
-                    dstdir = max(dir2ph, key=key)
-
-            log_file_path = log_cfg.create_plot_log_path(time=pendulum.now())
-
-            plot_args: typing.List[str]
-            if plotting_cfg.type == "bladebit":
-                if plotting_cfg.bladebit is None:
-                    raise Exception(
-                        "bladebit plotter selected but not configured, report this as a plotman bug",
-                    )
-                plot_args = plotman.plotters.bladebit.create_command_line(
-                    options=plotting_cfg.bladebit,
-                    tmpdir=tmpdir,
-                    tmp2dir=dir_cfg.tmp2,
-                    dstdir=dstdir,
-                    farmer_public_key=plotting_cfg.farmer_pk,
-                    pool_public_key=plotting_cfg.pool_pk,
-                    pool_contract_address=plotting_cfg.pool_contract_address,
-                )
-            elif plotting_cfg.type == "madmax":
-                if plotting_cfg.madmax is None:
-                    raise Exception(
-                        "madmax plotter selected but not configured, report this as a plotman bug",
-                    )
-                plot_args = plotman.plotters.madmax.create_command_line(
-                    options=plotting_cfg.madmax,
-                    tmpdir=tmpdir,
-                    tmp2dir=dir_cfg.tmp2,
-                    dstdir=dstdir,
-                    farmer_public_key=plotting_cfg.farmer_pk,
-                    pool_public_key=plotting_cfg.pool_pk,
-                    pool_contract_address=plotting_cfg.pool_contract_address,
-                )
-            else:
-                if plotting_cfg.chia is None:
-                    raise Exception(
-                        "chia plotter selected but not configured, report this as a plotman bug",
-                    )
-                plot_args = plotman.plotters.chianetwork.create_command_line(
-                    options=plotting_cfg.chia,
-                    tmpdir=tmpdir,
-                    tmp2dir=dir_cfg.tmp2,
-                    dstdir=dstdir,
-                    farmer_public_key=plotting_cfg.farmer_pk,
-                    pool_public_key=plotting_cfg.pool_pk,
-                    pool_contract_address=plotting_cfg.pool_contract_address,
-                )
-
-            logmsg = "Starting plot job: %s ; logging to %s" % (
-                " ".join(plot_args),
-                log_file_path,
+        plot_args = plotman.plotters.bladebit.create_command_line(
+            options=plotting_cfg.bladebit,
+            tmpdir=tmpdir,
+            tmp2dir=dir_cfg.tmp2,
+            dstdir=dstdir,
+            farmer_public_key=plotting_cfg.farmer_pk,
+            pool_public_key=plotting_cfg.pool_pk,
+            pool_contract_address=plotting_cfg.pool_contract_address,
+        )
+    elif plotting_cfg.type == "madmax":
+        if plotting_cfg.madmax is None:
+            raise Exception(
+                "madmax plotter selected but not configured, report this as a plotman bug",
+            )
+        plot_args = plotman.plotters.madmax.create_command_line(
+            options=plotting_cfg.madmax,
+            tmpdir=tmpdir,
+            tmp2dir=dir_cfg.tmp2,
+            dstdir=dstdir,
+            farmer_public_key=plotting_cfg.farmer_pk,
+            pool_public_key=plotting_cfg.pool_pk,
+            pool_contract_address=plotting_cfg.pool_contract_address,
+        )
+    else:
+        if plotting_cfg.chia is None:
+            raise Exception(
+                "chia plotter selected but not configured, report this as a plotman bug",
             )
+        plot_args = plotman.plotters.chianetwork.create_command_line(
+            options=plotting_cfg.chia,
+            tmpdir=tmpdir,
+            tmp2dir=dir_cfg.tmp2,
+            dstdir=dstdir,
+            farmer_public_key=plotting_cfg.farmer_pk,
+            pool_public_key=plotting_cfg.pool_pk,
+            pool_contract_address=plotting_cfg.pool_contract_address,
+        )
+
+    logmsg = "Starting plot job: %s ; logging to %s" % (
+        " ".join(plot_args),
+        log_file_path,
+    )
+    if tuned:
+        logmsg += " ; %s" % tuned
+
+    pin = None
+    if sched_cfg.cpu_affinity:
+        cpus = plotman.affinity.allocate(
+            nodes=plotman.affinity.read_nodes(),
+            allocations=plotman.affinity.pinned_allocations(jobs),
+            threads=plotting_cfg.threads(),
+        )
+        pin = plotman.affinity.pinner(cpus)
+        if pin is not None:
+            logmsg += " ; pinned to cpus %s" % (plotman.affinity.format_cpulist(cpus))
+
+    # TODO: CAMPid 09840103109429840981397487498131
+    try:
+        open_log_file = open(log_file_path, "x")
+    except FileExistsError:
+        # The desired log file name already exists.  Most likely another
+        # plotman process already launched a new process in response to
+        # the same scenario that triggered us.  Let's at least not
+        # confuse things further by having two plotting processes
+        # logging to the same file.  If we really should launch another
+        # plotting process, we'll get it at the next check cycle anyways.
+        message = (
+            f"Plot log file already exists, skipping attempt to start a"
+            f" new plot: {log_file_path!r}"
+        )
+        return (False, logmsg)
+    except FileNotFoundError as e:
+        message = (
+            f"Unable to open log file.  Verify that the directory exists"
+            f" and has proper write permissions: {log_file_path!r}"
+        )
+        raise Exception(message) from e
+
+    # Preferably, do not add any code between the try block above
+    # and the with block below.  IOW, this space intentionally left
+    # blank...  As is, this provides a good chance that our handle
+    # of the log file will get closed explicitly while still
+    # allowing handling of just the log file opening error.
+
+    if sys.platform == "win32":
+        creationflags = subprocess.CREATE_NO_WINDOW
+        nice = psutil.BELOW_NORMAL_PRIORITY_CLASS
+    else:
+        creationflags = 0
+        nice = 15
+
+    with open_log_file:
+        # start_new_sessions to make the job independent of this controlling tty (POSIX only).
+        # subprocess.CREATE_NO_WINDOW to make the process independent of this controlling tty and have no console window on Windows.
+        p = subprocess.Popen(
+            plot_args,
+            stdout=open_log_file,
+            stderr=subprocess.STDOUT,
+            start_new_session=True,
+            creationflags=creationflags,
+            # Pinned before the plotter starts any threads
+            preexec_fn=pin,
+        )
+
+    psutil.Process(p.pid).nice(nice)
 
-            # TODO: CAMPid 09840103109429840981397487498131
-            try:
-                open_log_file = open(log_file_path, "x")
-            except FileExistsError:
-                # The desired log file name already exists.  Most likely another
-                # plotman process already launched a new process in response to
-                # the same scenario that triggered us.  Let's at least not
-                # confuse things further by having two plotting processes
-                # logging to the same file.  If we really should launch another
-                # plotting process, we'll get it at the next check cycle anyways.
-                message = (
-                    f"Plot log file already exists, skipping attempt to start a"
-                    f" new plot: {log_file_path!r}"
-                )
-                return (False, logmsg)
-            except FileNotFoundError as e:
-                message = (
-                    f"Unable to open log file.  Verify that the directory exists"
-                    f" and has proper write permissions: {log_file_path!r}"
-                )
-                raise Exception(message) from e
-
-            # Preferably, do not add any code between the try block above
-            # and the with block below.  IOW, this space intentionally left
-            # blank...  As is, this provides a good chance that our handle
-            # of the log file will get closed explicitly while still
-            # allowing handling of just the log file opening error.
-
-            if sys.platform == "win32":
-                creationflags = subprocess.CREATE_NO_WINDOW
-                nice = psutil.BELOW_NORMAL_PRIORITY_CLASS
-            else:
-                creationflags = 0
-                nice = 15
-
-            with open_log_file:
-                # start_new_sessions to make the job independent of this controlling tty (POSIX only).
-                # subprocess.CREATE_NO_WINDOW to make the process independent of this controlling tty and have no console window on Windows.
-                p = subprocess.Popen(
-                    plot_args,
-                    stdout=open_log_file,
-                    stderr=subprocess.STDOUT,
-                    start_new_session=True,
-                    creationflags=creationflags,
-                )
-
-            psutil.Process(p.pid).nice(nice)
-            return (True, logmsg)
-
-    return (False, wait_reason)
+    return (True, logmsg)
 
 
 def select_jobs_by_partial_id(
@@ -1,19 +1,21 @@
 import math
 import os
 import re
-import shutil
+import time
 import typing
 
-from plotman import chiapos
+import attr
+
+from plotman import chiapos, topology
 import plotman.job
 
 GB = 1_000_000_000
+MB = 1_000_000
 
 
 def df_b(d: str) -> int:
-    "Return free space for directory (in bytes)"
-    usage = shutil.disk_usage(d)
-    return usage.free
+    "Return free space for directory (in bytes), read once per filesystem per tick"
+    return topology.free_bytes(d)
 
 
 def get_plotsize(k: int) -> int:
@@ -59,21 +61,57 @@ def split_path_prefix(items: typing.List[str]) -> typing.Tuple[str, typing.List[
         return (prefix, remainders)
 
 
-def list_plots(d: str) -> typing.List[str]:
-    "List completed plots in a directory (not recursive)"
+_PLOT_RE = re.compile(r"^plot-k(\d+)-.*plot$")
+
+# Seconds a listing is reused for while the mtime of the directory stays the
+# same.  Plots growing in place and changes within the mtime granularity of the
+# filesystem leave the mtime as is, so listings still expire.
+LIST_PLOTS_TTL_S = 30.0
+
+
+@attr.frozen
+class _PlotListing:
+    mtime_ns: int
+    listed_at: float
+    plots: typing.Tuple[str, ...]
+
+
+_plot_listings: typing.Dict[str, _PlotListing] = {}
+
+
+def _scan_plots(d: str) -> typing.List[str]:
     plots = []
-    for plot in os.listdir(d):
-        matches = re.search(r"^plot-k(\d*)-.*plot$", plot)
-        if matches is not None:
-            grps = matches.groups()
-            plot_k = int(grps[0])
-            plot = os.path.join(d, plot)
+    with os.scandir(d) as entries:
+        for entry in entries:
+            matches = _PLOT_RE.search(entry.name)
+            if matches is None:
+                continue
+            plot_k = int(matches.group(1))
             try:
-                if os.stat(plot).st_size > (0.95 * get_plotsize(plot_k)):
-                    plots.append(plot)
+                if entry.stat().st_size > (0.95 * get_plotsize(plot_k)):
+                    plots.append(entry.path)
             except FileNotFoundError:
                 continue
-    return plots
+    return sorted(plots)
+
+
+def list_plots(
+    d: str, clock: typing.Callable[[], float] = time.monotonic
+) -> typing.List[str]:
+    "List completed plots in a directory (not recursive), cached until it changes"
+    mtime_ns = os.stat(d).st_mtime_ns
+    now = clock()
+    listing = _plot_listings.get(d)
+    if (
+        listing is None
+        or listing.mtime_ns != mtime_ns
+        or now - listing.listed_at >= LIST_PLOTS_TTL_S
+    ):
+        listing = _PlotListing(
+            mtime_ns=mtime_ns, listed_at=now, plots=tuple(_scan_plots(d))
+        )
+        _plot_listings[d] = listing
+    return list(listing.plots)
 
 
 def column_wrap(
@@ -0,0 +1,176 @@
+import hashlib
+import os
+import re
+import struct
+import time
+import typing
+
+import attr
+
+from plotman import chiapos, plot_util
+
+PLOT_MAGIC = b"Proof of Space Plot"
+
+# Pointers to tables 1 through 7 and to the C1, C2 and C3 checkpoint tables.
+TABLE_POINTERS = 10
+
+# Spread over the whole plot, 64 samples of 64KiB read 4MiB of a 100GB plot
+# and are sure to catch a transfer that stopped early or left a hole.
+SAMPLES = 64
+SAMPLE_SIZE = 64 * 2 ** 10
+
+_PLOT_ID_RE = re.compile(r"-([0-9a-f]{64})\.plot")
+
+
+class VerificationException(Exception):
+    pass
+
+
+@attr.frozen
+class Header:
+    plot_id: bytes
+    k: int
+    format_description: str
+    memo: bytes
+    table_pointers: typing.Tuple[int, ...]
+
+
+@attr.frozen
+class Verification:
+    """The outcome of verifying a transferred plot and what it cost."""
+
+    header: Header
+    samples: int
+    bytes_read: int
+    seconds: float
+
+    def __str__(self) -> str:
+        return "verified k%d plot %s with %d samples, read %d bytes in %.2f s" % (
+            self.header.k,
+            self.header.plot_id.hex()[:8],
+            self.samples,
+            self.bytes_read,
+            self.seconds,
+        )
+
+
+def read_header(file: typing.BinaryIO) -> Header:
+    """Parse the header chiapos writes at the start of each plot."""
+
+    def read(size: int) -> bytes:
+        data = file.read(size)
+        if len(data) != size:
+            raise VerificationException("Plot header is truncated")
+        return data
+
+    if read(len(PLOT_MAGIC)) != PLOT_MAGIC:
+        raise VerificationException("Not a plot, the magic bytes do not match")
+    plot_id = read(chiapos.kIdLen)
+    [k] = read(1)
+    [format_description_size] = struct.unpack(">H", read(2))
+    format_description = read(format_description_size).decode(errors="replace")
+    [memo_size] = struct.unpack(">H", read(2))
+    memo = read(memo_size)
+    table_pointers = struct.unpack(f">{TABLE_POINTERS}Q", read(8 * TABLE_POINTERS))
+    return Header(
+        plot_id=plot_id,
+        k=k,
+        format_description=format_description,
+        memo=memo,
+        table_pointers=table_pointers,
+    )
+
+
+def check_header(header: Header, size: int, filename: str) -> None:
+    """Check that the header is consistent with the size and the name of the
+    plot, like plot_util.list_plots() would judge the plot complete."""
+    if not chiapos.kMinPlotSize <= header.k <= chiapos.kMaxPlotSize:
+        raise VerificationException(f"Invalid k in plot header: {header.k}")
+    if size < 0.95 * plot_util.get_plotsize(header.k):
+        raise VerificationException(
+            f"Plot of {size} bytes is too small for k{header.k}"
+        )
+    previous = 0
+    for pointer in header.table_pointers:
+        if not previous <= pointer < size:
+            raise VerificationException(
+                f"Table pointers out of order or past the end of the plot:"
+                f" {header.table_pointers}"
+            )
+        previous = pointer
+    match = _PLOT_ID_RE.search(os.path.basename(filename))
+    if match is not None and match.group(1) != header.plot_id.hex():
+        raise VerificationException(
+            f"Plot id {header.plot_id.hex()} in header does not match {filename!r}"
+        )
+
+
+def sample_offsets(size: int, samples: int, sample_size: int) -> typing.List[int]:
+    """Offsets spread evenly from the start to the end of a file of size bytes,
+    the same for any two files of the same size."""
+    if samples <= 0 or size <= 0:
+        return []
+    last = max(size - sample_size, 0)
+    if samples == 1:
+        return [last]
+    return sorted({last * i // (samples - 1) for i in range(samples)})
+
+
+def sparse_hash(fd: int, offsets: typing.Sequence[int], sample_size: int) -> bytes:
+    hasher = hashlib.blake2b()
+    for offset in offsets:
+        hasher.update(os.pread(fd, sample_size, offset))
+    return hasher.digest()
+
+
+def drop_cache(fd: int) -> None:
+    """Have the samples read from the disk rather than from the pages the
+    transfer just wrote."""
+    if hasattr(os, "posix_fadvise"):
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+def verify(
+    source: str,
+    destination: str,
+    samples: int = SAMPLES,
+    sample_size: int = SAMPLE_SIZE,
+    clock: typing.Callable[[], float] = time.monotonic,
+) -> Verification:
+    """Check a copied plot without reading all of it.  The header of the copy is
+    parsed and checked against its size and the source name and samples at
+    fixed offsets are hashed on both sides and compared.  Raises
+    VerificationException when the copy is not intact."""
+    start = clock()
+    src = os.open(source, os.O_RDONLY)
+    try:
+        dst = os.open(destination, os.O_RDONLY)
+        try:
+            size = os.fstat(src).st_size
+            if os.fstat(dst).st_size != size:
+                raise VerificationException(
+                    f"Copy is {os.fstat(dst).st_size} bytes instead of {size}"
+                )
+            drop_cache(dst)
+            with os.fdopen(os.dup(dst), "rb") as file:
+                header = read_header(file)
+            check_header(header, size, source)
+
+            offsets = sample_offsets(size, samples, sample_size)
+            if sparse_hash(src, offsets, sample_size) != sparse_hash(
+                dst, offsets, sample_size
+            ):
+                raise VerificationException(
+                    f"Sampled contents of {destination!r} differ from {source!r}"
+                )
+        finally:
+            os.close(dst)
+    finally:
+        os.close(src)
+
+    return Verification(
+        header=header,
+        samples=len(offsets),
+        bytes_read=2 * sum(min(sample_size, size - offset) for offset in offsets),
+        seconds=clock() - start,
+    )
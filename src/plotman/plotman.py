@@ -18,15 +18,31 @@ import pendulum
 from plotman import (
     analyzer,
     archive,
+    archive_queue,
+    backpressure,
     configuration,
+    copy_gate,
+    diskstats,
+    exporter,
+    fleet,
+    history,
     interactive,
     manager,
     plot_util,
+    plot_verify,
+    priority,
     reporting,
+    simulate,
+    topology,
+    transfer,
+    transfer_log,
+    tuner,
+    watch,
+    watchdog,
     csv_exporter,
 )
 from plotman import resources as plotman_resources
-from plotman.job import Job
+from plotman.job import Job, JobIndex
 
 
 class PlotmanArgParser:
@@ -45,14 +61,35 @@ class PlotmanArgParser:
         p_status.add_argument(
             "--json", action="store_true", help="export status report in json format"
         )
+        p_status.add_argument(
+            "--watch",
+            action="store_true",
+            help="keep running and print a json snapshot, then a json line per change",
+        )
+        p_status.add_argument(
+            "--interval",
+            type=float,
+            default=None,
+            help="seconds between checks for changes with --watch",
+        )
 
         sp.add_parser(
             "prometheus",
             help="show current plotting status in prometheus readable format",
         )
 
+        sp.add_parser(
+            "exporter",
+            help="serve prometheus metrics over http, collected in the background",
+        )
+
         sp.add_parser("dirs", help="show directories info")
 
+        sp.add_parser(
+            "topology",
+            help="show the filesystems and disks the tmp and dst dirs are on",
+        )
+
         p_interactive = sp.add_parser(
             "interactive", help="run interactive control/monitoring mode"
         )
@@ -83,10 +120,104 @@ class PlotmanArgParser:
 
         sp.add_parser("dsched", help="print destination dir schedule")
 
+        sp.add_parser(
+            "tuning", help="show the plotter parameter tuning results by tmp dir class"
+        )
+
         sp.add_parser("plot", help="run plotting loop")
 
         sp.add_parser("archive", help="move completed plots to farming location")
 
+        sp.add_parser(
+            "transfers", help="show completed archive transfers by archive dir"
+        )
+
+        p_transfer = sp.add_parser(
+            "transfer",
+            help="move a plot to an archive dir, as run by the local archiving target",
+        )
+        p_transfer.add_argument("source", type=str, help="the plot to move")
+        p_transfer.add_argument(
+            "destination", type=str, help="the archive dir to move it to"
+        )
+        p_transfer.add_argument(
+            "--verify-samples",
+            type=int,
+            default=plot_verify.SAMPLES,
+            help="sampled blocks compared between the copy and the plot before the plot is removed, 0 to only check the header of the copy",
+        )
+
+        p_simulate = sp.add_parser(
+            "simulate",
+            help="simulate the scheduling of plot jobs to evaluate scheduling settings",
+        )
+        p_simulate.add_argument(
+            "--days",
+            type=float,
+            default=30,
+            help="number of days to simulate (default: %(default)s)",
+        )
+        p_simulate.add_argument(
+            "--phase-minutes",
+            type=float,
+            nargs="+",
+            metavar="MINUTES",
+            help="durations of phases 1 through 4 and optionally the copy to the dst"
+            " dir.  By default the durations of completed plot logs are sampled",
+        )
+        p_simulate.add_argument(
+            "--tmpdir-capacity",
+            type=int,
+            default=None,
+            help="jobs a tmp dir runs at full speed, more slow proportionally",
+        )
+        p_simulate.add_argument(
+            "--system-capacity",
+            type=int,
+            default=None,
+            help="jobs the system runs at full speed, more slow proportionally",
+        )
+        p_simulate.add_argument(
+            "--set",
+            dest="overrides",
+            action="append",
+            default=[],
+            metavar="KEY=VALUE",
+            help="override a scheduling: option, the value is parsed as YAML",
+        )
+        p_simulate.add_argument(
+            "--sweep",
+            action="append",
+            default=[],
+            metavar="KEY=VALUE,VALUE...",
+            help="simulate each of the values for a scheduling: option, repeat"
+            " to simulate all combinations",
+        )
+        p_simulate.add_argument(
+            "--seed", type=int, default=None, help="seed for reproducible results"
+        )
+
+        sp.add_parser("agent", help="serve this host's jobs to a plotman controller")
+
+        p_controller = sp.add_parser(
+            "controller", help="schedule and control jobs across plotman agents"
+        )
+        sp_controller = p_controller.add_subparsers(
+            dest="controller_subcommand", required=True
+        )
+        sp_controller.add_parser("run", help="run the fleet plotting loop")
+        sp_controller.add_parser("status", help="show the jobs of all agents")
+        for name, help in [
+            ("suspend", "suspend job on an agent"),
+            ("resume", "resume suspended job on an agent"),
+            ("kill", "kill job on an agent (and cleanup temp files)"),
+        ]:
+            p_command = sp_controller.add_parser(name, help=help)
+            p_command.add_argument("agent", type=str, help="name of the agent")
+            p_command.add_argument(
+                "idprefix", type=str, help="disambiguating prefix of plot ID"
+            )
+
         p_export = sp.add_parser(
             "export", help="exports metadata from the plot logs as CSV"
         )
@@ -233,6 +364,23 @@ def main() -> None:
             print("No action requested, add 'generate' or 'path'.")
             return
 
+    elif args.cmd == "transfer":
+        # Run by the transfer script of the local target, which does not need
+        # the configuration.
+        def verify(source: str, copy: str) -> None:
+            verification = plot_verify.verify(source, copy, samples=args.verify_samples)
+            print(verification, flush=True)
+
+        destination = transfer.move(
+            args.source,
+            args.destination,
+            report=lambda progress: print(progress, flush=True),
+            verify=verify,
+            log=lambda message: print(message, flush=True),
+        )
+        print(f"Moved {args.source} to {destination}")
+        return
+
     config_path = configuration.get_path()
     config_text = configuration.read_configuration_text(config_path)
     preset_target_definitions_text = importlib.resources.read_text(
@@ -276,20 +424,155 @@ def main() -> None:
         # Stay alive, spawning plot jobs
         #
         if args.cmd == "plot":
+            # Parse the completed logs up front rather than in the first tick
+            print("...reading completed plot logs")
+            history.completed_logs(cfg.logging.plots)
             print("...starting plot loop")
-            while True:
-                (started, msg) = manager.maybe_start_new_plot(
-                    cfg.directories, cfg.scheduling, cfg.plotting, cfg.logging
+            backpressure_controller = None
+            if cfg.scheduling.backpressure is not None:
+                backpressure_controller = backpressure.Controller(
+                    config=cfg.scheduling.backpressure
+                )
+            dst_copy_gate = None
+            if cfg.scheduling.dst_max_copies is not None:
+                dst_copy_gate = copy_gate.CopyGate(
+                    max_copies=cfg.scheduling.dst_max_copies
                 )
+            job_watchdog = None
+            if cfg.scheduling.watchdog is not None:
+                job_watchdog = watchdog.Watchdog(config=cfg.scheduling.watchdog)
+            # Listed once each tick and shared by everything acting on the jobs
+            jobs: typing.List[Job] = []
+            try:
+                while True:
+                    jobs = Job.get_running_jobs(cfg.logging.plots, cached_jobs=jobs)
+                    (started, msg) = manager.maybe_start_new_plot(
+                        cfg.directories,
+                        cfg.scheduling,
+                        cfg.plotting,
+                        cfg.logging,
+                        jobs,
+                    )
 
-                # TODO: report this via a channel that can be polled on demand, so we don't spam the console
-                if started:
-                    print("%s" % (msg))
-                else:
-                    print("...sleeping %d s: %s" % (cfg.scheduling.polling_time_s, msg))
-                root_logger.info("[plot] %s", msg)
+                    # TODO: report this via a channel that can be polled on demand, so we don't spam the console
+                    if started:
+                        print("%s" % (msg))
+                    else:
+                        print(
+                            "...sleeping %d s: %s"
+                            % (cfg.scheduling.polling_time_s, msg)
+                        )
+                    root_logger.info("[plot] %s", msg)
+                    if started:
+                        jobs = Job.get_running_jobs(cfg.logging.plots, cached_jobs=jobs)
+
+                    if cfg.scheduling.priorities is not None:
+                        for log_message in priority.apply(
+                            jobs, cfg.scheduling.priorities
+                        ):
+                            print(log_message)
+                            root_logger.info("[priority] %s", log_message)
+
+                    if backpressure_controller is not None:
+                        for log_message in backpressure_controller.update(
+                            jobs, topology.device_for_path
+                        ):
+                            print(log_message)
+                            root_logger.info("[backpressure] %s", log_message)
+
+                    if dst_copy_gate is not None:
+                        for log_message in dst_copy_gate.update(jobs):
+                            print(log_message)
+                            root_logger.info("[copy gate] %s", log_message)
+
+                    if job_watchdog is not None:
+                        for log_message in job_watchdog.update(jobs):
+                            print(log_message)
+                            root_logger.warning("[watchdog] %s", log_message)
+
+                    time.sleep(cfg.scheduling.polling_time_s)
+            finally:
+                if backpressure_controller is not None or dst_copy_gate is not None:
+                    jobs = Job.get_running_jobs(cfg.logging.plots, cached_jobs=jobs)
+                if backpressure_controller is not None:
+                    for log_message in backpressure_controller.resume_all(jobs):
+                        print(log_message)
+                        root_logger.info("[backpressure] %s", log_message)
+                if dst_copy_gate is not None:
+                    for log_message in dst_copy_gate.resume_all(jobs):
+                        print(log_message)
+                        root_logger.info("[copy gate] %s", log_message)
 
-                time.sleep(cfg.scheduling.polling_time_s)
+        #
+        # Serve this host's jobs to a controller
+        #
+        elif args.cmd == "agent":
+            agent_cfg = cfg.commands.agent
+            agent = fleet.create_agent(cfg)
+            with fleet.Server(agent, (agent_cfg.host, agent_cfg.port)) as server:
+                start_msg = "...serving agent %s on %s:%d" % (
+                    agent.name,
+                    agent_cfg.host,
+                    agent_cfg.port,
+                )
+                print(start_msg)
+                root_logger.info("[agent] %s", start_msg)
+                server.serve_forever()
+
+        #
+        # Serve prometheus metrics
+        #
+        elif args.cmd == "exporter":
+            exporter_cfg = cfg.commands.exporter
+            collector = exporter.Collector(cfg=cfg, refresh_s=exporter_cfg.refresh_s)
+            collector.start()
+            with exporter.Server(
+                collector, (exporter_cfg.host, exporter_cfg.port)
+            ) as metrics_server:
+                start_msg = "...serving metrics on http://%s:%d/metrics" % (
+                    exporter_cfg.host,
+                    exporter_cfg.port,
+                )
+                print(start_msg)
+                root_logger.info("[exporter] %s", start_msg)
+                metrics_server.serve_forever()
+
+        #
+        # Schedule and control jobs across agents
+        #
+        elif args.cmd == "controller":
+            controller = fleet.create_controller(cfg)
+            if args.controller_subcommand == "run":
+                print("...starting fleet plot loop")
+                while True:
+                    (started, msg) = controller.maybe_start_new_plot()
+                    if started:
+                        print("%s" % (msg))
+                    else:
+                        print(
+                            "...sleeping %d s: %s"
+                            % (cfg.scheduling.polling_time_s, msg)
+                        )
+                    root_logger.info("[controller] %s", msg)
+                    time.sleep(cfg.scheduling.polling_time_s)
+
+            elif args.controller_subcommand == "status":
+                snapshots, errors = controller.snapshots()
+                print(reporting.fleet_report(snapshots))
+                for error in errors:
+                    print(error)
+
+            else:
+                try:
+                    print(
+                        controller.command(
+                            name=args.agent,
+                            command=args.controller_subcommand,
+                            plot_id=args.idprefix,
+                        )
+                    )
+                except fleet.FleetException as e:
+                    print("Error: %s" % e)
 
         #
         # Analysis of completed jobs
@@ -304,6 +587,57 @@ def main() -> None:
                 get_term_width(cfg),
             )
 
+        #
+        # Simulate scheduling against past or configured phase durations
+        #
+        elif args.cmd == "simulate":
+            durations = None
+            if args.phase_minutes is not None:
+                if len(args.phase_minutes) not in {4, 5}:
+                    print("--phase-minutes takes four or five durations")
+                    return
+                durations = simulate.Durations(
+                    *(minutes * 60 for minutes in args.phase_minutes)
+                )
+            contention = simulate.Contention(
+                tmpdir_jobs=args.tmpdir_capacity,
+                system_jobs=args.system_capacity,
+            )
+            completed = history.completed_logs(cfg.logging.plots).recent()
+            if durations is None and not any(
+                simulate.durations_from_info(info) is not None for info in completed
+            ):
+                print(
+                    "No completed plot logs with phase durations found in %s,"
+                    " specify --phase-minutes instead" % (cfg.logging.plots)
+                )
+                return
+
+            runs = []
+            for overrides in simulate.sweep(args.overrides, args.sweep):
+                run_cfg = configuration.get_validated_configs(
+                    simulate.apply_overrides(config_text, overrides),
+                    config_path,
+                    preset_target_definitions_text,
+                )
+                random.seed(args.seed)
+                simulated = simulate.simulate(
+                    dir_cfg=run_cfg.directories,
+                    sched_cfg=run_cfg.scheduling,
+                    plotting_cfg=run_cfg.plotting,
+                    days=args.days,
+                    history=completed,
+                    durations=durations,
+                    contention=contention,
+                    rng=random.Random(args.seed),
+                )
+                runs.append((overrides, simulated))
+
+            if len(runs) == 1:
+                print(simulate.report(runs[0][1]))
+            else:
+                print(simulate.sweep_report(runs))
+
         #
         # Exports log metadata to CSV
         #
@@ -315,14 +649,46 @@ def main() -> None:
                 with open(args.save_to, "w", encoding="utf-8") as file:
                     csv_exporter.generate(logfilenames=logfilenames, file=file)
 
+        #
+        # Stream status changes
+        #
+        elif args.cmd == "status" and args.watch:
+            status_cfg = cfg.commands.status
+
+            def write(line: str) -> None:
+                sys.stdout.write(line)
+                sys.stdout.flush()
+
+            watch.run(
+                cfg,
+                interval_s=status_cfg.interval_s
+                if args.interval is None
+                else args.interval,
+                change_ratio=status_cfg.change_ratio,
+                write=write,
+            )
+
         else:
+            if args.cmd in ["status", "dirs"]:
+                # The baseline for the device activity while the jobs are read
+                diskstats.utilization()
             jobs = Job.get_running_jobs(cfg.logging.plots)
+            if args.cmd in ["status", "dirs"]:
+                diskstats.wait_for_interval()
 
             # Status report
             if args.cmd == "status":
                 if args.json:
                     # convert jobs list into json
-                    result = reporting.json_report(jobs)
+                    result = reporting.json_report(
+                        jobs,
+                        transfers=None
+                        if cfg.archiving is None
+                        else archive.get_running_transfers(cfg.archiving),
+                        io=topology.utilization_for_paths(
+                            cfg.directories.tmp + cfg.directories.get_dst_directories()
+                        ),
+                    )
                 else:
                     result = "{0}\n\n{1}\n\nUpdated at: {2}".format(
                         reporting.status_report(jobs, get_term_width(cfg)),
@@ -333,7 +699,17 @@ def main() -> None:
 
             # Prometheus report
             if args.cmd == "prometheus":
-                print(reporting.prometheus_report(jobs))
+                print(
+                    reporting.prometheus_report(
+                        jobs,
+                        transfers=()
+                        if cfg.archiving is None
+                        else archive.get_running_transfers(cfg.archiving),
+                        completions=history.persisted_completion_stats(
+                            cfg.logging.plots, cfg.logging.completion_stats
+                        ),
+                    )
+                )
 
             # Directories report
             elif args.cmd == "dirs":
@@ -344,9 +720,13 @@ def main() -> None:
                         cfg.archiving,
                         cfg.scheduling,
                         get_term_width(cfg),
+                        cfg.logging,
                     )
                 )
 
+            elif args.cmd == "topology":
+                print(reporting.topology_report(cfg.directories, get_term_width(cfg)))
+
             elif args.cmd == "interactive":
                 interactive.run_interactive(
                     cfg=cfg,
@@ -366,6 +746,14 @@ def main() -> None:
                     start_msg = "...starting archive loop"
                     print(start_msg)
                     root_logger.info("[archive] %s", start_msg)
+                    disk_space = archive.DiskSpace(
+                        arch_cfg=cfg.archiving,
+                        refresh_s=cfg.archiving.disk_space_refresh_s,
+                    )
+                    disk_space.start()
+                    plot_queue = archive_queue.ArchiveQueue.load(
+                        path=cfg.logging.archive_queue, arch_cfg=cfg.archiving
+                    )
                     firstit = True
                     while True:
                         if not firstit:
@@ -378,7 +766,12 @@ def main() -> None:
                         firstit = False
 
                         archiving_status, log_messages = archive.spawn_archive_process(
-                            cfg.directories, cfg.archiving, cfg.logging, jobs
+                            cfg.directories,
+                            cfg.archiving,
+                            cfg.logging,
+                            jobs,
+                            disk_space=disk_space,
+                            queue=plot_queue,
                         )
                         if log_messages:
                             for log_message in log_messages:
@@ -387,9 +780,31 @@ def main() -> None:
                         else:
                             root_logger.info("[archive] %s", archiving_status)
 
+            elif args.cmd == "transfers":
+                transfer_logs = transfer_log.transfer_logs(cfg.logging.transfers)
+                transfer_logs.update()
+                print(
+                    reporting.transfer_history_report(
+                        transfer_logs.recent(), get_term_width(cfg)
+                    )
+                )
+
+            elif args.cmd == "tuning":
+                print(
+                    tuner.report(
+                        plotting_cfg=cfg.plotting,
+                        tmpdirs=cfg.directories.tmp,
+                        jobs=jobs,
+                        completed=history.completed_logs(cfg.logging.plots).recent(),
+                        width=get_term_width(cfg),
+                    )
+                )
+
             # Debugging: show the destination drive usage schedule
             elif args.cmd == "dsched":
-                for (d, ph) in manager.dstdirs_to_furthest_phase(jobs).items():
+                for (d, ph) in manager.dstdirs_to_furthest_phase(
+                    JobIndex.of(jobs)
+                ).items():
                     print("  %s : %s" % (d, str(ph)))
 
             #
@@ -452,14 +867,11 @@ def main() -> None:
                                 "Canceled.  If you wish to resume the job, do so manually."
                             )
                         else:
-                            print("killing...")
-
-                            job.cancel()
+                            print("killing and cleaning up temp files...")
 
-                            print("cleaning up temp files...")
+                            removed = job.kill()
 
-                            for f in temp_files:
-                                os.remove(f)
+                            print("Removed %d temp files" % len(removed))
 
                     elif args.cmd == "suspend":
                         print(f"Suspending {job.plotter.common_info().plot_id}")
@@ -27,6 +27,8 @@ class LineDecoder:
         factory=lambda: codecs.getincrementaldecoder(encoding="utf-8")(),
     )
     buffer: str = ""
+    # Characters that end a line.  Progress meters end their updates with \r.
+    line_ends: str = "\n"
 
     def update(self, chunk: bytes, final: bool = False) -> typing.List[str]:
         self.buffer += self.decoder.decode(input=chunk, final=final)
@@ -34,7 +36,7 @@ class LineDecoder:
         if final:
             index = len(self.buffer)
         else:
-            newline_index = self.buffer.rfind("\n")
+            newline_index = max(self.buffer.rfind(end) for end in self.line_ends)
 
             if newline_index == -1:
                 return []
@@ -98,11 +100,17 @@ class CommonInfo:
     phase4_duration_raw: float = 0
     total_time_raw: float = 0
     copy_time_raw: float = 0
+    # Total cpu seconds, when the plotter reports it
+    cpu_time_raw: float = 0
     started_at: typing.Optional[pendulum.DateTime] = None
     tmp_files: typing.List[pathlib.Path] = attr.ib(factory=list)
     plot_id: typing.Optional[str] = None
     process_id: typing.Optional[int] = None
     completed: bool = False
+    # Copying the final plot from the tmp or tmp2 dir to the dst dir
+    copying: bool = False
+    # The final plot is in the dst dir, copied or renamed there
+    final_plot_written: bool = False
 
     # Phase 1 duration
     @property
@@ -119,6 +119,7 @@ class SpecificInfo:
             type="bladebit",
             dstdir=self.dst_dir,
             phase=self.phase,
+            completed=self.total_time_raw > 0,
             tmpdir="",
             tmp2dir="",
             started_at=self.started_at,
@@ -132,6 +133,8 @@ class SpecificInfo:
             phase4_duration_raw=self.phase4_duration_raw,
             total_time_raw=self.total_time_raw,
             filename=self.filename,
+            # The final plot is written straight to the dst dir
+            final_plot_written=self.total_time_raw > 0,
         )
 
 
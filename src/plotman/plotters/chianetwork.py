@@ -120,7 +120,10 @@ class SpecificInfo:
     phase4_duration_raw: float = 0
     total_time_raw: float = 0
     copy_time_raw: float = 0
+    cpu_time_raw: float = 0
     filename: str = ""
+    copying: bool = False
+    final_plot_written: bool = False
 
     def common(self) -> plotman.plotters.CommonInfo:
         return plotman.plotters.CommonInfo(
@@ -142,7 +145,10 @@ class SpecificInfo:
             phase4_duration_raw=self.phase4_duration_raw,
             total_time_raw=self.total_time_raw,
             copy_time_raw=self.copy_time_raw,
+            cpu_time_raw=self.cpu_time_raw,
             filename=self.filename,
+            copying=self.copying,
+            final_plot_written=self.final_plot_written,
         )
 
 
@@ -327,14 +333,18 @@ def phase4_3(match: typing.Match[str], info: SpecificInfo) -> SpecificInfo:
 def phase5(match: typing.Match[str], info: SpecificInfo) -> SpecificInfo:
     # Approximate working space used (without final file): 269.297 GiB
     phase = plotman.job.Phase(major=5, minor=0)
-    return attr.evolve(info, phase=phase)
+    # The final file is renamed rather than copied when tmp2 is the dst dir
+    copying = info.dst_dir == "" or os.path.normpath(info.tmp_dir2) != os.path.normpath(
+        info.dst_dir
+    )
+    return attr.evolve(info, phase=phase, copying=copying)
 
 
 @handlers.register(expression=r"^Copied final file from ")
 def phase5_1(match: typing.Match[str], info: SpecificInfo) -> SpecificInfo:
     # Copied final file from "/farm/yards/902/fake_tmp2/plot-k32-2021-07-14-22-33-d2540dcfcffddbfbd7e60b4aca4d54fb937db71991298fabc253f020a87ff7d4.plot.2.tmp" to "/farm/yards/902/fake_dst/plot-k32-2021-07-14-22-33-d2540dcfcffddbfbd7e60b4aca4d54fb937db71991298fabc253f020a87ff7d4.plot.2.tmp"
     phase = attr.evolve(info.phase, minor=1)
-    return attr.evolve(info, phase=phase)
+    return attr.evolve(info, phase=phase, copying=False, final_plot_written=True)
 
 
 # @handlers.register(expression=r"^Copy time = (\d+\.\d+) seconds")
@@ -355,7 +365,9 @@ def phase5_2(match: typing.Match[str], info: SpecificInfo) -> SpecificInfo:
 def phase5_3(match: typing.Match[str], info: SpecificInfo) -> SpecificInfo:
     # Renamed final file from "/farm/yards/902/fake_dst/plot-k32-2021-07-14-22-33-d2540dcfcffddbfbd7e60b4aca4d54fb937db71991298fabc253f020a87ff7d4.plot.2.tmp" to "/farm/yards/902/fake_dst/plot-k32-2021-07-14-22-33-d2540dcfcffddbfbd7e60b4aca4d54fb937db71991298fabc253f020a87ff7d4.plot"
     phase = attr.evolve(info.phase, minor=3)
-    return attr.evolve(info, phase=phase, filename=match.group(1))
+    return attr.evolve(
+        info, phase=phase, filename=match.group(1), final_plot_written=True
+    )
 
 
 @handlers.register(expression=r"^Time for phase 1 = (\d+\.\d+) seconds")
@@ -382,10 +394,16 @@ def phase4_duration(match: typing.Match[str], info: SpecificInfo) -> SpecificInf
     return attr.evolve(info, phase4_duration_raw=float(match.group(1)))
 
 
-@handlers.register(expression=r"^Total time = (\d+\.\d+) seconds")
+@handlers.register(
+    expression=r"^Total time = (\d+\.\d+) seconds(?:\. CPU \((\d+\.\d+)%\))?"
+)
 def total_time(match: typing.Match[str], info: SpecificInfo) -> SpecificInfo:
     # Total time = 39945.080 seconds. CPU (123.100%) Mon Apr  5 06:06:35 2021
-    return attr.evolve(info, total_time_raw=float(match.group(1)))
+    total_time_raw = float(match.group(1))
+    cpu_time_raw = 0.0
+    if match.group(2) is not None:
+        cpu_time_raw = total_time_raw * float(match.group(2)) / 100
+    return attr.evolve(info, total_time_raw=total_time_raw, cpu_time_raw=cpu_time_raw)
 
 
 @handlers.register(expression=r"^Copy time = (\d+\.\d+) seconds")
@@ -110,12 +110,15 @@ class SpecificInfo:
     # copy_time_raw: float = 0
     filename: str = ""
     plot_name: str = ""
+    copying: bool = False
+    final_plot_written: bool = False
 
     def common(self) -> plotman.plotters.CommonInfo:
         return plotman.plotters.CommonInfo(
             type="madmax",
             dstdir=self.dst_dir,
             phase=self.phase,
+            completed=self.total_time_raw > 0,
             tmpdir=self.tmp_dir,
             tmp2dir=self.tmp2_dir,
             started_at=self.started_at,
@@ -130,6 +133,8 @@ class SpecificInfo:
             phase4_duration_raw=self.phase4_duration_raw,
             total_time_raw=self.total_time_raw,
             filename=self.filename,
+            copying=self.copying,
+            final_plot_written=self.final_plot_written,
         )
 
 
@@ -309,13 +314,18 @@ def phase5(match: typing.Match[str], info: SpecificInfo) -> SpecificInfo:
 @handlers.register(expression=r"^Started copy to ")
 def phase_5_1(match: typing.Match[str], info: SpecificInfo) -> SpecificInfo:
     # Started copy to /farm/yards/902/fake_dst/plot-k32-2021-07-14-21-56-522acbd6308af7e229281352f746449134126482cfabd51d38e0f89745d21698.plot
-    return attr.evolve(info, phase=plotman.job.Phase(major=5, minor=1))
+    return attr.evolve(info, phase=plotman.job.Phase(major=5, minor=1), copying=True)
 
 
 @handlers.register(expression=r"^Renamed final plot to ")
 def phase_5_2(match: typing.Match[str], info: SpecificInfo) -> SpecificInfo:
     # Renamed final plot to /farm/yards/902/fake_dst/plot-k32-2021-07-14-21-56-522acbd6308af7e229281352f746449134126482cfabd51d38e0f89745d21698.plot
-    return attr.evolve(info, phase=plotman.job.Phase(major=5, minor=2))
+    return attr.evolve(
+        info,
+        phase=plotman.job.Phase(major=5, minor=2),
+        copying=False,
+        final_plot_written=True,
+    )
 
 
 @handlers.register(expression=r"^Final Directory:\s*(.+)")
@@ -0,0 +1,191 @@
+import contextlib
+import os
+import sys
+import typing
+
+import attr
+import psutil
+
+from plotman import configuration, job
+
+_IONICE_CLASSES = {
+    "none": getattr(psutil, "IOPRIO_CLASS_NONE", None),
+    "best_effort": getattr(psutil, "IOPRIO_CLASS_BE", None),
+    "idle": getattr(psutil, "IOPRIO_CLASS_IDLE", None),
+}
+
+# The changes each process was denied, to avoid repeating the failures every
+# tick.  Raising priority generally requires privileges.
+_denied: typing.Dict[int, typing.Set[str]] = {}
+
+# The priority of each process before it was first re-prioritized, restored
+# when no rule applies to it any more, such as once the system is no longer
+# saturated.
+_original: typing.Dict[int, "Priority"] = {}
+
+
+@attr.frozen
+class Priority:
+    nice: typing.Optional[int] = None
+    ionice_class: typing.Optional[str] = None
+    ionice_value: typing.Optional[int] = None
+
+
+def rule_priority(rule: configuration.PriorityRule) -> Priority:
+    return Priority(
+        nice=rule.nice,
+        ionice_class=rule.ionice_class,
+        ionice_value=rule.ionice_value,
+    )
+
+
+def is_saturated(priorities: configuration.Priorities) -> bool:
+    """Whether the one minute load average per cpu is at or above the configured
+    saturation load."""
+    if not hasattr(os, "getloadavg"):
+        return False
+
+    load_1m, _, _ = os.getloadavg()
+    return load_1m / (os.cpu_count() or 1) >= priorities.saturation_load
+
+
+def desired_priority(
+    phase: job.Phase, priorities: configuration.Priorities, saturated: bool
+) -> typing.Optional[Priority]:
+    """Return the priority for a job in the given phase, or None to leave it as is.
+
+    The rule with the furthest phase milestone the job has reached applies.
+    When the box is saturated, jobs that have not yet reached the saturated
+    rule's milestone get its priority instead."""
+    if not phase.known:
+        return None
+
+    saturated_rule = priorities.saturated
+    if (
+        saturated
+        and saturated_rule is not None
+        and phase < job.Phase(saturated_rule.phase_major, saturated_rule.phase_minor)
+    ):
+        return rule_priority(saturated_rule)
+
+    reached = [
+        rule
+        for rule in priorities.rules
+        if job.Phase(rule.phase_major, rule.phase_minor) <= phase
+    ]
+    if not reached:
+        return None
+
+    def key(rule: configuration.PriorityRule) -> job.Phase:
+        return job.Phase(rule.phase_major, rule.phase_minor)
+
+    return rule_priority(max(reached, key=key))
+
+
+def apply(
+    jobs: typing.List[job.Job], priorities: configuration.Priorities
+) -> typing.List[str]:
+    """Re-prioritize running jobs based on their phase and restore the jobs no
+    rule applies to any more.  Returns log messages describing the changes
+    made."""
+    if sys.platform == "win32":
+        return []
+
+    saturated = is_saturated(priorities)
+    log_messages = []
+
+    for j in jobs:
+        pid = j.proc.pid
+        priority = desired_priority(j.progress(), priorities, saturated)
+
+        with contextlib.suppress(psutil.NoSuchProcess):
+            if priority is not None:
+                reason = " (saturated)" if saturated else ""
+                if pid not in _original:
+                    _original[pid] = current_priority(j.proc)
+            elif pid in _original:
+                priority = _original.pop(pid)
+                reason = " (restored)"
+            else:
+                continue
+
+            changes = set_priority(j.proc, priority)
+            if changes:
+                log_messages.append(
+                    "Reprioritized %s in phase %s%s: %s"
+                    % (j.plot_id_prefix(), j.progress(), reason, ", ".join(changes))
+                )
+
+    running = {j.proc.pid for j in jobs}
+    for pid in _denied.keys() - running:
+        del _denied[pid]
+    for pid in _original.keys() - running:
+        del _original[pid]
+
+    return log_messages
+
+
+def current_priority(proc: psutil.Process) -> Priority:
+    """The nice and, when its class is one plotman sets, ionice of proc."""
+    ionice_class = None
+    ionice_value = None
+    if hasattr(proc, "ionice"):
+        current = proc.ionice()
+        for name, ioclass in _IONICE_CLASSES.items():
+            if ioclass is not None and current.ioclass == ioclass:
+                ionice_class = name
+                ionice_value = current.value
+    return Priority(
+        nice=proc.nice(), ionice_class=ionice_class, ionice_value=ionice_value
+    )
+
+
+def set_priority(proc: psutil.Process, priority: Priority) -> typing.List[str]:
+    """Set the nice and ionice of proc to priority where they differ.  Returns
+    the changes made and those denied, each of which is only attempted once."""
+    denied = _denied.get(proc.pid, set())
+    changes = []
+
+    def change(description: str, apply_change: typing.Callable[[], None]) -> None:
+        if description in denied:
+            return
+        try:
+            apply_change()
+        except psutil.AccessDenied:
+            _denied.setdefault(proc.pid, set()).add(description)
+            changes.append(
+                f"{description} denied, higher priorities may require privileges"
+            )
+        else:
+            changes.append(description)
+
+    nice = priority.nice
+    if nice is not None and proc.nice() != nice:
+        change(f"nice {nice}", lambda: proc.nice(nice))
+
+    ionice_class = priority.ionice_class or "best_effort"
+    ioclass = _IONICE_CLASSES[ionice_class]
+    if (
+        (priority.ionice_class is not None or priority.ionice_value is not None)
+        and ioclass is not None
+        and hasattr(proc, "ionice")
+    ):
+        if ionice_class in ["idle", "none"]:
+            # The idle and none classes take no level
+            value = 0
+        elif priority.ionice_value is None:
+            # The kernel's default best effort level
+            value = 4
+        else:
+            value = priority.ionice_value
+        current = proc.ionice()
+        if (current.ioclass, current.value) != (ioclass, value):
+            change(
+                f"ionice {ionice_class}:{value}",
+                lambda: proc.ionice(
+                    ioclass=ioclass,
+                    value=None if ionice_class in ["idle", "none"] else value,
+                ),
+            )
+
+    return changes
@@ -1,13 +1,27 @@
+import collections
 import time
 import json
 import math
 import os
+import statistics
 import typing
 
+import attr
 import psutil
 import texttable as tt  # from somewhere?
 from itertools import groupby
-from plotman import archive, configuration, job, manager, plot_util
+from plotman import (
+    archive,
+    configuration,
+    diskstats,
+    fleet,
+    history,
+    job,
+    manager,
+    plot_util,
+    topology,
+    transfer_log,
+)
 
 
 def abbr_path(path: str, putative_prefix: str) -> str:
@@ -98,12 +112,17 @@ def status_report(
         "phase",
         "tmp",
         "pid",
+        "cpus",
         "stat",
         "mem",
         "user",
         "sys",
         "io",
     ]
+    # Rates need an earlier sample, which one-off listings lack
+    show_rates = any(j.io.read_rate is not None for j in jobs)
+    if show_rates:
+        headings += ["read", "write"]
     if height:
         headings.insert(0, "#")
     tab.header(headings)
@@ -136,6 +155,7 @@ def status_report(
                             j.get_tmp_usage(), 0
                         ),  # Current temp file size
                         j.proc.pid,  # System pid
+                        j.get_cpu_affinity_str(),  # CPUs the job is pinned to
                         j.get_run_status(),  # OS status for the job process
                         plot_util.human_format(
                             j.get_mem_usage(), 1, True
@@ -144,6 +164,11 @@ def status_report(
                         plot_util.time_format(j.get_time_sys()),  # system time
                         plot_util.time_format(j.get_time_iowait()),  # io wait
                     ]
+                    if show_rates:
+                        row += [
+                            rate_format(j.io.read_rate),  # Storage read rate
+                            rate_format(j.io.write_rate),  # Storage write rate
+                        ]
             except (psutil.NoSuchProcess, psutil.AccessDenied):
                 # In case the job has disappeared
                 row = [j.plot_id_prefix()] + (["--"] * (len(headings) - 2))
@@ -164,20 +189,108 @@ def to_prometheus_format(
     prom_stati: typing.Sequence[
         typing.Tuple[str, typing.Mapping[str, typing.Union[int, float, None]]]
     ],
+    metric_type: str = "gauge",
 ) -> typing.List[str]:
     prom_str_list = []
     for metric_name, metric_desc in metrics.items():
         prom_str_list.append(f"# HELP {metric_name} {metric_desc}.")
-        prom_str_list.append(f"# TYPE {metric_name} gauge")
+        prom_str_list.append(f"# TYPE {metric_name} {metric_type}")
         for label_str, values in prom_stati:
+            if values[metric_name] is None:
+                continue
             prom_str_list.append(
                 "%s{%s} %s" % (metric_name, label_str, values[metric_name])
             )
     return prom_str_list
 
 
+def to_prometheus_histogram(
+    metric_name: str,
+    metric_desc: str,
+    histograms: typing.Sequence[typing.Tuple[str, history.Histogram]],
+) -> typing.List[str]:
+    prom_str_list = [
+        f"# HELP {metric_name} {metric_desc}.",
+        f"# TYPE {metric_name} histogram",
+    ]
+    for label_str, histogram in histograms:
+        separator = "," if label_str else ""
+        for bound, count in histogram.cumulative():
+            le = "+Inf" if math.isinf(bound) else f"{bound:g}"
+            prom_str_list.append(
+                '%s_bucket{%s%sle="%s"} %d'
+                % (metric_name, label_str, separator, le, count)
+            )
+        prom_str_list.append("%s_sum{%s} %s" % (metric_name, label_str, histogram.sum))
+        prom_str_list.append(
+            "%s_count{%s} %d" % (metric_name, label_str, histogram.count)
+        )
+    return prom_str_list
+
+
+def completion_metrics(
+    stats: history.CompletionStats, tmp_prefix: str = "", dst_prefix: str = ""
+) -> typing.List[str]:
+    def label_str(labels: history.CompletionLabels) -> str:
+        plotter, tmpdir, dstdir = labels
+        return 'plotter="%s",tmp_dir="%s",dst_dir="%s"' % (
+            plotter,
+            abbr_path(tmpdir, tmp_prefix),
+            abbr_path(dstdir, dst_prefix),
+        )
+
+    lines = to_prometheus_histogram(
+        "plotman_completed_phase_duration_seconds",
+        "Durations of the phases of completed plots in s",
+        [
+            (f'{label_str(labels)},phase="{phase}"', histogram)
+            for (labels, phase), histogram in sorted(stats.phases.items())
+        ],
+    )
+    lines.extend(
+        to_prometheus_histogram(
+            "plotman_completed_duration_seconds",
+            "Total durations of completed plots in s",
+            [(label_str(labels), h) for labels, h in sorted(stats.total.items())],
+        )
+    )
+    lines.extend(
+        to_prometheus_histogram(
+            "plotman_completed_copy_duration_seconds",
+            "Durations of copying completed plots to the dst dir in s",
+            [(label_str(labels), h) for labels, h in sorted(stats.copy.items())],
+        )
+    )
+    lines.extend(
+        to_prometheus_format(
+            {
+                "plotman_completed_plots_total": "Completed plots",
+                "plotman_completed_plot_bytes_total": "Expected size of the completed plots in bytes",
+            },
+            [
+                (
+                    label_str(labels),
+                    {
+                        "plotman_completed_plots_total": plots,
+                        "plotman_completed_plot_bytes_total": stats.plot_bytes.get(
+                            labels
+                        ),
+                    },
+                )
+                for labels, plots in sorted(stats.plots.items())
+            ],
+            metric_type="counter",
+        )
+    )
+    return lines
+
+
 def prometheus_report(
-    jobs: typing.List[job.Job], tmp_prefix: str = "", dst_prefix: str = ""
+    jobs: typing.List[job.Job],
+    tmp_prefix: str = "",
+    dst_prefix: str = "",
+    transfers: typing.Sequence[archive.Transfer] = (),
+    completions: typing.Optional[history.CompletionStats] = None,
 ) -> str:
     metrics = {
         "plotman_plot_phase_major": "The phase the plot is currently in",
@@ -188,6 +301,10 @@ def prometheus_report(
         "plotman_plot_user_time": "Processor time (user) in s",
         "plotman_plot_sys_time": "Processor time (sys) in s",
         "plotman_plot_iowait_time": "Processor time (iowait) in s",
+        "plotman_plot_read_bytes": "Bytes read from storage",
+        "plotman_plot_write_bytes": "Bytes written to storage",
+        "plotman_plot_read_bytes_per_second": "Recent storage read rate in bytes/s",
+        "plotman_plot_write_bytes_per_second": "Recent storage write rate in bytes/s",
     }
     prom_stati = []
     for j in jobs:
@@ -210,9 +327,96 @@ def prometheus_report(
             "plotman_plot_user_time": j.get_time_user(),
             "plotman_plot_sys_time": j.get_time_sys(),
             "plotman_plot_iowait_time": j.get_time_iowait(),
+            "plotman_plot_read_bytes": None
+            if j.io.sample is None
+            else j.io.sample.read_bytes,
+            "plotman_plot_write_bytes": None
+            if j.io.sample is None
+            else j.io.sample.write_bytes,
+            "plotman_plot_read_bytes_per_second": j.io.read_rate,
+            "plotman_plot_write_bytes_per_second": j.io.write_rate,
         }
         prom_stati += [(label_str, values)]
-    return "\n".join(to_prometheus_format(metrics, prom_stati))
+    lines = to_prometheus_format(metrics, prom_stati)
+
+    if transfers:
+        transfer_metrics = {
+            "plotman_transfer_bytes": "Bytes transferred",
+            "plotman_transfer_percent": "Percent of the plot transferred",
+            "plotman_transfer_rate": "Recent transfer rate in bytes/s",
+            "plotman_transfer_average_rate": "Average transfer rate in bytes/s",
+            "plotman_transfer_eta": "Estimated time remaining in s",
+        }
+        transfer_stati = []
+        for transfer in transfers:
+            transfer_info = transfer.info
+            transfer_labels = {
+                "pid": transfer.pid,
+                "plot": ""
+                if transfer.source is None
+                else os.path.basename(transfer.source),
+                "archive_dir": transfer.destination or "",
+            }
+            label_str = ",".join([f'{k}="{v}"' for k, v in transfer_labels.items()])
+            transfer_values: typing.Dict[str, typing.Union[int, float, None]] = {
+                "plotman_transfer_bytes": None
+                if transfer_info is None
+                else transfer_info.transferred,
+                "plotman_transfer_percent": None
+                if transfer_info is None
+                else transfer_info.percent,
+                "plotman_transfer_rate": None
+                if transfer_info is None
+                else transfer_info.rate,
+                "plotman_transfer_average_rate": transfer.average_rate(),
+                "plotman_transfer_eta": None
+                if transfer_info is None
+                else transfer_info.eta,
+            }
+            transfer_stati.append((label_str, transfer_values))
+        lines.extend(to_prometheus_format(transfer_metrics, transfer_stati))
+
+    if completions is not None:
+        lines.extend(completion_metrics(completions, tmp_prefix, dst_prefix))
+
+    return "\n".join(lines)
+
+
+def fleet_report(snapshots: typing.Dict[str, fleet.AgentSnapshot]) -> str:
+    tab = tt.Texttable()
+    headings = ["agent", "plot id", "k", "tmp", "dst", "wall", "phase", "pid", "stat"]
+    tab.header(headings)
+    tab.set_cols_dtype("t" * len(headings))
+    tab.set_cols_align("r" * len(headings))
+    tab.set_header_align("r" * len(headings))
+    for name, snapshot in sorted(snapshots.items()):
+        for j in sorted(snapshot.jobs, key=lambda j: j.time_wall, reverse=True):
+            tab.add_row(
+                [
+                    name,
+                    j.plot_id[:8],
+                    j.plot_size,
+                    j.tmpdir,
+                    j.dstdir,
+                    plot_util.time_format(j.time_wall),
+                    str(j.phase),
+                    j.pid,
+                    "STP" if j.suspended else "RUN",
+                ]
+            )
+    tab.set_deco(0)  # No borders
+
+    next_jobs = [
+        "%s: %s"
+        % (
+            name,
+            snapshot.wait_reason
+            if snapshot.placement is None
+            else "ready for %s" % snapshot.placement.tmpdir,
+        )
+        for name, snapshot in sorted(snapshots.items())
+    ]
+    return "%s\n\n%s" % (tab.draw(), "\n".join(next_jobs))
 
 
 def summary(jobs: typing.List[job.Job], tmp_prefix: str = "") -> str:
@@ -230,27 +434,55 @@ def summary(jobs: typing.List[job.Job], tmp_prefix: str = "") -> str:
     return "\n".join(summary)
 
 
+IO_HEADINGS = ["rd MB/s", "wr MB/s", "IOPS", "util"]
+
+
+def io_cells(usage: typing.Optional[diskstats.Utilization]) -> typing.List[str]:
+    if usage is None:
+        return ["-"] * len(IO_HEADINGS)
+    return [
+        "%.0f" % (usage.read_bytes_per_s / plot_util.MB),
+        "%.0f" % (usage.write_bytes_per_s / plot_util.MB),
+        "%.0f" % usage.iops,
+        "%.0f%%" % usage.busy_percent,
+    ]
+
+
 def tmp_dir_report(
-    jobs: typing.List[job.Job],
+    index: job.JobIndex,
     dir_cfg: configuration.Directories,
     sched_cfg: configuration.Scheduling,
     width: int,
     start_row: typing.Optional[int] = None,
     end_row: typing.Optional[int] = None,
     prefix: str = "",
+    scores: typing.Optional[typing.Dict[str, manager.TmpdirScore]] = None,
+    io: typing.Optional[typing.Dict[str, diskstats.Utilization]] = None,
 ) -> str:
-    """start_row, end_row let you split the table up if you want"""
+    """start_row, end_row let you split the table up if you want.  scores, if
+    provided, adds the throughput selection speed and score columns and io the
+    activity of the device of each dir."""
     tab = tt.Texttable()
     headings = ["tmp", "ready", "phases"]
+    if io is not None:
+        headings[2:2] = IO_HEADINGS
+    if scores is not None:
+        headings[2:2] = ["speed", "score"]
     tab.header(headings)
     tab.set_cols_dtype("t" * len(headings))
     tab.set_cols_align("r" * (len(headings) - 1) + "l")
     for i, d in enumerate(sorted(dir_cfg.tmp)):
         if (start_row and i < start_row) or (end_row and i >= end_row):
             continue
-        phases = sorted(job.job_phases_for_tmpdir(d, jobs))
+        phases = index.phases_for_tmpdir(d)
         ready = manager.phases_permit_new_job(phases, d, sched_cfg, dir_cfg)
         row = [abbr_path(d, prefix), "OK" if ready else "--", phases_str(phases, 5)]
+        if io is not None:
+            row[2:2] = io_cells(io.get(d))
+        if scores is not None:
+            score = scores[d]
+            speed = "-" if score.speed is None else "%.2f" % score.speed
+            row[2:2] = [speed, "%.2f" % score.score]
         tab.add_row(row)
 
     tab.set_max_width(width)
@@ -260,26 +492,36 @@ def tmp_dir_report(
 
 
 def dst_dir_report(
-    jobs: typing.List[job.Job], dstdirs: typing.List[str], width: int, prefix: str = ""
+    index: job.JobIndex,
+    dstdirs: typing.List[str],
+    width: int,
+    prefix: str = "",
+    io: typing.Optional[typing.Dict[str, diskstats.Utilization]] = None,
 ) -> str:
     tab = tt.Texttable()
-    dir2oldphase = manager.dstdirs_to_furthest_phase(jobs)
-    dir2newphase = manager.dstdirs_to_youngest_phase(jobs)
+    copies = manager.copies_by_device(index)
     headings = ["dst", "plots", "GBfree", "inbnd phases", "pri"]
+    if io is not None:
+        headings[3:3] = IO_HEADINGS
     tab.header(headings)
     tab.set_cols_dtype("t" * len(headings))
 
     for d in sorted(dstdirs):
         # TODO: This logic is replicated in archive.py's priority computation,
         # maybe by moving more of the logic in to directory.py
-        eldest_ph = dir2oldphase.get(d, job.Phase(0, 0))
-        phases = job.job_phases_for_dstdir(d, jobs)
+        phases = index.phases_for_dstdir(d)
+        eldest_ph = phases[-1] if phases else job.Phase(0, 0)
 
         dir_plots = plot_util.list_plots(d)
         gb_free = int(plot_util.df_b(d) / plot_util.GB)
         n_plots = len(dir_plots)
-        priority = archive.compute_priority(eldest_ph, gb_free, n_plots)
+        device = manager.dst_device(d)
+        priority = archive.compute_priority(
+            eldest_ph, gb_free, n_plots, copies.get(device, 0)
+        )
         row = [abbr_path(d, prefix), n_plots, gb_free, phases_str(phases, 5), priority]
+        if io is not None:
+            row[3:3] = io_cells(io.get(d))
         tab.add_row(row)
     tab.set_max_width(width)
     tab.set_deco(tt.Texttable.BORDER | tt.Texttable.HEADER)
@@ -307,6 +549,155 @@ def arch_dir_report(
     return tab.draw()  # type: ignore[no-any-return]
 
 
+def topology_report(
+    dir_cfg: configuration.Directories,
+    width: int,
+    topo: typing.Optional[topology.Topology] = None,
+) -> str:
+    """Where each configured dir lives, to check that dirs sharing filesystems
+    and disks are recognized as such."""
+    if topo is None:
+        topo = topology.get()
+    dirs = [("tmp", d) for d in dir_cfg.tmp]
+    if dir_cfg.tmp2 is not None:
+        dirs.append(("tmp2", dir_cfg.tmp2))
+    if dir_cfg.dst is not None:
+        dirs.extend(("dst", d) for d in dir_cfg.dst)
+
+    tab = tt.Texttable()
+    headings = ["dir", "use", "mount", "fs", "type", "device", "disks", "GBfree"]
+    tab.header(headings)
+    tab.set_cols_dtype("t" * len(headings))
+    tab.set_cols_align("l" * (len(headings) - 1) + "r")
+    for use, d in dirs:
+        location = topo.locate(d)
+        try:
+            gb_free = str(int(topo.free_bytes(d) / plot_util.GB))
+        except OSError:
+            gb_free = "-"
+        tab.add_row(
+            [
+                d,
+                use,
+                location.mount_point or "-",
+                location.filesystem,
+                location.fstype or "-",
+                location.device or "-",
+                " ".join(location.disks) or "-",
+                gb_free,
+            ]
+        )
+    tab.set_max_width(width)
+    tab.set_deco(0)  # No borders
+    return tab.draw()  # type: ignore[no-any-return]
+
+
+def rate_format(rate: typing.Optional[float]) -> str:
+    if rate is None:
+        return "-"
+    return "%sB/s" % plot_util.human_format(rate, 0)
+
+
+def transfer_report(
+    transfers: typing.Sequence[archive.Transfer],
+    width: int,
+    prefix: str = "",
+    now: typing.Optional[float] = None,
+) -> str:
+    if not transfers:
+        return ""
+    if now is None:
+        now = time.time()
+
+    tab = tt.Texttable()
+    headings = ["pid", "plot", "archive dir", "wall", "done", "rate", "avg", "eta"]
+    tab.header(headings)
+    tab.set_cols_dtype("t" * len(headings))
+    tab.set_cols_align("r" * len(headings))
+    tab.set_header_align("r" * len(headings))
+    for transfer in transfers:
+        info = transfer.info
+        average_rate = transfer.average_rate(now)
+        tab.add_row(
+            [
+                "<pending>" if transfer.pid is None else transfer.pid,
+                "?" if transfer.source is None else os.path.basename(transfer.source),
+                "?"
+                if transfer.destination is None
+                else abbr_path(transfer.destination, prefix),
+                "-"
+                if transfer.start_time is None
+                else plot_util.time_format(int(now - transfer.start_time)),
+                "-"
+                if info is None or info.percent is None
+                else "%.0f%%" % info.percent,
+                rate_format(None if info is None else info.rate),
+                rate_format(average_rate),
+                "-"
+                if info is None or info.eta is None
+                else plot_util.time_format(int(info.eta)),
+            ]
+        )
+    tab.set_max_width(width)
+    tab.set_deco(0)  # No borders
+    return tab.draw()  # type: ignore[no-any-return]
+
+
+def transfer_history_report(
+    infos: typing.Sequence[transfer_log.TransferInfo], width: int
+) -> str:
+    """Completed transfers by archive dir, to spot slow archive disks."""
+    by_destination: typing.Dict[
+        str, typing.List[transfer_log.TransferInfo]
+    ] = collections.defaultdict(list)
+    for info in infos:
+        by_destination[info.destination or "?"].append(info)
+
+    tab = tt.Texttable()
+    headings = [
+        "archive dir",
+        "transfers",
+        "failed",
+        "size",
+        "avg",
+        "slowest",
+        "verify",
+        "last",
+    ]
+    tab.header(headings)
+    tab.set_cols_dtype("t" * len(headings))
+    tab.set_cols_align("l" + "r" * (len(headings) - 1))
+    for destination, destination_infos in sorted(by_destination.items()):
+        succeeded = [info for info in destination_infos if info.error is None]
+        rates = [
+            rate
+            for rate in (info.average_rate() for info in succeeded)
+            if rate is not None
+        ]
+        verify_seconds = [
+            info.verify_s for info in succeeded if info.verify_s is not None
+        ]
+        last = destination_infos[-1].started_at
+        tab.add_row(
+            [
+                destination,
+                len(destination_infos),
+                len(destination_infos) - len(succeeded),
+                "%sB"
+                % plot_util.human_format(
+                    sum(info.transferred for info in succeeded), 1
+                ),
+                rate_format(statistics.mean(rates) if rates else None),
+                rate_format(min(rates) if rates else None),
+                "%.1fs" % statistics.mean(verify_seconds) if verify_seconds else "-",
+                "-" if last is None else last.strftime("%Y-%m-%d %H:%M"),
+            ]
+        )
+    tab.set_max_width(width)
+    tab.set_deco(0)  # No borders
+    return tab.draw()  # type: ignore[no-any-return]
+
+
 # TODO: remove this
 def dirs_report(
     jobs: typing.List[job.Job],
@@ -314,11 +705,17 @@ def dirs_report(
     arch_cfg: typing.Optional[configuration.Archiving],
     sched_cfg: configuration.Scheduling,
     width: int,
+    log_cfg: typing.Optional[configuration.Logging] = None,
 ) -> str:
     dst_dir = dir_cfg.get_dst_directories()
+    index = job.JobIndex.of(jobs)
+    io = topology.utilization_for_paths(dir_cfg.tmp + dst_dir)
+    scores = None
+    if log_cfg is not None:
+        scores = manager.configured_tmpdir_scores(index, dir_cfg, sched_cfg, log_cfg)
     reports = [
-        tmp_dir_report(jobs, dir_cfg, sched_cfg, width),
-        dst_dir_report(jobs, dst_dir, width),
+        tmp_dir_report(index, dir_cfg, sched_cfg, width, scores=scores, io=io),
+        dst_dir_report(index, dst_dir, width, io=io),
     ]
     if arch_cfg is not None:
         freebytes, archive_log_messages = archive.get_archdir_freebytes(arch_cfg)
@@ -329,20 +726,31 @@ def dirs_report(
                 *archive_log_messages,
             ]
         )
+        transfers = archive.get_running_transfers(arch_cfg)
+        if transfers:
+            reports.extend(["archive transfers:", transfer_report(transfers, width)])
 
     return "\n".join(reports) + "\n"
 
 
-def json_report(jobs: typing.List[job.Job]) -> str:
+def json_report(
+    jobs: typing.List[job.Job],
+    transfers: typing.Optional[typing.Sequence[archive.Transfer]] = None,
+    io: typing.Optional[typing.Dict[str, diskstats.Utilization]] = None,
+) -> str:
     jobs_dicts = []
     for j in sorted(jobs, key=job.Job.get_time_wall):
         with j.proc.oneshot():
             jobs_dicts.append(j.to_dict())
 
-    stuff = {
+    stuff: typing.Dict[str, object] = {
         "jobs": jobs_dicts,
         "total_jobs": len(jobs),
         "updated": time.time(),
     }
+    if transfers is not None:
+        stuff["transfers"] = [transfer.to_dict() for transfer in transfers]
+    if io is not None:
+        stuff["io"] = {d: attr.asdict(usage) for d, usage in sorted(io.items())}
 
     return json.dumps(stuff)
@@ -0,0 +1,459 @@
+import bisect
+import collections
+import functools
+import itertools
+import math
+import os
+import random
+import statistics
+import sys
+import typing
+
+import attr
+import texttable as tt
+import yaml
+
+from plotman import configuration, job, manager
+import plotman.plotters
+
+
+DAY = 24 * 3600
+
+# The subphases of each phase as reported by the chia plotter.  Stagger
+# milestones are expressed in these.  Phase 5 is the copy to the dst dir.
+PHASE_STEPS = {1: 8, 2: 8, 3: 7, 4: 4, 5: 1}
+
+# Remaining work below this is considered done, to absorb float rounding.
+EPSILON = 1e-6
+
+
+@attr.frozen
+class Durations:
+    """Uncontended durations in seconds of the phases of one plot."""
+
+    phase1: float
+    phase2: float
+    phase3: float
+    phase4: float
+    copy: float = 0
+
+    @functools.lru_cache(maxsize=None)
+    def steps(self) -> typing.List[typing.Tuple[job.Phase, float]]:
+        """Split each phase evenly across its subphases.  The result is shared
+        and must not be modified."""
+        durations = [self.phase1, self.phase2, self.phase3, self.phase4, self.copy]
+        steps = []
+        for major, duration in enumerate(durations, start=1):
+            if duration <= 0:
+                continue
+            count = PHASE_STEPS[major]
+            for minor in range(count):
+                steps.append((job.Phase(major, minor), duration / count))
+        return steps
+
+
+def durations_from_info(
+    info: plotman.plotters.CommonInfo,
+) -> typing.Optional[Durations]:
+    """Return the durations measured by a completed plot log, or None if the
+    plotter does not report all four phases."""
+    durations = Durations(
+        phase1=info.phase1_duration_raw,
+        phase2=info.phase2_duration_raw,
+        phase3=info.phase3_duration_raw,
+        phase4=info.phase4_duration_raw,
+        copy=max(0, info.copy_time_raw),
+    )
+    if min(durations.phase1, durations.phase2, durations.phase3, durations.phase4) <= 0:
+        return None
+
+    return durations
+
+
+@attr.frozen
+class Contention:
+    """Slow down phases when more jobs overlap than a tmp dir, or the system
+    as a whole, can run at full speed.  Jobs copying to the dst dir are not
+    counted."""
+
+    tmpdir_jobs: typing.Optional[int] = None
+    system_jobs: typing.Optional[int] = None
+
+    def rate(self, tmpdir_jobs: int, system_jobs: int) -> float:
+        rate = 1.0
+        if self.tmpdir_jobs is not None and tmpdir_jobs > self.tmpdir_jobs:
+            rate = min(rate, self.tmpdir_jobs / tmpdir_jobs)
+        if self.system_jobs is not None and system_jobs > self.system_jobs:
+            rate = min(rate, self.system_jobs / system_jobs)
+        return rate
+
+
+@attr.mutable
+class Clock:
+    now: float = 0
+
+
+@attr.mutable
+class SimJob:
+    """A simulated job.  It provides the parts of the ``job.Job`` and
+    ``CommonInfo`` interfaces that the scheduling logic uses.  Progress is
+    measured as work, the seconds it would have taken at full speed."""
+
+    clock: Clock
+    tmpdir: str
+    dstdir: str
+    steps: typing.List[typing.Tuple[job.Phase, float]]
+    started_at: float
+    plot_size: int = 32
+    tmp2dir: str = ""
+    rate: float = 1.0
+    work_done: float = 0
+    updated_at: float = attr.ib()
+    # Cumulative work at the end of each step
+    step_ends: typing.List[float] = attr.ib(init=False)
+    # Upcoming (work, kind) points the simulation reacts to, in order
+    checkpoints: typing.List[typing.Tuple[float, str]] = attr.ib(factory=list)
+    phase: job.Phase = job.Phase(known=False)
+    progress_at: float = -math.inf
+
+    @updated_at.default
+    def _updated_at_default(self) -> float:
+        return self.started_at
+
+    @step_ends.default
+    def _step_ends_default(self) -> typing.List[float]:
+        return list(itertools.accumulate(duration for _, duration in self.steps))
+
+    @property
+    def plotter(self) -> "SimJob":
+        return self
+
+    def common_info(self) -> "SimJob":
+        return self
+
+    def work(self) -> float:
+        return self.work_done + (self.clock.now - self.updated_at) * self.rate
+
+    def work_before(self, phase: job.Phase) -> typing.Optional[float]:
+        """Work done when the job reaches phase, or None if it never does."""
+        for (step_phase, duration), step_end in zip(self.steps, self.step_ends):
+            if step_phase >= phase:
+                return step_end - duration
+        return None
+
+    def set_rate(self, rate: float) -> None:
+        self.work_done = self.work()
+        self.updated_at = self.clock.now
+        self.rate = rate
+
+    def next_checkpoint_at(self) -> float:
+        work, _ = self.checkpoints[0]
+        return self.updated_at + (work - self.work_done) / self.rate
+
+    def progress(self) -> job.Phase:
+        # The scheduling logic asks repeatedly within a single poll
+        if self.progress_at != self.clock.now:
+            step = bisect.bisect_right(self.step_ends, self.work() + EPSILON)
+            self.phase = self.steps[min(step, len(self.steps) - 1)][0]
+            self.progress_at = self.clock.now
+        return self.phase
+
+    def get_time_wall(self) -> int:
+        return int(self.clock.now - self.started_at)
+
+    @property
+    def copying(self) -> bool:
+        return self.progress().major >= 5
+
+    @property
+    def final_plot_written(self) -> bool:
+        # Jobs are removed as soon as their copy finishes
+        return self.work() + EPSILON >= self.step_ends[-1]
+
+
+@attr.mutable
+class TmpdirUsage:
+    plots: int = 0
+    busy_s: float = 0
+    job_s: float = 0
+
+
+@attr.frozen
+class Result:
+    duration_s: float
+    plots: int
+    plot_times: typing.List[float]
+    tmpdirs: typing.Dict[str, TmpdirUsage]
+    # Plots started to each dst dir, when dst dirs are configured
+    dstdirs: typing.Dict[str, int] = attr.ib(factory=dict)
+
+    @property
+    def days(self) -> float:
+        return self.duration_s / DAY
+
+    @property
+    def plots_per_day(self) -> float:
+        return self.plots / self.days
+
+    def busy_fraction(self, tmpdir: str) -> float:
+        return self.tmpdirs[tmpdir].busy_s / self.duration_s
+
+    def idle_hours_per_day(self, tmpdir: str) -> float:
+        return (1 - self.busy_fraction(tmpdir)) * 24
+
+
+def accumulate_usage(
+    usage: typing.Dict[str, TmpdirUsage], working: typing.Dict[str, int], elapsed: float
+) -> None:
+    for d, count in working.items():
+        if d in usage and count > 0:
+            usage[d].busy_s += elapsed
+            usage[d].job_s += count * elapsed
+
+
+def simulate(
+    dir_cfg: configuration.Directories,
+    sched_cfg: configuration.Scheduling,
+    plotting_cfg: configuration.Plotting,
+    days: float,
+    history: typing.Sequence[plotman.plotters.CommonInfo] = (),
+    durations: typing.Optional[Durations] = None,
+    contention: Contention = Contention(),
+    rng: typing.Optional[random.Random] = None,
+) -> Result:
+    """Run the real scheduling logic against simulated jobs for the given number
+    of days.  Each job takes the configured durations or, if none, those of a
+    random completed log from the same tmp dir, or from any tmp dir when that
+    one has no history.  dst dirs are assumed to never fill."""
+    if rng is None:
+        rng = random.Random()
+
+    samples: typing.Dict[str, typing.List[Durations]] = collections.defaultdict(list)
+    for info in history:
+        measured = durations_from_info(info)
+        if measured is not None:
+            samples[os.path.normpath(info.tmpdir)].append(measured)
+    all_samples = [d for ds in samples.values() for d in ds]
+    if durations is None and not all_samples:
+        raise Exception(
+            "No completed plot logs with phase durations to simulate from,"
+            " specify the phase durations instead"
+        )
+
+    def choose_durations(tmpdir: str) -> Durations:
+        if durations is not None:
+            return durations
+        return rng.choice(samples.get(os.path.normpath(tmpdir)) or all_samples)
+
+    polling_s = max(1, sched_cfg.polling_time_s)
+    global_stagger = int(sched_cfg.global_stagger_m * manager.MIN)
+    milestones = {d: manager.tmpdir_limits(d, sched_cfg).milestone for d in dir_cfg.tmp}
+
+    def next_poll_at(t: float) -> float:
+        return math.ceil(t / polling_s) * polling_s
+
+    clock = Clock()
+    end = days * DAY
+    jobs: typing.List[SimJob] = []
+    usage = {d: TmpdirUsage() for d in dir_cfg.tmp}
+    dst_plots: typing.Dict[str, int] = collections.Counter()
+    plot_times: typing.List[float] = []
+    next_poll = 0.0
+    # Rates only change when jobs start, finish or start copying, so contention
+    # and usage are only reassessed then.
+    working: typing.Dict[str, int] = {}
+    working_since = 0.0
+    rates_changed = True
+
+    while True:
+        if next_poll <= clock.now:
+            placement, _ = manager.plan_new_plot(
+                # SimJob provides the parts of the Job interface used
+                index=job.JobIndex.of(typing.cast(typing.List[job.Job], jobs)),
+                dir_cfg=dir_cfg,
+                sched_cfg=sched_cfg,
+                plotting_cfg=plotting_cfg,
+                completed=lambda: history,
+                freebytes=lambda d: sys.maxsize,
+            )
+            if placement is not None:
+                new_job = SimJob(
+                    clock=clock,
+                    tmpdir=placement.tmpdir,
+                    dstdir=placement.dstdir,
+                    steps=choose_durations(placement.tmpdir).steps(),
+                    started_at=clock.now,
+                    plot_size=plotting_cfg.plot_size(),
+                )
+                # Eligibility of tmp dirs only changes when a job crosses its
+                # milestone or ends, and contention when it starts copying.
+                checkpoints = [
+                    (new_job.work_before(milestones[new_job.tmpdir]), "milestone"),
+                    (new_job.work_before(job.Phase(5, 0)), "copy"),
+                    (new_job.step_ends[-1], "end"),
+                ]
+                new_job.checkpoints = sorted(
+                    (work, kind)
+                    for work, kind in checkpoints
+                    if work is not None and work > 0
+                )
+                jobs.append(new_job)
+                usage[placement.tmpdir].plots += 1
+                if dir_cfg.dst is not None:
+                    dst_plots[placement.dstdir] += 1
+                rates_changed = True
+                # The new job holds off the next one for the global stagger
+                next_poll = next_poll_at(clock.now + max(polling_s, global_stagger))
+            else:
+                youngest = max((j.started_at for j in jobs), default=-math.inf)
+                if clock.now - youngest < global_stagger:
+                    next_poll = max(
+                        clock.now + polling_s, next_poll_at(youngest + global_stagger)
+                    )
+                else:
+                    # Nothing changes until a job crosses a milestone or ends
+                    next_poll = math.inf
+
+        if rates_changed:
+            rates_changed = False
+            accumulate_usage(usage, working, clock.now - working_since)
+            working_since = clock.now
+            working = collections.Counter(j.tmpdir for j in jobs if not j.copying)
+            system_jobs = sum(working.values())
+            for j in jobs:
+                rate = (
+                    1.0
+                    if j.copying
+                    else contention.rate(working[j.tmpdir], system_jobs)
+                )
+                if rate != j.rate:
+                    j.set_rate(rate)
+
+        next_event = min((j.next_checkpoint_at() for j in jobs), default=math.inf)
+        clock.now = min(next_poll, next_event, end)
+
+        if clock.now >= end:
+            accumulate_usage(usage, working, clock.now - working_since)
+            break
+
+        for j in list(jobs):
+            while j.next_checkpoint_at() <= clock.now + EPSILON:
+                _, kind = j.checkpoints.pop(0)
+                if kind == "end":
+                    jobs.remove(j)
+                    plot_times.append(clock.now - j.started_at)
+                    rates_changed = True
+                    next_poll = min(next_poll, next_poll_at(clock.now))
+                    break
+                elif kind == "copy":
+                    rates_changed = True
+                else:
+                    next_poll = min(next_poll, next_poll_at(clock.now))
+
+    return Result(
+        duration_s=end,
+        plots=len(plot_times),
+        plot_times=plot_times,
+        tmpdirs=usage,
+        dstdirs=dict(dst_plots),
+    )
+
+
+def report(result: Result) -> str:
+    mean_plot_h = statistics.mean(result.plot_times) / 3600 if result.plot_times else 0
+    summary = "Simulated %.0f days: %d plots, %.2f plots/day, mean plot time %.1fh" % (
+        result.days,
+        result.plots,
+        result.plots_per_day,
+        mean_plot_h,
+    )
+
+    tab = tt.Texttable()
+    headings = ["tmp", "plots", "busy", "avg jobs", "idle h/day"]
+    tab.header(headings)
+    tab.set_cols_dtype("t" * len(headings))
+    tab.set_cols_align("l" + "r" * (len(headings) - 1))
+    for d, usage in result.tmpdirs.items():
+        tab.add_row(
+            [
+                d,
+                usage.plots,
+                "%.0f%%" % (100 * result.busy_fraction(d)),
+                "%.2f" % (usage.job_s / result.duration_s),
+                "%.1f" % result.idle_hours_per_day(d),
+            ]
+        )
+    tab.set_max_width(0)
+    tab.set_deco(tt.Texttable.BORDER | tt.Texttable.HEADER)
+    if result.dstdirs:
+        summary += "\nPlots started per dst dir: " + ", ".join(
+            f"{d} {plots}" for d, plots in sorted(result.dstdirs.items())
+        )
+    return summary + "\n" + tab.draw()  # type: ignore[no-any-return]
+
+
+def parse_override(override: str) -> typing.Tuple[str, str]:
+    key, separator, value = override.partition("=")
+    if not separator or not key:
+        raise configuration.ConfigurationException(
+            f"Scheduling override must be of the form key=value: {override!r}"
+        )
+    return (key, value)
+
+
+def apply_overrides(
+    config_text: str, overrides: typing.Sequence[typing.Tuple[str, object]]
+) -> str:
+    """Return the config text with the given scheduling options replaced."""
+    config = yaml.safe_load(config_text)
+    scheduling = config.setdefault("scheduling", {})
+    for key, value in overrides:
+        scheduling[key] = value
+    return yaml.safe_dump(config)
+
+
+def sweep(
+    overrides: typing.Sequence[str], sweeps: typing.Sequence[str]
+) -> typing.List[typing.List[typing.Tuple[str, object]]]:
+    """Expand ``key=value`` overrides and ``key=v1,v2`` sweeps into the list of
+    scheduling overrides for each combination.  Values are parsed as YAML."""
+    fixed = [
+        (key, yaml.safe_load(value)) for key, value in map(parse_override, overrides)
+    ]
+    axes = [
+        [(key, yaml.safe_load(value)) for value in values.split(",")]
+        for key, values in map(parse_override, sweeps)
+    ]
+    return [fixed + list(combination) for combination in itertools.product(*axes)]
+
+
+def sweep_report(
+    runs: typing.Sequence[
+        typing.Tuple[typing.Sequence[typing.Tuple[str, object]], Result]
+    ],
+) -> str:
+    keys = [key for key, _ in runs[0][0]] if runs else []
+    tab = tt.Texttable()
+    headings = keys + ["plots/day", "mean plot h", "busy", "idle h/day"]
+    tab.header(headings)
+    tab.set_cols_dtype("t" * len(headings))
+    tab.set_cols_align("r" * len(headings))
+    for overrides, result in runs:
+        tmpdirs = list(result.tmpdirs)
+        busy = (
+            statistics.mean(result.busy_fraction(d) for d in tmpdirs) if tmpdirs else 0
+        )
+        tab.add_row(
+            [str(value) for _, value in overrides]
+            + [
+                "%.2f" % result.plots_per_day,
+                "%.1f" % (statistics.mean(result.plot_times) / 3600)
+                if result.plot_times
+                else "-",
+                "%.0f%%" % (100 * busy),
+                "%.1f" % ((1 - busy) * 24),
+            ]
+        )
+    tab.set_max_width(0)
+    tab.set_deco(tt.Texttable.BORDER | tt.Texttable.HEADER)
+    return tab.draw()  # type: ignore[no-any-return]
@@ -0,0 +1,276 @@
+import contextlib
+import os
+import re
+import shutil
+import time
+import typing
+
+import attr
+
+from plotman import diskstats
+
+MOUNTINFO_PATH = "/proc/self/mountinfo"
+SYS_PATH = "/sys"
+
+# Seconds a topology is reused for, long enough to cover all the decisions of
+# one tick with a single statvfs() per filesystem.
+TOPOLOGY_TTL_S = 2.0
+
+# Joins the names of the disks of a device key.
+DISK_SEPARATOR = "+"
+
+
+@attr.frozen
+class Mount:
+    """One line of /proc/self/mountinfo."""
+
+    mount_id: int
+    device_number: str
+    root: str
+    mount_point: str
+    fstype: str
+    source: str
+
+
+def _unescape(field: str) -> str:
+    # Spaces and such in paths are written as octal escapes like \040.
+    return re.sub(r"\\([0-7]{3})", lambda match: chr(int(match.group(1), 8)), field)
+
+
+def parse_mountinfo(text: str) -> typing.List[Mount]:
+    # https://www.kernel.org/doc/Documentation/filesystems/proc.txt
+    # 36 35 98:0 /mnt1 /mnt/parent rw,noatime master:1 - ext3 /dev/root rw,errors=continue
+    mounts = []
+    for line in text.splitlines():
+        before, separator, after = line.partition(" - ")
+        fields = before.split()
+        filesystem = after.split()
+        if not separator or len(fields) < 5 or len(filesystem) < 2:
+            continue
+        mounts.append(
+            Mount(
+                mount_id=int(fields[0]),
+                device_number=fields[2],
+                root=_unescape(fields[3]),
+                mount_point=_unescape(fields[4]),
+                fstype=filesystem[0],
+                source=_unescape(filesystem[1]),
+            )
+        )
+    return mounts
+
+
+def read_mountinfo(path: str = MOUNTINFO_PATH) -> typing.List[Mount]:
+    try:
+        with open(path) as file:
+            return parse_mountinfo(file.read())
+    except FileNotFoundError:
+        # Not Linux
+        return []
+
+
+def _whole_device(device_path: str) -> str:
+    """The sysfs dir of the whole device for a partition's sysfs dir."""
+    if os.path.exists(os.path.join(device_path, "partition")):
+        return os.path.dirname(device_path)
+    return device_path
+
+
+def member_disks(device_path: str) -> typing.Tuple[str, ...]:
+    """The names of the disks under the block device with the sysfs dir
+    device_path, following the slaves of md and device mapper devices such as
+    LVM volumes down to the whole disks of their partitions."""
+    device_path = _whole_device(device_path)
+    slaves_path = os.path.join(device_path, "slaves")
+    try:
+        slaves = os.listdir(slaves_path)
+    except OSError:
+        slaves = []
+    if not slaves:
+        return (os.path.basename(device_path),)
+
+    disks: typing.Set[str] = set()
+    for slave in slaves:
+        disks.update(member_disks(os.path.realpath(os.path.join(slaves_path, slave))))
+    return tuple(sorted(disks))
+
+
+@attr.frozen
+class Location:
+    """Where a directory lives.  filesystem identifies the filesystem, by its
+    device number when known and otherwise by the path itself, device is the
+    whole block device it is mounted from and disks are the physical disks
+    under that."""
+
+    path: str
+    filesystem: str
+    mount_point: typing.Optional[str] = None
+    fstype: typing.Optional[str] = None
+    device: typing.Optional[str] = None
+    disks: typing.Tuple[str, ...] = ()
+
+    def device_key(self) -> typing.Optional[str]:
+        """Names the disks behind the directory, so that directories sharing
+        their disks share the key even on different partitions or volumes."""
+        if not self.disks:
+            return None
+        return DISK_SEPARATOR.join(self.disks)
+
+
+@attr.mutable
+class Topology:
+    """Resolves directories to their mount, block device and disks.  Free
+    space is read once per filesystem for as long as the topology is used."""
+
+    mounts: typing.List[Mount]
+    sys_path: str = SYS_PATH
+    created_at: float = 0
+    locations: typing.Dict[str, Location] = attr.ib(factory=dict)
+    freebytes: typing.Dict[str, int] = attr.ib(factory=dict)
+
+    @classmethod
+    def read(
+        cls,
+        mountinfo_path: str = MOUNTINFO_PATH,
+        sys_path: str = SYS_PATH,
+        now: typing.Optional[float] = None,
+    ) -> "Topology":
+        return cls(
+            mounts=read_mountinfo(mountinfo_path),
+            sys_path=sys_path,
+            created_at=time.monotonic() if now is None else now,
+        )
+
+    def mount_for_path(self, path: str) -> typing.Optional[Mount]:
+        """The mount a path is on, the last mounted one where several share the
+        longest matching mount point."""
+        best: typing.Optional[Mount] = None
+        for mount in self.mounts:
+            if os.path.commonpath([mount.mount_point, path]) != mount.mount_point:
+                continue
+            if best is None or len(mount.mount_point) >= len(best.mount_point):
+                best = mount
+        return best
+
+    def locate(self, path: str) -> Location:
+        normalized = os.path.normpath(path)
+        location = self.locations.get(normalized)
+        if location is not None:
+            return location
+
+        location = Location(path=normalized, filesystem=normalized)
+        with contextlib.suppress(OSError):
+            real_path = os.path.realpath(normalized)
+            st_dev = os.stat(real_path).st_dev
+            device_number = f"{os.major(st_dev)}:{os.minor(st_dev)}"
+            mount = self.mount_for_path(real_path)
+            if mount is None:
+                location = attr.evolve(location, filesystem=device_number)
+            else:
+                # btrfs reports a different st_dev for each subvolume, use the
+                # one of the mount to tell filesystems apart.
+                location = attr.evolve(
+                    location,
+                    filesystem=mount.device_number,
+                    mount_point=mount.mount_point,
+                    fstype=mount.fstype,
+                )
+                device_number = mount.device_number
+            device_path = os.path.realpath(
+                os.path.join(self.sys_path, "dev", "block", device_number)
+            )
+            if os.path.isdir(device_path):
+                location = attr.evolve(
+                    location,
+                    device=os.path.basename(_whole_device(device_path)),
+                    disks=member_disks(device_path),
+                )
+
+        self.locations[normalized] = location
+        return location
+
+    def device_for_path(self, path: str) -> typing.Optional[str]:
+        return self.locate(path).device_key()
+
+    def filesystem_for_path(self, path: str) -> str:
+        return self.locate(path).filesystem
+
+    def free_bytes(self, path: str) -> int:
+        filesystem = self.filesystem_for_path(path)
+        free = self.freebytes.get(filesystem)
+        if free is None:
+            free = shutil.disk_usage(path).free
+            self.freebytes[filesystem] = free
+        return free
+
+
+def combine_utilization(
+    utilization: typing.Dict[str, diskstats.Utilization],
+    device_keys: typing.Iterable[str],
+) -> typing.Dict[str, diskstats.Utilization]:
+    """Add the utilization of devices spanning several disks.  They are as busy
+    as their busiest disk and move the bytes and operations of all of them.
+    md devices account little or none of their own."""
+    combined = dict(utilization)
+    for key in device_keys:
+        disks = [
+            utilization[disk]
+            for disk in key.split(DISK_SEPARATOR)
+            if disk in utilization
+        ]
+        if disks:
+            combined[key] = diskstats.Utilization(
+                busy_percent=max(usage.busy_percent for usage in disks),
+                read_bytes_per_s=sum(usage.read_bytes_per_s for usage in disks),
+                write_bytes_per_s=sum(usage.write_bytes_per_s for usage in disks),
+                read_iops=sum(usage.read_iops for usage in disks),
+                write_iops=sum(usage.write_iops for usage in disks),
+            )
+    return combined
+
+
+def utilization_for_paths(
+    paths: typing.Iterable[str],
+    utilization: typing.Optional[typing.Dict[str, diskstats.Utilization]] = None,
+) -> typing.Dict[str, diskstats.Utilization]:
+    """The utilization of the disks behind each of paths, from the process wide
+    sample unless given.  Paths on unknown devices are left out."""
+    if utilization is None:
+        utilization = diskstats.utilization()
+    keys = {path: get().device_for_path(path) for path in paths}
+    combined = combine_utilization(
+        utilization, {key for key in keys.values() if key is not None}
+    )
+    return {
+        path: combined[key]
+        for path, key in keys.items()
+        if key is not None and key in combined
+    }
+
+
+_current: typing.Optional[Topology] = None
+
+
+def get(
+    max_age_s: float = TOPOLOGY_TTL_S, now: typing.Optional[float] = None
+) -> Topology:
+    """The process wide topology, read again once older than max_age_s."""
+    global _current
+    if now is None:
+        now = time.monotonic()
+    if _current is None or now - _current.created_at >= max_age_s:
+        _current = Topology.read(now=now)
+    return _current
+
+
+def device_for_path(path: str) -> typing.Optional[str]:
+    """The disks behind path as a device key, or None if unknown."""
+    return get().device_for_path(path)
+
+
+def filesystem_for_path(path: str) -> str:
+    return get().filesystem_for_path(path)
+
+
+def free_bytes(path: str) -> int:
+    return get().free_bytes(path)
@@ -0,0 +1,325 @@
+import contextlib
+import errno
+import json
+import os
+import time
+import typing
+
+import attr
+
+from plotman import plot_verify
+
+# Bytes copied per system call.  Large enough that the call overhead does not
+# matter and small enough to report progress and notice failures promptly.
+CHUNK_SIZE = 64 * 2 ** 20
+
+# Seconds between progress reports, which is also how often the progress of
+# a copy is checkpointed to resume from if it is interrupted.
+REPORT_INTERVAL_S = 10.0
+
+# Blocks of the part copied before an interruption compared with the source
+# before resuming.
+RESUME_SAMPLES = 16
+
+# copy_file_range() and sendfile() refuse some combinations of filesystems with
+# these, in which case the next strategy is tried.
+_UNSUPPORTED = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP}
+
+
+class TransferException(Exception):
+    pass
+
+
+@attr.frozen
+class Progress:
+    """How far a transfer has come after elapsed seconds, with the rate in
+    bytes per second since the previous report.  Parsed back from the transfer
+    log by plotman.transfer_log."""
+
+    copied: int
+    total: int
+    elapsed: float
+    rate: float
+
+    def __str__(self) -> str:
+        return "transferred %d of %d bytes in %.1f s at %d bytes/s" % (
+            self.copied,
+            self.total,
+            self.elapsed,
+            self.rate,
+        )
+
+
+@attr.frozen
+class Checkpoint:
+    """How far the copy of source into partial had got with the data up to
+    offset flushed to disk.  The size and mtime tell whether source is still the
+    same file."""
+
+    source: str
+    size: int
+    mtime_ns: int
+    partial: str
+    offset: int
+
+
+def checkpoint_path(partial: str) -> str:
+    return partial + ".checkpoint"
+
+
+def write_checkpoint(checkpoint: Checkpoint) -> None:
+    path = checkpoint_path(checkpoint.partial)
+    with open(path + ".new", "w") as f:
+        json.dump(attr.asdict(checkpoint), f)
+    os.replace(path + ".new", path)
+
+
+def read_checkpoint(partial: str) -> typing.Optional[Checkpoint]:
+    try:
+        with open(checkpoint_path(partial)) as f:
+            return Checkpoint(**json.load(f))
+    except (OSError, ValueError, TypeError):
+        return None
+
+
+def discard_partial(partial: str) -> None:
+    for path in [partial, checkpoint_path(partial)]:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path)
+
+
+def resume_offset(source: str, partial: str, src: int, dst: int) -> int:
+    """The offset to continue an interrupted copy of source into partial from,
+    or 0 to start over.  The checkpoint must be for the same source file and
+    samples of the part copied so far must match it."""
+    checkpoint = read_checkpoint(partial)
+    stat = os.fstat(src)
+    if (
+        checkpoint is None
+        or (checkpoint.source, checkpoint.partial) != (source, partial)
+        or (checkpoint.size, checkpoint.mtime_ns) != (stat.st_size, stat.st_mtime_ns)
+        or not 0 < checkpoint.offset <= min(stat.st_size, os.fstat(dst).st_size)
+    ):
+        return 0
+
+    plot_verify.drop_cache(dst)
+    offsets = plot_verify.sample_offsets(
+        checkpoint.offset, RESUME_SAMPLES, plot_verify.SAMPLE_SIZE
+    )
+    sample_size = min(plot_verify.SAMPLE_SIZE, checkpoint.offset)
+    if plot_verify.sparse_hash(src, offsets, sample_size) != plot_verify.sparse_hash(
+        dst, offsets, sample_size
+    ):
+        return 0
+    return checkpoint.offset
+
+
+def temporary_path(destination: str) -> str:
+    """Where a plot is written before being renamed into place.  The name does
+    not end in .plot so that farmers and plotman ignore partial plots."""
+    return destination + ".tmp"
+
+
+def preallocate(fd: int, size: int) -> None:
+    """Reserve the space for the whole plot up front to avoid fragmentation and
+    to fail early when the archive dir is short of space."""
+    if not hasattr(os, "posix_fallocate"):
+        return
+    try:
+        os.posix_fallocate(fd, 0, size)
+    except OSError as e:
+        if e.errno not in _UNSUPPORTED:
+            raise
+
+
+def _copy_read_write(src: int, dst: int, offset: int, count: int) -> int:
+    data = os.pread(src, count, offset)
+    written = 0
+    while written < len(data):
+        written += os.pwrite(dst, data[written:], offset + written)
+    return written
+
+
+def _copy_sendfile(src: int, dst: int, offset: int, count: int) -> int:
+    # sendfile() writes at the current position of the destination.
+    os.lseek(dst, offset, os.SEEK_SET)
+    return os.sendfile(dst, src, offset, count)
+
+
+def _copy_file_range(src: int, dst: int, offset: int, count: int) -> int:
+    return os.copy_file_range(src, dst, count, offset, offset)
+
+
+def copy_strategies() -> typing.List[typing.Callable[[int, int, int, int], int]]:
+    """The ways of copying a range of one file to another that this platform
+    offers, in order of preference.  copy_file_range() keeps the data in the
+    kernel and lets the filesystem clone or offload the copy."""
+    strategies: typing.List[typing.Callable[[int, int, int, int], int]] = []
+    if hasattr(os, "copy_file_range"):
+        strategies.append(_copy_file_range)
+    if hasattr(os, "sendfile") and os.name == "posix":
+        strategies.append(_copy_sendfile)
+    strategies.append(_copy_read_write)
+    return strategies
+
+
+def copy(
+    src: int,
+    dst: int,
+    size: int,
+    report: typing.Callable[[Progress], None],
+    report_interval_s: float = REPORT_INTERVAL_S,
+    chunk_size: int = CHUNK_SIZE,
+    clock: typing.Callable[[], float] = time.monotonic,
+    offset: int = 0,
+    checkpoint: typing.Optional[typing.Callable[[int], None]] = None,
+) -> None:
+    """Copy size bytes between open files from offset on, reporting progress
+    and calling checkpoint with the bytes copied so far along the way."""
+    strategies = copy_strategies()
+    start = clock()
+    last_report = start
+    last_copied = offset
+    copied = offset
+    while copied < size:
+        count = min(chunk_size, size - copied)
+        try:
+            n = strategies[0](src, dst, copied, count)
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED or len(strategies) == 1:
+                raise
+            strategies.pop(0)
+            continue
+        if n == 0:
+            raise TransferException(f"Source ended after {copied} of {size} bytes")
+        copied += n
+
+        now = clock()
+        if now - last_report >= report_interval_s or copied == size:
+            interval = now - last_report
+            rate = (copied - last_copied) / interval if interval > 0 else 0
+            report(Progress(copied=copied, total=size, elapsed=now - start, rate=rate))
+            last_report = now
+            last_copied = copied
+            if checkpoint is not None and copied < size:
+                checkpoint(copied)
+
+
+def fsync_directory(path: str) -> None:
+    """Make a rename in the directory durable."""
+    if os.name != "posix":
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def same_filesystem(source: str, destination_dir: str) -> bool:
+    return os.stat(source).st_dev == os.stat(destination_dir).st_dev
+
+
+def already_moved(
+    source: str,
+    destination: str,
+    verify: typing.Optional[typing.Callable[[str, str], None]] = None,
+) -> bool:
+    """Whether destination is a complete copy of source.  Copies are only
+    renamed into place once complete, so a destination of the same size that
+    passes verify(source, destination), if given, is one."""
+    if os.stat(destination).st_size != os.stat(source).st_size:
+        return False
+    if verify is not None:
+        try:
+            verify(source, destination)
+        except plot_verify.VerificationException:
+            return False
+    return True
+
+
+def move(
+    source: str,
+    destination_dir: str,
+    report: typing.Callable[[Progress], None] = lambda progress: None,
+    report_interval_s: float = REPORT_INTERVAL_S,
+    verify: typing.Optional[typing.Callable[[str, str], None]] = None,
+    log: typing.Callable[[str], None] = lambda message: None,
+) -> str:
+    """Move a plot into destination_dir and return its new path.  The plot is
+    renamed when both are on the same filesystem.  Otherwise it is copied to a
+    temporary name, flushed to disk, checked with verify(source, temporary) if
+    given and renamed into place so that it never appears partially written or
+    corrupt, and only then is the source removed.  An interrupted copy is kept
+    with a checkpoint of its progress and resumed by the next move of the same
+    plot to the same destination_dir.  A plot already in place from a move
+    interrupted before it removed the source only has its source removed."""
+    os.makedirs(destination_dir, exist_ok=True)
+    destination = os.path.join(destination_dir, os.path.basename(source))
+    size = os.stat(source).st_size
+    if os.path.exists(destination):
+        if not already_moved(source, destination, verify):
+            raise TransferException(f"Destination already exists: {destination!r}")
+        log(f"Found {destination} already in place, removing the source")
+        os.remove(source)
+        report(Progress(copied=size, total=size, elapsed=0, rate=0))
+        return destination
+
+    if same_filesystem(source, destination_dir):
+        os.rename(source, destination)
+        fsync_directory(destination_dir)
+        report(Progress(copied=size, total=size, elapsed=0, rate=0))
+        return destination
+
+    temporary = temporary_path(destination)
+    src = os.open(source, os.O_RDONLY)
+    try:
+        dst = os.open(temporary, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            offset = resume_offset(source, temporary, src, dst)
+            if offset > 0:
+                log(f"Resuming {temporary} at {offset} bytes")
+            else:
+                os.ftruncate(dst, 0)
+                preallocate(dst, size)
+            mtime_ns = os.fstat(src).st_mtime_ns
+
+            def checkpoint(copied: int) -> None:
+                getattr(os, "fdatasync", os.fsync)(dst)
+                write_checkpoint(
+                    Checkpoint(
+                        source=source,
+                        size=size,
+                        mtime_ns=mtime_ns,
+                        partial=temporary,
+                        offset=copied,
+                    )
+                )
+
+            copy(
+                src,
+                dst,
+                size,
+                report,
+                report_interval_s,
+                offset=offset,
+                checkpoint=checkpoint,
+            )
+            os.fsync(dst)
+        finally:
+            os.close(dst)
+        if verify is not None:
+            verify(source, temporary)
+    except (TransferException, plot_verify.VerificationException):
+        # Nothing worth resuming.
+        discard_partial(temporary)
+        raise
+    finally:
+        os.close(src)
+
+    os.rename(temporary, destination)
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(checkpoint_path(temporary))
+    fsync_directory(destination_dir)
+    os.remove(source)
+    return destination
@@ -0,0 +1,266 @@
+import glob
+import os
+import typing
+
+import attr
+import pendulum
+
+import plotman.plotters
+
+# rsync shows rates in powers of 1024
+_UNITS = {"": 1, "k": 2 ** 10, "M": 2 ** 20, "G": 2 ** 30, "T": 2 ** 40}
+
+
+@attr.frozen
+class TransferInfo:
+    """What a transfer log says about the transfer.  Sizes are in bytes and
+    rates in bytes per second.  rate is the most recent rate reported while
+    elapsed and the average rate are only known for the plotman transfer
+    engine and for completed rsync transfers."""
+
+    source: typing.Optional[str] = None
+    destination: typing.Optional[str] = None
+    started_at: typing.Optional[pendulum.DateTime] = None
+    transferred: int = 0
+    total: typing.Optional[int] = None
+    percent: typing.Optional[float] = None
+    rate: typing.Optional[float] = None
+    eta: typing.Optional[float] = None
+    elapsed: typing.Optional[float] = None
+    completed: bool = False
+    error: typing.Optional[str] = None
+    verify_s: typing.Optional[float] = None
+    resumed_at: int = 0
+
+    def average_rate(
+        self, elapsed: typing.Optional[float] = None
+    ) -> typing.Optional[float]:
+        """The average rate, over elapsed seconds if the log does not say,
+        since the transfer was resumed if it was."""
+        if self.elapsed is not None:
+            elapsed = self.elapsed
+        if not elapsed:
+            return None
+        return (self.transferred - self.resumed_at) / elapsed
+
+    def to_dict(self) -> typing.Dict[str, object]:
+        return {
+            "source": self.source,
+            "destination": self.destination,
+            "started_at": None
+            if self.started_at is None
+            else self.started_at.isoformat(),
+            "transferred": self.transferred,
+            "total": self.total,
+            "percent": self.percent,
+            "rate": self.rate,
+            "eta": self.eta,
+            "elapsed": self.elapsed,
+            "completed": self.completed,
+            "error": self.error,
+            "verify_s": self.verify_s,
+            "resumed_at": self.resumed_at,
+        }
+
+
+handlers = plotman.plotters.RegexLineHandlers[TransferInfo]()
+
+
+@handlers.register(expression=r"^Archiving (.+) to (.+)$")
+def archiving(match: typing.Match[str], info: TransferInfo) -> TransferInfo:
+    # Archiving /mnt/dst/00/plot-k32-2021-08-29-22-22-1fc7b57baae24da78e3bea44d58ab51f.plot to /farm/sites/a
+    return attr.evolve(info, source=match.group(1), destination=match.group(2))
+
+
+@handlers.register(
+    expression=r"^\s*([\d,]+)\s+(\d+)%\s+([\d.]+)([kMGT]?)B/s\s+(\d+):(\d\d):(\d\d)(.*to-chk=0/)?"
+)
+def rsync_progress(match: typing.Match[str], info: TransferInfo) -> TransferInfo:
+    # rsync --info=progress2 while running shows the time remaining
+    #  1,234,567,890  11%  150.23MB/s    0:10:28
+    # and when done the time taken, with nothing left to check once the last
+    # file is transferred
+    # 108,834,620,118 100%  172.41MB/s    0:10:02 (xfr#1, to-chk=0/1)
+    percent = float(match.group(2))
+    seconds = (
+        int(match.group(5)) * 3600 + int(match.group(6)) * 60 + int(match.group(7))
+    )
+    transferred = int(match.group(1).replace(",", ""))
+    done = match.group(8) is not None
+    return attr.evolve(
+        info,
+        transferred=transferred,
+        total=transferred if done else info.total,
+        percent=percent,
+        rate=float(match.group(3)) * _UNITS[match.group(4)],
+        eta=0 if percent == 100 else seconds,
+        elapsed=seconds if percent == 100 else info.elapsed,
+        completed=info.completed or done,
+    )
+
+
+@handlers.register(expression=r"^total size is ([\d,]+)")
+def rsync_done(match: typing.Match[str], info: TransferInfo) -> TransferInfo:
+    # total size is 108,834,620,118  speedup is 1.00
+    return attr.evolve(info, total=int(match.group(1).replace(",", "")), completed=True)
+
+
+@handlers.register(expression=r"^rsync error: (.*)")
+def rsync_error(match: typing.Match[str], info: TransferInfo) -> TransferInfo:
+    # rsync error: error in file IO (code 11) at receiver.c(374) [receiver=3.1.3]
+    return attr.evolve(info, error=match.group(1), completed=True)
+
+
+@handlers.register(
+    expression=r"^transferred (\d+) of (\d+) bytes in ([\d.]+) s at (\d+) bytes/s$"
+)
+def engine_progress(match: typing.Match[str], info: TransferInfo) -> TransferInfo:
+    # From plotman.transfer.Progress
+    # transferred 26843545600 of 108834620118 bytes in 139.2 s at 192837465 bytes/s
+    transferred = int(match.group(1))
+    total = int(match.group(2))
+    rate = float(match.group(4))
+    return attr.evolve(
+        info,
+        transferred=transferred,
+        total=total,
+        percent=100.0 * transferred / total if total else 100.0,
+        rate=rate,
+        eta=(total - transferred) / rate if rate else None,
+        elapsed=float(match.group(3)),
+    )
+
+
+@handlers.register(
+    expression=r"^verified k\d+ plot \w+ with \d+ samples, read \d+ bytes in ([\d.]+) s$"
+)
+def engine_verified(match: typing.Match[str], info: TransferInfo) -> TransferInfo:
+    # From plotman.plot_verify.Verification
+    # verified k32 plot 1fc7b57b with 64 samples, read 8388608 bytes in 0.42 s
+    return attr.evolve(info, verify_s=float(match.group(1)))
+
+
+@handlers.register(expression=r"^(?:plotman\.\S+Exception|[A-Z]\w*Error): (.*)$")
+def engine_error(match: typing.Match[str], info: TransferInfo) -> TransferInfo:
+    # The last line of the traceback when the transfer engine fails
+    # plotman.plot_verify.VerificationException: Sampled contents of ... differ from ...
+    # OSError: [Errno 28] No space left on device
+    return attr.evolve(info, error=match.group(1), completed=True)
+
+
+@handlers.register(expression=r"^Resuming \S+ at (\d+) bytes$")
+def engine_resumed(match: typing.Match[str], info: TransferInfo) -> TransferInfo:
+    # Resuming /farm/sites/a/plot-k32-....plot.tmp at 26843545600 bytes
+    return attr.evolve(info, resumed_at=int(match.group(1)))
+
+
+@handlers.register(expression=r"^Moved (.+) to (.+)$")
+def engine_done(match: typing.Match[str], info: TransferInfo) -> TransferInfo:
+    # Moved /mnt/dst/00/plot-k32-....plot to /farm/sites/a/plot-k32-....plot
+    return attr.evolve(info, eta=0, completed=True)
+
+
+@attr.mutable
+class TransferLog:
+    """Incrementally parsed transfer log."""
+
+    info: TransferInfo = attr.ib(factory=TransferInfo)
+    offset: int = 0
+    decoder: plotman.plotters.LineDecoder = attr.ib(
+        factory=lambda: plotman.plotters.LineDecoder(line_ends="\n\r")
+    )
+
+    def update(self, chunk: bytes) -> TransferInfo:
+        self.offset += len(chunk)
+        for line in self.decoder.update(chunk=chunk):
+            for pattern, handler_functions in handlers.mapping.items():
+                match = pattern.search(line)
+
+                if match is None:
+                    continue
+
+                for handler_function in handler_functions:
+                    self.info = handler_function(match=match, info=self.info)
+
+                break
+
+        return self.info
+
+
+def log_started_at(filename: str) -> typing.Optional[pendulum.DateTime]:
+    # 2021-08-29T22_22_52.123456-07_00.transfer.log
+    timestamp = os.path.basename(filename).split(".transfer.log")[0]
+    try:
+        parsed = pendulum.parse(timestamp.replace("_", ":"))
+    except ValueError:
+        return None
+    if not isinstance(parsed, pendulum.DateTime):
+        return None
+    return parsed
+
+
+@attr.mutable
+class TransferLogs:
+    """Incrementally parsed transfer logs in a directory, like
+    plotman.history.CompletedLogs is for plot logs."""
+
+    directory: str
+    completed: typing.Dict[str, TransferInfo] = attr.ib(factory=dict)
+    in_progress: typing.Dict[str, TransferLog] = attr.ib(factory=dict)
+
+    def read(self, filename: str) -> typing.Optional[TransferInfo]:
+        """Read the new part of one log and return what is known so far."""
+        if filename in self.completed:
+            return self.completed[filename]
+
+        state = self.in_progress.get(filename)
+        if state is None:
+            state = TransferLog(info=TransferInfo(started_at=log_started_at(filename)))
+            self.in_progress[filename] = state
+        try:
+            with open(filename, "rb") as file:
+                file.seek(state.offset)
+                chunk = file.read()
+        except FileNotFoundError:
+            del self.in_progress[filename]
+            return None
+
+        info = state.update(chunk=chunk)
+        if info.completed:
+            del self.in_progress[filename]
+            self.completed[filename] = info
+        return info
+
+    def update(self) -> typing.List[TransferInfo]:
+        """Read new log data and return the infos of newly completed logs."""
+        newly_completed = []
+        for filename in glob.glob(os.path.join(self.directory, "*.transfer.log")):
+            if filename in self.completed:
+                continue
+            info = self.read(filename)
+            if info is not None and info.completed:
+                newly_completed.append(info)
+        return newly_completed
+
+    def recent(self, limit: typing.Optional[int] = None) -> typing.List[TransferInfo]:
+        """Return completed infos ordered by start time, most recent last."""
+        infos = sorted(
+            self.completed.values(),
+            key=lambda info: info.started_at.timestamp()
+            if info.started_at is not None
+            else 0,
+        )
+        if limit is not None:
+            infos = infos[-limit:]
+        return infos
+
+
+_transfer_logs_by_directory: typing.Dict[str, TransferLogs] = {}
+
+
+def transfer_logs(directory: str) -> TransferLogs:
+    """Return the process wide transfer log history for directory, without
+    reading new data."""
+    return _transfer_logs_by_directory.setdefault(
+        directory, TransferLogs(directory=directory)
+    )
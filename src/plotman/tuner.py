@@ -0,0 +1,302 @@
+import collections
+import itertools
+import os
+import random
+import statistics
+import typing
+
+import attr
+import texttable as tt
+
+from plotman import configuration, job, plot_util
+import plotman.plotters
+
+DAY = 24 * 3600  # Seconds
+
+
+@attr.frozen
+class Parameters:
+    """The plotter options the tuner varies.  buffer is only used by chia."""
+
+    threads: int
+    buckets: int
+    buffer: typing.Optional[int] = None
+
+    def __str__(self) -> str:
+        result = f"-r {self.threads} -u {self.buckets}"
+        if self.buffer is not None:
+            result += f" -b {self.buffer}"
+        return result
+
+
+@attr.frozen
+class Trial:
+    """The results of completed jobs with one set of parameters in one tmp dir
+    class.  Durations and cpu time are means in seconds.  throughput is in
+    plots per day for each thread given to a job, so that parameters are
+    compared by what the cpus make when shared by jobs using them rather than
+    by the speed of a single job."""
+
+    parameters: Parameters
+    samples: int
+    running: int
+    throughput: typing.Optional[float] = None
+    phase_durations: typing.Optional[typing.Tuple[float, float, float, float]] = None
+    cpu_time: typing.Optional[float] = None
+
+
+def configured_parameters(plotting_cfg: configuration.Plotting) -> Parameters:
+    if plotting_cfg.type == "madmax":
+        assert plotting_cfg.madmax is not None
+        return Parameters(
+            threads=plotting_cfg.madmax.n_threads,
+            buckets=plotting_cfg.madmax.n_buckets,
+        )
+
+    assert plotting_cfg.chia is not None
+    return Parameters(
+        threads=plotting_cfg.chia.n_threads,
+        buckets=plotting_cfg.chia.n_buckets,
+        buffer=plotting_cfg.chia.job_buffer,
+    )
+
+
+def info_parameters(info: plotman.plotters.CommonInfo) -> Parameters:
+    """The parameters a job ran with, as reported in its log."""
+    return Parameters(
+        threads=info.threads,
+        buckets=info.buckets,
+        buffer=info.buffer if info.type == "chia" else None,
+    )
+
+
+def candidates(
+    plotting_cfg: configuration.Plotting, tuning: configuration.Tuning
+) -> typing.List[Parameters]:
+    """Every combination of the configured values.  Options without values
+    to try keep their configured setting."""
+    base = configured_parameters(plotting_cfg)
+    buffers: typing.List[typing.Optional[int]] = [base.buffer]
+    if tuning.buffer:
+        buffers = [*tuning.buffer]
+    return [
+        Parameters(threads=threads, buckets=buckets, buffer=buffer)
+        for threads, buckets, buffer in itertools.product(
+            tuning.threads or [base.threads],
+            tuning.buckets or [base.buckets],
+            buffers,
+        )
+    ]
+
+
+def tmpdir_class(tmpdir: str, tuning: configuration.Tuning) -> str:
+    """The name of the class a tmp dir is configured in, or else the dir
+    itself."""
+    normalized = os.path.normpath(tmpdir)
+    for name, dirs in (tuning.tmpdir_classes or {}).items():
+        if normalized in (os.path.normpath(d) for d in dirs):
+            return name
+    return normalized
+
+
+def trials(
+    plotting_cfg: configuration.Plotting,
+    tuning: configuration.Tuning,
+    tmpdir: str,
+    jobs: typing.List[job.Job],
+    completed: typing.Sequence[plotman.plotters.CommonInfo],
+) -> typing.List[Trial]:
+    """Summarize the recent results of each candidate in the class of tmpdir."""
+    cls = tmpdir_class(tmpdir, tuning)
+
+    results: typing.Dict[
+        Parameters, typing.List[plotman.plotters.CommonInfo]
+    ] = collections.defaultdict(list)
+    for info in completed:
+        if (
+            info.type == plotting_cfg.type
+            and info.total_time_raw > 0
+            and info.plot_size == plotting_cfg.plot_size()
+            and tmpdir_class(info.tmpdir, tuning) == cls
+        ):
+            results[info_parameters(info)].append(info)
+
+    running = collections.Counter(
+        info_parameters(info)
+        for info in (j.plotter.common_info() for j in jobs)
+        if tmpdir_class(info.tmpdir, tuning) == cls
+    )
+
+    result = []
+    for parameters in candidates(plotting_cfg, tuning):
+        recent = results[parameters][-tuning.history_size :]
+        if not recent:
+            result.append(
+                Trial(parameters=parameters, samples=0, running=running[parameters])
+            )
+            continue
+
+        total_time = statistics.mean(info.total_time_raw for info in recent)
+        cpu_times = [info.cpu_time_raw for info in recent if info.cpu_time_raw > 0]
+        result.append(
+            Trial(
+                parameters=parameters,
+                samples=len(recent),
+                running=running[parameters],
+                throughput=DAY / (total_time * parameters.threads),
+                phase_durations=(
+                    statistics.mean(info.phase1_duration_raw for info in recent),
+                    statistics.mean(info.phase2_duration_raw for info in recent),
+                    statistics.mean(info.phase3_duration_raw for info in recent),
+                    statistics.mean(info.phase4_duration_raw for info in recent),
+                ),
+                cpu_time=statistics.mean(cpu_times) if cpu_times else None,
+            )
+        )
+
+    return result
+
+
+def best(trials: typing.List[Trial]) -> typing.Optional[Trial]:
+    measured = [trial for trial in trials if trial.throughput is not None]
+    if not measured:
+        return None
+
+    def key(trial: Trial) -> float:
+        assert trial.throughput is not None
+        return trial.throughput
+
+    return max(measured, key=key)
+
+
+def choose(
+    trials: typing.List[Trial],
+    tuning: configuration.Tuning,
+    rng: random.Random,
+) -> typing.Tuple[Parameters, str]:
+    """Choose the parameters for a new job.  Candidates are first tried in turn
+    until each has min_samples completed or running jobs.  After that the best
+    is chosen, except for an explore_fraction of jobs that try another one so
+    changing conditions are noticed."""
+    for trial in trials:
+        if trial.samples + trial.running < tuning.min_samples:
+            return (trial.parameters, "exploring")
+
+    chosen = best(trials)
+    if chosen is None:
+        return (trials[0].parameters, "exploring")
+
+    others = [trial for trial in trials if trial is not chosen]
+    if others and rng.random() < tuning.explore_fraction:
+        return (rng.choice(others).parameters, "exploring")
+
+    return (chosen.parameters, "best")
+
+
+def apply(
+    plotting_cfg: configuration.Plotting, parameters: Parameters
+) -> configuration.Plotting:
+    """Return the plotting configuration with the parameters substituted."""
+    if plotting_cfg.type == "madmax":
+        assert plotting_cfg.madmax is not None
+        return attr.evolve(
+            plotting_cfg,
+            madmax=attr.evolve(
+                plotting_cfg.madmax,
+                n_threads=parameters.threads,
+                n_buckets=parameters.buckets,
+            ),
+        )
+
+    assert plotting_cfg.chia is not None
+    return attr.evolve(
+        plotting_cfg,
+        chia=attr.evolve(
+            plotting_cfg.chia,
+            n_threads=parameters.threads,
+            n_buckets=parameters.buckets,
+            job_buffer=parameters.buffer,
+        ),
+    )
+
+
+def tune(
+    plotting_cfg: configuration.Plotting,
+    tmpdir: str,
+    jobs: typing.List[job.Job],
+    completed: typing.Sequence[plotman.plotters.CommonInfo],
+    rng: typing.Optional[random.Random] = None,
+) -> typing.Tuple[configuration.Plotting, str]:
+    """Return the plotting configuration for a new job in tmpdir along with a
+    description of the choice."""
+    tuning = plotting_cfg.tuning
+    if tuning is None:
+        return (plotting_cfg, "")
+
+    parameters, reason = choose(
+        trials=trials(plotting_cfg, tuning, tmpdir, jobs, completed),
+        tuning=tuning,
+        rng=random.Random() if rng is None else rng,
+    )
+    return (apply(plotting_cfg, parameters), "tuned %s (%s)" % (parameters, reason))
+
+
+def report(
+    plotting_cfg: configuration.Plotting,
+    tmpdirs: typing.List[str],
+    jobs: typing.List[job.Job],
+    completed: typing.Sequence[plotman.plotters.CommonInfo],
+    width: int,
+) -> str:
+    tuning = plotting_cfg.tuning
+    if tuning is None:
+        return "plotting: tuning: is not configured"
+
+    tab = tt.Texttable()
+    headings = [
+        "class",
+        "parameters",
+        "plots",
+        "running",
+        "plots/day/thread",
+        "phase 1",
+        "phase 2",
+        "phase 3",
+        "phase 4",
+        "cpu",
+        "best",
+    ]
+    tab.header(headings)
+    tab.set_cols_dtype("t" * len(headings))
+    tab.set_cols_align("l" * 2 + "r" * (len(headings) - 2))
+
+    # One tmp dir per class is enough to find its trials
+    classes = {tmpdir_class(d, tuning): d for d in sorted(tmpdirs)}
+    for cls, tmpdir in sorted(classes.items()):
+        class_trials = trials(plotting_cfg, tuning, tmpdir, jobs, completed)
+        best_trial = best(class_trials)
+        for trial in class_trials:
+            durations: typing.List[str] = ["-"] * 4
+            if trial.phase_durations is not None:
+                durations = [
+                    plot_util.time_format(int(duration))
+                    for duration in trial.phase_durations
+                ]
+            tab.add_row(
+                [
+                    cls,
+                    str(trial.parameters),
+                    trial.samples,
+                    trial.running,
+                    "-" if trial.throughput is None else "%.2f" % trial.throughput,
+                    *durations,
+                    "-"
+                    if trial.cpu_time is None
+                    else plot_util.time_format(int(trial.cpu_time)),
+                    "*" if trial is best_trial else "",
+                ]
+            )
+
+    tab.set_max_width(width)
+    tab.set_deco(0)  # No borders
+    return tab.draw()  # type: ignore[no-any-return]
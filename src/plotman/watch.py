@@ -0,0 +1,187 @@
+import json
+import os
+import time
+import typing
+
+import attr
+import psutil
+
+from plotman import configuration, job, plot_util
+
+# Values of a job that are expected to change on every tick and are only
+# reported with the snapshot and the phase changes.
+_UNTRACKED = {"pid", "progress", "time_wall", "io_by_phase"}
+
+Event = typing.Dict[str, object]
+
+
+def moved(previous: object, current: object, change_ratio: float) -> bool:
+    """Whether a value changed enough to be reported again.  Numbers must move
+    by more than change_ratio of the value last reported, anything else by any
+    amount."""
+    if previous == current:
+        return False
+    if isinstance(previous, (int, float)) and isinstance(current, (int, float)):
+        if previous == 0:
+            return True
+        return abs(current - previous) > change_ratio * abs(previous)
+    return True
+
+
+def job_dicts(jobs: typing.Sequence[job.Job]) -> typing.Dict[int, Event]:
+    dicts = {}
+    for j in jobs:
+        try:
+            with j.proc.oneshot():
+                dicts[j.proc.pid] = j.to_dict()
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            # Ended since it was listed
+            continue
+    return dicts
+
+
+def dir_dicts(dir_cfg: configuration.Directories) -> typing.Dict[str, Event]:
+    """The configured dirs that currently exist, with their free space and for
+    dst dirs the number of plots in them."""
+    dirs = [("tmp", d) for d in dir_cfg.tmp]
+    if dir_cfg.tmp2 is not None:
+        dirs.append(("tmp2", dir_cfg.tmp2))
+    dirs.extend(("dst", d) for d in dir_cfg.get_dst_directories())
+
+    dicts: typing.Dict[str, Event] = {}
+    for use, d in dirs:
+        if not os.path.isdir(d):
+            # Not mounted or not created yet, the free space may be cached
+            continue
+        try:
+            free_bytes = plot_util.df_b(d)
+            plots = len(plot_util.list_plots(d)) if use == "dst" else None
+        except OSError:
+            # Missing or unavailable
+            continue
+        entry = dicts.setdefault(d, {"dir": d, "uses": []})
+        typing.cast(typing.List[str], entry["uses"]).append(use)
+        entry["free_bytes"] = free_bytes
+        if plots is not None:
+            entry["plots"] = plots
+    return dicts
+
+
+@attr.mutable
+class Watcher:
+    """Turns successive states of the jobs and dirs into events, remembering
+    the values last reported to only report what changed."""
+
+    change_ratio: float
+    jobs: typing.Dict[int, Event] = attr.ib(factory=dict)
+    dirs: typing.Dict[str, Event] = attr.ib(factory=dict)
+
+    def snapshot(
+        self, jobs: typing.Dict[int, Event], dirs: typing.Dict[str, Event], now: float
+    ) -> Event:
+        self.jobs = {pid: dict(values) for pid, values in jobs.items()}
+        self.dirs = {d: dict(values) for d, values in dirs.items()}
+        return {
+            "event": "snapshot",
+            "time": now,
+            "jobs": list(jobs.values()),
+            "dirs": list(dirs.values()),
+        }
+
+    def changes(
+        self, jobs: typing.Dict[int, Event], dirs: typing.Dict[str, Event], now: float
+    ) -> typing.List[Event]:
+        events: typing.List[Event] = []
+
+        for pid in self.jobs.keys() - jobs.keys():
+            ended = self.jobs.pop(pid)
+            events.append(
+                {
+                    "event": "job_ended",
+                    "time": now,
+                    "pid": pid,
+                    "plot_id": ended["plot_id"],
+                }
+            )
+        for pid, values in jobs.items():
+            reported = self.jobs.get(pid)
+            if reported is None:
+                self.jobs[pid] = dict(values)
+                events.append({"event": "job_started", "time": now, "job": values})
+                continue
+            if values["progress"] != reported["progress"]:
+                events.append(
+                    {
+                        "event": "job_phase",
+                        "time": now,
+                        "pid": pid,
+                        "plot_id": values["plot_id"],
+                        "phase": values["progress"],
+                        "previous": reported["progress"],
+                    }
+                )
+                reported["progress"] = values["progress"]
+            changed = {
+                key: value
+                for key, value in values.items()
+                if key not in _UNTRACKED
+                and moved(reported.get(key), value, self.change_ratio)
+            }
+            if changed:
+                reported.update(changed)
+                events.append(
+                    {
+                        "event": "job_changed",
+                        "time": now,
+                        "pid": pid,
+                        "plot_id": values["plot_id"],
+                        "changes": changed,
+                    }
+                )
+
+        for d in sorted(self.dirs.keys() - dirs.keys()):
+            del self.dirs[d]
+            events.append({"event": "dir_removed", "time": now, "dir": d})
+        for d, values in dirs.items():
+            reported = self.dirs.get(d)
+            if reported is None:
+                self.dirs[d] = dict(values)
+                events.append({"event": "dir_added", "time": now, "dir": values})
+                continue
+            changed = {
+                key: value
+                for key, value in values.items()
+                if moved(reported.get(key), value, self.change_ratio)
+            }
+            if changed:
+                reported.update(changed)
+                events.append(
+                    {"event": "dir_changed", "time": now, "dir": d, "changes": changed}
+                )
+
+        return events
+
+
+def run(
+    cfg: configuration.PlotmanConfig,
+    interval_s: float,
+    change_ratio: float,
+    write: typing.Callable[[str], None],
+    sleep: typing.Callable[[float], None] = time.sleep,
+) -> None:
+    """Write a snapshot as one line of json and then, at most every
+    interval_s, a line for each change."""
+    watcher = Watcher(change_ratio=change_ratio)
+    jobs: typing.List[job.Job] = []
+    first = True
+    while True:
+        jobs = job.Job.get_running_jobs(cfg.logging.plots, cached_jobs=jobs)
+        states = (job_dicts(jobs), dir_dicts(cfg.directories), time.time())
+        if first:
+            events = [watcher.snapshot(*states)]
+            first = False
+        else:
+            events = watcher.changes(*states)
+        for event in events:
+            write(json.dumps(event) + "\n")
+        sleep(interval_s)
@@ -0,0 +1,142 @@
+import contextlib
+import os
+import time
+import typing
+
+import attr
+import psutil
+
+from plotman import configuration, job
+
+# CPU seconds a job must use between checks to count as progress, so that
+# bookkeeping by an otherwise stuck process is not mistaken for work.
+CPU_PROGRESS_S = 1.0
+
+
+@attr.mutable
+class Progress:
+    """The last observed log size and cpu time of a job and when each last
+    advanced."""
+
+    log_size: int
+    cpu_time: float
+    log_at: float
+    cpu_at: float
+
+    def idle_s(self, now: float) -> float:
+        return now - max(self.log_at, self.cpu_at)
+
+
+def log_size(j: job.Job) -> int:
+    if j.logfile is None:
+        return 0
+    try:
+        return os.stat(j.logfile).st_size
+    except OSError:
+        return 0
+
+
+def cpu_time(j: job.Job) -> float:
+    cpu_times = j.proc.cpu_times()
+    return float(cpu_times.user + cpu_times.system)
+
+
+def stall_threshold_s(phase: job.Phase, config: configuration.Watchdog) -> float:
+    minutes = config.stall_m
+    if phase.known and phase.major in config.phase_stall_m:
+        minutes = config.phase_stall_m[phase.major]
+    return minutes * 60
+
+
+@attr.mutable
+class Watchdog:
+    """Flags jobs whose log has not grown and which have used no cpu time for
+    longer than the stall threshold of their phase, and optionally kills them
+    and removes their temp files.  Stopped jobs are not considered stalled."""
+
+    config: configuration.Watchdog
+    progress: typing.Dict[int, Progress] = attr.ib(factory=dict)
+    flagged: typing.Set[int] = attr.ib(factory=set)
+
+    def update(
+        self, jobs: typing.List[job.Job], now: typing.Optional[float] = None
+    ) -> typing.List[str]:
+        """Take one observation of each job.  Returns log messages for jobs
+        newly found stalled."""
+        if now is None:
+            now = time.monotonic()
+
+        log_messages: typing.List[str] = []
+        pids = {j.proc.pid for j in jobs}
+        for pid in list(self.progress):
+            if pid not in pids:
+                del self.progress[pid]
+                self.flagged.discard(pid)
+
+        for j in jobs:
+            with contextlib.suppress(psutil.NoSuchProcess, psutil.AccessDenied):
+                message = self._observe(j, now)
+                if message is not None:
+                    log_messages.append(message)
+
+        return log_messages
+
+    def _observe(self, j: job.Job, now: float) -> typing.Optional[str]:
+        pid = j.proc.pid
+        size = log_size(j)
+        cpu = cpu_time(j)
+
+        progress = self.progress.get(pid)
+        if progress is None or j.get_run_status() == "STP":
+            # Time spent stopped, such as by hand or by backpressure, is not
+            # a stall.
+            self.progress[pid] = Progress(
+                log_size=size, cpu_time=cpu, log_at=now, cpu_at=now
+            )
+            self.flagged.discard(pid)
+            return None
+
+        if size != progress.log_size:
+            progress.log_size = size
+            progress.log_at = now
+        if cpu - progress.cpu_time >= CPU_PROGRESS_S:
+            progress.cpu_time = cpu
+            progress.cpu_at = now
+
+        phase = j.progress()
+        idle_s = progress.idle_s(now)
+        if idle_s < stall_threshold_s(phase, self.config):
+            self.flagged.discard(pid)
+            return None
+        if pid in self.flagged:
+            return None
+
+        self.flagged.add(pid)
+        info = j.plotter.common_info()
+        context = (
+            "%s pid %d in phase %s stalled, no log output for %d min and no cpu"
+            " progress for %d min (status %s, cpu %ds, tmp %s, tmp2 %s, dst %s,"
+            " log %s)"
+            % (
+                j.plot_id_prefix(),
+                pid,
+                phase,
+                (now - progress.log_at) / 60,
+                (now - progress.cpu_at) / 60,
+                j.get_run_status(),
+                cpu,
+                info.tmpdir,
+                info.tmp2dir,
+                info.dstdir,
+                j.logfile,
+            )
+        )
+        if not self.config.kill:
+            return "Flagged %s" % context
+
+        temp_files = j.kill()
+        return "Killed %s, removed %d temp files: %s" % (
+            context,
+            len(temp_files),
+            ", ".join(sorted(temp_files)),
+        )